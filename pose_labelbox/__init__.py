@@ -1,25 +1,332 @@
+import importlib
 import importlib.metadata
 from pathlib import Path
 
-import toml
+PROJECT_NAME = 'wf-pose-labelbox' # Keep this synced with project name in pyproject.toml
 
-from .core import *
-from .process_video import *
-from .alphapose import *
-from .overlay import *
-from .labelbox import *
-from .utils import *
+# Submodules and their heavy third-party dependencies (pandas, labelbox,
+# honeycomb_io, video_io, cv_utils, ffmpeg) are imported on first attribute
+# access rather than at package import. Keep these lists synced with the
+# public names defined in each submodule. Later submodules take precedence
+# when names collide, as they did with the former star imports.
+_SUBMODULE_EXPORTS = {
+    'core': [
+        'download_videos',
+        'download_videos_async',
+        'extract_frames',
+        'run_pose_detection_2d',
+        'run_pose_detection_2d_chunk',
+        'generate_detection_chunks',
+        'generate_extraction_batches',
+        'generate_target_video_starts',
+        'generate_target_camera_ids',
+        'generate_video_path',
+        'generate_frame_path',
+        'generate_frame_paths',
+        'generate_frame_path_prefix',
+        'generate_frame_directory_path',
+        'generate_frame_filenames',
+        'generate_frame_filename',
+        'generate_frame_filename_prefix',
+        'generate_ffmpeg_frame_identifier',
+        'generate_image_list_path',
+    ],
+    'process_video': [
+        'extract_video_frames',
+        'extract_video_frames_batch',
+        'generate_bounding_box_overlay_videos',
+        'encode_bounding_box_overlay_video',
+        'generate_bounding_box_overlay_video_path',
+        'write_bounding_box_overlay_video_metadata',
+        'read_bounding_box_overlay_video_metadata',
+        'generate_bounding_box_overlay_video_metadata_path',
+        'bounding_box_overlay_filename_re',
+        'extract_bounding_box_overlay_timestamp',
+    ],
+    'alphapose': [
+        'detect_poses_2d',
+        'parse_alphapose_output',
+        'parse_alphapose_output_file',
+        'parse_poses_2d_raw',
+        'parse_pose_2d_raw',
+        'image_id_re',
+        'parse_image_id',
+        'generate_alphapose_output_directory_path',
+        'generate_parsed_alphapose_output_filename',
+        'DETECTION_CHUNK_MARKER_FILENAME',
+        'FAILED_DETECTION_CHUNKS_FILENAME',
+        'merge_detection_chunk_outputs',
+        'match_boundary_pose_tracks',
+        'generate_detection_chunk_id',
+        'generate_detection_chunk_directory_path',
+        'is_detection_chunk_complete',
+        'write_detection_chunk_marker',
+        'read_failed_detection_chunks',
+        'update_failed_detection_chunks',
+    ],
+    'overlay': [
+        'generate_bounding_box_overlays',
+        'generate_bounding_box_overlay',
+        'overlay_bounding_box',
+        'generate_bounding_box_overlay_path',
+        'generate_bounding_box_overlay_paths',
+        'generate_bounding_box_overlay_path_prefix',
+        'write_bounding_box_overlay',
+        'lookup_bounding_box_corners',
+        'write_bounding_box_overlay_metadata',
+        'read_bounding_box_overlay_metadata',
+        'has_bounding_box_overlays',
+        'generate_bounding_box_overlay_metadata_path',
+    ],
+    'labelbox': [
+        'LABELBOX_DATETIME_FORMAT',
+        'create_project',
+        'create_project_async',
+        'create_metadata_fields',
+        'create_metadata_field',
+        'create_person_ontology',
+        'create_person_feature_schema',
+        'create_dataset',
+        'create_dataset_async',
+        'generate_bounding_box_overlay_video_records',
+        'upload_bounding_box_overlay_video',
+        'generate_data_row',
+        'create_data_rows',
+        'bounding_box_overlay_filename_re',
+        'parse_bounding_box_overlay_video_path',
+        'fetch_labels',
+        'fetch_labels_async',
+        'export_labels',
+        'parse_labels',
+        'encode_frame_offsets',
+        'decode_frame_offsets',
+        'generate_labelbox_client',
+    ],
+    'utils': [
+        'LazyModule',
+        'lazy_import',
+        'generate_output_period',
+        'convert_to_datetime_utc',
+    ],
+    'metrics': [
+        'InMemoryMetricsSink',
+        'JSONLinesMetricsSink',
+        'PrometheusTextfileMetricsSink',
+        'format_prometheus_labels',
+        'set_metrics_sink',
+        'get_metrics_sink',
+        'flush_metrics',
+        'metrics_sink',
+        'record_event',
+        'increment_counter',
+        'record_timing',
+        'record_file_bytes',
+        'time_stage',
+        'run_subprocess',
+        'record_subprocess',
+    ],
+    'profiling': [
+        'PROFILING_MODES',
+        'enable_profiling',
+        'disable_profiling',
+        'profile_run',
+        'profile_stage',
+        'profiled',
+        'write_profile',
+        'generate_profile_path_stem',
+        'SamplingProfiler',
+    ],
+    'sharding': [
+        'LEASE_FILENAME_RE',
+        'UNREADABLE_LEASE_GRACE_PERIOD',
+        'WORK_UNIT_ARGUMENTS',
+        'REQUIRED_WORK_UNIT_ARGUMENTS',
+        'OVERLAY_STAGES',
+        'run_sharded',
+        'process_work_unit',
+        'validate_sharded_stage',
+        'generate_stage_arguments',
+        'generate_work_units',
+        'generate_windows',
+        'generate_work_unit_id',
+        'generate_lease_directory_path',
+        'generate_worker_id',
+        'load_or_create_work_units',
+        'claim_work_unit',
+        'renew_lease',
+        'release_lease',
+        'complete_work_unit',
+        'record_work_unit_failure',
+        'count_work_unit_failures',
+        'is_work_unit_done',
+        'is_lease_superseded',
+        'fetch_latest_lease',
+        'generate_lease_path',
+        'generate_done_path',
+        'write_json_exclusive',
+        'LeaseHeartbeat',
+    ],
+    'frame_reader': [
+        'VideoFrameReader',
+        'generate_video_index',
+        'normalize_frame_offsets',
+    ],
+    'cache': [
+        'DEFAULT_CACHE_DIRECTORIES',
+        'DEFAULT_RETAINED_DIRECTORIES',
+        'CacheManager',
+        'iterate_file_paths',
+        'protect_paths',
+    ],
+    'triangulation': [
+        'generate_poses_3d',
+        'fetch_camera_calibrations',
+        'load_camera_calibrations',
+        'triangulate_poses',
+        'generate_empty_poses_3d',
+        'generate_camera_parameters',
+        'generate_rotation_matrix',
+        'generate_cross_product_matrix',
+        'generate_fundamental_matrices',
+        'undistort_points',
+        'generate_candidate_pairs',
+        'compute_epipolar_costs',
+        'match_poses',
+        'triangulate_pose_groups',
+        'compute_reprojection_errors',
+        'generate_poses_3d_output_path',
+    ],
+    'tracks': [
+        'prune_pose_tracks',
+        'compute_pose_track_statistics',
+        'apply_pose_track_pruning_rules',
+        'stitch_pose_tracks',
+        'stitch_pose_track_fragments',
+        'generate_stitching_candidates',
+        'compute_stitching_costs',
+        'link_pose_track_windows',
+        'link_window_pose_tracks',
+        'match_overlap_pose_tracks',
+        'convert_to_seconds',
+        'compute_box_ious',
+        'segment_pose_tracks',
+        'generate_segment_indices',
+        'generate_pose_track_timestamps',
+        'SPARSE_MODES',
+        'select_sparse_frames',
+        'generate_pose_track_statistics_filename',
+        'generate_pose_track_lineage_filename',
+    ],
+    'pose_index': [
+        'PoseIndex',
+        'load_pose_index',
+        'convert_timestamp_to_seconds',
+    ],
+    'rendering': [
+        'TIMESTAMP_FORMAT',
+        'OverlayRenderer',
+        'rasterize_text_box',
+        'resize_image',
+        'generate_layer',
+        'shift_point',
+        'draw_rectangle_in_place',
+    ],
+    'aio': [
+        'DEFAULT_MAX_CONCURRENT_REQUESTS',
+        'RequestPool',
+        'open_request_pool',
+        'run_sync',
+    ],
+    'session': [
+        'Session',
+        'resolve_honeycomb_client',
+        'resolve_video_client',
+    ],
+    'export': [
+        'SHARD_PLAN_DIRECTORY_NAME',
+        'SHARD_PLAN_MANIFEST_FILENAME',
+        'export_person_crops',
+        'record_shard_results',
+        'write_shard_plan',
+        'generate_crop_records',
+        'generate_shard_indices',
+        'write_planned_person_crop_shard',
+        'write_person_crop_shard',
+        'generate_crop_corners',
+        'load_person_crop_index',
+        'read_person_crop',
+        'generate_shard_path',
+        'generate_shard_index_path',
+        'generate_shard_plan_path',
+    ],
+    'planning': [
+        'PLAN_STAGES',
+        'STAGE_THROUGHPUT_METRICS',
+        'STAGE_RATIO_METRICS',
+        'load_throughput_calibration',
+        'plan_run',
+        'plan_video_work_units',
+        'plan_camera_work_units',
+        'estimate_run_costs',
+        'get_bytes_per_item',
+        'get_file_size',
+    ],
+    'loadtest': [
+        'LOAD_TEST_STAGE_ITEM_COUNTERS',
+        'NUM_KEYPOINTS',
+        'FakeServiceError',
+        'FakeService',
+        'FakeHoneycomb',
+        'FakeVideoService',
+        'FakeLabelboxField',
+        'FakeLabelbox',
+        'FakeLabelboxClassification',
+        'FakeLabelboxClient',
+        'FakePoseDetector',
+        'PeakMemorySampler',
+        'install_fake_services',
+        'generate_synthetic_video',
+        'run_load_test_stage',
+        'sum_counter',
+        'run_load_test',
+    ],
+    'pipeline': [
+        'STALL_THRESHOLD',
+        'QueueStallTracker',
+        'run_io_pipeline',
+    ],
+}
 
-PROJECT_NAME = 'wf-pose-labelbox' # Keep this synced with project name in pyproject.toml
+_ATTRIBUTE_SUBMODULES = dict()
+for _submodule_name, _attribute_names in _SUBMODULE_EXPORTS.items():
+    for _attribute_name in _attribute_names:
+        _ATTRIBUTE_SUBMODULES[_attribute_name] = _submodule_name
+
+__all__ = list(_ATTRIBUTE_SUBMODULES.keys()) + ['PROJECT_NAME', 'get_version']
+
+def __getattr__(name):
+    if name in _SUBMODULE_EXPORTS:
+        return importlib.import_module(f'.{name}', __name__)
+    if name in _ATTRIBUTE_SUBMODULES:
+        submodule = importlib.import_module(f'.{_ATTRIBUTE_SUBMODULES[name]}', __name__)
+        value = getattr(submodule, name)
+        globals()[name] = value
+        return value
+    if name == '__version__':
+        version = get_version()
+        globals()['__version__'] = version
+        return version
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted(set(globals().keys()) | set(__all__) | set(_SUBMODULE_EXPORTS.keys()) | {'__version__'})
 
 def get_version() -> str:
     try:
         version = importlib.metadata.version(PROJECT_NAME)
     except:
+        import toml
         path = Path(__file__).resolve().parents[1] / "pyproject.toml"
         pyproject = toml.load(str(path))
         version: str = pyproject["tool"]["poetry"]["version"]
     return version
-
-
-__version__ = get_version()
@@ -0,0 +1,78 @@
+import pose_labelbox.metrics
+import concurrent.futures
+import contextlib
+import asyncio
+import functools
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT_REQUESTS = 8
+
+class RequestPool:
+    # Runs blocking client calls (Honeycomb, video service, Labelbox) on a
+    # dedicated thread pool so that coroutines can wait on many of them at
+    # once. The semaphore caps the number of requests in flight; pass one
+    # pool to several async stages to share the cap between them
+    def __init__(self, max_concurrent_requests=DEFAULT_MAX_CONCURRENT_REQUESTS):
+        if max_concurrent_requests < 1:
+            raise ValueError('Maximum number of concurrent requests must be at least 1')
+        self.max_concurrent_requests = max_concurrent_requests
+        # Created on first use, inside the running loop (before Python 3.10
+        # a semaphore binds to the loop that is current when it is created)
+        self.semaphore = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrent_requests,
+            thread_name_prefix='pose_labelbox_request',
+        )
+        self.num_in_flight = 0
+        self.max_num_in_flight = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    async def run(self, function, *args, request_name=None, **kwargs):
+        if request_name is None:
+            request_name = getattr(function, '__name__', 'request')
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        async with self.semaphore:
+            self.num_in_flight += 1
+            self.max_num_in_flight = max(self.max_num_in_flight, self.num_in_flight)
+            start_time = time.perf_counter()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self.executor,
+                    functools.partial(function, *args, **kwargs),
+                )
+            finally:
+                self.num_in_flight -= 1
+                pose_labelbox.metrics.record_timing('async_request', time.perf_counter() - start_time, request=request_name)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+@contextlib.asynccontextmanager
+async def open_request_pool(request_pool=None, max_concurrent_requests=DEFAULT_MAX_CONCURRENT_REQUESTS):
+    # Uses the pool passed in, or creates (and afterwards closes) one
+    if request_pool is not None:
+        yield request_pool
+        return
+    async with RequestPool(max_concurrent_requests=max_concurrent_requests) as request_pool:
+        yield request_pool
+
+def run_sync(coroutine):
+    # Runs a coroutine to completion for the sync wrappers. Inside a running
+    # event loop (e.g., in Jupyter) it runs on a separate thread with its own
+    # loop, since the running loop can't be blocked on
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
@@ -1,10 +1,12 @@
 import pose_labelbox.utils
+import pose_labelbox.session
 import pose_labelbox.core
-import pandas as pd
-import numpy as np
-import subprocess
+import pose_labelbox.metrics
+import pose_labelbox.profiling
+import pose_labelbox.tracks
 import datetime
 import json
+import os
 import re
 import uuid
 import pathlib
@@ -13,6 +15,12 @@ from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
+DETECTION_CHUNK_MARKER_FILENAME = 'detection_complete.json'
+FAILED_DETECTION_CHUNKS_FILENAME = 'failed_detection_chunks.json'
+
+pd = pose_labelbox.utils.lazy_import('pandas')
+np = pose_labelbox.utils.lazy_import('numpy')
+
 def detect_poses_2d(
     image_list_path,
     output_directory_path,
@@ -26,6 +34,7 @@ def detect_poses_2d(
     format='coco',
     pose_tracking_reid=True,
     single_process=True,
+    camera_id=None,
 ):
     logger.info(f'Detecting 2D poses for images in {image_list_path}')
     with open(image_list_path, 'r') as fp:
@@ -84,7 +93,14 @@ def detect_poses_2d(
         alphapose_command.append('--pose_track')
     arguments = docker_command + alphapose_command
     logger.info(f"Executing: {' '.join(arguments)}")
-    subprocess.run(arguments)
+    completed_process = pose_labelbox.metrics.run_subprocess(
+        arguments,
+        name='detect_poses_2d',
+        camera_id=camera_id,
+    )
+    if completed_process.returncode == 0:
+        pose_labelbox.metrics.increment_counter('images_detected', image_count, camera_id=camera_id)
+    return completed_process.returncode
 
 def parse_alphapose_output(
     inference_id,
@@ -104,9 +120,11 @@ def parse_alphapose_output(
     audience=None,
     client_id=None,
     client_secret=None,
+    session=None,
     alphapose_output_parent_directory='/data/alphapose_output',
     alphapose_output_filename='alphapose-results.json',
 ):
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
     target_camera_ids = pose_labelbox.core.generate_target_camera_ids(
         start=start,
         end=end,
@@ -143,11 +161,14 @@ def parse_alphapose_output(
         if parsed_alphapose_output_file_path.is_file():
             logger.info(f'Parsed AlphaPose output file {parsed_alphapose_output_file_path} already exists. Skipping.')
             continue
-        parse_alphapose_output_file(
-            input_path=alphapose_output_file_path,
-            output_path=parsed_alphapose_output_file_path,
-            frame_period=frame_period,
-        )
+        with pose_labelbox.metrics.time_stage('parse_alphapose_output', camera_id=camera_id), pose_labelbox.profiling.profile_stage('parse_alphapose_output', camera_id=camera_id):
+            poses_2d = parse_alphapose_output_file(
+                input_path=alphapose_output_file_path,
+                output_path=parsed_alphapose_output_file_path,
+                frame_period=frame_period,
+            )
+        pose_labelbox.metrics.increment_counter('poses_2d_parsed', len(poses_2d), camera_id=camera_id)
+        pose_labelbox.metrics.increment_counter('pose_tracks_2d_parsed', poses_2d['pose_track_label'].nunique(), camera_id=camera_id)
 
 def parse_alphapose_output_file(
     input_path,
@@ -162,6 +183,7 @@ def parse_alphapose_output_file(
         frame_period=frame_period,
     )
     poses_2d.to_pickle(output_path)
+    return poses_2d
 
 def parse_poses_2d_raw(
     poses_2d_raw,
@@ -267,6 +289,7 @@ def generate_parsed_alphapose_output_filename(
     start,
     end,
     video_duration=datetime.timedelta(seconds=10),
+    suffix=None,
 ):
     output_start, output_end = pose_labelbox.utils.generate_output_period(
         start=start,
@@ -275,5 +298,178 @@ def generate_parsed_alphapose_output_filename(
     )
     output_start_string = output_start.strftime('%Y%m%d_%H%M%S')
     output_end_string = output_end.strftime('%Y%m%d_%H%M%S')
-    parsed_alphapose_output_filename = f'poses_2d_{camera_id}_{output_start_string}_{output_end_string}.pkl'
+    if suffix is None:
+        parsed_alphapose_output_filename = f'poses_2d_{camera_id}_{output_start_string}_{output_end_string}.pkl'
+    else:
+        parsed_alphapose_output_filename = f'poses_2d_{camera_id}_{output_start_string}_{output_end_string}_{suffix}.pkl'
     return parsed_alphapose_output_filename
+
+def merge_detection_chunk_outputs(
+    chunk_output_paths,
+    output_path,
+    link_pose_tracks=True,
+    boundary_min_iou=0.5,
+):
+    # AlphaPose numbers pose tracks from scratch in every run, so track labels
+    # are always made unique across chunks. If link_pose_tracks is set, tracks
+    # whose boxes overlap across a chunk boundary are also given the label of
+    # the track they continue
+    output_path = pathlib.Path(output_path)
+    merged_poses_2d_raw = list()
+    previous_boundary_poses = list()
+    next_pose_track_label = 0
+    num_linked_pose_tracks = 0
+    for chunk_output_path in chunk_output_paths:
+        with open(chunk_output_path, 'r') as fp:
+            poses_2d_raw = json.load(fp)
+        if len(poses_2d_raw) == 0:
+            # Tracks can't continue across a chunk with no detections
+            previous_boundary_poses = list()
+            continue
+        if link_pose_tracks:
+            first_image_id = min(pose_2d_raw['image_id'] for pose_2d_raw in poses_2d_raw)
+            boundary_poses = [pose_2d_raw for pose_2d_raw in poses_2d_raw if pose_2d_raw['image_id'] == first_image_id]
+            pose_track_label_map = match_boundary_pose_tracks(
+                previous_poses_2d_raw=previous_boundary_poses,
+                next_poses_2d_raw=boundary_poses,
+                min_iou=boundary_min_iou,
+            )
+        else:
+            pose_track_label_map = dict()
+        num_linked_pose_tracks += len(pose_track_label_map)
+        for pose_track_label in sorted(set(int(pose_2d_raw['idx']) for pose_2d_raw in poses_2d_raw)):
+            if pose_track_label not in pose_track_label_map:
+                pose_track_label_map[pose_track_label] = next_pose_track_label
+                next_pose_track_label += 1
+        for pose_2d_raw in poses_2d_raw:
+            pose_2d_raw['idx'] = pose_track_label_map[int(pose_2d_raw['idx'])]
+        merged_poses_2d_raw.extend(poses_2d_raw)
+        last_image_id = max(pose_2d_raw['image_id'] for pose_2d_raw in poses_2d_raw)
+        previous_boundary_poses = [pose_2d_raw for pose_2d_raw in poses_2d_raw if pose_2d_raw['image_id'] == last_image_id]
+    logger.info(f'Merged {len(chunk_output_paths)} detection chunks into {output_path}, linking {num_linked_pose_tracks} pose tracks across chunk boundaries')
+    pose_labelbox.metrics.increment_counter('pose_tracks_linked_across_chunks', num_linked_pose_tracks)
+    temporary_path = output_path.with_name(f'.{output_path.name}.{uuid.uuid4().hex}.tmp')
+    with open(temporary_path, 'w') as fp:
+        json.dump(merged_poses_2d_raw, fp)
+    os.replace(temporary_path, output_path)
+    return merged_poses_2d_raw
+
+def match_boundary_pose_tracks(
+    previous_poses_2d_raw,
+    next_poses_2d_raw,
+    min_iou=0.5,
+):
+    # Greedy one-to-one matching by decreasing box IoU between the last frame
+    # of one chunk and the first frame of the next. Returns a map from track
+    # labels in the next chunk to (already relabelled) labels in the previous
+    if len(previous_poses_2d_raw) == 0 or len(next_poses_2d_raw) == 0:
+        return dict()
+    previous_boxes = np.array([pose_2d_raw['box'] for pose_2d_raw in previous_poses_2d_raw], dtype=float)
+    next_boxes = np.array([pose_2d_raw['box'] for pose_2d_raw in next_poses_2d_raw], dtype=float)
+    previous_corners = np.stack([previous_boxes[:, :2], previous_boxes[:, :2] + previous_boxes[:, 2:]], axis=1)
+    next_corners = np.stack([next_boxes[:, :2], next_boxes[:, :2] + next_boxes[:, 2:]], axis=1)
+    previous_indices, next_indices = np.meshgrid(
+        np.arange(len(previous_corners)),
+        np.arange(len(next_corners)),
+        indexing='ij',
+    )
+    previous_indices = previous_indices.ravel()
+    next_indices = next_indices.ravel()
+    ious = pose_labelbox.tracks.compute_box_ious(
+        previous_corners[previous_indices],
+        next_corners[next_indices],
+    )
+    pose_track_label_map = dict()
+    matched_previous_indices = set()
+    for pair_index in np.argsort(-ious, kind='stable'):
+        if ious[pair_index] < min_iou:
+            break
+        previous_index = int(previous_indices[pair_index])
+        next_pose_track_label = int(next_poses_2d_raw[next_indices[pair_index]]['idx'])
+        if previous_index in matched_previous_indices or next_pose_track_label in pose_track_label_map:
+            continue
+        matched_previous_indices.add(previous_index)
+        pose_track_label_map[next_pose_track_label] = int(previous_poses_2d_raw[previous_index]['idx'])
+    return pose_track_label_map
+
+def generate_detection_chunk_id(
+    chunk_start,
+    chunk_end,
+):
+    chunk_start_string = chunk_start.strftime('%Y%m%d_%H%M%S')
+    chunk_end_string = chunk_end.strftime('%Y%m%d_%H%M%S')
+    return f'{chunk_start_string}_{chunk_end_string}'
+
+def generate_detection_chunk_directory_path(
+    alphapose_output_directory_path,
+    chunk_start,
+    chunk_end,
+):
+    detection_chunk_directory_path = (
+        pathlib.Path(alphapose_output_directory_path) /
+        'chunks' /
+        generate_detection_chunk_id(chunk_start, chunk_end)
+    )
+    return detection_chunk_directory_path
+
+def is_detection_chunk_complete(
+    chunk_output_directory_path,
+    alphapose_output_filename='alphapose-results.json',
+):
+    chunk_output_directory_path = pathlib.Path(chunk_output_directory_path)
+    return (
+        (chunk_output_directory_path / DETECTION_CHUNK_MARKER_FILENAME).is_file() and
+        (chunk_output_directory_path / alphapose_output_filename).is_file()
+    )
+
+def write_detection_chunk_marker(
+    chunk_output_directory_path,
+    chunk_start,
+    chunk_end,
+):
+    marker_path = pathlib.Path(chunk_output_directory_path) / DETECTION_CHUNK_MARKER_FILENAME
+    with open(marker_path, 'w') as fp:
+        json.dump({
+            'chunk_start': chunk_start.isoformat(),
+            'chunk_end': chunk_end.isoformat(),
+            'completed': datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+        }, fp)
+
+def read_failed_detection_chunks(alphapose_output_directory_path):
+    failed_detection_chunks_path = pathlib.Path(alphapose_output_directory_path) / FAILED_DETECTION_CHUNKS_FILENAME
+    if not failed_detection_chunks_path.is_file():
+        return dict()
+    with open(failed_detection_chunks_path, 'r') as fp:
+        return json.load(fp)
+
+def update_failed_detection_chunks(
+    alphapose_output_directory_path,
+    chunk_start,
+    chunk_end,
+    returncode,
+):
+    # Failed chunks are keyed by chunk ID; a chunk that later succeeds is
+    # removed from the record
+    alphapose_output_directory_path = pathlib.Path(alphapose_output_directory_path)
+    failed_detection_chunks = read_failed_detection_chunks(alphapose_output_directory_path)
+    chunk_id = generate_detection_chunk_id(chunk_start, chunk_end)
+    if returncode == 0:
+        if chunk_id not in failed_detection_chunks:
+            return failed_detection_chunks
+        del failed_detection_chunks[chunk_id]
+    else:
+        num_failures = failed_detection_chunks.get(chunk_id, dict()).get('num_failures', 0)
+        failed_detection_chunks[chunk_id] = {
+            'chunk_start': chunk_start.isoformat(),
+            'chunk_end': chunk_end.isoformat(),
+            'returncode': returncode,
+            'num_failures': num_failures + 1,
+            'failed': datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+        }
+    alphapose_output_directory_path.mkdir(parents=True, exist_ok=True)
+    failed_detection_chunks_path = alphapose_output_directory_path / FAILED_DETECTION_CHUNKS_FILENAME
+    temporary_path = failed_detection_chunks_path.with_name(f'.{failed_detection_chunks_path.name}.{uuid.uuid4().hex}.tmp')
+    with open(temporary_path, 'w') as fp:
+        json.dump(failed_detection_chunks, fp, indent=2)
+    os.replace(temporary_path, failed_detection_chunks_path)
+    return failed_detection_chunks
@@ -0,0 +1,237 @@
+import pose_labelbox.metrics
+import contextlib
+import threading
+import datetime
+import pathlib
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Videos and frames are regenerated on a miss (downloaded or extracted
+# again), so they can be evicted. Overlay images and overlay videos can't be
+# regenerated by the stages that read them, so they count toward the budget
+# but are never evicted
+DEFAULT_CACHE_DIRECTORIES = [
+    '/data/videos',
+    '/data/frames',
+]
+DEFAULT_RETAINED_DIRECTORIES = [
+    '/data/bounding_box_overlays',
+    '/data/bounding_box_overlay_videos',
+]
+
+class CacheManager:
+    def __init__(
+        self,
+        cache_directories=None,
+        retained_directories=None,
+        max_bytes=None,
+        target_fraction=0.9,
+        min_idle_time=datetime.timedelta(minutes=30),
+    ):
+        # Retained directories default to the pipeline's only along with the
+        # default cache directories
+        if retained_directories is None:
+            retained_directories = DEFAULT_RETAINED_DIRECTORIES if cache_directories is None else list()
+        if cache_directories is None:
+            cache_directories = DEFAULT_CACHE_DIRECTORIES
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError('Cache size budget must be positive')
+        if target_fraction <= 0 or target_fraction > 1:
+            raise ValueError('Target fraction must be greater than 0 and no greater than 1')
+        self.cache_directory_paths = [pathlib.Path(cache_directory).absolute() for cache_directory in cache_directories]
+        self.retained_directory_paths = [pathlib.Path(retained_directory).absolute() for retained_directory in retained_directories]
+        if len(set(self.cache_directory_paths) & set(self.retained_directory_paths)) > 0:
+            raise ValueError('Directories cannot be both evictable and retained')
+        self.max_bytes = max_bytes
+        self.target_fraction = target_fraction
+        self.min_idle_time = min_idle_time
+        self.protected_paths = dict()
+        self.lock = threading.Lock()
+        # Running index of file path -> (last used, size, evictable), built by
+        # one scan on first use and then kept up to date by touch() and by
+        # evictions, so enforcing the budget doesn't rescan every tree
+        self.index = None
+        self.indexed_bytes = 0
+
+    @contextlib.contextmanager
+    def protect(self, paths):
+        # Files at or under a protected path are never evicted while the
+        # context is active. Protection is counted, so nested or concurrent
+        # protection of the same path is released only when the last user exits
+        paths = [pathlib.Path(path).absolute() for path in paths]
+        with self.lock:
+            for path in paths:
+                self.protected_paths[path] = self.protected_paths.get(path, 0) + 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                for path in paths:
+                    self.protected_paths[path] -= 1
+                    if self.protected_paths[path] == 0:
+                        del self.protected_paths[path]
+
+    def is_protected(self, path):
+        path = pathlib.Path(path).absolute()
+        with self.lock:
+            if len(self.protected_paths) == 0:
+                return False
+            if path in self.protected_paths:
+                return True
+            return any(parent in self.protected_paths for parent in path.parents)
+
+    def is_evictable(self, path):
+        path = pathlib.Path(path).absolute()
+        return any(
+            cache_directory_path in path.parents
+            for cache_directory_path in self.cache_directory_paths
+        )
+
+    def touch(self, paths):
+        # Last use is tracked through access times, which are updated
+        # explicitly because many filesystems are mounted with relatime or
+        # noatime. Modification times are left alone. Stages touch the files
+        # they write, which also adds them to the size index
+        now = time.time()
+        for path in paths:
+            path = pathlib.Path(path)
+            if path.is_dir():
+                file_paths = iterate_file_paths(path)
+            else:
+                file_paths = [path]
+            for file_path in file_paths:
+                try:
+                    stat_result = os.stat(file_path)
+                    os.utime(file_path, (now, stat_result.st_mtime))
+                except FileNotFoundError:
+                    self.update_index(file_path, None)
+                    continue
+                self.update_index(file_path, (max(now, stat_result.st_mtime), stat_result.st_size))
+
+    def is_retained(self, path):
+        path = pathlib.Path(path).absolute()
+        return any(
+            retained_directory_path in path.parents
+            for retained_directory_path in self.retained_directory_paths
+        )
+
+    def update_index(self, file_path, entry):
+        # Entry is (last used, size), or None for a file that no longer exists
+        file_path = os.path.abspath(file_path)
+        evictable = self.is_evictable(file_path)
+        if entry is not None and not evictable and not self.is_retained(file_path):
+            return
+        with self.lock:
+            if self.index is None:
+                return
+            previous_entry = self.index.pop(file_path, None)
+            if previous_entry is not None:
+                self.indexed_bytes -= previous_entry[1]
+            if entry is not None:
+                self.index[file_path] = (entry[0], entry[1], evictable)
+                self.indexed_bytes += entry[1]
+
+    def scan(self):
+        entries = list()
+        for directory_path in self.cache_directory_paths + self.retained_directory_paths:
+            for file_path in iterate_file_paths(directory_path):
+                try:
+                    stat_result = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((
+                    max(stat_result.st_atime, stat_result.st_mtime),
+                    stat_result.st_size,
+                    os.path.abspath(file_path),
+                ))
+        return entries
+
+    def refresh(self):
+        # Rebuilds the size index from disk, e.g. after files were added or
+        # removed without going through touch()
+        entries = self.scan()
+        index = {
+            file_path: (last_used, size, self.is_evictable(file_path))
+            for last_used, size, file_path in entries
+        }
+        with self.lock:
+            self.index = index
+            self.indexed_bytes = sum(size for _, size, _ in index.values())
+
+    def usage_bytes(self):
+        if self.index is None:
+            self.refresh()
+        return self.indexed_bytes
+
+    def enforce_budget(self):
+        if self.max_bytes is None:
+            return 0
+        usage_bytes = self.usage_bytes()
+        if usage_bytes <= self.max_bytes:
+            return 0
+        target_bytes = self.max_bytes*self.target_fraction
+        logger.info(f'Cache usage {usage_bytes} bytes exceeds budget of {self.max_bytes} bytes. Evicting least recently used files')
+        latest_eviction_time = time.time() - self.min_idle_time.total_seconds()
+        with self.lock:
+            entries = sorted(
+                (last_used, size, file_path)
+                for file_path, (last_used, size, evictable) in self.index.items()
+                if evictable
+            )
+        evicted_bytes = 0
+        num_evicted_files = 0
+        for last_used, size, file_path in entries:
+            if usage_bytes <= target_bytes or last_used > latest_eviction_time:
+                break
+            if self.is_protected(file_path):
+                continue
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                self.update_index(file_path, None)
+                usage_bytes -= size
+                continue
+            except OSError as error:
+                logger.warning(f'Failed to evict {file_path}: {error}')
+                continue
+            self.update_index(file_path, None)
+            usage_bytes -= size
+            evicted_bytes += size
+            num_evicted_files += 1
+            self.remove_empty_directories(pathlib.Path(file_path).parent)
+        logger.info(f'Evicted {num_evicted_files} files ({evicted_bytes} bytes) from cache')
+        pose_labelbox.metrics.increment_counter('cache_files_evicted', num_evicted_files)
+        pose_labelbox.metrics.increment_counter('cache_bytes_evicted', evicted_bytes)
+        if usage_bytes > self.max_bytes:
+            logger.warning(f'Cache usage {usage_bytes} bytes still exceeds budget of {self.max_bytes} bytes. Remaining files are retained, protected, or in use')
+        return evicted_bytes
+
+    def remove_empty_directories(self, directory_path):
+        while directory_path not in self.cache_directory_paths and any(
+            cache_directory_path in directory_path.parents
+            for cache_directory_path in self.cache_directory_paths
+        ):
+            try:
+                os.rmdir(directory_path)
+            except OSError:
+                return
+            directory_path = directory_path.parent
+
+def iterate_file_paths(directory_path):
+    try:
+        directory_entries = list(os.scandir(directory_path))
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for directory_entry in directory_entries:
+        if directory_entry.is_dir(follow_symlinks=False):
+            yield from iterate_file_paths(directory_entry.path)
+        elif directory_entry.is_file(follow_symlinks=False):
+            yield directory_entry.path
+
+def protect_paths(cache_manager, paths):
+    if cache_manager is None:
+        return contextlib.nullcontext()
+    return cache_manager.protect(paths)
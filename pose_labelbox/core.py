@@ -1,20 +1,30 @@
 import pose_labelbox.process_video
 import pose_labelbox.alphapose
 import pose_labelbox.utils
-import video_io
-import honeycomb_io
-import pandas as pd
-import tqdm
-import tqdm.notebook
+import pose_labelbox.session
+import pose_labelbox.metrics
+import pose_labelbox.profiling
+import pose_labelbox.cache
+import pose_labelbox.aio
 import datetime
 import tempfile
 import itertools
+import functools
+import time
+import asyncio
 import pathlib
 import uuid
+import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+video_io = pose_labelbox.utils.lazy_import('video_io')
+honeycomb_io = pose_labelbox.utils.lazy_import('honeycomb_io')
+np = pose_labelbox.utils.lazy_import('numpy')
+pd = pose_labelbox.utils.lazy_import('pandas')
+tqdm = pose_labelbox.utils.lazy_import('tqdm')
+
 def download_videos(
     start,
     end,
@@ -26,23 +36,26 @@ def download_videos(
     camera_names=None,
     video_duration=datetime.timedelta(seconds=10),
     client=None,
-    uri=video_io.config.HONEYCOMB_URI,
-    token_uri=video_io.config.HONEYCOMB_TOKEN_URI,
-    audience=video_io.config.HONEYCOMB_AUDIENCE,
-    client_id=video_io.config.HONEYCOMB_CLIENT_ID,
-    client_secret=video_io.config.HONEYCOMB_CLIENT_SECRET,
-    video_storage_url=video_io.config.VIDEO_STORAGE_URL,
-    video_storage_auth_domain=video_io.config.VIDEO_STORAGE_AUTH_DOMAIN,
-    video_storage_audience=video_io.config.VIDEO_STORAGE_AUDIENCE,
-    video_storage_client_id=video_io.config.VIDEO_STORAGE_CLIENT_ID,
-    video_storage_client_secret=video_io.config.VIDEO_STORAGE_CLIENT_SECRET,
-    video_client: video_io.client.VideoStorageClient=None,
+    uri=None,
+    token_uri=None,
+    audience=None,
+    client_id=None,
+    client_secret=None,
+    session=None,
+    video_storage_url=None,
+    video_storage_auth_domain=None,
+    video_storage_audience=None,
+    video_storage_client_id=None,
+    video_storage_client_secret=None,
+    video_client: 'video_io.client.VideoStorageClient'=None,
     local_video_directory="/data/videos",
     video_filename_extension=None,
-    max_workers=video_io.config.MAX_DOWNLOAD_WORKERS,
+    max_workers=None,
+    cache_manager=None,
     overwrite: bool = False,
+    max_concurrent_requests=pose_labelbox.aio.DEFAULT_MAX_CONCURRENT_REQUESTS,
 ):
-    target_camera_ids = generate_target_camera_ids(
+    return pose_labelbox.aio.run_sync(download_videos_async(
         start=start,
         end=end,
         environment_id=environment_id,
@@ -51,72 +64,185 @@ def download_videos(
         camera_part_numbers=camera_part_numbers,
         camera_serial_numbers=camera_serial_numbers,
         camera_names=camera_names,
-        client=client,
-        uri=uri,
-        token_uri=token_uri,
-        audience=audience,
-        client_id=client_id,
-        client_secret=client_secret,      
-    )
-    target_video_starts = generate_target_video_starts(
-        start=start,
-        end=end,
         video_duration=video_duration,
-    )
-    target_videos = list(itertools.product(target_camera_ids, target_video_starts))
-    logger.info(f'Searching video service for {len(target_videos)} target videos')
-    video_metadata = video_io.fetch_video_metadata(
-        start=start,
-        end=end,
-        video_timestamps=None,
-        camera_assignment_ids=None,
-        environment_id=environment_id,
-        environment_name=environment_name,
-        camera_device_types=None,
-        camera_device_ids=camera_ids,
-        camera_part_numbers=camera_part_numbers,
-        camera_names=camera_names,
-        camera_serial_numbers=camera_serial_numbers,
         client=client,
         uri=uri,
         token_uri=token_uri,
         audience=audience,
         client_id=client_id,
         client_secret=client_secret,
+        session=session,
         video_storage_url=video_storage_url,
         video_storage_auth_domain=video_storage_auth_domain,
         video_storage_audience=video_storage_audience,
         video_storage_client_id=video_storage_client_id,
         video_storage_client_secret=video_storage_client_secret,
         video_client=video_client,
-    )
-    found_videos = list()
-    for video_metadatum in video_metadata:
-        found_videos.append((
-            video_metadatum['device_id'],
-            pose_labelbox.utils.convert_to_datetime_utc(video_metadatum['video_timestamp'])
-        ))
-    logger.info(f'{len(found_videos)} videos found in video service')
-    missing_videos = set(target_videos).difference(found_videos)
-    if len(missing_videos) > 0:
-        raise ValueError(f'{len(missing_videos)} videos not found: {missing_videos}')
-    extra_videos = set(found_videos).difference(target_videos)
-    if len(extra_videos) > 0:
-        raise ValueError(f'{len(extra_videos)} videos found that are not in target video set: {extra_videos}')
-    logger.info(f'Downloading {len(video_metadata)} videos')
-    video_metadata_with_local_paths = video_io.download_video_files(
-        video_metadata=video_metadata,
         local_video_directory=local_video_directory,
         video_filename_extension=video_filename_extension,
         max_workers=max_workers,
-        video_storage_url=video_storage_url,
-        video_storage_auth_domain=video_storage_auth_domain,
-        video_storage_audience=video_storage_audience,
-        video_storage_client_id=video_storage_client_id,
-        video_storage_client_secret=video_storage_client_secret,
+        cache_manager=cache_manager,
         overwrite=overwrite,
-        video_client=video_client,
-    )
+        max_concurrent_requests=max_concurrent_requests,
+    ))
+
+async def download_videos_async(
+    start,
+    end,
+    environment_id=None,
+    environment_name=None,
+    camera_ids=None,
+    camera_part_numbers=None,
+    camera_serial_numbers=None,
+    camera_names=None,
+    video_duration=datetime.timedelta(seconds=10),
+    client=None,
+    uri=None,
+    token_uri=None,
+    audience=None,
+    client_id=None,
+    client_secret=None,
+    session=None,
+    video_storage_url=None,
+    video_storage_auth_domain=None,
+    video_storage_audience=None,
+    video_storage_client_id=None,
+    video_storage_client_secret=None,
+    video_client: 'video_io.client.VideoStorageClient'=None,
+    local_video_directory="/data/videos",
+    video_filename_extension=None,
+    max_workers=None,
+    cache_manager=None,
+    overwrite: bool = False,
+    max_concurrent_requests=pose_labelbox.aio.DEFAULT_MAX_CONCURRENT_REQUESTS,
+    request_pool=None,
+):
+    # Video metadata is fetched for all cameras concurrently, and videos are
+    # downloaded one per request, so at most max_concurrent_requests (and at
+    # most max_workers) downloads are in flight at once
+    stage_start_time = time.perf_counter()
+    # Defaults are resolved here rather than in the signature so that importing
+    # this module doesn't import video_io
+    uri = uri if uri is not None else video_io.config.HONEYCOMB_URI
+    token_uri = token_uri if token_uri is not None else video_io.config.HONEYCOMB_TOKEN_URI
+    audience = audience if audience is not None else video_io.config.HONEYCOMB_AUDIENCE
+    client_id = client_id if client_id is not None else video_io.config.HONEYCOMB_CLIENT_ID
+    client_secret = client_secret if client_secret is not None else video_io.config.HONEYCOMB_CLIENT_SECRET
+    video_storage_url = video_storage_url if video_storage_url is not None else video_io.config.VIDEO_STORAGE_URL
+    video_storage_auth_domain = video_storage_auth_domain if video_storage_auth_domain is not None else video_io.config.VIDEO_STORAGE_AUTH_DOMAIN
+    video_storage_audience = video_storage_audience if video_storage_audience is not None else video_io.config.VIDEO_STORAGE_AUDIENCE
+    video_storage_client_id = video_storage_client_id if video_storage_client_id is not None else video_io.config.VIDEO_STORAGE_CLIENT_ID
+    video_storage_client_secret = video_storage_client_secret if video_storage_client_secret is not None else video_io.config.VIDEO_STORAGE_CLIENT_SECRET
+    if max_workers is None:
+        # The configured default can come from the environment as a string,
+        # and is zero on a single-CPU machine
+        max_workers = max(int(video_io.config.MAX_DOWNLOAD_WORKERS), 1)
+    elif max_workers < 1:
+        raise ValueError('Number of download workers must be at least 1')
+    async with pose_labelbox.aio.open_request_pool(request_pool=request_pool, max_concurrent_requests=max_concurrent_requests) as request_pool:
+        # Creating session clients fetches tokens, so it happens off the loop
+        client = await request_pool.run(pose_labelbox.session.resolve_honeycomb_client, client=client, session=session)
+        video_client = await request_pool.run(pose_labelbox.session.resolve_video_client, video_client=video_client, session=session)
+        target_camera_ids = await request_pool.run(
+            generate_target_camera_ids,
+            start=start,
+            end=end,
+            environment_id=environment_id,
+            environment_name=environment_name,
+            camera_ids=camera_ids,
+            camera_part_numbers=camera_part_numbers,
+            camera_serial_numbers=camera_serial_numbers,
+            camera_names=camera_names,
+            client=client,
+            uri=uri,
+            token_uri=token_uri,
+            audience=audience,
+            client_id=client_id,
+            client_secret=client_secret,
+        )
+        target_video_starts = generate_target_video_starts(
+            start=start,
+            end=end,
+            video_duration=video_duration,
+        )
+        target_videos = list(itertools.product(target_camera_ids, target_video_starts))
+        logger.info(f'Searching video service for {len(target_videos)} target videos')
+        camera_video_metadata = await asyncio.gather(*[
+            request_pool.run(
+                _profile_camera_request,
+                'download_videos',
+                camera_id,
+                video_io.fetch_video_metadata,
+                request_name='fetch_video_metadata',
+                start=start,
+                end=end,
+                video_timestamps=None,
+                camera_assignment_ids=None,
+                environment_id=environment_id,
+                environment_name=environment_name,
+                camera_device_types=None,
+                camera_device_ids=[camera_id],
+                camera_part_numbers=None,
+                camera_names=None,
+                camera_serial_numbers=None,
+                client=client,
+                uri=uri,
+                token_uri=token_uri,
+                audience=audience,
+                client_id=client_id,
+                client_secret=client_secret,
+                video_storage_url=video_storage_url,
+                video_storage_auth_domain=video_storage_auth_domain,
+                video_storage_audience=video_storage_audience,
+                video_storage_client_id=video_storage_client_id,
+                video_storage_client_secret=video_storage_client_secret,
+                video_client=video_client,
+            )
+            for camera_id in target_camera_ids
+        ])
+        video_metadata = [video_metadatum for video_metadata in camera_video_metadata for video_metadatum in video_metadata]
+        found_videos = list()
+        for video_metadatum in video_metadata:
+            found_videos.append((
+                video_metadatum['device_id'],
+                pose_labelbox.utils.convert_to_datetime_utc(video_metadatum['video_timestamp'])
+            ))
+        logger.info(f'{len(found_videos)} videos found in video service')
+        missing_videos = set(target_videos).difference(found_videos)
+        if len(missing_videos) > 0:
+            raise ValueError(f'{len(missing_videos)} videos not found: {missing_videos}')
+        extra_videos = set(found_videos).difference(target_videos)
+        if len(extra_videos) > 0:
+            raise ValueError(f'{len(extra_videos)} videos found that are not in target video set: {extra_videos}')
+        logger.info(f'Downloading {len(video_metadata)} videos')
+        download_semaphore = asyncio.Semaphore(max_workers)
+
+        async def download_video_file(video_metadatum):
+            async with download_semaphore:
+                return await request_pool.run(
+                    _profile_camera_request,
+                    'download_videos',
+                    video_metadatum['device_id'],
+                    video_io.download_video_files,
+                    request_name='download_video_files',
+                    video_metadata=[video_metadatum],
+                    local_video_directory=local_video_directory,
+                    video_filename_extension=video_filename_extension,
+                    max_workers=1,
+                    video_storage_url=video_storage_url,
+                    video_storage_auth_domain=video_storage_auth_domain,
+                    video_storage_audience=video_storage_audience,
+                    video_storage_client_id=video_storage_client_id,
+                    video_storage_client_secret=video_storage_client_secret,
+                    overwrite=overwrite,
+                    video_client=video_client,
+                )
+
+        video_metadata_with_local_paths_list = await asyncio.gather(*[
+            download_video_file(video_metadatum)
+            for video_metadatum in video_metadata
+        ])
+    video_metadata_with_local_paths = [video_metadatum for video_metadata in video_metadata_with_local_paths_list for video_metadatum in video_metadata]
     video_metadata_df = (
         pd.DataFrame(video_metadata_with_local_paths)
         .rename(columns={
@@ -140,6 +266,15 @@ def download_videos(
         ])
         .set_index('data_id')
     )
+    for camera_id, video_local_path in video_metadata_df[['camera_id', 'video_local_path']].itertuples(index=False):
+        pose_labelbox.metrics.increment_counter('videos_downloaded', camera_id=camera_id)
+        pose_labelbox.metrics.record_file_bytes('video_bytes_downloaded', video_local_path, camera_id=camera_id)
+    if cache_manager is not None:
+        video_local_paths = video_metadata_df['video_local_path'].tolist()
+        cache_manager.touch(video_local_paths)
+        with cache_manager.protect(video_local_paths):
+            cache_manager.enforce_budget()
+    pose_labelbox.metrics.record_timing('download_videos', time.perf_counter() - stage_start_time)
     return video_metadata_df
 
 def extract_frames(
@@ -158,16 +293,21 @@ def extract_frames(
     audience=None,
     client_id=None,
     client_secret=None,
+    session=None,
     frames_per_video=100,
     frames_per_second=10,
     local_video_directory="/data/videos",
     local_frames_directory="/data/frames",
     video_filename_extension='mp4',
     frame_filename_extension='png',
+    extraction_batch_size=None,
+    cache_manager=None,
     overwrite=False,
     progress_bar=False,
     notebook=False,
 ):
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
+    stage_start_time = time.perf_counter()
     target_camera_ids = generate_target_camera_ids(
         start=start,
         end=end,
@@ -192,6 +332,7 @@ def extract_frames(
     environment_id = honeycomb_io.fetch_environment_id(
         environment_id=environment_id,
         environment_name=environment_name,
+        client=client,
     )
     if progress_bar:
         if notebook:
@@ -200,43 +341,112 @@ def extract_frames(
             video_iterator = tqdm.tqdm(list(itertools.product(target_camera_ids, target_video_starts)))
     else:
         video_iterator = list(itertools.product(target_camera_ids, target_video_starts))
-    for camera_id, video_start in video_iterator:
-        video_path = generate_video_path(
-            environment_id=environment_id,
-            camera_id=camera_id,
-            video_start=video_start,
-            local_video_directory=local_video_directory,
-            video_filename_extension=video_filename_extension,
-        )
-        frame_directory_path = generate_frame_directory_path(
-            environment_id=environment_id,
-            camera_id=camera_id,
-            video_start=video_start,
-            local_frames_directory=local_frames_directory,
-        )
-        frame_filenames = generate_frame_filenames(
-            environment_id=environment_id,
-            camera_id=camera_id,
-            video_start=video_start,
-            frames_per_video=frames_per_video,
-            frame_filename_extension=frame_filename_extension,
-        )
-        if frame_directory_path.is_dir():
-            existing_filenames = {path.name for path in frame_directory_path.iterdir()}
-            if set(frame_filenames).issubset(existing_filenames) and not overwrite:
-                logger.info(f'Frames for {video_path} already extracted.')
-                continue
-        ffmpeg_frame_identifier = generate_ffmpeg_frame_identifier(
-            environment_id=environment_id,
-            camera_id=camera_id,
-            video_start=video_start,
-        )
-        pose_labelbox.process_video.extract_video_frames(
-            video_path=video_path,
-            frame_directory_path=frame_directory_path,
-            ffmpeg_frame_identifier=ffmpeg_frame_identifier,
-            frames_per_second=frames_per_second,
+    pending_videos = list()
+    used_paths = list()
+    # Videos are ordered by camera, so each camera's share of the work is
+    # profiled on its own
+    for camera_id, camera_videos in itertools.groupby(video_iterator, key=lambda video: video[0]):
+        with pose_labelbox.profiling.profile_stage('extract_frames', camera_id=camera_id):
+            for _, video_start in camera_videos:
+                video_path = generate_video_path(
+                    environment_id=environment_id,
+                    camera_id=camera_id,
+                    video_start=video_start,
+                    local_video_directory=local_video_directory,
+                    video_filename_extension=video_filename_extension,
+                )
+                frame_directory_path = generate_frame_directory_path(
+                    environment_id=environment_id,
+                    camera_id=camera_id,
+                    video_start=video_start,
+                    local_frames_directory=local_frames_directory,
+                )
+                frame_filenames = generate_frame_filenames(
+                    environment_id=environment_id,
+                    camera_id=camera_id,
+                    video_start=video_start,
+                    frames_per_video=frames_per_video,
+                    frame_filename_extension=frame_filename_extension,
+                )
+                used_paths.append(frame_directory_path)
+                if frame_directory_path.is_dir():
+                    existing_filenames = {path.name for path in frame_directory_path.iterdir()}
+                    if set(frame_filenames).issubset(existing_filenames) and not overwrite:
+                        logger.info(f'Frames for {video_path} already extracted.')
+                        pose_labelbox.metrics.increment_counter('videos_already_extracted', camera_id=camera_id)
+                        continue
+                if cache_manager is not None:
+                    used_paths.append(video_path)
+                    if not video_path.is_file():
+                        # The video was evicted from the local cache (or never
+                        # downloaded), so fetch it again
+                        logger.info(f'Video {video_path} not found locally. Downloading')
+                        download_videos(
+                            start=video_start,
+                            end=video_start + video_duration,
+                            environment_id=environment_id,
+                            camera_ids=[camera_id],
+                            video_duration=video_duration,
+                            client=client,
+                            uri=uri,
+                            token_uri=token_uri,
+                            audience=audience,
+                            client_id=client_id,
+                            client_secret=client_secret,
+                            session=session,
+                            local_video_directory=local_video_directory,
+                            video_filename_extension=video_filename_extension,
+                        )
+                ffmpeg_frame_identifier = generate_ffmpeg_frame_identifier(
+                    environment_id=environment_id,
+                    camera_id=camera_id,
+                    video_start=video_start,
+                    frame_filename_extension=frame_filename_extension,
+                )
+                if extraction_batch_size is not None:
+                    pending_videos.append({
+                        'camera_id': camera_id,
+                        'video_start': video_start,
+                        'video_path': video_path,
+                        'frame_directory_path': frame_directory_path,
+                        'ffmpeg_frame_identifier': ffmpeg_frame_identifier,
+                    })
+                    continue
+                pose_labelbox.process_video.extract_video_frames(
+                    video_path=video_path,
+                    frame_directory_path=frame_directory_path,
+                    ffmpeg_frame_identifier=ffmpeg_frame_identifier,
+                    frames_per_second=frames_per_second,
+                    camera_id=camera_id,
+                )
+                pose_labelbox.metrics.increment_counter('videos_extracted', camera_id=camera_id)
+                pose_labelbox.metrics.increment_counter('frames_extracted', frames_per_video, camera_id=camera_id)
+    if extraction_batch_size is not None:
+        extraction_batches = generate_extraction_batches(
+            videos=pending_videos,
+            extraction_batch_size=extraction_batch_size,
+            video_duration=video_duration,
         )
+        logger.info(f'Extracting frames from {len(pending_videos)} videos in {len(extraction_batches)} batches')
+        for extraction_batch in extraction_batches:
+            camera_id = extraction_batch[0]['camera_id']
+            with pose_labelbox.profiling.profile_stage('extract_frames', camera_id=camera_id):
+                pose_labelbox.process_video.extract_video_frames_batch(
+                    video_paths=[video['video_path'] for video in extraction_batch],
+                    frame_directory_paths=[video['frame_directory_path'] for video in extraction_batch],
+                    ffmpeg_frame_identifiers=[video['ffmpeg_frame_identifier'] for video in extraction_batch],
+                    frames_per_video=frames_per_video,
+                    frames_per_second=frames_per_second,
+                    video_duration=video_duration,
+                    camera_id=camera_id,
+                )
+            pose_labelbox.metrics.increment_counter('videos_extracted', len(extraction_batch), camera_id=camera_id)
+            pose_labelbox.metrics.increment_counter('frames_extracted', len(extraction_batch)*frames_per_video, camera_id=camera_id)
+    if cache_manager is not None:
+        cache_manager.touch(used_paths)
+        with cache_manager.protect(used_paths):
+            cache_manager.enforce_budget()
+    pose_labelbox.metrics.record_timing('extract_frames', time.perf_counter() - stage_start_time)
 
 def run_pose_detection_2d(
     start,
@@ -255,6 +465,7 @@ def run_pose_detection_2d(
     audience=None,
     client_id=None,
     client_secret=None,
+    session=None,
     frames_per_video=100,
     local_frames_directory="/data/frames",
     frame_filename_extension='png',
@@ -271,7 +482,15 @@ def run_pose_detection_2d(
     format='coco',
     pose_tracking_reid=True,
     single_process=True,
+    local_video_directory="/data/videos",
+    video_filename_extension='mp4',
+    cache_manager=None,
+    chunk_duration=None,
+    boundary_min_iou=0.5,
+    failed_chunks_only=False,
 ):
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
+    stage_start_time = time.perf_counter()
     target_camera_ids = generate_target_camera_ids(
         start=start,
         end=end,
@@ -296,13 +515,197 @@ def run_pose_detection_2d(
     environment_id = honeycomb_io.fetch_environment_id(
         environment_id=environment_id,
         environment_name=environment_name,
+        client=client,
     )
     if inference_id is None:
         inference_id = str(uuid.uuid4())
+    if chunk_duration is not None and chunk_duration % video_duration != datetime.timedelta(0):
+        raise ValueError('Chunk duration must be a multiple of video duration')
     for camera_id in target_camera_ids:
-        logger.info(f'Generating image list for camera {camera_id}')
+        alphapose_output_directory_path = pose_labelbox.alphapose.generate_alphapose_output_directory_path(
+            inference_id=inference_id,
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+            alphapose_output_parent_directory=alphapose_output_parent_directory,
+        )
+        alphapose_output_file_path = alphapose_output_directory_path / alphapose_output_filename
+        if alphapose_output_file_path.is_file():
+            logger.info(f'AlphaPose output file {alphapose_output_file_path} already exists. Skipping.')
+            continue
+        with pose_labelbox.profiling.profile_stage('run_pose_detection_2d', camera_id=camera_id):
+            detection_chunks = generate_detection_chunks(
+                start=start,
+                end=end,
+                video_duration=video_duration,
+                chunk_duration=chunk_duration,
+            )
+            failed_detection_chunks = pose_labelbox.alphapose.read_failed_detection_chunks(alphapose_output_directory_path)
+            chunk_output_directory_paths = list()
+            for chunk_start, chunk_end in detection_chunks:
+                # Without chunking, the single chunk writes straight into the
+                # camera's output directory as before
+                if chunk_duration is None:
+                    chunk_output_directory_path = alphapose_output_directory_path
+                else:
+                    chunk_output_directory_path = pose_labelbox.alphapose.generate_detection_chunk_directory_path(
+                        alphapose_output_directory_path=alphapose_output_directory_path,
+                        chunk_start=chunk_start,
+                        chunk_end=chunk_end,
+                    )
+                chunk_output_directory_paths.append(chunk_output_directory_path)
+                if pose_labelbox.alphapose.is_detection_chunk_complete(chunk_output_directory_path, alphapose_output_filename):
+                    logger.info(f'Pose detection for camera {camera_id} from {chunk_start} to {chunk_end} already complete. Skipping.')
+                    pose_labelbox.metrics.increment_counter('detection_chunks_skipped', camera_id=camera_id)
+                    continue
+                chunk_id = pose_labelbox.alphapose.generate_detection_chunk_id(chunk_start, chunk_end)
+                if failed_chunks_only and chunk_id not in failed_detection_chunks:
+                    continue
+                returncode = run_pose_detection_2d_chunk(
+                    inference_id=inference_id,
+                    environment_id=environment_id,
+                    camera_id=camera_id,
+                    chunk_start=chunk_start,
+                    chunk_end=chunk_end,
+                    chunk_output_directory_path=chunk_output_directory_path,
+                    video_duration=video_duration,
+                    client=client,
+                    uri=uri,
+                    token_uri=token_uri,
+                    audience=audience,
+                    client_id=client_id,
+                    client_secret=client_secret,
+                    session=session,
+                    frames_per_video=frames_per_video,
+                    local_frames_directory=local_frames_directory,
+                    frame_filename_extension=frame_filename_extension,
+                    image_list_parent_directory=image_list_parent_directory,
+                    alphapose_output_filename=alphapose_output_filename,
+                    docker_image=docker_image,
+                    config_file=config_file,
+                    model_file=model_file,
+                    detector_name=detector_name,
+                    detector_batch_size_per_gpu=detector_batch_size_per_gpu,
+                    pose_batch_size_per_gpu=pose_batch_size_per_gpu,
+                    gpus=gpus,
+                    format=format,
+                    pose_tracking_reid=pose_tracking_reid,
+                    single_process=single_process,
+                    local_video_directory=local_video_directory,
+                    video_filename_extension=video_filename_extension,
+                    cache_manager=cache_manager,
+                )
+                if returncode == 0:
+                    pose_labelbox.alphapose.write_detection_chunk_marker(
+                        chunk_output_directory_path=chunk_output_directory_path,
+                        chunk_start=chunk_start,
+                        chunk_end=chunk_end,
+                    )
+                    pose_labelbox.alphapose.update_failed_detection_chunks(
+                        alphapose_output_directory_path=alphapose_output_directory_path,
+                        chunk_start=chunk_start,
+                        chunk_end=chunk_end,
+                        returncode=returncode,
+                    )
+                    pose_labelbox.metrics.increment_counter('detection_chunks_completed', camera_id=camera_id)
+                else:
+                    # A failed chunk is recorded for retry and the remaining
+                    # chunks still run; the next run picks up from here
+                    logger.error(f'Pose detection for camera {camera_id} from {chunk_start} to {chunk_end} failed with exit code {returncode}')
+                    pose_labelbox.alphapose.update_failed_detection_chunks(
+                        alphapose_output_directory_path=alphapose_output_directory_path,
+                        chunk_start=chunk_start,
+                        chunk_end=chunk_end,
+                        returncode=returncode,
+                    )
+                    pose_labelbox.metrics.increment_counter('detection_chunks_failed', camera_id=camera_id)
+            if chunk_duration is None:
+                continue
+            if not all(
+                pose_labelbox.alphapose.is_detection_chunk_complete(chunk_output_directory_path, alphapose_output_filename)
+                for chunk_output_directory_path in chunk_output_directory_paths
+            ):
+                logger.warning(f'Pose detection for camera {camera_id} is incomplete. Not merging chunk outputs')
+                continue
+            pose_labelbox.alphapose.merge_detection_chunk_outputs(
+                chunk_output_paths=[
+                    chunk_output_directory_path / alphapose_output_filename
+                    for chunk_output_directory_path in chunk_output_directory_paths
+                ],
+                output_path=alphapose_output_file_path,
+                link_pose_tracks=pose_tracking_reid,
+                boundary_min_iou=boundary_min_iou,
+            )
+    pose_labelbox.metrics.record_timing('run_pose_detection_2d', time.perf_counter() - stage_start_time)
+    return inference_id
+
+def _profile_camera_request(
+    stage_name,
+    camera_id,
+    function,
+    *args,
+    **kwargs
+):
+    # Requests for each camera run on request pool threads, so their share of
+    # the stage is profiled there rather than around the whole event loop
+    with pose_labelbox.profiling.profile_stage(stage_name, camera_id=camera_id):
+        return function(*args, **kwargs)
+
+def run_pose_detection_2d_chunk(
+    inference_id,
+    environment_id,
+    camera_id,
+    chunk_start,
+    chunk_end,
+    chunk_output_directory_path,
+    video_duration=datetime.timedelta(seconds=10),
+    client=None,
+    uri=None,
+    token_uri=None,
+    audience=None,
+    client_id=None,
+    client_secret=None,
+    session=None,
+    frames_per_video=100,
+    local_frames_directory="/data/frames",
+    frame_filename_extension='png',
+    image_list_parent_directory = '/data/image_lists',
+    alphapose_output_filename='alphapose-results.json',
+    docker_image='alphapose-12-1',
+    config_file='configs/halpe_26/resnet/256x192_res50_lr1e-3_1x.yaml',
+    model_file='pretrained_models/halpe26_fast_res50_256x192.pth',
+    detector_name='yolox-x',
+    detector_batch_size_per_gpu=30,
+    pose_batch_size_per_gpu=100,
+    gpus='0',
+    format='coco',
+    pose_tracking_reid=True,
+    single_process=True,
+    local_video_directory="/data/videos",
+    video_filename_extension='mp4',
+    cache_manager=None,
+):
+    chunk_video_starts = generate_target_video_starts(
+        start=chunk_start,
+        end=chunk_end,
+        video_duration=video_duration,
+    )
+    # Frames for this chunk must stay in the local cache until pose
+    # detection has read them
+    frame_directory_paths = [
+        generate_frame_directory_path(
+            environment_id=environment_id,
+            camera_id=camera_id,
+            video_start=video_start,
+            local_frames_directory=local_frames_directory
+        )
+        for video_start in chunk_video_starts
+    ]
+    with pose_labelbox.cache.protect_paths(cache_manager, frame_directory_paths):
+        logger.info(f'Generating image list for camera {camera_id} from {chunk_start} to {chunk_end}')
         image_list=list()
-        for video_start in sorted(target_video_starts):
+        for video_start in sorted(chunk_video_starts):
             frame_directory_path = generate_frame_directory_path(
                 environment_id=environment_id,
                 camera_id=camera_id,
@@ -316,39 +719,52 @@ def run_pose_detection_2d(
                 frames_per_video=frames_per_video,
                 frame_filename_extension=frame_filename_extension,
             )
+            if cache_manager is not None and not all((frame_directory_path / frame_filename).is_file() for frame_filename in frame_filenames):
+                # Frames were evicted from the local cache (or never
+                # extracted), so regenerate them
+                logger.info(f'Frames missing from {frame_directory_path}. Extracting')
+                extract_frames(
+                    start=video_start,
+                    end=video_start + video_duration,
+                    environment_id=environment_id,
+                    camera_ids=[camera_id],
+                    video_duration=video_duration,
+                    client=client,
+                    uri=uri,
+                    token_uri=token_uri,
+                    audience=audience,
+                    client_id=client_id,
+                    client_secret=client_secret,
+                    session=session,
+                    frames_per_video=frames_per_video,
+                    local_video_directory=local_video_directory,
+                    local_frames_directory=local_frames_directory,
+                    video_filename_extension=video_filename_extension,
+                    frame_filename_extension=frame_filename_extension,
+                    cache_manager=cache_manager,
+                )
             for frame_filename in frame_filenames:
                 frame_path = frame_directory_path / frame_filename
                 if not frame_path.is_file():
                     raise ValueError(f'Frame image {frame_path} does not exist')
                 image_list.append(frame_path)
         logger.info(f'Running 2D pose detection on {len(image_list)} images')
+        pose_labelbox.metrics.increment_counter('images_listed_for_detection', len(image_list), camera_id=camera_id)
         image_list_path = generate_image_list_path(
             inference_id=inference_id,
             camera_id=camera_id,
-            start=start,
-            end=end,
+            start=chunk_start,
+            end=chunk_end,
             video_duration=video_duration,
             image_list_parent_directory=image_list_parent_directory,
         )
         image_list_path.parent.mkdir(parents=True, exist_ok=True)
         with open(image_list_path, 'w') as fp:
             fp.writelines([str(path) + '\n' for path in image_list])
-        alphapose_output_directory_path = pose_labelbox.alphapose.generate_alphapose_output_directory_path(
-            inference_id=inference_id,
-            camera_id=camera_id,
-            start=start,
-            end=end,
-            video_duration=video_duration,
-            alphapose_output_parent_directory=alphapose_output_parent_directory,
-        )
-        alphapose_output_file_path = alphapose_output_directory_path / alphapose_output_filename
-        if alphapose_output_file_path.is_file():
-            logger.info(f'AlphaPose output file {alphapose_output_file_path} already exists. Skipping.')
-            continue
-        alphapose_output_directory_path.mkdir(parents=True, exist_ok=True)
-        pose_labelbox.alphapose.detect_poses_2d(
+        chunk_output_directory_path.mkdir(parents=True, exist_ok=True)
+        returncode = pose_labelbox.alphapose.detect_poses_2d(
             image_list_path=image_list_path,
-            output_directory_path=alphapose_output_directory_path,
+            output_directory_path=chunk_output_directory_path,
             docker_image=docker_image,
             config_file=config_file,
             model_file=model_file,
@@ -359,8 +775,57 @@ def run_pose_detection_2d(
             format=format,
             pose_tracking_reid=pose_tracking_reid,
             single_process=single_process,
+            camera_id=camera_id,
         )
-    return inference_id
+    alphapose_output_file_path = chunk_output_directory_path / alphapose_output_filename
+    if returncode != 0 and alphapose_output_file_path.is_file():
+        # Keep output from a failed run out of the way so that it is never
+        # mistaken for a finished result
+        alphapose_output_file_path.replace(alphapose_output_file_path.with_name(f'{alphapose_output_filename}.failed'))
+    return returncode
+
+def generate_detection_chunks(
+    start,
+    end,
+    video_duration=datetime.timedelta(seconds=10),
+    chunk_duration=None,
+):
+    # Chunks are aligned to video boundaries; without a chunk duration the
+    # whole period is a single chunk
+    output_start, output_end = pose_labelbox.utils.generate_output_period(
+        start=start,
+        end=end,
+        video_duration=video_duration,
+    )
+    if chunk_duration is None:
+        return [(output_start, output_end)]
+    detection_chunks = list()
+    chunk_start = output_start
+    while chunk_start < output_end:
+        chunk_end = min(chunk_start + chunk_duration, output_end)
+        detection_chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end
+    return detection_chunks
+
+def generate_extraction_batches(
+    videos,
+    extraction_batch_size,
+    video_duration=datetime.timedelta(seconds=10),
+):
+    # Batches contain consecutive videos from a single camera so that their
+    # concatenation is a continuous stream
+    extraction_batches = list()
+    for video in sorted(videos, key=lambda video: (video['camera_id'], video['video_start'])):
+        if (
+            len(extraction_batches) > 0 and
+            len(extraction_batches[-1]) < extraction_batch_size and
+            extraction_batches[-1][-1]['camera_id'] == video['camera_id'] and
+            extraction_batches[-1][-1]['video_start'] + video_duration == video['video_start']
+        ):
+            extraction_batches[-1].append(video)
+        else:
+            extraction_batches.append([video])
+    return extraction_batches
 
 def generate_target_video_starts(
     start,
@@ -401,7 +866,9 @@ def generate_target_camera_ids(
     audience=None,
     client_id=None,
     client_secret=None,
+    session=None,
 ):
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
     if environment_id is None and environment_name is None:
         raise ValueError('Must specify either environment ID or environment name')
     target_camera_ids = honeycomb_io.fetch_device_ids(
@@ -459,21 +926,83 @@ def generate_frame_path(
         (pd.Timestamp(timestamp) - video_start) /
         pd.Timedelta(frame_period)
     ) + 1
+    frame_path_prefix = generate_frame_path_prefix(
+        environment_id=environment_id,
+        camera_id=camera_id,
+        video_start=video_start,
+        local_frames_directory=local_frames_directory,
+    )
+    frame_path = pathlib.Path(f'{frame_path_prefix}{frame_index:03d}.{frame_filename_extension}')
+    return frame_path
+
+def generate_frame_paths(
+    environment_id,
+    camera_ids,
+    timestamps,
+    video_duration=datetime.timedelta(seconds=10),
+    frame_period=datetime.timedelta(milliseconds=100),
+    local_frames_directory='/data/frames',
+    frame_filename_extension='png',
+):
+    # Bulk version of generate_frame_path. camera_ids is a single camera ID or
+    # one per timestamp. Returns an array of path strings; the directory and
+    # filename prefix are built once per camera and video
+    timestamps = pd.DatetimeIndex(timestamps)
+    if len(timestamps) == 0:
+        return np.array([], dtype=object)
+    camera_ids = np.broadcast_to(np.asarray(camera_ids, dtype=object), (len(timestamps),))
+    video_starts = timestamps.floor(video_duration)
+    frame_indices = np.round((timestamps - video_starts) / pd.Timedelta(frame_period)).astype('int64') + 1
+    codes, videos = pd.MultiIndex.from_arrays([camera_ids, video_starts]).factorize()
+    frame_path_prefixes = np.array([
+        generate_frame_path_prefix(
+            environment_id=environment_id,
+            camera_id=camera_id,
+            video_start=video_start,
+            local_frames_directory=local_frames_directory,
+        )
+        for camera_id, video_start in videos
+    ], dtype=object)
+    frame_path_suffixes = (pd.Index(frame_indices).astype(str).str.zfill(3) + f'.{frame_filename_extension}').to_numpy(dtype=object)
+    return frame_path_prefixes[codes] + frame_path_suffixes
+
+def generate_frame_path_prefix(
+    environment_id,
+    camera_id,
+    video_start,
+    local_frames_directory='/data/frames',
+):
+    # Everything in a frame path before the frame index. Cached per video;
+    # the time zone is part of the key because timestamps that differ only in
+    # time zone compare equal but format differently
+    return _generate_frame_path_prefix(
+        environment_id,
+        camera_id,
+        video_start,
+        video_start.tzinfo,
+        local_frames_directory,
+    )
+
+@functools.lru_cache(maxsize=4096)
+def _generate_frame_path_prefix(
+    environment_id,
+    camera_id,
+    video_start,
+    video_start_tzinfo,
+    local_frames_directory,
+):
     frame_directory_path = generate_frame_directory_path(
         environment_id=environment_id,
         camera_id=camera_id,
         video_start=video_start,
-        local_frames_directory=local_frames_directory
+        local_frames_directory=local_frames_directory,
     )
-    frame_filename = generate_frame_filename(
+    frame_filename_prefix = generate_frame_filename_prefix(
         environment_id=environment_id,
         camera_id=camera_id,
         video_start=video_start,
-        frame_index=frame_index,
-        frame_filename_extension=frame_filename_extension,
     )
-    frame_path = frame_directory_path / frame_filename
-    return frame_path
+    return os.path.join(frame_directory_path, frame_filename_prefix)
 
 def generate_frame_directory_path(
     environment_id,
@@ -500,16 +1029,15 @@ def generate_frame_filenames(
     frames_per_video=100,
     frame_filename_extension='png',
 ):
-    frame_filenames = list()
-    for frame_index in range(1, frames_per_video + 1):
-        frame_filename = generate_frame_filename(
-            environment_id=environment_id,
-            camera_id=camera_id,
-            video_start=video_start,
-            frame_index=frame_index,
-            frame_filename_extension='png',
-        )
-        frame_filenames.append(frame_filename)
+    frame_filename_prefix = generate_frame_filename_prefix(
+        environment_id=environment_id,
+        camera_id=camera_id,
+        video_start=video_start,
+    )
+    frame_filenames = [
+        f'{frame_filename_prefix}{frame_index:03d}.{frame_filename_extension}'
+        for frame_index in range(1, frames_per_video + 1)
+    ]
     return frame_filenames
 
 def generate_frame_filename(
@@ -519,7 +1047,20 @@ def generate_frame_filename(
     frame_index,
     frame_filename_extension='png',
 ):
-    frame_filename = '{}_{}_{:04d}-{:02d}-{:02d}_{:02d}-{:02d}-{:02d}_{:03d}.{}'.format(
+    frame_filename_prefix = generate_frame_filename_prefix(
+        environment_id=environment_id,
+        camera_id=camera_id,
+        video_start=video_start,
+    )
+    frame_filename = f'{frame_filename_prefix}{frame_index:03d}.{frame_filename_extension}'
+    return frame_filename
+
+def generate_frame_filename_prefix(
+    environment_id,
+    camera_id,
+    video_start,
+):
+    frame_filename_prefix = '{}_{}_{:04d}-{:02d}-{:02d}_{:02d}-{:02d}-{:02d}_'.format(
         environment_id,
         camera_id,
         video_start.year,
@@ -528,10 +1069,8 @@ def generate_frame_filename(
         video_start.hour,
         video_start.minute,
         video_start.second,
-        frame_index,
-        frame_filename_extension,
     )
-    return frame_filename
+    return frame_filename_prefix
 
 def generate_ffmpeg_frame_identifier(
     environment_id,
@@ -0,0 +1,412 @@
+import pose_labelbox.alphapose
+import pose_labelbox.core
+import pose_labelbox.metrics
+import pose_labelbox.profiling
+import pose_labelbox.utils
+import concurrent.futures
+import datetime
+import tarfile
+import json
+import pathlib
+import uuid
+import io
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+cv = pose_labelbox.utils.lazy_import('cv2')
+cv_utils = pose_labelbox.utils.lazy_import('cv_utils')
+np = pose_labelbox.utils.lazy_import('numpy')
+pd = pose_labelbox.utils.lazy_import('pandas')
+
+SHARD_PLAN_DIRECTORY_NAME = 'crop_plan'
+SHARD_PLAN_MANIFEST_FILENAME = 'plan.json'
+
+@pose_labelbox.profiling.profiled('export_person_crops')
+def export_person_crops(
+    label_data,
+    inference_id,
+    environment_id,
+    start,
+    end,
+    export_id=None,
+    export_parent_directory='/data/person_crops',
+    shard_size=1000,
+    crop_padding=0.1,
+    crop_image_extension='jpg',
+    excluded_person_names=('Unusable bounding box',),
+    num_workers=None,
+    video_duration=datetime.timedelta(seconds=10),
+    frame_period=datetime.timedelta(milliseconds=100),
+    alphapose_output_parent_directory='/data/alphapose_output',
+    parsed_alphapose_output_suffix=None,
+    local_frames_directory='/data/frames',
+    frame_filename_extension='png',
+):
+    # Crops every labeled bounding box out of its source frame into tar
+    # shards of roughly shard_size crops, each with an index pickle (person,
+    # camera, pose track, timestamp, box and keypoints per crop). Shards end
+    # on frame boundaries so each frame is decoded once. The shard plan is
+    # written one shard at a time on the first run and reused, and shards
+    # whose index already exists are skipped, so an interrupted export can
+    # simply be rerun. Returns the export directory, whose shard indexes can
+    # be read one at a time with load_person_crop_index
+    if export_id is None:
+        export_id = inference_id
+    export_directory_path = pathlib.Path(export_parent_directory) / export_id
+    export_directory_path.mkdir(parents=True, exist_ok=True)
+    shard_plan_manifest_path = export_directory_path / SHARD_PLAN_DIRECTORY_NAME / SHARD_PLAN_MANIFEST_FILENAME
+    if shard_plan_manifest_path.is_file():
+        logger.info(f'Loading existing shard plan from {shard_plan_manifest_path}')
+        with open(shard_plan_manifest_path, 'r') as fp:
+            shard_plan_manifest = json.load(fp)
+    else:
+        shard_plan_manifest = write_shard_plan(
+            export_directory_path=export_directory_path,
+            crop_records_iterator=generate_crop_records(
+                label_data=label_data,
+                inference_id=inference_id,
+                start=start,
+                end=end,
+                excluded_person_names=excluded_person_names,
+                video_duration=video_duration,
+                frame_period=frame_period,
+                alphapose_output_parent_directory=alphapose_output_parent_directory,
+                parsed_alphapose_output_suffix=parsed_alphapose_output_suffix,
+            ),
+            shard_size=shard_size,
+        )
+    shard_indices = list(range(shard_plan_manifest['num_shards']))
+    pending_shard_indices = [
+        shard_index for shard_index in shard_indices
+        if not generate_shard_index_path(export_directory_path, shard_index).is_file()
+    ]
+    num_skipped = len(shard_indices) - len(pending_shard_indices)
+    pose_labelbox.metrics.increment_counter('person_crop_shards_skipped', num_skipped)
+    logger.info(f"Exporting {shard_plan_manifest['num_crops']} person crops in {len(shard_indices)} shards to {export_directory_path} ({num_skipped} shards already written)")
+    shard_arguments = dict(
+        export_directory_path=export_directory_path,
+        environment_id=environment_id,
+        crop_padding=crop_padding,
+        crop_image_extension=crop_image_extension,
+        video_duration=video_duration,
+        frame_period=frame_period,
+        local_frames_directory=local_frames_directory,
+        frame_filename_extension=frame_filename_extension,
+    )
+    if num_workers == 1:
+        shard_results = (
+            write_planned_person_crop_shard(
+                shard_index=shard_index,
+                **shard_arguments
+            )
+            for shard_index in pending_shard_indices
+        )
+        record_shard_results(shard_results)
+    else:
+        max_workers = num_workers if num_workers is not None else (os.cpu_count() or 1)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # Workers read their shard's plan and frames and stream crops into
+            # the shard on disk. At most max_workers shards are in flight, so
+            # no more than one shard per worker is in memory
+            futures = set()
+            for shard_index in pending_shard_indices:
+                if len(futures) >= max_workers:
+                    done_futures, futures = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                    record_shard_results(future.result() for future in done_futures)
+                futures.add(executor.submit(
+                    write_planned_person_crop_shard,
+                    shard_index=shard_index,
+                    **shard_arguments
+                ))
+            record_shard_results(future.result() for future in concurrent.futures.as_completed(futures))
+    return export_directory_path
+
+def record_shard_results(shard_results):
+    # Workers may run in other processes, so their metrics are recorded here
+    for shard_result in shard_results:
+        pose_labelbox.metrics.increment_counter('person_crop_shards_written')
+        pose_labelbox.metrics.increment_counter('person_crops_exported', shard_result['num_crops'])
+        pose_labelbox.metrics.increment_counter('person_crops_skipped', shard_result['num_skipped_crops'])
+        pose_labelbox.metrics.increment_counter('person_crop_frames_decoded', shard_result['num_frames'])
+        pose_labelbox.metrics.record_file_bytes('person_crop_shard_bytes', shard_result['shard_path'])
+        logger.info(f"Wrote {shard_result['num_crops']} person crops to {shard_result['shard_path']}")
+
+def write_shard_plan(
+    export_directory_path,
+    crop_records_iterator,
+    shard_size=1000,
+):
+    # Shards don't span cameras, so each camera's crop records are split and
+    # written as they are generated. The manifest is written last and marks
+    # the plan as complete
+    shard_plan_directory_path = pathlib.Path(export_directory_path) / SHARD_PLAN_DIRECTORY_NAME
+    shard_plan_directory_path.mkdir(parents=True, exist_ok=True)
+    num_shards = 0
+    num_crops = 0
+    for camera_crop_records in crop_records_iterator:
+        camera_shard_indices = num_shards + np.asarray(generate_shard_indices(
+            frame_keys=list(zip(camera_crop_records['camera_id'], camera_crop_records['timestamp'])),
+            shard_size=shard_size,
+        ), dtype='int64')
+        for shard_index, shard_crop_records in camera_crop_records.groupby(camera_shard_indices, sort=True):
+            shard_plan_path = generate_shard_plan_path(export_directory_path, shard_index)
+            temporary_path = shard_plan_path.with_name(f'.{shard_plan_path.name}.{uuid.uuid4().hex}.tmp')
+            shard_crop_records.assign(shard_index=shard_index).reset_index(drop=True).to_pickle(temporary_path)
+            os.replace(temporary_path, shard_plan_path)
+        num_shards = int(camera_shard_indices[-1]) + 1
+        num_crops += len(camera_crop_records)
+    if num_crops == 0:
+        raise ValueError('No labeled poses to export')
+    shard_plan_manifest = {
+        'num_shards': num_shards,
+        'num_crops': num_crops,
+        'shard_size': shard_size,
+    }
+    shard_plan_manifest_path = shard_plan_directory_path / SHARD_PLAN_MANIFEST_FILENAME
+    temporary_path = shard_plan_manifest_path.with_name(f'.{shard_plan_manifest_path.name}.{uuid.uuid4().hex}.tmp')
+    with open(temporary_path, 'w') as fp:
+        json.dump(shard_plan_manifest, fp)
+    os.replace(temporary_path, shard_plan_manifest_path)
+    return shard_plan_manifest
+
+def generate_crop_records(
+    label_data,
+    inference_id,
+    start,
+    end,
+    excluded_person_names=('Unusable bounding box',),
+    video_duration=datetime.timedelta(seconds=10),
+    frame_period=datetime.timedelta(milliseconds=100),
+    alphapose_output_parent_directory='/data/alphapose_output',
+    parsed_alphapose_output_suffix=None,
+):
+    # Joins fetch_labels output (indexed by camera, pose track and timestamp)
+    # with the parsed 2D poses, one record per labeled detection. Yields the
+    # records of one camera at a time, sorted by timestamp so the crops from
+    # each frame are contiguous
+    label_data = label_data.reset_index()
+    label_data = label_data.loc[~label_data['person_name'].isin(list(excluded_person_names))]
+    label_data = label_data.assign(timestamp=pd.to_datetime(label_data['timestamp'], utc=True).dt.round(pd.Timedelta(frame_period)))
+    for camera_id, camera_label_data in label_data.groupby('camera_id'):
+        alphapose_output_directory_path = pose_labelbox.alphapose.generate_alphapose_output_directory_path(
+            inference_id=inference_id,
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+            alphapose_output_parent_directory=alphapose_output_parent_directory,
+        )
+        parsed_alphapose_output_filename = pose_labelbox.alphapose.generate_parsed_alphapose_output_filename(
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+            suffix=parsed_alphapose_output_suffix,
+        )
+        poses_2d = pd.read_pickle(alphapose_output_directory_path / parsed_alphapose_output_filename)
+        poses_2d = (
+            poses_2d
+            .reset_index()
+            .assign(timestamp=lambda df: pd.to_datetime(df['timestamp'], utc=True).dt.round(pd.Timedelta(frame_period)))
+            .loc[:, [
+                'pose_2d_id',
+                'pose_track_label',
+                'timestamp',
+                'bounding_box_corners',
+                'keypoint_coordinates_2d',
+                'keypoint_quality_2d',
+            ]]
+        )
+        camera_crop_records = camera_label_data.merge(
+            poses_2d,
+            left_on=['pose_track_2d_label', 'timestamp'],
+            right_on=['pose_track_label', 'timestamp'],
+            how='inner',
+        )
+        # Only this camera's matched records are kept while they are consumed
+        del poses_2d
+        num_unmatched = len(camera_label_data) - len(camera_crop_records)
+        if num_unmatched > 0:
+            # Labels are forward filled across frames where the track has no
+            # detection, so there is nothing to crop there
+            logger.info(f'{num_unmatched} labeled frames for camera {camera_id} have no detection')
+        if len(camera_crop_records) == 0:
+            continue
+        yield (
+            camera_crop_records
+            .loc[:, [
+                'camera_id',
+                'timestamp',
+                'pose_track_label',
+                'pose_2d_id',
+                'person_name',
+                'bounding_box_corners',
+                'keypoint_coordinates_2d',
+                'keypoint_quality_2d',
+            ]]
+            .sort_values(['timestamp', 'pose_track_label'])
+            .reset_index(drop=True)
+        )
+
+def generate_shard_indices(frame_keys, shard_size=1000):
+    # Frame keys must be sorted. A shard is closed at the first frame boundary
+    # after it reaches shard_size crops
+    if shard_size < 1:
+        raise ValueError('Shard size must be at least 1')
+    shard_indices = list()
+    shard_index = 0
+    num_crops_in_shard = 0
+    previous_frame_key = None
+    for frame_key in frame_keys:
+        if frame_key != previous_frame_key and num_crops_in_shard >= shard_size:
+            shard_index += 1
+            num_crops_in_shard = 0
+        shard_indices.append(shard_index)
+        num_crops_in_shard += 1
+        previous_frame_key = frame_key
+    return shard_indices
+
+def write_planned_person_crop_shard(
+    shard_index,
+    export_directory_path,
+    **kwargs
+):
+    # Runs in the worker, so the parent never holds the shard's crop records
+    crop_records = pd.read_pickle(generate_shard_plan_path(export_directory_path, shard_index))
+    return write_person_crop_shard(
+        shard_index=shard_index,
+        crop_records=crop_records,
+        export_directory_path=export_directory_path,
+        **kwargs
+    )
+
+def write_person_crop_shard(
+    shard_index,
+    crop_records,
+    export_directory_path,
+    environment_id,
+    crop_padding=0.1,
+    crop_image_extension='jpg',
+    video_duration=datetime.timedelta(seconds=10),
+    frame_period=datetime.timedelta(milliseconds=100),
+    local_frames_directory='/data/frames',
+    frame_filename_extension='png',
+):
+    # Crops are encoded and appended to the tar one at a time; the shard and
+    # then its index are moved into place only once complete
+    shard_path = generate_shard_path(export_directory_path, shard_index)
+    index_path = generate_shard_index_path(export_directory_path, shard_index)
+    temporary_shard_path = shard_path.with_name(f'.{shard_path.name}.{uuid.uuid4().hex}.tmp')
+    index_records = list()
+    num_frames = 0
+    num_skipped_crops = 0
+    frame_crop_records_list = list(crop_records.groupby(['camera_id', 'timestamp'], sort=False))
+    frame_paths = pose_labelbox.core.generate_frame_paths(
+        environment_id=environment_id,
+        camera_ids=[camera_id for (camera_id, _), _ in frame_crop_records_list],
+        timestamps=[timestamp for (_, timestamp), _ in frame_crop_records_list],
+        video_duration=video_duration,
+        frame_period=frame_period,
+        local_frames_directory=local_frames_directory,
+        frame_filename_extension=frame_filename_extension,
+    )
+    with tarfile.open(temporary_shard_path, 'w') as tar:
+        for ((camera_id, timestamp), frame_crop_records), frame_path in zip(frame_crop_records_list, frame_paths):
+            image = cv_utils.read_image(path=frame_path)
+            num_frames += 1
+            for crop_record in frame_crop_records.itertuples(index=False):
+                crop_corners = generate_crop_corners(
+                    bounding_box_corners=crop_record.bounding_box_corners,
+                    image_shape=image.shape,
+                    crop_padding=crop_padding,
+                )
+                if crop_corners is None:
+                    num_skipped_crops += 1
+                    continue
+                (column_start, row_start), (column_end, row_end) = crop_corners
+                success, encoded_crop = cv.imencode(f'.{crop_image_extension}', image[row_start:row_end, column_start:column_end])
+                if not success:
+                    raise ValueError(f'Failed to encode crop for pose {crop_record.pose_2d_id}')
+                member_name = f'{crop_record.pose_2d_id}.{crop_image_extension}'
+                tar_info = tarfile.TarInfo(name=member_name)
+                tar_info.size = len(encoded_crop)
+                tar.addfile(tar_info, io.BytesIO(encoded_crop.tobytes()))
+                index_records.append({
+                    'shard_index': shard_index,
+                    'member_name': member_name,
+                    'person_name': crop_record.person_name,
+                    'camera_id': camera_id,
+                    'pose_track_label': crop_record.pose_track_label,
+                    'timestamp': timestamp,
+                    'bounding_box_corners': crop_record.bounding_box_corners,
+                    'crop_corners': np.asarray(crop_corners),
+                    # Keypoints are in frame coordinates; subtract the first
+                    # crop corner for crop coordinates
+                    'keypoint_coordinates_2d': crop_record.keypoint_coordinates_2d,
+                    'keypoint_quality_2d': crop_record.keypoint_quality_2d,
+                })
+    os.replace(temporary_shard_path, shard_path)
+    shard_index_data = pd.DataFrame(index_records, columns=[
+        'shard_index',
+        'member_name',
+        'person_name',
+        'camera_id',
+        'pose_track_label',
+        'timestamp',
+        'bounding_box_corners',
+        'crop_corners',
+        'keypoint_coordinates_2d',
+        'keypoint_quality_2d',
+    ])
+    temporary_index_path = index_path.with_name(f'.{index_path.name}.{uuid.uuid4().hex}.tmp')
+    shard_index_data.to_pickle(temporary_index_path)
+    os.replace(temporary_index_path, index_path)
+    return {
+        'shard_path': shard_path,
+        'num_crops': len(index_records),
+        'num_skipped_crops': num_skipped_crops,
+        'num_frames': num_frames,
+    }
+
+def generate_crop_corners(
+    bounding_box_corners,
+    image_shape,
+    crop_padding=0.1,
+):
+    # Integer [[column_start, row_start], [column_end, row_end]] of the box
+    # grown by crop_padding of its size on each side and clipped to the image.
+    # Returns None if nothing is left
+    bounding_box_corners = np.asarray(bounding_box_corners, dtype=float)
+    if not np.all(np.isfinite(bounding_box_corners)):
+        return None
+    image_height, image_width = image_shape[:2]
+    padding = crop_padding*(bounding_box_corners[1] - bounding_box_corners[0])
+    column_start, row_start = np.floor(bounding_box_corners[0] - padding).astype('int64')
+    column_end, row_end = np.ceil(bounding_box_corners[1] + padding).astype('int64')
+    column_start, column_end = max(int(column_start), 0), min(int(column_end), image_width)
+    row_start, row_end = max(int(row_start), 0), min(int(row_end), image_height)
+    if column_start >= column_end or row_start >= row_end:
+        return None
+    return [[column_start, row_start], [column_end, row_end]]
+
+def load_person_crop_index(export_directory_path):
+    # Yields the index of each shard in shard order, so that only one is in
+    # memory at a time
+    for shard_index_path in sorted(pathlib.Path(export_directory_path).glob('shard_[0-9]*.pkl')):
+        yield pd.read_pickle(shard_index_path)
+
+def read_person_crop(export_directory_path, shard_index, member_name):
+    with tarfile.open(generate_shard_path(export_directory_path, shard_index), 'r') as tar:
+        encoded_crop = tar.extractfile(member_name).read()
+    return cv.imdecode(np.frombuffer(encoded_crop, dtype='uint8'), cv.IMREAD_COLOR)
+
+def generate_shard_path(export_directory_path, shard_index):
+    return pathlib.Path(export_directory_path) / f'shard_{shard_index:06d}.tar'
+
+def generate_shard_index_path(export_directory_path, shard_index):
+    return pathlib.Path(export_directory_path) / f'shard_{shard_index:06d}.pkl'
+
+def generate_shard_plan_path(export_directory_path, shard_index):
+    return pathlib.Path(export_directory_path) / SHARD_PLAN_DIRECTORY_NAME / f'shard_{shard_index:06d}.pkl'
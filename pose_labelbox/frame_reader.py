@@ -0,0 +1,174 @@
+import pose_labelbox.core
+import pose_labelbox.utils
+import pose_labelbox.metrics
+from collections import OrderedDict
+import datetime
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+ffmpeg = pose_labelbox.utils.lazy_import('ffmpeg')
+np = pose_labelbox.utils.lazy_import('numpy')
+pd = pose_labelbox.utils.lazy_import('pandas')
+
+class VideoFrameReader:
+    def __init__(
+        self,
+        video_metadata,
+        local_video_directory='/data/videos',
+        video_filename_extension='mp4',
+        video_duration=datetime.timedelta(seconds=10),
+        max_batch_gap_frames=30,
+        max_cached_frames=300,
+    ):
+        self.local_video_directory = local_video_directory
+        self.video_filename_extension = video_filename_extension
+        self.video_duration = video_duration
+        self.max_batch_gap_frames = max_batch_gap_frames
+        self.max_cached_frames = max_cached_frames
+        self.video_index = generate_video_index(
+            video_metadata=video_metadata,
+            local_video_directory=local_video_directory,
+            video_filename_extension=video_filename_extension,
+        )
+        self.frame_cache = OrderedDict()
+        self.video_dimensions = dict()
+
+    def read_frame(self, camera_id, timestamp):
+        return self.read_frames(camera_id, [timestamp])[0]
+
+    def read_frames(self, camera_id, timestamps):
+        timestamps = [pd.Timestamp(timestamp) for timestamp in timestamps]
+        frames = dict()
+        uncached_frame_locations = list()
+        for timestamp in timestamps:
+            cache_key = (camera_id, timestamp)
+            if cache_key in self.frame_cache:
+                self.frame_cache.move_to_end(cache_key)
+                frames[timestamp] = self.frame_cache[cache_key]
+                continue
+            uncached_frame_locations.append(self.locate_frame(camera_id, timestamp))
+        for video_key, frame_batch in self.generate_decode_batches(uncached_frame_locations):
+            decoded_frames = self.decode_frame_batch(video_key, frame_batch)
+            for timestamp, image in decoded_frames.items():
+                frames[timestamp] = image
+                self.frame_cache[(camera_id, timestamp)] = image
+                self.frame_cache.move_to_end((camera_id, timestamp))
+        while len(self.frame_cache) > self.max_cached_frames:
+            self.frame_cache.popitem(last=False)
+        return [frames[timestamp] for timestamp in timestamps]
+
+    def iterate_frames(self, camera_id, timestamps, batch_size=100):
+        timestamps = list(timestamps)
+        for batch_start in range(0, len(timestamps), batch_size):
+            batch_timestamps = timestamps[batch_start:(batch_start + batch_size)]
+            images = self.read_frames(camera_id, batch_timestamps)
+            for timestamp, image in zip(batch_timestamps, images):
+                yield timestamp, image
+
+    def locate_frame(self, camera_id, timestamp):
+        video_start = timestamp.floor(self.video_duration)
+        video_key = (camera_id, video_start)
+        if video_key not in self.video_index:
+            raise ValueError(f'No video found for camera {camera_id} at {timestamp}')
+        frame_offsets = self.video_index[video_key]['frame_offsets']
+        offset_seconds = (timestamp - video_start).total_seconds()
+        frame_number = int(np.argmin(np.abs(frame_offsets - offset_seconds)))
+        return video_key, frame_number, timestamp
+
+    def generate_decode_batches(self, frame_locations):
+        # Nearby frames from the same video are decoded in one sequential pass;
+        # a new pass starts when the gap to the next requested frame is large
+        frame_locations = sorted(frame_locations, key=lambda frame_location: (frame_location[0], frame_location[1]))
+        batches = list()
+        for video_key, frame_number, timestamp in frame_locations:
+            if (
+                len(batches) > 0 and
+                batches[-1][0] == video_key and
+                frame_number - batches[-1][1][-1][0] <= self.max_batch_gap_frames
+            ):
+                batches[-1][1].append((frame_number, timestamp))
+            else:
+                batches.append((video_key, [(frame_number, timestamp)]))
+        return batches
+
+    def decode_frame_batch(self, video_key, frame_batch):
+        video_path = self.video_index[video_key]['video_path']
+        width, height = self.fetch_video_dimensions(video_key)
+        first_frame_number = frame_batch[0][0]
+        last_frame_number = frame_batch[-1][0]
+        start_time = time.perf_counter()
+        stdout, _ = (
+            ffmpeg
+            .input(str(video_path))
+            .filter('select', f'between(n,{first_frame_number},{last_frame_number})')
+            .output('pipe:', format='rawvideo', pix_fmt='bgr24', vsync='passthrough')
+            .run(capture_stdout=True, quiet=True)
+        )
+        camera_id = video_key[0]
+        pose_labelbox.metrics.record_timing('decode_frame_batch', time.perf_counter() - start_time, camera_id=camera_id)
+        decoded_frames = (
+            np.frombuffer(stdout, dtype=np.uint8)
+            .reshape((-1, height, width, 3))
+        )
+        pose_labelbox.metrics.increment_counter('frames_decoded', decoded_frames.shape[0], camera_id=camera_id)
+        frames = dict()
+        for frame_number, timestamp in frame_batch:
+            frame_position = frame_number - first_frame_number
+            if frame_position >= decoded_frames.shape[0]:
+                raise ValueError(f'Frame {frame_number} could not be decoded from {video_path}')
+            frames[timestamp] = decoded_frames[frame_position].copy()
+        return frames
+
+    def fetch_video_dimensions(self, video_key):
+        if video_key not in self.video_dimensions:
+            video_path = self.video_index[video_key]['video_path']
+            probe = ffmpeg.probe(str(video_path))
+            video_stream = next(stream for stream in probe['streams'] if stream['codec_type'] == 'video')
+            self.video_dimensions[video_key] = (int(video_stream['width']), int(video_stream['height']))
+        return self.video_dimensions[video_key]
+
+def generate_video_index(
+    video_metadata,
+    local_video_directory='/data/videos',
+    video_filename_extension='mp4',
+):
+    video_index = dict()
+    for video_metadatum in video_metadata.to_dict(orient='records'):
+        video_start = pd.Timestamp(video_metadatum['video_start']).tz_convert('UTC')
+        video_path = pose_labelbox.core.generate_video_path(
+            environment_id=video_metadatum['environment_id'],
+            camera_id=video_metadatum['camera_id'],
+            video_start=video_start,
+            local_video_directory=local_video_directory,
+            video_filename_extension=video_filename_extension,
+        )
+        frame_offsets = normalize_frame_offsets(
+            frame_offsets=video_metadatum.get('frame_offsets'),
+            fps=video_metadatum.get('fps'),
+            duration_seconds=video_metadatum.get('duration_seconds'),
+        )
+        video_index[(video_metadatum['camera_id'], video_start)] = {
+            'video_path': video_path,
+            'frame_offsets': frame_offsets,
+        }
+    return video_index
+
+def normalize_frame_offsets(
+    frame_offsets,
+    fps,
+    duration_seconds=None,
+):
+    # Frame offsets are interpreted as seconds from the start of the video.
+    # Offsets that run well past the video duration are assumed to be in
+    # milliseconds. If the video service didn't provide offsets, they are
+    # generated from the nominal frame rate.
+    if frame_offsets is None or (np.ndim(frame_offsets) == 0 and pd.isna(frame_offsets)) or len(frame_offsets) == 0:
+        if fps is None or pd.isna(fps) or duration_seconds is None or pd.isna(duration_seconds):
+            raise ValueError('Video metadata must include either frame offsets or both FPS and duration')
+        return np.arange(round(duration_seconds*fps))/fps
+    frame_offsets = np.asarray(frame_offsets, dtype=float)
+    if duration_seconds is not None and not pd.isna(duration_seconds) and frame_offsets.max() > 2*duration_seconds:
+        frame_offsets = frame_offsets/1000.0
+    return frame_offsets
@@ -1,20 +1,29 @@
 import pose_labelbox.utils
-import honeycomb_io
-import labelbox as lb
-import pandas as pd
-import slugify
+import pose_labelbox.session
+import pose_labelbox.process_video
+import pose_labelbox.metrics
+import pose_labelbox.profiling
+import pose_labelbox.aio
 from collections import OrderedDict
 import pathlib
 import datetime
 import uuid
 import re
 import os
+import time
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+honeycomb_io = pose_labelbox.utils.lazy_import('honeycomb_io')
+lb = pose_labelbox.utils.lazy_import('labelbox')
+pd = pose_labelbox.utils.lazy_import('pandas')
+slugify = pose_labelbox.utils.lazy_import('slugify')
+
 LABELBOX_DATETIME_FORMAT = '%Y%m%dT%H-%M-%S.%fUTC'
 
+@pose_labelbox.profiling.profiled('create_project')
 def create_project(
     inference_id,
     ontology_id=None,
@@ -30,61 +39,131 @@ def create_project(
     bounding_box_overlay_video_parent_directory='/data/bounding_box_overlay_videos',
     overlay_video_extension='mp4',
     frame_period=datetime.timedelta(milliseconds=100),
-    client=None
+    client=None,
+    session=None,
+    max_concurrent_requests=pose_labelbox.aio.DEFAULT_MAX_CONCURRENT_REQUESTS,
 ):
-    if client is None:
-        client = generate_labelbox_client()
-    name=f'Identify people ({inference_id})'
-    existing_projects = client.get_projects(where=(lb.Project.name == name))
-    existing_project = existing_projects.get_one()
-    if existing_project is not None:
-        logger.info(f'Person identification project for inference ID {inference_id} already exists. Skipping')
-        return existing_project.uid
-    create_metadata_fields(client)
-    if ontology_id is None:
-        logger.info(f'Person ontology for inference ID {inference_id} not specified. Creating.')
-        ontology_id = create_person_ontology(
-            inference_id=inference_id,
-            person_descriptions=person_descriptions,
-            unusuable_bounding_box_label=unusuable_bounding_box_label,
-            person_feature_schema_id=person_feature_schema_id,
-            client=client,
+    return pose_labelbox.aio.run_sync(create_project_async(
+        inference_id=inference_id,
+        ontology_id=ontology_id,
+        person_descriptions=person_descriptions,
+        unusuable_bounding_box_label=unusuable_bounding_box_label,
+        person_feature_schema_id=person_feature_schema_id,
+        dataset_id=dataset_id,
+        start=start,
+        end=end,
+        environment_name=environment_name,
+        environment_id=environment_id,
+        video_duration=video_duration,
+        bounding_box_overlay_video_parent_directory=bounding_box_overlay_video_parent_directory,
+        overlay_video_extension=overlay_video_extension,
+        frame_period=frame_period,
+        client=client,
+        session=session,
+        max_concurrent_requests=max_concurrent_requests,
+    ))
+
+async def create_project_async(
+    inference_id,
+    ontology_id=None,
+    person_descriptions=None,
+    unusuable_bounding_box_label='Unusable bounding box',
+    person_feature_schema_id=None,
+    dataset_id=None,
+    start=None,
+    end=None,
+    environment_name=None,
+    environment_id=None,
+    video_duration=datetime.timedelta(seconds=10),
+    bounding_box_overlay_video_parent_directory='/data/bounding_box_overlay_videos',
+    overlay_video_extension='mp4',
+    frame_period=datetime.timedelta(milliseconds=100),
+    client=None,
+    session=None,
+    max_concurrent_requests=pose_labelbox.aio.DEFAULT_MAX_CONCURRENT_REQUESTS,
+    request_pool=None,
+):
+    # The ontology and the dataset don't depend on each other, so they are
+    # created concurrently (the dataset's uploads share the request pool)
+    async with pose_labelbox.aio.open_request_pool(request_pool=request_pool, max_concurrent_requests=max_concurrent_requests) as request_pool:
+        if client is None:
+            client = await request_pool.run(generate_labelbox_client, session=session)
+        name=f'Identify people ({inference_id})'
+
+        def fetch_existing_project():
+            return client.get_projects(where=(lb.Project.name == name)).get_one()
+
+        existing_project = await request_pool.run(fetch_existing_project)
+        if existing_project is not None:
+            logger.info(f'Person identification project for inference ID {inference_id} already exists. Skipping')
+            return existing_project.uid
+        await request_pool.run(create_metadata_fields, client)
+
+        async def resolve_ontology_id():
+            if ontology_id is not None:
+                return ontology_id
+            logger.info(f'Person ontology for inference ID {inference_id} not specified. Creating.')
+            return await request_pool.run(
+                create_person_ontology,
+                inference_id=inference_id,
+                person_descriptions=person_descriptions,
+                unusuable_bounding_box_label=unusuable_bounding_box_label,
+                person_feature_schema_id=person_feature_schema_id,
+                client=client,
+            )
+
+        async def resolve_dataset_id():
+            if dataset_id is not None:
+                return dataset_id
+            logger.info(f'Dataset for inference ID {inference_id} not specified. Creating.')
+            return await create_dataset_async(
+                start=start,
+                end=end,
+                inference_id=inference_id,
+                environment_name=environment_name,
+                environment_id=environment_id,
+                video_duration=video_duration,
+                bounding_box_overlay_video_parent_directory=bounding_box_overlay_video_parent_directory,
+                overlay_video_extension=overlay_video_extension,
+                frame_period=frame_period,
+                client=client,
+                session=session,
+                request_pool=request_pool,
+            )
+
+        resolved_ontology_id, resolved_dataset_id = await asyncio.gather(
+            resolve_ontology_id(),
+            resolve_dataset_id(),
         )
-    ontology = client.get_ontology(ontology_id)
-    if dataset_id is None:
-        logger.info(f'Dataset for inference ID {inference_id} not specified. Creating.')
-        dataset_id = create_dataset(
-            start=start,
-            end=end,
-            inference_id=inference_id,
-            environment_name=environment_name,
-            environment_id=environment_id,
-            video_duration=video_duration,
-            bounding_box_overlay_video_parent_directory=bounding_box_overlay_video_parent_directory,
-            overlay_video_extension=overlay_video_extension,
-            frame_period=frame_period,
-            client=client,
+        ontology, dataset = await asyncio.gather(
+            request_pool.run(client.get_ontology, resolved_ontology_id),
+            request_pool.run(client.get_dataset, resolved_dataset_id),
         )
-    dataset = client.get_dataset(dataset_id)
-    logger.info('Creating project')
-    project = client.create_project(
-        name=name,
-        media_type=lb.MediaType.Video
-    )
-    batch_name=f'First batch ({inference_id})'
-    batch = project.create_batch(
-        name=batch_name,
-        data_rows=dataset.export_data_rows(),
-        priority=1
-    )
-    project.setup_editor(ontology)
+        logger.info('Creating project')
+        project = await request_pool.run(
+            client.create_project,
+            name=name,
+            media_type=lb.MediaType.Video
+        )
+        batch_name=f'First batch ({inference_id})'
+
+        def create_batch():
+            return project.create_batch(
+                name=batch_name,
+                data_rows=dataset.export_data_rows(),
+                priority=1
+            )
+
+        await request_pool.run(create_batch)
+        await request_pool.run(project.setup_editor, ontology)
     return project.uid
 
 def create_metadata_fields(
     client=None,
+    session=None,
 ):
     if client is None:
-        client = generate_labelbox_client()
+        client = generate_labelbox_client(session=session)
     metadata_ontology = client.get_data_row_metadata_ontology()
     create_metadata_field(
         name='inference_id',
@@ -122,6 +201,12 @@ def create_metadata_fields(
         metadata_ontology=metadata_ontology,
         client=client,
     )
+    create_metadata_field(
+        name='pose_track_segment_index',
+        kind=lb.schema.data_row_metadata.DataRowMetadataKind('CustomMetadataString'),
+        metadata_ontology=metadata_ontology,
+        client=client,
+    )
     create_metadata_field(
         name='video_start_isoformat',
         kind=lb.schema.data_row_metadata.DataRowMetadataKind('CustomMetadataString'),
@@ -140,15 +225,42 @@ def create_metadata_fields(
         metadata_ontology=metadata_ontology,
         client=client,
     )
+    create_metadata_field(
+        name='overlay_scale',
+        kind=lb.schema.data_row_metadata.DataRowMetadataKind('CustomMetadataString'),
+        metadata_ontology=metadata_ontology,
+        client=client,
+    )
+    create_metadata_field(
+        name='frame_offsets',
+        kind=lb.schema.data_row_metadata.DataRowMetadataKind('CustomMetadataString'),
+        metadata_ontology=metadata_ontology,
+        client=client,
+    )
+    create_metadata_field(
+        name='video_segment_index',
+        kind=lb.schema.data_row_metadata.DataRowMetadataKind('CustomMetadataString'),
+        metadata_ontology=metadata_ontology,
+        client=client,
+    )
+    create_metadata_field(
+        name='video_segment_offset',
+        kind=lb.schema.data_row_metadata.DataRowMetadataKind('CustomMetadataString'),
+        metadata_ontology=metadata_ontology,
+        client=client,
+    )
 
 def create_metadata_field(
     name,
-    kind=lb.schema.data_row_metadata.DataRowMetadataKind('CustomMetadataString'),
+    kind=None,
     metadata_ontology=None,
     client=None,
+    session=None,
 ):
+    if kind is None:
+        kind = lb.schema.data_row_metadata.DataRowMetadataKind('CustomMetadataString')
     if client is None:
-        client = generate_labelbox_client()
+        client = generate_labelbox_client(session=session)
     if metadata_ontology is None:
         metadata_ontology = client.get_data_row_metadata_ontology()
     try:
@@ -167,9 +279,10 @@ def create_person_ontology(
     unusuable_bounding_box_label='Unusable bounding box',
     person_feature_schema_id=None,
     client=None,
+    session=None,
 ):
     if client is None:
-        client = generate_labelbox_client()
+        client = generate_labelbox_client(session=session)
     name = f'Person ({inference_id})'
     existing_ontologies = client.get_ontologies(name_contains=name)
     existing_ontology = existing_ontologies.get_one()
@@ -199,9 +312,10 @@ def create_person_feature_schema(
     person_descriptions,
     unusuable_bounding_box_label='Unusable bounding box',
     client=None,
+    session=None,
 ):
     if client is None:
-        client = generate_labelbox_client()
+        client = generate_labelbox_client(session=session)
     name = f'person_{inference_id}'
     instructions = f'Person ({inference_id})'
     existing_feature_schemas = client.get_feature_schemas(name_contains=instructions)
@@ -231,6 +345,7 @@ def create_person_feature_schema(
     person_radio = client.create_feature_schema(person_radio_classification.asdict())
     return person_radio.uid
 
+@pose_labelbox.profiling.profiled('create_dataset')
 def create_dataset(
     start,
     end,
@@ -242,68 +357,211 @@ def create_dataset(
     overlay_video_extension='mp4',
     frame_period=datetime.timedelta(milliseconds=100),
     client=None,
+    session=None,
+    max_concurrent_requests=pose_labelbox.aio.DEFAULT_MAX_CONCURRENT_REQUESTS,
+    data_row_batch_size=None,
 ):
-    if client is None:
-        client = generate_labelbox_client()
-    name = f'Pose tracks 2D ({inference_id})'
-    existing_datasets = client.get_datasets(where=(lb.Dataset.name == name))
-    existing_dataset = existing_datasets.get_one()
-    if existing_dataset is not None:
-        logger.info(f'Dataset for inference ID {inference_id} already exists. Skipping')
-        return existing_dataset.uid
-    environment_id = honeycomb_io.fetch_environment_id(
-        environment_id=environment_id,
-        environment_name=environment_name,
-    )
-    if start is None or end is None:
-        raise ValueError('Start and end values not provided')
-    labeling_period_start, labeling_period_end = pose_labelbox.utils.generate_output_period(
+    return pose_labelbox.aio.run_sync(create_dataset_async(
         start=start,
         end=end,
+        inference_id=inference_id,
+        environment_name=environment_name,
+        environment_id=environment_id,
         video_duration=video_duration,
-    )
-    inference_directory_path = (
-        pathlib.Path(bounding_box_overlay_video_parent_directory) /
-        inference_id
-    )
-    logger.info('Creating dataset')
-    dataset = client.create_dataset(
-        iam_integration=None,
-        name=name,
-        description=name
-    )
-    datarows=list()
-    for camera_directory_path in sorted(inference_directory_path.iterdir()):
+        bounding_box_overlay_video_parent_directory=bounding_box_overlay_video_parent_directory,
+        overlay_video_extension=overlay_video_extension,
+        frame_period=frame_period,
+        client=client,
+        session=session,
+        max_concurrent_requests=max_concurrent_requests,
+        data_row_batch_size=data_row_batch_size,
+    ))
+
+async def create_dataset_async(
+    start,
+    end,
+    inference_id,
+    environment_name=None,
+    environment_id=None,
+    video_duration=datetime.timedelta(seconds=10),
+    bounding_box_overlay_video_parent_directory='/data/bounding_box_overlay_videos',
+    overlay_video_extension='mp4',
+    frame_period=datetime.timedelta(milliseconds=100),
+    client=None,
+    session=None,
+    max_concurrent_requests=pose_labelbox.aio.DEFAULT_MAX_CONCURRENT_REQUESTS,
+    data_row_batch_size=None,
+    request_pool=None,
+):
+    # Videos are uploaded concurrently. With data_row_batch_size set, data rows
+    # are created in batches whose tasks are submitted and polled concurrently
+    async with pose_labelbox.aio.open_request_pool(request_pool=request_pool, max_concurrent_requests=max_concurrent_requests) as request_pool:
+        if client is None:
+            client = await request_pool.run(generate_labelbox_client, session=session)
+        name = f'Pose tracks 2D ({inference_id})'
+
+        def fetch_existing_dataset():
+            return client.get_datasets(where=(lb.Dataset.name == name)).get_one()
+
+        existing_dataset = await request_pool.run(fetch_existing_dataset)
+        if existing_dataset is not None:
+            logger.info(f'Dataset for inference ID {inference_id} already exists. Skipping')
+            return existing_dataset.uid
+
+        def fetch_environment_id():
+            return honeycomb_io.fetch_environment_id(
+                environment_id=environment_id,
+                environment_name=environment_name,
+                client=pose_labelbox.session.resolve_honeycomb_client(session=session),
+            )
+
+        environment_id = await request_pool.run(fetch_environment_id)
+        if start is None or end is None:
+            raise ValueError('Start and end values not provided')
+        labeling_period_start, labeling_period_end = pose_labelbox.utils.generate_output_period(
+            start=start,
+            end=end,
+            video_duration=video_duration,
+        )
+        overlay_videos = generate_bounding_box_overlay_video_records(
+            inference_directory_path=pathlib.Path(bounding_box_overlay_video_parent_directory) / inference_id,
+            overlay_video_extension=overlay_video_extension,
+            frame_period=frame_period,
+        )
+        logger.info('Creating dataset')
+        dataset = await request_pool.run(
+            client.create_dataset,
+            iam_integration=None,
+            name=name,
+            description=name
+        )
+        logger.info(f'Uploading {len(overlay_videos)} videos')
+        video_urls = await asyncio.gather(*[
+            request_pool.run(
+                upload_bounding_box_overlay_video,
+                client=client,
+                video_local_path=overlay_video['video_local_path'],
+                camera_id=overlay_video['camera_id'],
+            )
+            for overlay_video in overlay_videos
+        ])
+        datarows = [
+            generate_data_row(
+                overlay_video=overlay_video,
+                video_url=video_url,
+                environment_id=environment_id,
+                inference_id=inference_id,
+                labeling_period_start=labeling_period_start,
+                labeling_period_end=labeling_period_end,
+            )
+            for overlay_video, video_url in zip(overlay_videos, video_urls)
+        ]
+        if data_row_batch_size is None:
+            datarow_batches = [datarows]
+        else:
+            datarow_batches = [
+                datarows[batch_start:batch_start + data_row_batch_size]
+                for batch_start in range(0, len(datarows), data_row_batch_size)
+            ]
+        with pose_labelbox.metrics.time_stage('create_data_rows'):
+            create_tasks = await asyncio.gather(*[
+                request_pool.run(
+                    create_data_rows,
+                    dataset=dataset,
+                    datarows=datarow_batch,
+                )
+                for datarow_batch in datarow_batches
+            ])
+    for create_task in create_tasks:
+        if create_task.errors:
+            raise Exception(f'Creation task errors: {create_task.errors}')
+        logger.info(f'Creation task status: {create_task.status}')
+    pose_labelbox.metrics.increment_counter('data_rows_created', len(datarows))
+    return dataset.uid
+
+def generate_bounding_box_overlay_video_records(
+    inference_directory_path,
+    overlay_video_extension='mp4',
+    frame_period=datetime.timedelta(milliseconds=100),
+):
+    overlay_videos = list()
+    for camera_directory_path in sorted(pathlib.Path(inference_directory_path).iterdir()):
         camera_id = camera_directory_path.name
         logger.info(f'Generating data rows for camera {camera_id}')
-        for video_local_path in sorted(camera_directory_path.iterdir()):
+        for video_local_path in sorted(camera_directory_path.glob(f'*.{overlay_video_extension}')):
             pose_track_label, video_start, video_end = parse_bounding_box_overlay_video_path(video_local_path)
             num_frames = round((video_end - video_start)/frame_period)
-            logger.info(f'Generating data row for camera {camera_id} and pose track label {pose_track_label}')
-            data_id = str(uuid.uuid4())
-            video_url = client.upload_file(video_local_path)
-            datarows.append({
-                lb.DataRow.row_data: video_url,
-                lb.DataRow.external_id: data_id,
-                lb.DataRow.global_key: data_id,
-                lb.DataRow.metadata_fields: [
-                    lb.DataRowMetadataField(name='environment_id', value=environment_id),
-                    lb.DataRowMetadataField(name='inference_id',  value=inference_id),
-                    lb.DataRowMetadataField(name='labeling_period_start_isoformat',  value=labeling_period_start.strftime(LABELBOX_DATETIME_FORMAT)),
-                    lb.DataRowMetadataField(name='labeling_period_end_isoformat',  value=labeling_period_end.strftime(LABELBOX_DATETIME_FORMAT)),
-                    lb.DataRowMetadataField(name='camera_id',  value=camera_id),
-                    lb.DataRowMetadataField(name='pose_track_2d_label',  value=pose_track_label),
-                    lb.DataRowMetadataField(name='video_start_isoformat',  value=video_start.strftime(LABELBOX_DATETIME_FORMAT)),
-                    lb.DataRowMetadataField(name='video_end_isoformat',  value=video_end.strftime(LABELBOX_DATETIME_FORMAT)),
-                    lb.DataRowMetadataField(name='num_frames',  value=str(num_frames)),
-                ]
+            video_metadata = pose_labelbox.process_video.read_bounding_box_overlay_video_metadata(video_local_path)
+            frame_offsets = video_metadata.get('frame_offsets')
+            if frame_offsets is not None:
+                # Sparse videos only contain some of the frames in their span
+                num_frames = len(frame_offsets)
+            overlay_videos.append({
+                'camera_id': camera_id,
+                'video_local_path': video_local_path,
+                'pose_track_label': pose_track_label,
+                'video_start': video_start,
+                'video_end': video_end,
+                'num_frames': num_frames,
+                'pose_track_segment_index': video_metadata.get('pose_track_segment_index', 0),
+                # Overlay videos may be downscaled renditions of the camera frames
+                'overlay_scale': video_metadata.get('overlay_scale', 1.0),
+                'frame_offsets': frame_offsets,
+                'video_segment_index': video_metadata.get('video_segment_index', 0),
+                'video_segment_offset': video_metadata.get('video_segment_offset', 0),
             })
+    return overlay_videos
+
+def upload_bounding_box_overlay_video(
+    client,
+    video_local_path,
+    camera_id,
+):
+    upload_start_time = time.perf_counter()
+    video_url = client.upload_file(video_local_path)
+    pose_labelbox.metrics.record_timing('upload_video', time.perf_counter() - upload_start_time, camera_id=camera_id)
+    pose_labelbox.metrics.record_file_bytes('video_bytes_uploaded', video_local_path, camera_id=camera_id)
+    return video_url
+
+def generate_data_row(
+    overlay_video,
+    video_url,
+    environment_id,
+    inference_id,
+    labeling_period_start,
+    labeling_period_end,
+):
+    logger.info(f"Generating data row for camera {overlay_video['camera_id']} and pose track label {overlay_video['pose_track_label']} (segment {overlay_video['pose_track_segment_index']}, video segment {overlay_video['video_segment_index']})")
+    data_id = str(uuid.uuid4())
+    metadata_fields = [
+        lb.DataRowMetadataField(name='environment_id', value=environment_id),
+        lb.DataRowMetadataField(name='inference_id',  value=inference_id),
+        lb.DataRowMetadataField(name='labeling_period_start_isoformat',  value=labeling_period_start.strftime(LABELBOX_DATETIME_FORMAT)),
+        lb.DataRowMetadataField(name='labeling_period_end_isoformat',  value=labeling_period_end.strftime(LABELBOX_DATETIME_FORMAT)),
+        lb.DataRowMetadataField(name='camera_id',  value=overlay_video['camera_id']),
+        lb.DataRowMetadataField(name='pose_track_2d_label',  value=overlay_video['pose_track_label']),
+        lb.DataRowMetadataField(name='pose_track_segment_index',  value=str(overlay_video['pose_track_segment_index'])),
+        lb.DataRowMetadataField(name='video_start_isoformat',  value=overlay_video['video_start'].strftime(LABELBOX_DATETIME_FORMAT)),
+        lb.DataRowMetadataField(name='video_end_isoformat',  value=overlay_video['video_end'].strftime(LABELBOX_DATETIME_FORMAT)),
+        lb.DataRowMetadataField(name='num_frames',  value=str(overlay_video['num_frames'])),
+        lb.DataRowMetadataField(name='overlay_scale',  value=str(overlay_video['overlay_scale'])),
+        lb.DataRowMetadataField(name='video_segment_index',  value=str(overlay_video['video_segment_index'])),
+        lb.DataRowMetadataField(name='video_segment_offset',  value=str(overlay_video['video_segment_offset'])),
+    ]
+    if overlay_video['frame_offsets'] is not None:
+        metadata_fields.append(lb.DataRowMetadataField(name='frame_offsets',  value=encode_frame_offsets(overlay_video['frame_offsets'])))
+    return {
+        lb.DataRow.row_data: video_url,
+        lb.DataRow.external_id: data_id,
+        lb.DataRow.global_key: data_id,
+        lb.DataRow.metadata_fields: metadata_fields,
+    }
+
+def create_data_rows(dataset, datarows):
+    # Submits a data row creation task and polls it until it finishes
     create_task = dataset.create_data_rows(datarows)
     create_task.wait_till_done()
-    if create_task.errors:
-        raise Exception(f'Creation task errors: {create_task.errors}')
-    logger.info('Creation task status: {create_task.status}')
-    return dataset.uid
+    return create_task
 
 bounding_box_overlay_filename_re = re.compile(r'(?P<pose_track_label>[0-9]+)_(?P<start_year_string>[0-9]{4})(?P<start_month_string>[0-9]{2})(?P<start_day_string>[0-9]{2})_(?P<start_hour_string>[0-9]{2})(?P<start_minute_string>[0-9]{2})(?P<start_second_string>[0-9]{2})_(?P<start_microsecond_string>[0-9]{6})_(?P<end_year_string>[0-9]{4})(?P<end_month_string>[0-9]{2})(?P<end_day_string>[0-9]{2})_(?P<end_hour_string>[0-9]{2})(?P<end_minute_string>[0-9]{2})(?P<end_second_string>[0-9]{2})_(?P<end_microsecond_string>[0-9]{6})')
 def parse_bounding_box_overlay_video_path(
@@ -335,13 +593,49 @@ def parse_bounding_box_overlay_video_path(
     )
     return pose_track_label, video_start, video_end
 
+@pose_labelbox.profiling.profiled('fetch_labels')
 def fetch_labels(
     project_id,
     frame_period=datetime.timedelta(milliseconds=100),
     client=None,
+    session=None,
+):
+    return pose_labelbox.aio.run_sync(fetch_labels_async(
+        project_id=project_id,
+        frame_period=frame_period,
+        client=client,
+        session=session,
+    ))
+
+async def fetch_labels_async(
+    project_id,
+    frame_period=datetime.timedelta(milliseconds=100),
+    client=None,
+    session=None,
+    max_concurrent_requests=pose_labelbox.aio.DEFAULT_MAX_CONCURRENT_REQUESTS,
+    request_pool=None,
+):
+    # Exports of several projects can be awaited together (e.g., with
+    # asyncio.gather and a shared request pool)
+    async with pose_labelbox.aio.open_request_pool(request_pool=request_pool, max_concurrent_requests=max_concurrent_requests) as request_pool:
+        if client is None:
+            client = await request_pool.run(generate_labelbox_client, session=session)
+        with pose_labelbox.metrics.time_stage('export_labels'):
+            data_rows = await request_pool.run(
+                export_labels,
+                client=client,
+                project_id=project_id,
+            )
+    return parse_labels(
+        data_rows=data_rows,
+        project_id=project_id,
+        frame_period=frame_period,
+    )
+
+def export_labels(
+    client,
+    project_id,
 ):
-    if client is None:
-        client = generate_labelbox_client()
     export_params= {
     "attachments": False,
     "metadata_fields": True,
@@ -356,8 +650,14 @@ def fetch_labels(
     export_task.wait_till_done()
     if export_task.errors:
         raise Exception(f'Export task errors: {export_task.errors}')
-    data_rows = export_task.result
-    label_data_df_list = list()
+    return export_task.result
+
+def parse_labels(
+    data_rows,
+    project_id,
+    frame_period=datetime.timedelta(milliseconds=100),
+):
+    segment_label_data = dict()
     for data_row in data_rows:
         metadata = dict()
         for metadata_field in data_row.get('metadata_fields'):
@@ -376,6 +676,12 @@ def fetch_labels(
         )
         camera_id = metadata.get('camera_id')
         pose_track_2d_label = int(metadata.get('pose_track_2d_label'))
+        # Data rows created before tracks were split at gaps have no segment
+        # index; they cover the whole track
+        pose_track_segment_index = int(metadata.get('pose_track_segment_index', 0))
+        # Likewise, data rows created before tracks were cut into fixed-length
+        # videos cover the whole segment
+        video_segment_index = int(metadata.get('video_segment_index', 0))
         pose_track_start = pd.to_datetime(
             metadata.get('video_start_isoformat'),
             format=LABELBOX_DATETIME_FORMAT,
@@ -387,16 +693,26 @@ def fetch_labels(
             utc=True
         )
         num_frames = int(metadata.get('num_frames'))
+        # Sparse videos map each video frame to an offset (in frame periods)
+        # from the start of the video
+        frame_offsets = None
+        if metadata.get('frame_offsets') is not None:
+            frame_offsets = decode_frame_offsets(metadata.get('frame_offsets'))
+            if len(frame_offsets) != num_frames:
+                raise ValueError(f'Frame offsets for pose track {pose_track_2d_label} (segment {pose_track_segment_index}) do not match the number of frames')
         labels = data_row['projects'][project_id]['labels']
         if len(labels) == 0:
             continue
         if len(labels) > 1:
-            raise ValueError(f'More than one label found for pose track {pose_track_2d_label}')
+            raise ValueError(f'More than one label found for pose track {pose_track_2d_label} (segment {pose_track_segment_index})')
         label = labels[0]
         pose_track_data_list = list()
         for frame_number, frame_data in label['annotations']['frames'].items():
             frame_number = int(frame_number)
-            timestamp = pose_track_start + (frame_number - 1)*frame_period
+            if frame_offsets is None:
+                timestamp = pose_track_start + (frame_number - 1)*frame_period
+            else:
+                timestamp = pose_track_start + frame_offsets[frame_number - 1]*frame_period
             classifications = frame_data['classifications']
             if len(classifications) == 0:
                 continue
@@ -408,14 +724,31 @@ def fetch_labels(
                 'timestamp': timestamp,
                 'person_name': person_name
             })
+        pose_track_data = pd.DataFrame(pose_track_data_list)
+        fill_end = pose_track_data['timestamp'].max()
+        if frame_offsets is not None:
+            # The last labeled keyframe holds until the end of the video
+            fill_end = pose_track_end - frame_period
+        # Fixed-length videos of one track segment are collected and filled
+        # together below
+        segment_key = (camera_id, pose_track_2d_label, pose_track_segment_index)
+        if segment_key not in segment_label_data:
+            segment_label_data[segment_key] = {'data': list(), 'fill_end': fill_end, 'video_segment_indices': set()}
+        if video_segment_index in segment_label_data[segment_key]['video_segment_indices']:
+            raise ValueError(f'More than one video found for pose track {pose_track_2d_label} (segment {pose_track_segment_index}, video segment {video_segment_index})')
+        segment_label_data[segment_key]['video_segment_indices'].add(video_segment_index)
+        segment_label_data[segment_key]['data'].append(pose_track_data)
+        segment_label_data[segment_key]['fill_end'] = max(segment_label_data[segment_key]['fill_end'], fill_end)
+    label_data_df_list = list()
+    for (camera_id, pose_track_2d_label, pose_track_segment_index), segment in segment_label_data.items():
         pose_track_data = (
-            pd.DataFrame(pose_track_data_list)
+            pd.concat(segment['data'])
             .set_index('timestamp')
             .sort_index()
         )
         new_index = pd.date_range(
             start=pose_track_data.index.min(),
-            end=pose_track_data.index.max(),
+            end=segment['fill_end'],
             freq=frame_period,
             name='timestamp'
         )
@@ -425,7 +758,13 @@ def fetch_labels(
         )
         pose_track_data_filled['camera_id'] = camera_id
         pose_track_data_filled['pose_track_2d_label'] = pose_track_2d_label
+        pose_track_data_filled['pose_track_segment_index'] = pose_track_segment_index
         label_data_df_list.append(pose_track_data_filled)
+        pose_labelbox.metrics.increment_counter('labeled_frames_fetched', len(pose_track_data_filled), camera_id=camera_id)
+    # Each segment is forward-filled on its own (so labels never carry across
+    # a gap, but do carry across the fixed-length videos within a segment)
+    # and the segments of a track are then stitched back together in time
+    # order
     label_data = (
         pd.concat(label_data_df_list)
         .reset_index()
@@ -438,7 +777,42 @@ def fetch_labels(
     )
     return label_data
 
-def generate_labelbox_client(api_key=None):
+def encode_frame_offsets(frame_offsets):
+    # Labelbox metadata values are strings, so offsets are stored as the first
+    # offset followed by run-length encoded differences ('<step>x<count>'),
+    # e.g. [0, 10, 20, 30, 33] -> '0,10x3,3'
+    frame_offsets = [int(frame_offset) for frame_offset in frame_offsets]
+    if len(frame_offsets) == 0:
+        return ''
+    tokens = [str(frame_offsets[0])]
+    step = None
+    count = 0
+    for previous_offset, frame_offset in zip(frame_offsets[:-1], frame_offsets[1:]):
+        if frame_offset - previous_offset == step:
+            count += 1
+            continue
+        if step is not None:
+            tokens.append(f'{step}x{count}' if count > 1 else str(step))
+        step = frame_offset - previous_offset
+        count = 1
+    if step is not None:
+        tokens.append(f'{step}x{count}' if count > 1 else str(step))
+    return ','.join(tokens)
+
+def decode_frame_offsets(frame_offsets_string):
+    if frame_offsets_string == '':
+        return list()
+    tokens = frame_offsets_string.split(',')
+    frame_offsets = [int(tokens[0])]
+    for token in tokens[1:]:
+        step, _, count = token.partition('x')
+        for _ in range(int(count) if count else 1):
+            frame_offsets.append(frame_offsets[-1] + int(step))
+    return frame_offsets
+
+def generate_labelbox_client(api_key=None, session=None):
+    if session is not None:
+        return session.labelbox_client
     if api_key is None:
         api_key = os.getenv('LABELBOX_API_KEY')
     client = lb.Client(api_key=api_key)
@@ -0,0 +1,868 @@
+import pose_labelbox.core
+import pose_labelbox.alphapose
+import pose_labelbox.overlay
+import pose_labelbox.process_video
+import pose_labelbox.labelbox
+import pose_labelbox.metrics
+import pose_labelbox.aio
+import pose_labelbox.utils
+import contextlib
+import datetime
+import threading
+import resource
+import pathlib
+import random
+import shutil
+import types
+import time
+import json
+import uuid
+import sys
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+ffmpeg = pose_labelbox.utils.lazy_import('ffmpeg')
+pd = pose_labelbox.utils.lazy_import('pandas')
+
+# The counter whose increase during each stage is reported as the stage's
+# throughput
+LOAD_TEST_STAGE_ITEM_COUNTERS = {
+    'download_videos': 'videos_downloaded',
+    'extract_frames': 'frames_extracted',
+    'run_pose_detection_2d': 'images_detected',
+    'parse_alphapose_output': 'poses_2d_parsed',
+    'generate_bounding_box_overlays': 'overlay_images_generated',
+    'generate_bounding_box_overlay_videos': 'overlay_video_frames_encoded',
+    'create_project': 'data_rows_created',
+    'fetch_labels': 'labeled_frames_fetched',
+}
+
+# AlphaPose with the Halpe 26 keypoint model
+NUM_KEYPOINTS = 26
+
+class FakeServiceError(Exception):
+    pass
+
+class FakeService:
+    # Stands in for a remote service: every request waits for the latency
+    # plus the time its payload takes at the given bandwidth (bytes per
+    # second, None for unlimited) and fails with probability error_rate.
+    # Requests, injected errors and bytes are counted by request name
+    def __init__(
+        self,
+        name,
+        latency=0.0,
+        error_rate=0.0,
+        bandwidth=None,
+        seed=0,
+    ):
+        if not 0.0 <= error_rate <= 1.0:
+            raise ValueError('Error rate must be between 0 and 1')
+        if bandwidth is not None and bandwidth <= 0:
+            raise ValueError('Bandwidth must be positive')
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.bandwidth = bandwidth
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_counts = dict()
+        self.error_counts = dict()
+        self.byte_counts = dict()
+
+    def request(self, request_name, num_bytes=0):
+        with self.lock:
+            self.request_counts[request_name] = self.request_counts.get(request_name, 0) + 1
+            self.byte_counts[request_name] = self.byte_counts.get(request_name, 0) + num_bytes
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.error_counts[request_name] = self.error_counts.get(request_name, 0) + 1
+        delay = self.latency
+        if self.bandwidth is not None:
+            delay += num_bytes/self.bandwidth
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise FakeServiceError(f'Injected {self.name} error in {request_name}')
+
+    def summary(self):
+        with self.lock:
+            return {
+                'num_requests': sum(self.request_counts.values()),
+                'num_errors': sum(self.error_counts.values()),
+                'num_bytes': sum(self.byte_counts.values()),
+            }
+
+class FakeHoneycomb(FakeService):
+    # Replaces the honeycomb_io module: one environment whose cameras are
+    # all active for the whole run
+    DEFAULT_CAMERA_DEVICE_TYPES = ['PI3WITHCAMERA', 'PIZEROWITHCAMERA']
+
+    def __init__(
+        self,
+        environment_id,
+        camera_ids,
+        latency=0.0,
+        error_rate=0.0,
+        seed=0,
+    ):
+        super().__init__(
+            name='honeycomb',
+            latency=latency,
+            error_rate=error_rate,
+            seed=seed,
+        )
+        self.environment_id = environment_id
+        self.camera_ids = list(camera_ids)
+
+    def generate_client(self, **kwargs):
+        self.request('generate_client')
+        return types.SimpleNamespace(service=self)
+
+    def fetch_environment_id(self, environment_id=None, environment_name=None, client=None, **kwargs):
+        if environment_id is not None:
+            return environment_id
+        self.request('fetch_environment_id')
+        return self.environment_id
+
+    def fetch_device_ids(self, device_ids=None, environment_id=None, environment_name=None, **kwargs):
+        self.request('fetch_device_ids')
+        if device_ids is None:
+            return list(self.camera_ids)
+        return [camera_id for camera_id in self.camera_ids if camera_id in device_ids]
+
+class FakeVideoService(FakeService):
+    # Replaces the video_io module. Every stored video is a copy of one
+    # synthetic template video; downloads copy it into the local video
+    # directory at the configured bandwidth
+    def __init__(
+        self,
+        environment_id,
+        camera_ids,
+        template_video_path,
+        video_duration=datetime.timedelta(seconds=10),
+        frames_per_second=10,
+        latency=0.0,
+        error_rate=0.0,
+        bandwidth=None,
+        seed=0,
+    ):
+        super().__init__(
+            name='video_service',
+            latency=latency,
+            error_rate=error_rate,
+            bandwidth=bandwidth,
+            seed=seed,
+        )
+        self.environment_id = environment_id
+        self.camera_ids = list(camera_ids)
+        self.template_video_path = pathlib.Path(template_video_path)
+        self.video_duration = video_duration
+        self.frames_per_second = frames_per_second
+        self.config = types.SimpleNamespace(
+            HONEYCOMB_URI=None,
+            HONEYCOMB_TOKEN_URI=None,
+            HONEYCOMB_AUDIENCE=None,
+            HONEYCOMB_CLIENT_ID=None,
+            HONEYCOMB_CLIENT_SECRET=None,
+            VIDEO_STORAGE_URL=None,
+            VIDEO_STORAGE_AUTH_DOMAIN=None,
+            VIDEO_STORAGE_AUDIENCE=None,
+            VIDEO_STORAGE_CLIENT_ID=None,
+            VIDEO_STORAGE_CLIENT_SECRET=None,
+            MAX_DOWNLOAD_WORKERS=4,
+        )
+        self.client = types.SimpleNamespace(VideoStorageClient=self.generate_client)
+
+    def generate_client(self, **kwargs):
+        self.request('generate_client')
+        return types.SimpleNamespace(service=self)
+
+    def fetch_video_metadata(self, start, end, camera_device_ids=None, **kwargs):
+        self.request('fetch_video_metadata')
+        video_starts = pose_labelbox.core.generate_target_video_starts(
+            start=start,
+            end=end,
+            video_duration=self.video_duration,
+        )
+        return [
+            {
+                'data_id': str(uuid.uuid5(uuid.NAMESPACE_URL, f'{camera_id}/{video_start.isoformat()}')),
+                'environment_id': self.environment_id,
+                'device_id': camera_id,
+                'video_timestamp': video_start,
+                'fps': self.frames_per_second,
+                'duration_seconds': self.video_duration.total_seconds(),
+            }
+            for camera_id in self.camera_ids
+            if camera_device_ids is None or camera_id in camera_device_ids
+            for video_start in video_starts
+        ]
+
+    def download_video_files(
+        self,
+        video_metadata,
+        local_video_directory='/data/videos',
+        video_filename_extension=None,
+        overwrite=False,
+        **kwargs
+    ):
+        if video_filename_extension is None:
+            video_filename_extension = 'mp4'
+        video_metadata_with_local_paths = list()
+        for video_metadatum in video_metadata:
+            video_local_path = pose_labelbox.core.generate_video_path(
+                environment_id=video_metadatum['environment_id'],
+                camera_id=video_metadatum['device_id'],
+                video_start=video_metadatum['video_timestamp'],
+                local_video_directory=local_video_directory,
+                video_filename_extension=video_filename_extension,
+            )
+            if overwrite or not video_local_path.is_file():
+                self.request('download_video_file', num_bytes=self.template_video_path.stat().st_size)
+                video_local_path.parent.mkdir(parents=True, exist_ok=True)
+                temporary_path = video_local_path.with_name(f'.{video_local_path.name}.{uuid.uuid4().hex}.tmp')
+                shutil.copyfile(self.template_video_path, temporary_path)
+                os.replace(temporary_path, video_local_path)
+            video_metadata_with_local_paths.append({**video_metadatum, 'video_local_path': str(video_local_path)})
+        return video_metadata_with_local_paths
+
+class FakeLabelboxField:
+    # Class attributes such as lb.DataRow.row_data are used both in queries
+    # (lb.Dataset.name == name) and as data row keys
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return (self.name, other)
+
+    def __hash__(self):
+        return hash(self.name)
+
+class FakeLabelbox(FakeService):
+    # Replaces the labelbox module and its client. Uploads are charged at the
+    # configured bandwidth. Exported projects come back with the first and
+    # last frame of each video labeled with the person assigned to the track
+    def __init__(
+        self,
+        person_names,
+        latency=0.0,
+        error_rate=0.0,
+        bandwidth=None,
+        seed=0,
+    ):
+        super().__init__(
+            name='labelbox',
+            latency=latency,
+            error_rate=error_rate,
+            bandwidth=bandwidth,
+            seed=seed,
+        )
+        self.person_names = list(person_names)
+        self.projects = dict()
+        self.datasets = dict()
+        self.ontologies = dict()
+        self.feature_schemas = dict()
+        self.metadata_schema_names = set()
+        self.Project = types.SimpleNamespace(name=FakeLabelboxField('name'))
+        self.Dataset = types.SimpleNamespace(name=FakeLabelboxField('name'))
+        self.DataRow = types.SimpleNamespace(
+            row_data=FakeLabelboxField('row_data'),
+            external_id=FakeLabelboxField('external_id'),
+            global_key=FakeLabelboxField('global_key'),
+            metadata_fields=FakeLabelboxField('metadata_fields'),
+        )
+        self.MediaType = types.SimpleNamespace(Video='VIDEO')
+        self.schema = types.SimpleNamespace(data_row_metadata=types.SimpleNamespace(DataRowMetadataKind=str))
+        self.Option = lambda value, label: {'value': value, 'label': label}
+        self.Classification = FakeLabelboxClassification
+        self.DataRowMetadataField = lambda name, value: {'schema_name': name, 'value': value}
+
+    def Client(self, api_key=None):
+        self.request('generate_client')
+        return FakeLabelboxClient(self)
+
+    def delete_projects_and_datasets(self):
+        # Cleans up after a failed project creation so that a retry starts
+        # from scratch instead of reusing a partially filled dataset
+        with self.lock:
+            self.projects.clear()
+            self.datasets.clear()
+
+    def find_one(self, objects, where):
+        _, name = where
+        matches = [labelbox_object for labelbox_object in objects.values() if labelbox_object.name == name]
+        return types.SimpleNamespace(get_one=lambda: matches[0] if len(matches) > 0 else None)
+
+class FakeLabelboxClassification:
+    Type = types.SimpleNamespace(RADIO='radio')
+    Scope = types.SimpleNamespace(INDEX='index')
+
+    def __init__(self, class_type, name, instructions, options, scope):
+        self.name = name
+        self.instructions = instructions
+        self.options = options
+
+    def asdict(self):
+        return {'name': self.name, 'instructions': self.instructions, 'options': self.options}
+
+class FakeLabelboxClient:
+    def __init__(self, service):
+        self.service = service
+
+    def create_object(self, objects, **attributes):
+        labelbox_object = types.SimpleNamespace(uid=str(uuid.uuid4()), **attributes)
+        with self.service.lock:
+            objects[labelbox_object.uid] = labelbox_object
+        return labelbox_object
+
+    def get_projects(self, where):
+        self.service.request('get_projects')
+        return self.service.find_one(self.service.projects, where)
+
+    def get_project(self, project_id):
+        self.service.request('get_project')
+        return self.service.projects[project_id]
+
+    def create_project(self, name, media_type):
+        self.service.request('create_project')
+        project = self.create_object(self.service.projects, name=name, data_rows=list())
+        project.create_batch = lambda name, data_rows, priority: self.create_batch(project, data_rows)
+        project.setup_editor = lambda ontology: self.service.request('setup_editor')
+        project.export_v2 = lambda params, filters: self.export_project(project)
+        return project
+
+    def create_batch(self, project, data_rows):
+        self.service.request('create_batch')
+        project.data_rows.extend(data_rows)
+
+    def export_project(self, project):
+        self.service.request('export_v2')
+        data_rows = list()
+        for data_row in project.data_rows:
+            metadata = {metadata_field['schema_name']: metadata_field['value'] for metadata_field in data_row['metadata_fields']}
+            person_name = self.service.person_names[int(metadata['pose_track_2d_label']) % len(self.service.person_names)]
+            data_rows.append({
+                'metadata_fields': data_row['metadata_fields'],
+                'projects': {project.uid: {'labels': [{'annotations': {'frames': {
+                    str(frame_number): {'classifications': [{'radio_answer': {'name': person_name}}]}
+                    for frame_number in sorted({1, int(metadata['num_frames'])})
+                }}}]}},
+            })
+        num_bytes = len(json.dumps(data_rows))
+        self.service.request('export_result', num_bytes=num_bytes)
+        return types.SimpleNamespace(wait_till_done=lambda: None, errors=None, result=data_rows)
+
+    def get_datasets(self, where):
+        self.service.request('get_datasets')
+        return self.service.find_one(self.service.datasets, where)
+
+    def get_dataset(self, dataset_id):
+        self.service.request('get_dataset')
+        return self.service.datasets[dataset_id]
+
+    def create_dataset(self, iam_integration, name, description):
+        self.service.request('create_dataset')
+        dataset = self.create_object(self.service.datasets, name=name, data_rows=list())
+        dataset.create_data_rows = lambda datarows: self.create_data_rows(dataset, datarows)
+        dataset.export_data_rows = lambda: iter(list(dataset.data_rows))
+        return dataset
+
+    def create_data_rows(self, dataset, datarows):
+        self.service.request('create_data_rows')
+        dataset.data_rows.extend([
+            {field.name: value for field, value in datarow.items()}
+            for datarow in datarows
+        ])
+        return types.SimpleNamespace(wait_till_done=lambda: None, errors=None, status='COMPLETE')
+
+    def upload_file(self, path):
+        self.service.request('upload_file', num_bytes=os.path.getsize(path))
+        return f'https://storage.labelbox.invalid/{uuid.uuid4()}/{pathlib.Path(path).name}'
+
+    def get_data_row_metadata_ontology(self):
+        self.service.request('get_data_row_metadata_ontology')
+        metadata_schema_names = self.service.metadata_schema_names
+
+        def get_by_name(name):
+            if name not in metadata_schema_names:
+                raise KeyError(name)
+            return name
+
+        def create_schema(name, kind):
+            self.service.request('create_schema')
+            metadata_schema_names.add(name)
+
+        return types.SimpleNamespace(get_by_name=get_by_name, create_schema=create_schema)
+
+    def get_ontologies(self, name_contains):
+        self.service.request('get_ontologies')
+        return self.service.find_one(self.service.ontologies, (None, name_contains))
+
+    def get_ontology(self, ontology_id):
+        self.service.request('get_ontology')
+        return self.service.ontologies[ontology_id]
+
+    def create_ontology_from_feature_schemas(self, name, feature_schema_ids, media_type):
+        self.service.request('create_ontology')
+        return self.create_object(self.service.ontologies, name=name)
+
+    def get_feature_schemas(self, name_contains):
+        self.service.request('get_feature_schemas')
+        return self.service.find_one(self.service.feature_schemas, (None, name_contains))
+
+    def create_feature_schema(self, normalized):
+        self.service.request('create_feature_schema')
+        return self.create_object(self.service.feature_schemas, name=normalized['instructions'])
+
+class FakePoseDetector:
+    # Replaces the AlphaPose container with canned output: num_people boxes
+    # drifting across the frame, with a new track label every track_duration
+    # (to mimic tracker identity switches). seconds_per_image simulates
+    # detector throughput
+    def __init__(
+        self,
+        frame_width,
+        frame_height,
+        num_people=3,
+        track_duration=None,
+        frame_period=datetime.timedelta(milliseconds=100),
+        seconds_per_image=0.0,
+        seed=0,
+    ):
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.num_people = num_people
+        self.track_duration = track_duration
+        self.frame_period = frame_period
+        self.seconds_per_image = seconds_per_image
+        self.seed = seed
+
+    def __call__(
+        self,
+        image_list_path,
+        output_directory_path,
+        camera_id=None,
+        **kwargs
+    ):
+        with open(image_list_path, 'r') as fp:
+            image_paths = [pathlib.Path(line.strip()) for line in fp if len(line.strip()) > 0]
+        poses_2d_raw = list()
+        for image_path in image_paths:
+            _, timestamp = pose_labelbox.alphapose.parse_image_id(
+                image_id=image_path.name,
+                frame_period=self.frame_period,
+            )
+            poses_2d_raw.extend(self.generate_poses_2d_raw(image_path.name, timestamp))
+        if self.seconds_per_image > 0:
+            time.sleep(self.seconds_per_image*len(image_paths))
+        output_path = pathlib.Path(output_directory_path) / 'alphapose-results.json'
+        temporary_path = output_path.with_name(f'.{output_path.name}.{uuid.uuid4().hex}.tmp')
+        with open(temporary_path, 'w') as fp:
+            json.dump(poses_2d_raw, fp)
+        os.replace(temporary_path, output_path)
+        pose_labelbox.metrics.increment_counter('images_detected', len(image_paths), camera_id=camera_id)
+        return 0
+
+    def generate_poses_2d_raw(self, image_id, timestamp):
+        seconds = timestamp.timestamp()
+        track_index = 0
+        if self.track_duration is not None:
+            track_index = int(seconds // self.track_duration.total_seconds())
+        box_width = self.frame_width/(2*max(self.num_people, 1))
+        box_height = self.frame_height/2
+        poses_2d_raw = list()
+        for person_index in range(self.num_people):
+            phase = random.Random(f'{self.seed}/{person_index}').random()
+            # Each person crosses the frame and back once a minute
+            position = abs(((seconds/60.0 + phase) % 1.0)*2 - 1)
+            x = position*(self.frame_width - box_width)
+            y = (self.frame_height - box_height)*person_index/max(self.num_people - 1, 1)
+            keypoints = list()
+            for keypoint_index in range(NUM_KEYPOINTS):
+                keypoints.extend([
+                    x + box_width*((keypoint_index % 5) + 0.5)/5,
+                    y + box_height*((keypoint_index // 5) + 0.5)/6,
+                    0.9,
+                ])
+            poses_2d_raw.append({
+                'image_id': image_id,
+                'category_id': 1,
+                'keypoints': keypoints,
+                'score': 2.5,
+                'box': [x, y, box_width, box_height],
+                'idx': track_index*self.num_people + person_index + 1,
+            })
+        return poses_2d_raw
+
+class PeakMemorySampler:
+    # Samples the resident set size of this process on a background thread so
+    # that each stage's peak can be reported. Memory of subprocesses (ffmpeg)
+    # isn't included. Without /proc, falls back to the lifetime peak
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak_rss_bytes = 0
+        self._stop_event = threading.Event()
+        self._sampler_thread = None
+        self._page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else None
+        self._use_proc = os.path.isfile('/proc/self/statm')
+
+    def __enter__(self):
+        self.peak_rss_bytes = self.read_rss_bytes()
+        self._stop_event.clear()
+        self._sampler_thread = threading.Thread(target=self._sample, daemon=True)
+        self._sampler_thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop_event.set()
+        self._sampler_thread.join()
+        self._sampler_thread = None
+        self.peak_rss_bytes = max(self.peak_rss_bytes, self.read_rss_bytes())
+        return False
+
+    def _sample(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak_rss_bytes = max(self.peak_rss_bytes, self.read_rss_bytes())
+
+    def read_rss_bytes(self):
+        if self._use_proc:
+            with open('/proc/self/statm', 'r') as fp:
+                return int(fp.read().split()[1])*self._page_size
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss*1024
+
+@contextlib.contextmanager
+def install_fake_services(
+    honeycomb=None,
+    video_service=None,
+    labelbox=None,
+    pose_detector=None,
+):
+    # Swaps the fakes in for the honeycomb_io, video_io and labelbox modules
+    # (and the AlphaPose container) in every loaded pose_labelbox module, and
+    # restores the originals afterwards
+    replacements = {
+        'honeycomb_io': honeycomb,
+        'video_io': video_service,
+        'lb': labelbox,
+    }
+    originals = list()
+    try:
+        for module_name, module in list(sys.modules.items()):
+            if not module_name.startswith('pose_labelbox.') or module is None:
+                continue
+            for attribute_name, replacement in replacements.items():
+                if replacement is None or attribute_name not in vars(module):
+                    continue
+                originals.append((module, attribute_name, vars(module)[attribute_name]))
+                setattr(module, attribute_name, replacement)
+        if pose_detector is not None:
+            originals.append((pose_labelbox.alphapose, 'detect_poses_2d', pose_labelbox.alphapose.detect_poses_2d))
+            pose_labelbox.alphapose.detect_poses_2d = pose_detector
+        yield
+    finally:
+        for module, attribute_name, original in reversed(originals):
+            setattr(module, attribute_name, original)
+
+def generate_synthetic_video(
+    output_path,
+    video_duration=datetime.timedelta(seconds=10),
+    frames_per_second=10,
+    frame_width=640,
+    frame_height=360,
+    video_codec='libx264',
+    pixel_format='yuv420p',
+):
+    output_path = pathlib.Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    (
+        ffmpeg
+        .input(f'testsrc2=size={frame_width}x{frame_height}:rate={frames_per_second}', f='lavfi', t=video_duration.total_seconds())
+        .output(str(output_path), vcodec=video_codec, pix_fmt=pixel_format)
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    return output_path
+
+def run_load_test_stage(
+    stage_name,
+    stage_function,
+    metrics_sink,
+    services,
+    max_stage_attempts=3,
+    before_retry=None,
+):
+    # Runs a stage until it succeeds (stages skip work that is already done,
+    # so a retry resumes where the failed attempt stopped) and measures it.
+    # Only injected service errors are retried, after calling before_retry if
+    # given. Other errors are reported in the stage report rather than raised
+    item_counter_name = LOAD_TEST_STAGE_ITEM_COUNTERS.get(stage_name)
+    num_items_before = sum_counter(metrics_sink, item_counter_name)
+    service_summaries_before = {service.name: service.summary() for service in services}
+    error = None
+    result = None
+    start_time = time.perf_counter()
+    with PeakMemorySampler() as memory_sampler:
+        for attempt in range(1, max_stage_attempts + 1):
+            if attempt > 1 and before_retry is not None:
+                before_retry()
+            try:
+                result = stage_function()
+                error = None
+                break
+            except FakeServiceError as stage_error:
+                logger.warning(f'Stage {stage_name} failed on attempt {attempt}: {stage_error}')
+                error = stage_error
+            except Exception as stage_error:
+                logger.exception(f'Stage {stage_name} failed on attempt {attempt}')
+                error = stage_error
+                break
+    wall_seconds = time.perf_counter() - start_time
+    num_items = sum_counter(metrics_sink, item_counter_name) - num_items_before
+    stage_report = {
+        'stage': stage_name,
+        'wall_seconds': wall_seconds,
+        'num_attempts': attempt,
+        'num_items': num_items,
+        'items_per_second': num_items/wall_seconds if wall_seconds > 0 else float('nan'),
+        'peak_rss_bytes': memory_sampler.peak_rss_bytes,
+        'error': None if error is None else repr(error),
+    }
+    for service in services:
+        service_summary = service.summary()
+        for key, value in service_summary.items():
+            stage_report[f'{service.name}_{key}'] = value - service_summaries_before[service.name][key]
+    logger.info(f'Stage {stage_name}: {wall_seconds:.2f} s, {num_items} items ({stage_report["items_per_second"]:.1f}/s), peak RSS {memory_sampler.peak_rss_bytes/2**20:.0f} MiB')
+    return stage_report, result, error
+
+def sum_counter(metrics_sink, name):
+    if name is None:
+        return 0
+    return sum(
+        value
+        for (counter_name, _), value in list(metrics_sink.counters.items())
+        if counter_name == name
+    )
+
+def run_load_test(
+    working_directory,
+    num_cameras=2,
+    duration=datetime.timedelta(minutes=1),
+    start=None,
+    video_duration=datetime.timedelta(seconds=10),
+    frames_per_second=10,
+    frame_width=640,
+    frame_height=360,
+    num_people=3,
+    track_duration=None,
+    person_names=('Alice', 'Bob', 'Carol', 'Dave'),
+    honeycomb_latency=0.05,
+    honeycomb_error_rate=0.0,
+    video_service_latency=0.1,
+    video_service_error_rate=0.0,
+    video_service_bandwidth=50e6,
+    labelbox_latency=0.2,
+    labelbox_error_rate=0.0,
+    labelbox_bandwidth=10e6,
+    detection_seconds_per_image=0.0,
+    max_concurrent_requests=pose_labelbox.aio.DEFAULT_MAX_CONCURRENT_REQUESTS,
+    max_stage_attempts=3,
+    seed=0,
+    report_path=None,
+):
+    # Runs the full pipeline from video download to label fetch against
+    # in-process fakes of Honeycomb, the video service, Labelbox and
+    # AlphaPose, with all data under working_directory, and reports wall
+    # time, throughput, peak memory and service traffic per stage. Scale is
+    # set by the number of cameras and the duration of the run
+    working_directory = pathlib.Path(working_directory)
+    frames_per_video = round(video_duration.total_seconds()*frames_per_second)
+    frame_period = video_duration/frames_per_video
+    if start is None:
+        start = datetime.datetime(2023, 1, 1, 8, 0, 0, tzinfo=datetime.timezone.utc)
+    end = start + duration
+    id_random = random.Random(seed)
+    # Frame filenames are parsed back into camera IDs, which must be UUIDs
+    environment_id = str(uuid.UUID(int=id_random.getrandbits(128), version=4))
+    camera_ids = [str(uuid.UUID(int=id_random.getrandbits(128), version=4)) for _ in range(num_cameras)]
+    inference_id = str(uuid.UUID(int=id_random.getrandbits(128), version=4))
+    template_video_path = generate_synthetic_video(
+        output_path=working_directory / 'template_video.mp4',
+        video_duration=video_duration,
+        frames_per_second=frames_per_second,
+        frame_width=frame_width,
+        frame_height=frame_height,
+    )
+    honeycomb = FakeHoneycomb(
+        environment_id=environment_id,
+        camera_ids=camera_ids,
+        latency=honeycomb_latency,
+        error_rate=honeycomb_error_rate,
+        seed=seed,
+    )
+    video_service = FakeVideoService(
+        environment_id=environment_id,
+        camera_ids=camera_ids,
+        template_video_path=template_video_path,
+        video_duration=video_duration,
+        frames_per_second=frames_per_second,
+        latency=video_service_latency,
+        error_rate=video_service_error_rate,
+        bandwidth=video_service_bandwidth,
+        seed=seed + 1,
+    )
+    labelbox = FakeLabelbox(
+        person_names=person_names,
+        latency=labelbox_latency,
+        error_rate=labelbox_error_rate,
+        bandwidth=labelbox_bandwidth,
+        seed=seed + 2,
+    )
+    pose_detector = FakePoseDetector(
+        frame_width=frame_width,
+        frame_height=frame_height,
+        num_people=num_people,
+        track_duration=track_duration,
+        frame_period=frame_period,
+        seconds_per_image=detection_seconds_per_image,
+        seed=seed,
+    )
+    services = [honeycomb, video_service, labelbox]
+    directories = {
+        'local_video_directory': working_directory / 'videos',
+        'local_frames_directory': working_directory / 'frames',
+        'image_list_parent_directory': working_directory / 'image_lists',
+        'alphapose_output_parent_directory': working_directory / 'alphapose_output',
+        'bounding_box_overlay_parent_directory': working_directory / 'bounding_box_overlays',
+        'bounding_box_overlay_video_parent_directory': working_directory / 'bounding_box_overlay_videos',
+    }
+    stages = [
+        ('download_videos', lambda: pose_labelbox.core.download_videos(
+            start=start,
+            end=end,
+            environment_id=environment_id,
+            video_duration=video_duration,
+            local_video_directory=directories['local_video_directory'],
+            max_concurrent_requests=max_concurrent_requests,
+        )),
+        ('extract_frames', lambda: pose_labelbox.core.extract_frames(
+            start=start,
+            end=end,
+            environment_id=environment_id,
+            video_duration=video_duration,
+            frames_per_video=frames_per_video,
+            frames_per_second=frames_per_second,
+            local_video_directory=directories['local_video_directory'],
+            local_frames_directory=directories['local_frames_directory'],
+        )),
+        ('run_pose_detection_2d', lambda: pose_labelbox.core.run_pose_detection_2d(
+            start=start,
+            end=end,
+            environment_id=environment_id,
+            inference_id=inference_id,
+            video_duration=video_duration,
+            frames_per_video=frames_per_video,
+            local_frames_directory=directories['local_frames_directory'],
+            image_list_parent_directory=directories['image_list_parent_directory'],
+            alphapose_output_parent_directory=directories['alphapose_output_parent_directory'],
+        )),
+        ('parse_alphapose_output', lambda: pose_labelbox.alphapose.parse_alphapose_output(
+            inference_id=inference_id,
+            start=start,
+            end=end,
+            environment_id=environment_id,
+            video_duration=video_duration,
+            frame_period=frame_period,
+            alphapose_output_parent_directory=directories['alphapose_output_parent_directory'],
+        )),
+        ('generate_bounding_box_overlays', lambda: pose_labelbox.overlay.generate_bounding_box_overlays(
+            inference_id=inference_id,
+            start=start,
+            end=end,
+            environment_id=environment_id,
+            video_duration=video_duration,
+            frame_period=frame_period,
+            alphapose_output_parent_directory=directories['alphapose_output_parent_directory'],
+            local_frames_directory=directories['local_frames_directory'],
+            bounding_box_overlay_parent_directory=directories['bounding_box_overlay_parent_directory'],
+            local_video_directory=directories['local_video_directory'],
+        )),
+        ('generate_bounding_box_overlay_videos', lambda: pose_labelbox.process_video.generate_bounding_box_overlay_videos(
+            inference_id=inference_id,
+            bounding_box_overlay_parent_directory=directories['bounding_box_overlay_parent_directory'],
+            bounding_box_overlay_video_parent_directory=directories['bounding_box_overlay_video_parent_directory'],
+            frames_per_second=frames_per_second,
+            frame_period=frame_period,
+        )),
+        ('create_project', lambda: pose_labelbox.labelbox.create_project(
+            inference_id=inference_id,
+            person_descriptions=list(person_names),
+            start=start,
+            end=end,
+            environment_id=environment_id,
+            video_duration=video_duration,
+            bounding_box_overlay_video_parent_directory=directories['bounding_box_overlay_video_parent_directory'],
+            frame_period=frame_period,
+            max_concurrent_requests=max_concurrent_requests,
+        )),
+    ]
+    # A failed project creation can leave a partially filled dataset that a
+    # retry would otherwise reuse as if complete
+    stage_retry_cleanups = {
+        'create_project': labelbox.delete_projects_and_datasets,
+    }
+    stage_reports = list()
+    metrics_sink = pose_labelbox.metrics.InMemoryMetricsSink(keep_events=False)
+    run_start_time = time.perf_counter()
+    with pose_labelbox.metrics.metrics_sink(metrics_sink), install_fake_services(
+        honeycomb=honeycomb,
+        video_service=video_service,
+        labelbox=labelbox,
+        pose_detector=pose_detector,
+    ):
+        logger.info(f'Running load test for {num_cameras} cameras from {start} to {end} in {working_directory}')
+        for stage_name, stage_function in stages:
+            stage_report, result, error = run_load_test_stage(
+                stage_name=stage_name,
+                stage_function=stage_function,
+                metrics_sink=metrics_sink,
+                services=services,
+                max_stage_attempts=max_stage_attempts,
+                before_retry=stage_retry_cleanups.get(stage_name),
+            )
+            stage_reports.append(stage_report)
+            if error is not None:
+                logger.error(f"Stage {stage_name} failed after {stage_report['num_attempts']} attempts. Stopping load test")
+                break
+            if stage_name == 'create_project':
+                project_id = result
+                stage_report, _, error = run_load_test_stage(
+                    stage_name='fetch_labels',
+                    stage_function=lambda: pose_labelbox.labelbox.fetch_labels(
+                        project_id=project_id,
+                        frame_period=frame_period,
+                    ),
+                    metrics_sink=metrics_sink,
+                    services=services,
+                    max_stage_attempts=max_stage_attempts,
+                )
+                stage_reports.append(stage_report)
+    report = pd.DataFrame(stage_reports).set_index('stage')
+    logger.info(f'Load test finished in {time.perf_counter() - run_start_time:.2f} s')
+    if report_path is not None:
+        report_path = pathlib.Path(report_path)
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = report_path.with_name(f'.{report_path.name}.{uuid.uuid4().hex}.tmp')
+        with open(temporary_path, 'w') as fp:
+            json.dump({
+                'num_cameras': num_cameras,
+                'start': start.isoformat(),
+                'end': end.isoformat(),
+                'stages': stage_reports,
+            }, fp, indent=2)
+        os.replace(temporary_path, report_path)
+    return report
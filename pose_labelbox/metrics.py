@@ -0,0 +1,212 @@
+import subprocess
+import contextlib
+import threading
+import datetime
+import pathlib
+import json
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+_metrics_sink = None
+
+class InMemoryMetricsSink:
+    def __init__(self, keep_events=True):
+        self.keep_events = keep_events
+        self.events = list()
+        self.counters = dict()
+        self.timings = dict()
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        key = (event['name'], tuple(sorted(event['labels'].items())))
+        with self._lock:
+            if self.keep_events:
+                self.events.append(event)
+            if event['type'] == 'counter':
+                self.counters[key] = self.counters.get(key, 0) + event['value']
+            elif event['type'] == 'timing':
+                count, total, maximum = self.timings.get(key, (0, 0.0, 0.0))
+                self.timings[key] = (count + 1, total + event['value'], max(maximum, event['value']))
+
+    def flush(self):
+        pass
+
+    def summary(self):
+        with self._lock:
+            summary = list()
+            for (name, labels), value in self.counters.items():
+                summary.append({
+                    'type': 'counter',
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': None,
+                    'total': value,
+                    'mean': None,
+                    'max': None,
+                })
+            for (name, labels), (count, total, maximum) in self.timings.items():
+                summary.append({
+                    'type': 'timing',
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': count,
+                    'total': total,
+                    'mean': total/count,
+                    'max': maximum,
+                })
+        return summary
+
+class JSONLinesMetricsSink:
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._fp = open(self.path, 'a')
+
+    def record(self, event):
+        line = json.dumps(event, default=str) + '\n'
+        with self._lock:
+            self._fp.write(line)
+
+    def flush(self):
+        with self._lock:
+            self._fp.flush()
+
+    def close(self):
+        with self._lock:
+            self._fp.close()
+
+class PrometheusTextfileMetricsSink(InMemoryMetricsSink):
+    def __init__(self, path, prefix='pose_labelbox'):
+        super().__init__(keep_events=False)
+        self.path = pathlib.Path(path)
+        self.prefix = prefix
+
+    def flush(self):
+        lines = list()
+        for item in sorted(self.summary(), key=lambda item: (item['name'], sorted(item['labels'].items()))):
+            metric_name = f"{self.prefix}_{item['name']}"
+            label_string = format_prometheus_labels(item['labels'])
+            if item['type'] == 'counter':
+                lines.append(f"{metric_name}_total{label_string} {item['total']}")
+            else:
+                lines.append(f"{metric_name}_seconds_count{label_string} {item['count']}")
+                lines.append(f"{metric_name}_seconds_sum{label_string} {item['total']}")
+                lines.append(f"{metric_name}_seconds_max{label_string} {item['max']}")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.path.with_name(f'.{self.path.name}.{os.getpid()}.tmp')
+        with open(temporary_path, 'w') as fp:
+            fp.write('\n'.join(lines) + '\n')
+        os.replace(temporary_path, self.path)
+
+def format_prometheus_labels(labels):
+    if len(labels) == 0:
+        return ''
+    label_strings = list()
+    for key, value in sorted(labels.items()):
+        escaped_value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        label_strings.append(f'{key}="{escaped_value}"')
+    return '{' + ','.join(label_strings) + '}'
+
+def set_metrics_sink(sink):
+    global _metrics_sink
+    previous_sink = _metrics_sink
+    _metrics_sink = sink
+    return previous_sink
+
+def get_metrics_sink():
+    return _metrics_sink
+
+def flush_metrics():
+    if _metrics_sink is not None:
+        _metrics_sink.flush()
+
+@contextlib.contextmanager
+def metrics_sink(sink):
+    previous_sink = set_metrics_sink(sink)
+    try:
+        yield sink
+    finally:
+        sink.flush()
+        set_metrics_sink(previous_sink)
+
+def record_event(
+    event_type,
+    name,
+    value,
+    labels,
+):
+    if _metrics_sink is None:
+        return
+    _metrics_sink.record({
+        'type': event_type,
+        'name': name,
+        'value': value,
+        'labels': {key: str(label_value) for key, label_value in labels.items() if label_value is not None},
+        'time': datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+    })
+
+def increment_counter(name, value=1, **labels):
+    record_event(
+        event_type='counter',
+        name=name,
+        value=value,
+        labels=labels,
+    )
+
+def record_timing(name, seconds, **labels):
+    record_event(
+        event_type='timing',
+        name=name,
+        value=seconds,
+        labels=labels,
+    )
+
+def record_file_bytes(name, path, **labels):
+    if _metrics_sink is None:
+        return
+    try:
+        num_bytes = pathlib.Path(path).stat().st_size
+    except OSError:
+        return
+    increment_counter(name, num_bytes, **labels)
+
+@contextlib.contextmanager
+def time_stage(name, **labels):
+    if _metrics_sink is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start_time, **labels)
+
+def run_subprocess(
+    arguments,
+    name,
+    **labels
+):
+    start_time = time.perf_counter()
+    completed_process = subprocess.run(arguments)
+    record_subprocess(
+        name=name,
+        duration=time.perf_counter() - start_time,
+        returncode=completed_process.returncode,
+        **labels
+    )
+    return completed_process
+
+def record_subprocess(
+    name,
+    duration,
+    returncode,
+    **labels
+):
+    record_timing(f'{name}_subprocess', duration, **labels)
+    increment_counter(f'{name}_subprocess_exit', 1, returncode=returncode, **labels)
+    if returncode != 0:
+        logger.warning(f'Subprocess {name} exited with code {returncode}')
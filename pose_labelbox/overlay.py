@@ -1,16 +1,29 @@
 import pose_labelbox.core
 import pose_labelbox.alphapose
-import cv_utils
-import honeycomb_io
-import pandas as pd
-import tqdm
-import tqdm.notebook
+import pose_labelbox.metrics
+import pose_labelbox.profiling
+import pose_labelbox.cache
+import pose_labelbox.tracks
+import pose_labelbox.pose_index
+import pose_labelbox.rendering
+import pose_labelbox.pipeline
+import pose_labelbox.utils
+import pose_labelbox.session
 import datetime
+import functools
+import json
 import pathlib
+import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+cv_utils = pose_labelbox.utils.lazy_import('cv_utils')
+honeycomb_io = pose_labelbox.utils.lazy_import('honeycomb_io')
+np = pose_labelbox.utils.lazy_import('numpy')
+pd = pose_labelbox.utils.lazy_import('pandas')
+tqdm = pose_labelbox.utils.lazy_import('tqdm')
+
 def generate_bounding_box_overlays(
     inference_id,
     start,
@@ -29,12 +42,15 @@ def generate_bounding_box_overlays(
     audience=None,
     client_id=None,
     client_secret=None,
+    session=None,
     alphapose_output_parent_directory='/data/alphapose_output',
+    parsed_alphapose_output_suffix=None,
     show_timestamp=True,
     show_pose_track_label=True,
     show_no_detection_warning=True,
     local_frames_directory='/data/frames',
     frame_filename_extension='png',
+    bounding_box_overlay_parent_directory='/data/bounding_box_overlays',
     bounding_box_line_width=1.5,
     bounding_box_color='#00ff00',
     bounding_box_fill=False,
@@ -62,9 +78,30 @@ def generate_bounding_box_overlays(
     no_detection_warning_box_color='#ff0000',
     no_detection_warning_box_fill=True,
     no_detection_warning_box_alpha=0.5,
+    frame_reader=None,
+    max_gap=None,
+    local_video_directory='/data/videos',
+    video_filename_extension='mp4',
+    cache_manager=None,
+    in_place_rendering=False,
+    output_scale=1.0,
+    sparse_mode=None,
+    sparse_frame_interval=10,
+    keyframe_motion_threshold=0.5,
+    keyframe_min_iou=0.3,
+    max_keyframe_interval=None,
+    io_pipeline=True,
+    num_reader_threads=2,
+    num_writer_threads=2,
+    queue_depth=16,
     progress_bar=False,
     notebook=False,
 ):
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
+    if output_scale <= 0:
+        raise ValueError('Output scale must be positive')
+    if sparse_mode is not None and sparse_mode not in pose_labelbox.tracks.SPARSE_MODES:
+        raise ValueError(f'Sparse mode must be one of {pose_labelbox.tracks.SPARSE_MODES}')
     target_camera_ids = pose_labelbox.core.generate_target_camera_ids(
         start=start,
         end=end,
@@ -82,104 +119,327 @@ def generate_bounding_box_overlays(
         client_secret=client_secret,      
     )
     if environment_id is None:
-        environment_id = honeycomb_io.fetch_environment_id(environment_name=environment_name)
+        environment_id = honeycomb_io.fetch_environment_id(environment_name=environment_name, client=client)
     for camera_id in target_camera_ids:
-        logger.info(f'Generating bounding box overlay images for camera {camera_id}')
-        alphapose_output_directory_path = pose_labelbox.alphapose.generate_alphapose_output_directory_path(
-            inference_id=inference_id,
-            camera_id=camera_id,
-            start=start,
-            end=end,
-            video_duration=video_duration,
-            alphapose_output_parent_directory=alphapose_output_parent_directory,
-        )
-        parsed_alphapose_output_filename = pose_labelbox.alphapose.generate_parsed_alphapose_output_filename(
-            camera_id=camera_id,
-            start=start,
-            end=end,
-            video_duration=video_duration,
-        )
-        parsed_alphapose_output_file_path = alphapose_output_directory_path / parsed_alphapose_output_filename
-        poses_2d = (
-            pd.read_pickle(parsed_alphapose_output_file_path)
-            .sort_values([
-                'pose_track_label',
-                'timestamp'
-            ])
-        )
-        base_pose_track_iterator = poses_2d.groupby(
-            'pose_track_label',
-            group_keys=False
-        )
-        num_pose_tracks = len(poses_2d['pose_track_label'].unique())
-        if progress_bar:
-            if notebook:
-                pose_track_iterator = tqdm.notebook.tqdm(base_pose_track_iterator, total=num_pose_tracks)
-            else:
-                pose_track_iterator = tqdm(base_pose_track_iterator, total=num_pose_tracks)
-        else:
-            pose_track_iterator = base_pose_track_iterator
-        for pose_track_label, pose_track in pose_track_iterator:
-            pose_track_start = pose_track['timestamp'].min()
-            pose_track_end = pose_track['timestamp'].max()
-            timestamps = pd.date_range(
-                start=pose_track_start,
-                end=pose_track_end,
-                freq=frame_period
+        with pose_labelbox.metrics.time_stage('generate_bounding_box_overlays', camera_id=camera_id), pose_labelbox.profiling.profile_stage('generate_bounding_box_overlays', camera_id=camera_id):
+            logger.info(f'Generating bounding box overlay images for camera {camera_id}')
+            pose_index = pose_labelbox.pose_index.load_pose_index(
+                inference_id=inference_id,
+                camera_id=camera_id,
+                start=start,
+                end=end,
+                video_duration=video_duration,
+                frame_period=frame_period,
+                alphapose_output_parent_directory=alphapose_output_parent_directory,
+                parsed_alphapose_output_suffix=parsed_alphapose_output_suffix,
             )
-            for timestamp in timestamps:
-                num_timestamp_occurrences = (pose_track['timestamp'] == timestamp).sum()
-                if num_timestamp_occurrences > 1:
-                    raise ValueError(f'Pose track {pose_trackl_label} contains duplicate timestamps')
-                if num_timestamp_occurrences == 1:
-                    show_bounding_box = True
-                    bounding_box_corners=pose_track.loc[pose_track['timestamp'] == timestamp].iloc[0]['bounding_box_corners']
-                else:
-                    show_bounding_box = False
-                    bounding_box_corners = None
-                image_output_path = generate_bounding_box_overlay(
-                    inference_id=inference_id,
+            if cache_manager is not None and frame_reader is None:
+                # Source frames may have been evicted from the local cache, so
+                # regenerate any that are missing before drawing
+                pose_labelbox.core.extract_frames(
+                    start=start,
+                    end=end,
                     environment_id=environment_id,
-                    camera_id=camera_id,
-                    timestamp=timestamp,
-                    show_bounding_box=show_bounding_box,
-                    bounding_box_corners=bounding_box_corners,
-                    show_no_detection_warning=show_no_detection_warning,
-                    pose_track_label=pose_track_label,
-                    show_timestamp=show_timestamp,
-                    show_pose_track_label=show_pose_track_label,
+                    camera_ids=[camera_id],
                     video_duration=video_duration,
-                    frame_period=frame_period,
+                    client=client,
+                    uri=uri,
+                    token_uri=token_uri,
+                    audience=audience,
+                    client_id=client_id,
+                    client_secret=client_secret,
+                    session=session,
+                    local_video_directory=local_video_directory,
                     local_frames_directory=local_frames_directory,
+                    video_filename_extension=video_filename_extension,
                     frame_filename_extension=frame_filename_extension,
-                    bounding_box_line_width=bounding_box_line_width,
-                    bounding_box_color=bounding_box_color,
-                    bounding_box_fill=bounding_box_fill,
-                    bounding_box_alpha=bounding_box_alpha,
-                    timestamp_padding=timestamp_padding,
-                    timestamp_font_scale=timestamp_font_scale,
-                    timestamp_text_line_width=timestamp_text_line_width,
-                    timestamp_text_color=timestamp_text_color,
-                    timestamp_box_color=timestamp_box_color,
-                    timestamp_box_fill=timestamp_box_fill,
-                    timestamp_box_alpha=timestamp_box_alpha,
-                    pose_track_label_font_scale=pose_track_label_font_scale,
-                    pose_track_label_text_line_width=pose_track_label_text_line_width,
-                    pose_track_label_text_color=pose_track_label_text_color,
-                    pose_track_label_text_alpha=pose_track_label_text_alpha,
-                    pose_track_label_box_line_width=pose_track_label_box_line_width,
-                    pose_track_label_box_color=pose_track_label_box_color,
-                    pose_track_label_box_fill=pose_track_label_box_fill,
-                    pose_track_label_box_alpha=pose_track_label_box_alpha,
-                    no_detection_warning_font_scale=no_detection_warning_font_scale,
-                    no_detection_warning_text_line_width=no_detection_warning_text_line_width,
-                    no_detection_warning_text_color=no_detection_warning_text_color,
-                    no_detection_warning_text_alpha=no_detection_warning_text_alpha,
-                    no_detection_warning_box_line_width=no_detection_warning_box_line_width,
-                    no_detection_warning_box_color=no_detection_warning_box_color,
-                    no_detection_warning_box_fill=no_detection_warning_box_fill,
-                    no_detection_warning_box_alpha=no_detection_warning_box_alpha,
-                )            
+                    cache_manager=cache_manager,
+                )
+            protected_paths = [
+                pathlib.Path(local_frames_directory) / environment_id / camera_id,
+                pathlib.Path(bounding_box_overlay_parent_directory) / inference_id / camera_id,
+            ]
+            # Arguments shared by every overlay image for this camera
+            render_overlay = functools.partial(
+                generate_bounding_box_overlay,
+                inference_id=inference_id,
+                environment_id=environment_id,
+                camera_id=camera_id,
+                show_no_detection_warning=show_no_detection_warning,
+                show_timestamp=show_timestamp,
+                show_pose_track_label=show_pose_track_label,
+                output_scale=output_scale,
+                video_duration=video_duration,
+                frame_period=frame_period,
+                local_frames_directory=local_frames_directory,
+                frame_filename_extension=frame_filename_extension,
+                bounding_box_overlay_parent_directory=bounding_box_overlay_parent_directory,
+                bounding_box_line_width=bounding_box_line_width,
+                bounding_box_color=bounding_box_color,
+                bounding_box_fill=bounding_box_fill,
+                bounding_box_alpha=bounding_box_alpha,
+                timestamp_padding=timestamp_padding,
+                timestamp_font_scale=timestamp_font_scale,
+                timestamp_text_line_width=timestamp_text_line_width,
+                timestamp_text_color=timestamp_text_color,
+                timestamp_box_color=timestamp_box_color,
+                timestamp_box_fill=timestamp_box_fill,
+                timestamp_box_alpha=timestamp_box_alpha,
+                pose_track_label_font_scale=pose_track_label_font_scale,
+                pose_track_label_text_line_width=pose_track_label_text_line_width,
+                pose_track_label_text_color=pose_track_label_text_color,
+                pose_track_label_text_alpha=pose_track_label_text_alpha,
+                pose_track_label_box_line_width=pose_track_label_box_line_width,
+                pose_track_label_box_color=pose_track_label_box_color,
+                pose_track_label_box_fill=pose_track_label_box_fill,
+                pose_track_label_box_alpha=pose_track_label_box_alpha,
+                no_detection_warning_font_scale=no_detection_warning_font_scale,
+                no_detection_warning_text_line_width=no_detection_warning_text_line_width,
+                no_detection_warning_text_color=no_detection_warning_text_color,
+                no_detection_warning_text_alpha=no_detection_warning_text_alpha,
+                no_detection_warning_box_line_width=no_detection_warning_box_line_width,
+                no_detection_warning_box_color=no_detection_warning_box_color,
+                no_detection_warning_box_fill=no_detection_warning_box_fill,
+                no_detection_warning_box_alpha=no_detection_warning_box_alpha,
+            )
+            with pose_labelbox.cache.protect_paths(cache_manager, protected_paths):
+                overlay_tasks = list()
+                for pose_track_label in pose_index.track_labels:
+                    pose_track = pose_index.poses_for_track(pose_track_label)
+                    # Overlays of one track must share a scale since they are
+                    # encoded into the same videos
+                    existing_output_scale = read_bounding_box_overlay_metadata(
+                        inference_id=inference_id,
+                        camera_id=camera_id,
+                        pose_track_label=pose_track_label,
+                        bounding_box_overlay_parent_directory=bounding_box_overlay_parent_directory,
+                    ).get('output_scale')
+                    if existing_output_scale is None and has_bounding_box_overlays(
+                        inference_id=inference_id,
+                        camera_id=camera_id,
+                        pose_track_label=pose_track_label,
+                        bounding_box_overlay_parent_directory=bounding_box_overlay_parent_directory,
+                    ):
+                        # Overlays generated before metadata was recorded are
+                        # at full scale
+                        existing_output_scale = 1.0
+                    if existing_output_scale is not None and existing_output_scale != output_scale:
+                        raise ValueError(f'Existing overlays for camera {camera_id} and pose track {pose_track_label} were generated at scale {existing_output_scale}, not {output_scale}')
+                    renderer = None
+                    if in_place_rendering:
+                        # Constant overlay elements are rasterized once per track
+                        renderer = pose_labelbox.rendering.OverlayRenderer(
+                            pose_track_label=pose_track_label,
+                            output_scale=output_scale,
+                            show_timestamp=show_timestamp,
+                            show_pose_track_label=show_pose_track_label,
+                            show_no_detection_warning=show_no_detection_warning,
+                            bounding_box_line_width=bounding_box_line_width,
+                            bounding_box_color=bounding_box_color,
+                            bounding_box_fill=bounding_box_fill,
+                            bounding_box_alpha=bounding_box_alpha,
+                            timestamp_padding=timestamp_padding,
+                            timestamp_font_scale=timestamp_font_scale,
+                            timestamp_text_line_width=timestamp_text_line_width,
+                            timestamp_text_color=timestamp_text_color,
+                            timestamp_box_color=timestamp_box_color,
+                            timestamp_box_fill=timestamp_box_fill,
+                            timestamp_box_alpha=timestamp_box_alpha,
+                            pose_track_label_font_scale=pose_track_label_font_scale,
+                            pose_track_label_text_line_width=pose_track_label_text_line_width,
+                            pose_track_label_text_color=pose_track_label_text_color,
+                            pose_track_label_text_alpha=pose_track_label_text_alpha,
+                            pose_track_label_box_line_width=pose_track_label_box_line_width,
+                            pose_track_label_box_color=pose_track_label_box_color,
+                            pose_track_label_box_fill=pose_track_label_box_fill,
+                            pose_track_label_box_alpha=pose_track_label_box_alpha,
+                            no_detection_warning_font_scale=no_detection_warning_font_scale,
+                            no_detection_warning_text_line_width=no_detection_warning_text_line_width,
+                            no_detection_warning_text_color=no_detection_warning_text_color,
+                            no_detection_warning_text_alpha=no_detection_warning_text_alpha,
+                            no_detection_warning_box_line_width=no_detection_warning_box_line_width,
+                            no_detection_warning_box_color=no_detection_warning_box_color,
+                            no_detection_warning_box_fill=no_detection_warning_box_fill,
+                            no_detection_warning_box_alpha=no_detection_warning_box_alpha,
+                        )
+                    # With max_gap set, frames in gaps longer than max_gap are
+                    # not rendered, so each track segment becomes its own video
+                    timestamps = pose_labelbox.tracks.generate_pose_track_timestamps(
+                        timestamps=pose_track['timestamp'],
+                        frame_period=frame_period,
+                        max_gap=max_gap,
+                    )
+                    bounding_box_corners_list = [
+                        lookup_bounding_box_corners(
+                            pose_index=pose_index,
+                            pose_track_label=pose_track_label,
+                            timestamp=timestamp,
+                        )
+                        for timestamp in timestamps
+                    ]
+                    segments = None
+                    if sparse_mode is not None:
+                        # Only a subset of frames is rendered. The segment
+                        # bounds are recorded so the video stage can tell
+                        # segments apart from gaps between sparse frames
+                        if max_gap is None:
+                            segment_indices = np.zeros(len(timestamps), dtype='int64')
+                        else:
+                            segment_indices = pose_labelbox.tracks.generate_segment_indices(
+                                timestamps=timestamps,
+                                max_gap=max_gap,
+                            )
+                        segments = [
+                            (timestamps[segment_indices == segment_index].min(), timestamps[segment_indices == segment_index].max() + frame_period)
+                            for segment_index in sorted(set(segment_indices))
+                        ]
+                        sparse_frames = pose_labelbox.tracks.select_sparse_frames(
+                            bounding_box_corners=[
+                                np.full((2, 2), np.nan) if bounding_box_corners is None else bounding_box_corners
+                                for bounding_box_corners in bounding_box_corners_list
+                            ],
+                            segment_indices=segment_indices,
+                            sparse_mode=sparse_mode,
+                            sparse_frame_interval=sparse_frame_interval,
+                            keyframe_motion_threshold=keyframe_motion_threshold,
+                            keyframe_min_iou=keyframe_min_iou,
+                            max_keyframe_interval=max_keyframe_interval,
+                        )
+                        pose_labelbox.metrics.increment_counter('overlay_sparse_frames_skipped', int((~sparse_frames).sum()), camera_id=camera_id)
+                        timestamps = timestamps[sparse_frames]
+                        bounding_box_corners_list = [
+                            bounding_box_corners
+                            for bounding_box_corners, sparse_frame in zip(bounding_box_corners_list, sparse_frames)
+                            if sparse_frame
+                        ]
+                    write_bounding_box_overlay_metadata(
+                        inference_id=inference_id,
+                        camera_id=camera_id,
+                        pose_track_label=pose_track_label,
+                        output_scale=output_scale,
+                        sparse_mode=sparse_mode,
+                        segments=segments,
+                        bounding_box_overlay_parent_directory=bounding_box_overlay_parent_directory,
+                    )
+                    image_output_paths = generate_bounding_box_overlay_paths(
+                        inference_id=inference_id,
+                        camera_ids=camera_id,
+                        timestamps=timestamps,
+                        pose_track_labels=pose_track_label,
+                        bounding_box_overlay_parent_directory=bounding_box_overlay_parent_directory,
+                    )
+                    for timestamp, bounding_box_corners, image_output_path in zip(timestamps, bounding_box_corners_list, image_output_paths):
+                        if os.path.isfile(image_output_path):
+                            pose_labelbox.metrics.increment_counter('overlay_images_already_generated', camera_id=camera_id)
+                            continue
+                        overlay_tasks.append({
+                            'timestamp': timestamp,
+                            'pose_track_label': pose_track_label,
+                            'image_output_path': image_output_path,
+                            'show_bounding_box': bounding_box_corners is not None,
+                            'bounding_box_corners': bounding_box_corners,
+                            'renderer': renderer,
+                        })
+                # Overlays are rendered frame by frame, so each source frame is
+                # read (and resized) once and shared by every track in it
+                frame_tasks = dict()
+                for overlay_task in overlay_tasks:
+                    frame_tasks.setdefault(overlay_task['timestamp'], list()).append(overlay_task)
+                frame_tasks = sorted(frame_tasks.items(), key=lambda frame_task: frame_task[0])
+                source_image_iterator = None
+                frame_paths = None
+                if frame_reader is not None:
+                    # Decode source frames straight from the videos
+                    source_image_iterator = frame_reader.iterate_frames(
+                        camera_id=camera_id,
+                        timestamps=[timestamp for timestamp, _ in frame_tasks],
+                    )
+                else:
+                    frame_paths = dict(zip(
+                        [timestamp for timestamp, _ in frame_tasks],
+                        pose_labelbox.core.generate_frame_paths(
+                            environment_id=environment_id,
+                            camera_ids=camera_id,
+                            timestamps=[timestamp for timestamp, _ in frame_tasks],
+                            video_duration=video_duration,
+                            frame_period=frame_period,
+                            local_frames_directory=local_frames_directory,
+                            frame_filename_extension=frame_filename_extension,
+                        ),
+                    ))
+                progress = None
+                if progress_bar:
+                    if notebook:
+                        progress = tqdm.notebook.tqdm(total=len(overlay_tasks))
+                    else:
+                        progress = tqdm.tqdm(total=len(overlay_tasks))
+
+                def load_source_image(frame_task):
+                    timestamp, _ = frame_task
+                    if source_image_iterator is not None:
+                        _, image = next(source_image_iterator)
+                        if output_scale == 1.0:
+                            # Frames from the reader may be cached there, so
+                            # draw on a copy
+                            image = image.copy()
+                    else:
+                        image = cv_utils.read_image(path=frame_paths[timestamp])
+                    if output_scale != 1.0:
+                        image = pose_labelbox.rendering.resize_image(
+                            image=image,
+                            output_scale=output_scale,
+                        )
+                        pose_labelbox.metrics.increment_counter('overlay_source_frames_resized', camera_id=camera_id)
+                    return image
+
+                def render_source_image(frame_task, image):
+                    _, frame_overlay_tasks = frame_task
+                    images = list()
+                    for task_index, overlay_task in enumerate(frame_overlay_tasks):
+                        images.append(render_overlay(
+                            # The last track can draw on the source image itself
+                            image=image if task_index == len(frame_overlay_tasks) - 1 else image.copy(),
+                            image_owned=True,
+                            write_output=False,
+                            **overlay_task,
+                        ))
+                        if progress is not None:
+                            progress.update(1)
+                    return images
+
+                def write_overlay_images(frame_task, images):
+                    _, frame_overlay_tasks = frame_task
+                    for overlay_task, image in zip(frame_overlay_tasks, images):
+                        write_bounding_box_overlay(
+                            image=image,
+                            image_output_path=pathlib.Path(overlay_task['image_output_path']),
+                            camera_id=camera_id,
+                        )
+
+                if io_pipeline:
+                    # Source frames are read ahead and overlays written behind
+                    # by background threads while this thread renders
+                    pose_labelbox.pipeline.run_io_pipeline(
+                        tasks=frame_tasks,
+                        load_function=load_source_image,
+                        process_function=render_source_image,
+                        store_function=write_overlay_images,
+                        # The frame reader decodes sequentially
+                        num_loader_threads=1 if frame_reader is not None else num_reader_threads,
+                        num_storer_threads=num_writer_threads,
+                        queue_depth=queue_depth,
+                        stage='generate_bounding_box_overlays',
+                        camera_id=camera_id,
+                    )
+                else:
+                    for frame_task in frame_tasks:
+                        write_overlay_images(frame_task, render_source_image(frame_task, load_source_image(frame_task)))
+                if progress is not None:
+                    progress.close()
+                if cache_manager is not None:
+                    # Adds the new overlay images to the cache size index
+                    cache_manager.touch([pathlib.Path(bounding_box_overlay_parent_directory) / inference_id / camera_id])
+                    cache_manager.enforce_budget()
 
 
 
@@ -189,6 +449,12 @@ def generate_bounding_box_overlay(
     camera_id,
     timestamp,
     pose_track_label,
+    image=None,
+    image_output_path=None,
+    renderer=None,
+    image_owned=False,
+    write_output=True,
+    output_scale=1.0,
     show_timestamp=True,
     show_pose_track_label=True,
     show_bounding_box=False,
@@ -198,6 +464,7 @@ def generate_bounding_box_overlay(
     frame_period=datetime.timedelta(milliseconds=100),
     local_frames_directory='/data/frames',
     frame_filename_extension='png',
+    bounding_box_overlay_parent_directory='/data/bounding_box_overlays',
     bounding_box_line_width=1.5,
     bounding_box_color='#00ff00',
     bounding_box_fill=False,
@@ -226,66 +493,127 @@ def generate_bounding_box_overlay(
     no_detection_warning_box_fill=True,
     no_detection_warning_box_alpha=0.5,
 ):
-    image_input_path = pose_labelbox.core.generate_frame_path(
-        environment_id=environment_id,
-        camera_id=camera_id,
-        timestamp=timestamp,
-        video_duration=video_duration,
-        frame_period=frame_period,
-        local_frames_directory=local_frames_directory,
-        frame_filename_extension=frame_filename_extension,
-    )
-    image_output_path = generate_bounding_box_overlay_path(
-        inference_id=inference_id,
+    if write_output:
+        if image_output_path is None:
+            image_output_path = generate_bounding_box_overlay_path(
+                inference_id=inference_id,
+                camera_id=camera_id,
+                timestamp=timestamp,
+                pose_track_label=pose_track_label,
+                bounding_box_overlay_parent_directory=bounding_box_overlay_parent_directory,
+            )
+        image_output_path = pathlib.Path(image_output_path)
+        if image_output_path.is_file():
+            pose_labelbox.metrics.increment_counter('overlay_images_already_generated', camera_id=camera_id)
+            return
+    if image is None:
+        image_input_path = pose_labelbox.core.generate_frame_path(
+            environment_id=environment_id,
+            camera_id=camera_id,
+            timestamp=timestamp,
+            video_duration=video_duration,
+            frame_period=frame_period,
+            local_frames_directory=local_frames_directory,
+            frame_filename_extension=frame_filename_extension,
+        )
+    # Images passed in are expected to be at the output scale already
+    if renderer is not None:
+        # Images passed in may be shared (e.g., cached by a frame reader), so
+        # unless the caller owns them they are drawn on in the renderer's
+        # buffer rather than in place
+        copy_image = image is not None and not image_owned
+        if image is None:
+            image = pose_labelbox.rendering.resize_image(
+                image=cv_utils.read_image(path=str(image_input_path)),
+                output_scale=output_scale,
+            )
+        image = renderer.render(
+            image=image,
+            show_bounding_box=show_bounding_box,
+            bounding_box_corners=bounding_box_corners,
+            timestamp=timestamp,
+            copy=copy_image,
+        )
+    else:
+        if image is None:
+            image = pose_labelbox.rendering.resize_image(
+                image=cv_utils.read_image(path=str(image_input_path)),
+                output_scale=output_scale,
+            )
+        image = overlay_bounding_box(
+            image=image,
+            show_bounding_box=show_bounding_box,
+            bounding_box_corners=bounding_box_corners,
+            show_timestamp=show_timestamp,
+            timestamp=timestamp,
+            show_pose_track_label=show_pose_track_label,
+            pose_track_label=pose_track_label,
+            show_no_detection_warning=show_no_detection_warning,
+            output_scale=output_scale,
+            bounding_box_line_width=bounding_box_line_width,
+            bounding_box_color=bounding_box_color,
+            bounding_box_fill=bounding_box_fill,
+            bounding_box_alpha=bounding_box_alpha,
+            timestamp_padding=timestamp_padding,
+            timestamp_font_scale=timestamp_font_scale,
+            timestamp_text_line_width=timestamp_text_line_width,
+            timestamp_text_color=timestamp_text_color,
+            timestamp_box_color=timestamp_box_color,
+            timestamp_box_fill=timestamp_box_fill,
+            timestamp_box_alpha=timestamp_box_alpha,
+            pose_track_label_font_scale=pose_track_label_font_scale,
+            pose_track_label_text_line_width=pose_track_label_text_line_width,
+            pose_track_label_text_color=pose_track_label_text_color,
+            pose_track_label_text_alpha=pose_track_label_text_alpha,
+            pose_track_label_box_line_width=pose_track_label_box_line_width,
+            pose_track_label_box_color=pose_track_label_box_color,
+            pose_track_label_box_fill=pose_track_label_box_fill,
+            pose_track_label_box_alpha=pose_track_label_box_alpha,
+            no_detection_warning_font_scale=no_detection_warning_font_scale,
+            no_detection_warning_text_line_width=no_detection_warning_text_line_width,
+            no_detection_warning_text_color=no_detection_warning_text_color,
+            no_detection_warning_text_alpha=no_detection_warning_text_alpha,
+            no_detection_warning_box_line_width=no_detection_warning_box_line_width,
+            no_detection_warning_box_color=no_detection_warning_box_color,
+            no_detection_warning_box_fill=no_detection_warning_box_fill,
+            no_detection_warning_box_alpha=no_detection_warning_box_alpha,
+        )
+    if not write_output:
+        return image
+    write_bounding_box_overlay(
+        image=image,
+        image_output_path=image_output_path,
         camera_id=camera_id,
-        timestamp=timestamp,
-        pose_track_label=pose_track_label,
     )
-    if image_output_path.is_file():
-        return
+
+def write_bounding_box_overlay(
+    image,
+    image_output_path,
+    camera_id=None,
+):
     image_output_path.parent.mkdir(parents=True, exist_ok=True)
-    image = cv_utils.read_image(path=str(image_input_path))
-    image = overlay_bounding_box(
-        image=image,
-        show_bounding_box=show_bounding_box,
-        bounding_box_corners=bounding_box_corners,
-        show_timestamp=show_timestamp,
-        timestamp=timestamp,
-        show_pose_track_label=show_pose_track_label,
-        pose_track_label=pose_track_label,
-        show_no_detection_warning=show_no_detection_warning,
-        bounding_box_line_width=bounding_box_line_width,
-        bounding_box_color=bounding_box_color,
-        bounding_box_fill=bounding_box_fill,
-        bounding_box_alpha=bounding_box_alpha,
-        timestamp_padding=timestamp_padding,
-        timestamp_font_scale=timestamp_font_scale,
-        timestamp_text_line_width=timestamp_text_line_width,
-        timestamp_text_color=timestamp_text_color,
-        timestamp_box_color=timestamp_box_color,
-        timestamp_box_fill=timestamp_box_fill,
-        timestamp_box_alpha=timestamp_box_alpha,
-        pose_track_label_font_scale=pose_track_label_font_scale,
-        pose_track_label_text_line_width=pose_track_label_text_line_width,
-        pose_track_label_text_color=pose_track_label_text_color,
-        pose_track_label_text_alpha=pose_track_label_text_alpha,
-        pose_track_label_box_line_width=pose_track_label_box_line_width,
-        pose_track_label_box_color=pose_track_label_box_color,
-        pose_track_label_box_fill=pose_track_label_box_fill,
-        pose_track_label_box_alpha=pose_track_label_box_alpha,
-        no_detection_warning_font_scale=no_detection_warning_font_scale,
-        no_detection_warning_text_line_width=no_detection_warning_text_line_width,
-        no_detection_warning_text_color=no_detection_warning_text_color,
-        no_detection_warning_text_alpha=no_detection_warning_text_alpha,
-        no_detection_warning_box_line_width=no_detection_warning_box_line_width,
-        no_detection_warning_box_color=no_detection_warning_box_color,
-        no_detection_warning_box_fill=no_detection_warning_box_fill,
-        no_detection_warning_box_alpha=no_detection_warning_box_alpha,
-    )
     cv_utils.write_image(
         image=image,
         path=str(image_output_path)
     )
+    pose_labelbox.metrics.increment_counter('overlay_images_generated', camera_id=camera_id)
+    pose_labelbox.metrics.record_file_bytes('overlay_image_bytes', image_output_path, camera_id=camera_id)
+
+def lookup_bounding_box_corners(
+    pose_index,
+    pose_track_label,
+    timestamp,
+):
+    # Returns None if the track has no detection at this timestamp
+    pose_rows = pose_index.track_frame_rows(
+        pose_track_label=pose_track_label,
+        frame_index=pose_index.frame_index(timestamp),
+    )
+    if len(pose_rows) > 1:
+        raise ValueError(f'Pose track {pose_track_label} contains duplicate timestamps')
+    if len(pose_rows) == 0:
+        return None
+    return pose_index.bounding_box_corners[pose_rows[0]]
 
 def overlay_bounding_box(
     image,
@@ -296,6 +624,7 @@ def overlay_bounding_box(
     show_pose_track_label=True,
     pose_track_label=None,
     show_no_detection_warning=True,
+    output_scale=1.0,
     bounding_box_line_width=1.5,
     bounding_box_color='#00ff00',
     bounding_box_fill=False,
@@ -324,13 +653,16 @@ def overlay_bounding_box(
     no_detection_warning_box_fill=True,
     no_detection_warning_box_alpha=0.5,
 ):  
+    # With output_scale, the image is expected to have been resized already
+    # and the box, text and font coordinates are scaled to match it
+    anchor_padding = 5*output_scale
     if show_bounding_box:
         if bounding_box_corners is None:
             raise ValueError('Bounding box not specified')
         image = cv_utils.draw_rectangle(
             original_image=image,
-            coordinates=bounding_box_corners,
-            line_width=bounding_box_line_width,
+            coordinates=[[coordinate*output_scale for coordinate in corner] for corner in bounding_box_corners],
+            line_width=bounding_box_line_width*output_scale,
             color=bounding_box_color,
             fill=bounding_box_fill,
             alpha=bounding_box_alpha
@@ -340,15 +672,15 @@ def overlay_bounding_box(
         box_center = round(image_width/2)
         image = cv_utils.draw_text_box(
             original_image=image,
-            anchor_coordinates=[box_center, 0 + 5],
+            anchor_coordinates=[box_center, anchor_padding],
             text='No detection',
             horizontal_alignment='center',
             vertical_alignment='top',
-            font_scale=no_detection_warning_font_scale,
-            text_line_width=no_detection_warning_text_line_width,
+            font_scale=no_detection_warning_font_scale*output_scale,
+            text_line_width=no_detection_warning_text_line_width*output_scale,
             text_color=no_detection_warning_text_color,
             text_alpha=no_detection_warning_text_alpha,
-            box_line_width=no_detection_warning_box_line_width,
+            box_line_width=no_detection_warning_box_line_width*output_scale,
             box_color=no_detection_warning_box_color,
             box_fill=no_detection_warning_box_fill,
             box_alpha=no_detection_warning_box_alpha,
@@ -359,9 +691,9 @@ def overlay_bounding_box(
         image = cv_utils.draw_timestamp(
             original_image=image,
             timestamp=timestamp,
-            padding=timestamp_padding,
-            font_scale=timestamp_font_scale,
-            text_line_width=timestamp_text_line_width,
+            padding=timestamp_padding*output_scale,
+            font_scale=timestamp_font_scale*output_scale,
+            text_line_width=timestamp_text_line_width*output_scale,
             text_color=timestamp_text_color,
             box_color=timestamp_box_color,
             box_fill=timestamp_box_fill,
@@ -372,15 +704,15 @@ def overlay_bounding_box(
             raise ValueError('Pose track label not specified')
         image = cv_utils.draw_text_box(
             original_image=image,
-            anchor_coordinates=[0 + 5, 0 + 5],
+            anchor_coordinates=[anchor_padding, anchor_padding],
             text=str(pose_track_label),
             horizontal_alignment='left',
             vertical_alignment='top',
-            font_scale=pose_track_label_font_scale,
-            text_line_width=pose_track_label_text_line_width,
+            font_scale=pose_track_label_font_scale*output_scale,
+            text_line_width=pose_track_label_text_line_width*output_scale,
             text_color=pose_track_label_text_color,
             text_alpha=pose_track_label_text_alpha,
-            box_line_width=pose_track_label_box_line_width,
+            box_line_width=pose_track_label_box_line_width*output_scale,
             box_color=pose_track_label_box_color,
             box_fill=pose_track_label_box_fill,
             box_alpha=pose_track_label_box_alpha,
@@ -403,3 +735,121 @@ def generate_bounding_box_overlay_path(
         f"pose_track_overlay_{timestamp.strftime('%Y%m%d_%H%M%S_%f')}.{overlay_image_extension}"
     )
     return bounding_box_overlay_path
+
+def generate_bounding_box_overlay_paths(
+    inference_id,
+    camera_ids,
+    timestamps,
+    pose_track_labels,
+    bounding_box_overlay_parent_directory='/data/bounding_box_overlays',
+    overlay_image_extension='png',
+):
+    # Bulk version of generate_bounding_box_overlay_path. camera_ids and
+    # pose_track_labels are single values or one per timestamp. Returns an
+    # array of path strings
+    timestamps = pd.DatetimeIndex(timestamps)
+    if len(timestamps) == 0:
+        return np.array([], dtype=object)
+    camera_ids = np.broadcast_to(np.asarray(camera_ids, dtype=object), (len(timestamps),))
+    pose_track_labels = np.broadcast_to(np.asarray(pose_track_labels, dtype=object), (len(timestamps),))
+    codes, tracks = pd.MultiIndex.from_arrays([camera_ids, pose_track_labels]).factorize()
+    overlay_path_prefixes = np.array([
+        generate_bounding_box_overlay_path_prefix(
+            inference_id=inference_id,
+            camera_id=camera_id,
+            pose_track_label=pose_track_label,
+            bounding_box_overlay_parent_directory=bounding_box_overlay_parent_directory,
+        )
+        for camera_id, pose_track_label in tracks
+    ], dtype=object)
+    overlay_path_suffixes = (timestamps.strftime('%Y%m%d_%H%M%S_%f') + f'.{overlay_image_extension}').to_numpy(dtype=object)
+    return overlay_path_prefixes[codes] + overlay_path_suffixes
+
+@functools.lru_cache(maxsize=4096)
+def generate_bounding_box_overlay_path_prefix(
+    inference_id,
+    camera_id,
+    pose_track_label,
+    bounding_box_overlay_parent_directory='/data/bounding_box_overlays',
+):
+    # Everything in an overlay path before the timestamp
+    return os.path.join(
+        bounding_box_overlay_parent_directory,
+        inference_id,
+        camera_id,
+        str(pose_track_label),
+        'pose_track_overlay_',
+    )
+
+def write_bounding_box_overlay_metadata(
+    inference_id,
+    camera_id,
+    pose_track_label,
+    output_scale=1.0,
+    sparse_mode=None,
+    segments=None,
+    bounding_box_overlay_parent_directory='/data/bounding_box_overlays',
+):
+    metadata = {'output_scale': float(output_scale)}
+    if sparse_mode is not None:
+        metadata['sparse_mode'] = sparse_mode
+        metadata['segments'] = [
+            [segment_start.isoformat(), segment_end.isoformat()]
+            for segment_start, segment_end in segments
+        ]
+    metadata_path = generate_bounding_box_overlay_metadata_path(
+        inference_id=inference_id,
+        camera_id=camera_id,
+        pose_track_label=pose_track_label,
+        bounding_box_overlay_parent_directory=bounding_box_overlay_parent_directory,
+    )
+    metadata_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(metadata_path, 'w') as fp:
+        json.dump(metadata, fp)
+
+def read_bounding_box_overlay_metadata(
+    inference_id,
+    camera_id,
+    pose_track_label,
+    bounding_box_overlay_parent_directory='/data/bounding_box_overlays',
+):
+    # Overlays generated before metadata was recorded are at full scale
+    metadata_path = generate_bounding_box_overlay_metadata_path(
+        inference_id=inference_id,
+        camera_id=camera_id,
+        pose_track_label=pose_track_label,
+        bounding_box_overlay_parent_directory=bounding_box_overlay_parent_directory,
+    )
+    if not metadata_path.is_file():
+        return dict()
+    with open(metadata_path, 'r') as fp:
+        metadata = json.load(fp)
+    return metadata
+
+def has_bounding_box_overlays(
+    inference_id,
+    camera_id,
+    pose_track_label,
+    bounding_box_overlay_parent_directory='/data/bounding_box_overlays',
+):
+    pose_track_directory_path = generate_bounding_box_overlay_metadata_path(
+        inference_id=inference_id,
+        camera_id=camera_id,
+        pose_track_label=pose_track_label,
+        bounding_box_overlay_parent_directory=bounding_box_overlay_parent_directory,
+    ).parent
+    return any(True for _ in pose_track_directory_path.glob('pose_track_overlay_*'))
+
+def generate_bounding_box_overlay_metadata_path(
+    inference_id,
+    camera_id,
+    pose_track_label,
+    bounding_box_overlay_parent_directory='/data/bounding_box_overlays',
+):
+    return (
+        pathlib.Path(bounding_box_overlay_parent_directory) /
+        inference_id /
+        camera_id /
+        str(pose_track_label) /
+        'overlay_metadata.json'
+    )
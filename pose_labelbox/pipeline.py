@@ -0,0 +1,147 @@
+import pose_labelbox.metrics
+import threading
+import queue
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Waits shorter than this are not counted as stalls
+STALL_THRESHOLD = 0.001
+
+_END = object()
+
+class QueueStallTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wait_times = dict()
+        self.stall_counts = dict()
+
+    def record(self, name, wait_time):
+        with self.lock:
+            self.wait_times[name] = self.wait_times.get(name, 0.0) + wait_time
+            if wait_time >= STALL_THRESHOLD:
+                self.stall_counts[name] = self.stall_counts.get(name, 0) + 1
+
+    def report(self, stage, **labels):
+        for name in sorted(set(self.wait_times.keys()) | set(self.stall_counts.keys())):
+            pose_labelbox.metrics.record_timing(f'{stage}_{name}_wait', self.wait_times.get(name, 0.0), **labels)
+            pose_labelbox.metrics.increment_counter(f'{stage}_{name}_stalls', self.stall_counts.get(name, 0), **labels)
+
+def run_io_pipeline(
+    tasks,
+    load_function,
+    process_function,
+    store_function,
+    num_loader_threads=2,
+    num_storer_threads=2,
+    queue_depth=16,
+    stage='io_pipeline',
+    **labels
+):
+    # Loader threads call load_function(task) and feed a bounded queue, the
+    # calling thread runs process_function(task, loaded) on each result, and
+    # storer threads call store_function(task, processed) from a second
+    # bounded queue. Results are processed in completion order, not task
+    # order. Time spent blocked on each queue is reported as stall metrics:
+    #   read_queue_full: loaders waiting on processing (CPU bound)
+    #   read_queue_empty: processing waiting on loaders (read bound)
+    #   write_queue_full: processing waiting on storers (write bound)
+    if num_loader_threads < 1 or num_storer_threads < 1:
+        raise ValueError('Pipelines need at least one loader and one storer thread')
+    if queue_depth < 1:
+        raise ValueError('Queue depth must be at least 1')
+    task_queue = queue.Queue()
+    for task in tasks:
+        task_queue.put(task)
+    read_queue = queue.Queue(maxsize=queue_depth)
+    write_queue = queue.Queue(maxsize=queue_depth)
+    stop_event = threading.Event()
+    errors = list()
+    stall_tracker = QueueStallTracker()
+
+    def put(target_queue, item, name):
+        wait_start = time.perf_counter()
+        while not stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stall_tracker.record(name, time.perf_counter() - wait_start)
+
+    def fail(error):
+        errors.append(error)
+        stop_event.set()
+
+    def load():
+        while not stop_event.is_set():
+            try:
+                task = task_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                loaded = load_function(task)
+            except Exception as error:
+                fail(error)
+                break
+            put(read_queue, (task, loaded), 'read_queue_full')
+        put(read_queue, _END, 'read_queue_full')
+
+    def store():
+        while True:
+            item = write_queue.get()
+            if item is _END:
+                break
+            if stop_event.is_set():
+                continue
+            task, processed = item
+            try:
+                store_function(task, processed)
+            except Exception as error:
+                fail(error)
+
+    loader_threads = [threading.Thread(target=load, daemon=True) for _ in range(num_loader_threads)]
+    storer_threads = [threading.Thread(target=store, daemon=True) for _ in range(num_storer_threads)]
+    for thread in loader_threads + storer_threads:
+        thread.start()
+    num_processed = 0
+    num_finished_loaders = 0
+    try:
+        while num_finished_loaders < num_loader_threads and not stop_event.is_set():
+            wait_start = time.perf_counter()
+            try:
+                item = read_queue.get(timeout=0.1)
+            except queue.Empty:
+                stall_tracker.record('read_queue_empty', time.perf_counter() - wait_start)
+                continue
+            stall_tracker.record('read_queue_empty', time.perf_counter() - wait_start)
+            if item is _END:
+                num_finished_loaders += 1
+                continue
+            task, loaded = item
+            try:
+                processed = process_function(task, loaded)
+            except Exception as error:
+                fail(error)
+                break
+            put(write_queue, (task, processed), 'write_queue_full')
+            num_processed += 1
+    finally:
+        if stop_event.is_set():
+            # Unblock loaders waiting on a full read queue
+            while any(thread.is_alive() for thread in loader_threads):
+                try:
+                    read_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        for thread in loader_threads:
+            thread.join()
+        for _ in storer_threads:
+            write_queue.put(_END)
+        for thread in storer_threads:
+            thread.join()
+        stall_tracker.report(stage, **labels)
+    if len(errors) > 0:
+        raise errors[0]
+    return num_processed
@@ -0,0 +1,470 @@
+import pose_labelbox.core
+import pose_labelbox.alphapose
+import pose_labelbox.overlay
+import pose_labelbox.tracks
+import pose_labelbox.utils
+import pose_labelbox.session
+import datetime
+import pathlib
+import json
+import glob
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+honeycomb_io = pose_labelbox.utils.lazy_import('honeycomb_io')
+np = pose_labelbox.utils.lazy_import('numpy')
+pd = pose_labelbox.utils.lazy_import('pandas')
+
+PLAN_STAGES = (
+    'download_videos',
+    'extract_frames',
+    'detect_poses_2d',
+    'parse_alphapose_output',
+    'generate_bounding_box_overlays',
+    'generate_bounding_box_overlay_videos',
+    'create_dataset',
+)
+
+# For each stage, the timing, the counter of items processed and (where the
+# stage records one) the counter of bytes written that previous runs emit.
+# Items are videos for downloads, source frames for extraction, detection
+# and parsing, overlay images for the overlay stage and overlay frames for
+# encoding. Uploads are calibrated per byte uploaded
+STAGE_THROUGHPUT_METRICS = {
+    'download_videos': ('download_videos', 'videos_downloaded', 'video_bytes_downloaded'),
+    'extract_frames': ('extract_frames', 'frames_extracted', None),
+    'detect_poses_2d': ('run_pose_detection_2d', 'images_detected', None),
+    'parse_alphapose_output': ('parse_alphapose_output', 'images_detected', None),
+    'generate_bounding_box_overlays': ('generate_bounding_box_overlays', 'overlay_images_generated', 'overlay_image_bytes'),
+    'generate_bounding_box_overlay_videos': ('generate_bounding_box_overlay_videos', 'overlay_video_frames_encoded', 'overlay_video_bytes'),
+    'create_dataset': ('upload_video', 'video_bytes_uploaded', None),
+}
+
+# Ratios used to size the track-level stages for cameras whose poses haven't
+# been parsed yet
+STAGE_RATIO_METRICS = {
+    'overlay_images_per_frame': ('overlay_images_generated', 'images_detected'),
+    'pose_tracks_per_frame': ('pose_tracks_2d_parsed', 'images_detected'),
+}
+
+def load_throughput_calibration(metrics_paths):
+    # Totals the events in JSON lines metrics files from previous runs
+    # (labels are ignored) and converts them into per-item rates. Rates whose
+    # metrics are missing from the files are left out
+    if isinstance(metrics_paths, (str, pathlib.Path)):
+        metrics_paths = sorted(glob.glob(str(metrics_paths)))
+    counter_totals = dict()
+    timing_totals = dict()
+    for metrics_path in metrics_paths:
+        with open(metrics_path, 'r') as fp:
+            for line in fp:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                event = json.loads(line)
+                if event['type'] == 'counter':
+                    counter_totals[event['name']] = counter_totals.get(event['name'], 0) + event['value']
+                elif event['type'] == 'timing':
+                    timing_totals[event['name']] = timing_totals.get(event['name'], 0.0) + event['value']
+    calibration = dict()
+    for stage, (timing_name, item_counter_name, byte_counter_name) in STAGE_THROUGHPUT_METRICS.items():
+        num_items = counter_totals.get(item_counter_name, 0)
+        if num_items <= 0:
+            continue
+        if timing_name in timing_totals:
+            calibration[f'{stage}_seconds_per_item'] = timing_totals[timing_name]/num_items
+        if byte_counter_name is not None and byte_counter_name in counter_totals:
+            calibration[f'{stage}_bytes_per_item'] = counter_totals[byte_counter_name]/num_items
+    for ratio_name, (numerator_name, denominator_name) in STAGE_RATIO_METRICS.items():
+        if counter_totals.get(denominator_name, 0) > 0 and numerator_name in counter_totals:
+            calibration[ratio_name] = counter_totals[numerator_name]/counter_totals[denominator_name]
+    logger.info(f'Loaded {len(calibration)} throughput rates from {len(metrics_paths)} metrics files')
+    return calibration
+
+def plan_run(
+    inference_id,
+    start,
+    end,
+    environment_id=None,
+    environment_name=None,
+    camera_ids=None,
+    camera_part_numbers=None,
+    camera_serial_numbers=None,
+    camera_names=None,
+    video_duration=datetime.timedelta(seconds=10),
+    frames_per_video=100,
+    frame_period=datetime.timedelta(milliseconds=100),
+    max_gap=None,
+    client=None,
+    uri=None,
+    token_uri=None,
+    audience=None,
+    client_id=None,
+    client_secret=None,
+    session=None,
+    local_video_directory='/data/videos',
+    video_filename_extension='mp4',
+    local_frames_directory='/data/frames',
+    frame_filename_extension='png',
+    alphapose_output_parent_directory='/data/alphapose_output',
+    alphapose_output_filename='alphapose-results.json',
+    parsed_alphapose_output_suffix=None,
+    bounding_box_overlay_parent_directory='/data/bounding_box_overlays',
+    overlay_image_extension='png',
+    bounding_box_overlay_video_parent_directory='/data/bounding_box_overlay_videos',
+    overlay_video_extension='mp4',
+):
+    # Lists the work units of each stage for a run without running anything,
+    # marking those that existing artifacts already satisfy. Track-level
+    # stages are planned per track for cameras whose poses have been parsed
+    # and per camera (with unknown item counts) otherwise
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
+    target_camera_ids = pose_labelbox.core.generate_target_camera_ids(
+        start=start,
+        end=end,
+        environment_id=environment_id,
+        environment_name=environment_name,
+        camera_ids=camera_ids,
+        camera_part_numbers=camera_part_numbers,
+        camera_serial_numbers=camera_serial_numbers,
+        camera_names=camera_names,
+        client=client,
+        uri=uri,
+        token_uri=token_uri,
+        audience=audience,
+        client_id=client_id,
+        client_secret=client_secret,
+    )
+    if environment_id is None:
+        environment_id = honeycomb_io.fetch_environment_id(environment_name=environment_name, client=client)
+    target_video_starts = pose_labelbox.core.generate_target_video_starts(
+        start=start,
+        end=end,
+        video_duration=video_duration,
+    )
+    work_units = list()
+    for camera_id in target_camera_ids:
+        for video_start in target_video_starts:
+            work_units.extend(plan_video_work_units(
+                environment_id=environment_id,
+                camera_id=camera_id,
+                video_start=video_start,
+                frames_per_video=frames_per_video,
+                local_video_directory=local_video_directory,
+                video_filename_extension=video_filename_extension,
+                local_frames_directory=local_frames_directory,
+                frame_filename_extension=frame_filename_extension,
+            ))
+        work_units.extend(plan_camera_work_units(
+            inference_id=inference_id,
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            num_source_frames=len(target_video_starts)*frames_per_video,
+            video_duration=video_duration,
+            frame_period=frame_period,
+            max_gap=max_gap,
+            alphapose_output_parent_directory=alphapose_output_parent_directory,
+            alphapose_output_filename=alphapose_output_filename,
+            parsed_alphapose_output_suffix=parsed_alphapose_output_suffix,
+            bounding_box_overlay_parent_directory=bounding_box_overlay_parent_directory,
+            overlay_image_extension=overlay_image_extension,
+            bounding_box_overlay_video_parent_directory=bounding_box_overlay_video_parent_directory,
+            overlay_video_extension=overlay_video_extension,
+        ))
+    work_units = pd.DataFrame(
+        work_units,
+        columns=[
+            'stage',
+            'camera_id',
+            'video_start',
+            'pose_track_label',
+            'num_source_frames',
+            'num_items',
+            'num_items_done',
+            'existing_bytes',
+            'done',
+        ],
+    )
+    logger.info(f'Planned {len(work_units)} work units ({(~work_units["done"]).sum()} pending) for {len(target_camera_ids)} cameras and {len(target_video_starts)} videos per camera')
+    return work_units
+
+def plan_video_work_units(
+    environment_id,
+    camera_id,
+    video_start,
+    frames_per_video=100,
+    local_video_directory='/data/videos',
+    video_filename_extension='mp4',
+    local_frames_directory='/data/frames',
+    frame_filename_extension='png',
+):
+    video_path = pose_labelbox.core.generate_video_path(
+        environment_id=environment_id,
+        camera_id=camera_id,
+        video_start=video_start,
+        local_video_directory=local_video_directory,
+        video_filename_extension=video_filename_extension,
+    )
+    video_bytes = get_file_size(video_path)
+    frame_directory_path = pose_labelbox.core.generate_frame_directory_path(
+        environment_id=environment_id,
+        camera_id=camera_id,
+        video_start=video_start,
+        local_frames_directory=local_frames_directory,
+    )
+    frame_filenames = set(pose_labelbox.core.generate_frame_filenames(
+        environment_id=environment_id,
+        camera_id=camera_id,
+        video_start=video_start,
+        frames_per_video=frames_per_video,
+        frame_filename_extension=frame_filename_extension,
+    ))
+    num_frames_done = 0
+    frame_bytes = 0
+    if frame_directory_path.is_dir():
+        with os.scandir(frame_directory_path) as directory_entries:
+            for directory_entry in directory_entries:
+                if directory_entry.name in frame_filenames:
+                    num_frames_done += 1
+                    frame_bytes += directory_entry.stat().st_size
+    return [
+        {
+            'stage': 'download_videos',
+            'camera_id': camera_id,
+            'video_start': video_start,
+            'num_source_frames': frames_per_video,
+            'num_items': 1,
+            'num_items_done': int(video_bytes is not None),
+            'existing_bytes': video_bytes or 0,
+            'done': video_bytes is not None,
+        },
+        {
+            'stage': 'extract_frames',
+            'camera_id': camera_id,
+            'video_start': video_start,
+            'num_source_frames': frames_per_video,
+            'num_items': frames_per_video,
+            'num_items_done': num_frames_done,
+            'existing_bytes': frame_bytes,
+            'done': num_frames_done == frames_per_video,
+        },
+    ]
+
+def plan_camera_work_units(
+    inference_id,
+    camera_id,
+    start,
+    end,
+    num_source_frames,
+    video_duration=datetime.timedelta(seconds=10),
+    frame_period=datetime.timedelta(milliseconds=100),
+    max_gap=None,
+    alphapose_output_parent_directory='/data/alphapose_output',
+    alphapose_output_filename='alphapose-results.json',
+    parsed_alphapose_output_suffix=None,
+    bounding_box_overlay_parent_directory='/data/bounding_box_overlays',
+    overlay_image_extension='png',
+    bounding_box_overlay_video_parent_directory='/data/bounding_box_overlay_videos',
+    overlay_video_extension='mp4',
+):
+    alphapose_output_directory_path = pose_labelbox.alphapose.generate_alphapose_output_directory_path(
+        inference_id=inference_id,
+        camera_id=camera_id,
+        start=start,
+        end=end,
+        video_duration=video_duration,
+        alphapose_output_parent_directory=alphapose_output_parent_directory,
+    )
+    alphapose_output_bytes = get_file_size(alphapose_output_directory_path / alphapose_output_filename)
+    parsed_alphapose_output_file_path = alphapose_output_directory_path / pose_labelbox.alphapose.generate_parsed_alphapose_output_filename(
+        camera_id=camera_id,
+        start=start,
+        end=end,
+        video_duration=video_duration,
+        suffix=parsed_alphapose_output_suffix,
+    )
+    parsed_alphapose_output_bytes = get_file_size(parsed_alphapose_output_file_path)
+    work_units = [
+        {
+            'stage': 'detect_poses_2d',
+            'camera_id': camera_id,
+            'num_source_frames': num_source_frames,
+            'num_items': num_source_frames,
+            'num_items_done': num_source_frames if alphapose_output_bytes is not None else 0,
+            'existing_bytes': alphapose_output_bytes or 0,
+            'done': alphapose_output_bytes is not None,
+        },
+        {
+            'stage': 'parse_alphapose_output',
+            'camera_id': camera_id,
+            'num_source_frames': num_source_frames,
+            'num_items': num_source_frames,
+            'num_items_done': num_source_frames if parsed_alphapose_output_bytes is not None else 0,
+            'existing_bytes': parsed_alphapose_output_bytes or 0,
+            'done': parsed_alphapose_output_bytes is not None,
+        },
+    ]
+    if parsed_alphapose_output_bytes is None:
+        # Track counts aren't known until the poses are parsed
+        for stage in ('generate_bounding_box_overlays', 'generate_bounding_box_overlay_videos', 'create_dataset'):
+            work_units.append({
+                'stage': stage,
+                'camera_id': camera_id,
+                'num_source_frames': num_source_frames,
+                'num_items': np.nan,
+                'num_items_done': 0,
+                'existing_bytes': 0,
+                'done': False,
+            })
+        return work_units
+    poses_2d = pd.read_pickle(parsed_alphapose_output_file_path)
+    overlay_video_directory_path = pathlib.Path(bounding_box_overlay_video_parent_directory) / inference_id / camera_id
+    for pose_track_label, pose_track in poses_2d.groupby('pose_track_label'):
+        timestamps = pose_labelbox.tracks.generate_pose_track_timestamps(
+            timestamps=pose_track['timestamp'],
+            frame_period=frame_period,
+            max_gap=max_gap,
+        )
+        overlay_paths = pose_labelbox.overlay.generate_bounding_box_overlay_paths(
+            inference_id=inference_id,
+            camera_ids=camera_id,
+            timestamps=timestamps,
+            pose_track_labels=pose_track_label,
+            bounding_box_overlay_parent_directory=bounding_box_overlay_parent_directory,
+            overlay_image_extension=overlay_image_extension,
+        )
+        overlay_image_sizes = [get_file_size(overlay_path) for overlay_path in overlay_paths]
+        overlay_image_sizes = [overlay_image_size for overlay_image_size in overlay_image_sizes if overlay_image_size is not None]
+        # Segment bounds aren't known before encoding, so any video of the
+        # track counts as done
+        overlay_video_sizes = [
+            get_file_size(overlay_video_path)
+            for overlay_video_path in overlay_video_directory_path.glob(f'{pose_track_label}_*.{overlay_video_extension}')
+        ]
+        overlay_videos_done = len(overlay_video_sizes) > 0
+        work_units.append({
+            'stage': 'generate_bounding_box_overlays',
+            'camera_id': camera_id,
+            'pose_track_label': pose_track_label,
+            'num_items': len(overlay_paths),
+            'num_items_done': len(overlay_image_sizes),
+            'existing_bytes': sum(overlay_image_sizes),
+            'done': len(overlay_image_sizes) == len(overlay_paths),
+        })
+        work_units.append({
+            'stage': 'generate_bounding_box_overlay_videos',
+            'camera_id': camera_id,
+            'pose_track_label': pose_track_label,
+            'num_items': len(overlay_paths),
+            'num_items_done': len(overlay_paths) if overlay_videos_done else 0,
+            'existing_bytes': sum(overlay_video_sizes),
+            'done': overlay_videos_done,
+        })
+        # Whether a video has been uploaded is only known to Labelbox, so
+        # uploads are always pending. Items are overlay video frames
+        work_units.append({
+            'stage': 'create_dataset',
+            'camera_id': camera_id,
+            'pose_track_label': pose_track_label,
+            'num_items': len(overlay_paths),
+            'num_items_done': 0,
+            'existing_bytes': sum(overlay_video_sizes),
+            'done': False,
+        })
+    return work_units
+
+def estimate_run_costs(
+    work_units,
+    calibration=None,
+):
+    # Estimates the remaining cost of each stage of a plan: worker seconds
+    # (the stage timings of previous runs, i.e., wall time on one worker),
+    # bytes written to disk and bytes uploaded. Disk rates missing from the
+    # calibration fall back to the sizes of existing artifacts in the plan.
+    # Estimates that can't be calibrated are NaN
+    if calibration is None:
+        calibration = dict()
+    work_units = work_units.copy()
+    unknown_num_items = work_units['num_items'].isna()
+    work_units.loc[unknown_num_items, 'num_items'] = (
+        work_units.loc[unknown_num_items, 'num_source_frames']*calibration.get('overlay_images_per_frame', np.nan)
+    )
+    work_units['num_items_pending'] = work_units['num_items'] - work_units['num_items_done']
+    # Encoded video size per overlay frame, for the upload estimate
+    overlay_video_bytes_per_item = get_bytes_per_item(
+        work_units=work_units,
+        stage='generate_bounding_box_overlay_videos',
+        calibration=calibration,
+    )
+    estimates = list()
+    for stage in PLAN_STAGES:
+        stage_work_units = work_units.loc[work_units['stage'] == stage]
+        # Any pending unit of unknown size makes the stage total unknown,
+        # rather than an underestimate that looks valid
+        num_items_pending = (
+            stage_work_units['num_items_pending']
+            .where(~stage_work_units['done'], 0.0)
+            .sum(skipna=False, min_count=1)
+        )
+        if stage == 'create_dataset':
+            upload_bytes = (
+                stage_work_units['existing_bytes'].sum() +
+                stage_work_units.loc[stage_work_units['existing_bytes'] == 0, 'num_items'].sum(skipna=False)*overlay_video_bytes_per_item
+            )
+            estimated_seconds = upload_bytes*calibration.get('create_dataset_seconds_per_item', np.nan)
+            estimated_disk_bytes = 0.0
+            estimated_upload_bytes = upload_bytes
+        else:
+            estimated_seconds = num_items_pending*calibration.get(f'{stage}_seconds_per_item', np.nan)
+            estimated_disk_bytes = num_items_pending*get_bytes_per_item(
+                work_units=work_units,
+                stage=stage,
+                calibration=calibration,
+            )
+            estimated_upload_bytes = 0.0
+        estimates.append({
+            'stage': stage,
+            'num_units': len(stage_work_units),
+            'num_units_pending': int((~stage_work_units['done']).sum()),
+            'num_items': stage_work_units['num_items'].sum(skipna=False, min_count=1),
+            'num_items_pending': num_items_pending,
+            'estimated_seconds': estimated_seconds,
+            'estimated_disk_bytes': estimated_disk_bytes,
+            'estimated_upload_bytes': estimated_upload_bytes,
+        })
+    estimates = pd.DataFrame(estimates).set_index('stage')
+    num_source_frames = work_units.loc[work_units['stage'] == 'detect_poses_2d', 'num_source_frames'].sum()
+    num_pose_tracks = work_units.loc[work_units['stage'] == 'generate_bounding_box_overlays', 'pose_track_label'].notna().sum()
+    num_unparsed_frames = work_units.loc[(work_units['stage'] == 'parse_alphapose_output') & ~work_units['done'], 'num_source_frames'].sum()
+    if num_unparsed_frames > 0:
+        num_pose_tracks = num_pose_tracks + num_unparsed_frames*calibration.get('pose_tracks_per_frame', np.nan)
+    logger.info(
+        f'Estimated {num_pose_tracks:.0f} pose tracks from {num_source_frames} source frames, '
+        f'{estimates["estimated_seconds"].sum(min_count=1)/3600:.1f} worker hours, '
+        f'{estimates["estimated_disk_bytes"].sum(min_count=1)/1e9:.2f} GB written and '
+        f'{estimates["estimated_upload_bytes"].sum(min_count=1)/1e9:.2f} GB uploaded'
+    )
+    return estimates
+
+def get_bytes_per_item(
+    work_units,
+    stage,
+    calibration,
+):
+    bytes_per_item = calibration.get(f'{stage}_bytes_per_item')
+    if bytes_per_item is not None:
+        return bytes_per_item
+    stage_work_units = work_units.loc[work_units['stage'] == stage]
+    num_items_done = stage_work_units['num_items_done'].sum()
+    if num_items_done == 0:
+        return np.nan
+    return stage_work_units['existing_bytes'].sum()/num_items_done
+
+def get_file_size(path):
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,244 @@
+import pose_labelbox.alphapose
+import pose_labelbox.tracks
+import pose_labelbox.utils
+import datetime
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+np = pose_labelbox.utils.lazy_import('numpy')
+pd = pose_labelbox.utils.lazy_import('pandas')
+
+class PoseIndex:
+    def __init__(
+        self,
+        poses_2d,
+        frame_period=datetime.timedelta(milliseconds=100),
+        origin=None,
+        grid_cell_size=128,
+        min_grid_rows=64,
+    ):
+        # Poses are stored sorted by frame and then by pose track label, so the
+        # poses for any frame (or run of frames) are a contiguous block of rows
+        self.frame_period_seconds = pd.Timedelta(frame_period).total_seconds()
+        self.grid_cell_size = float(grid_cell_size)
+        self.min_grid_rows = min_grid_rows
+        timestamp_seconds = pose_labelbox.tracks.convert_to_seconds(poses_2d['timestamp'])
+        if origin is None:
+            self.origin_seconds = float(timestamp_seconds.min()) if len(timestamp_seconds) > 0 else 0.0
+        else:
+            self.origin_seconds = convert_timestamp_to_seconds(origin)
+        frame_indices = np.rint((timestamp_seconds - self.origin_seconds)/self.frame_period_seconds).astype('int64')
+        if len(frame_indices) > 0 and frame_indices.min() < 0:
+            raise ValueError('Pose index origin is later than the earliest pose')
+        pose_track_labels = poses_2d['pose_track_label'].to_numpy()
+        row_order = np.lexsort((pose_track_labels, frame_indices))
+        self.poses_2d = poses_2d.iloc[row_order]
+        self.frame_indices = frame_indices[row_order]
+        self.pose_track_labels = pose_track_labels[row_order]
+        self.bounding_box_corners = (
+            np.stack(self.poses_2d['bounding_box_corners'].to_numpy()).astype(float)
+            if len(self.poses_2d) > 0 else np.zeros((0, 2, 2))
+        )
+        # CSR frame offsets: rows for frame f are frame_offsets[f]:frame_offsets[f + 1]
+        self.num_frames = int(self.frame_indices.max()) + 1 if len(self.frame_indices) > 0 else 0
+        self.frame_offsets = np.zeros(self.num_frames + 1, dtype='int64')
+        np.cumsum(np.bincount(self.frame_indices, minlength=self.num_frames), out=self.frame_offsets[1:])
+        # Track offsets: rows for the i-th track label are
+        # track_rows[track_offsets[i]:track_offsets[i + 1]], in frame order
+        self.track_rows = np.argsort(self.pose_track_labels, kind='stable')
+        self.track_labels, track_counts = np.unique(self.pose_track_labels[self.track_rows], return_counts=True)
+        self.track_offsets = np.zeros(len(self.track_labels) + 1, dtype='int64')
+        np.cumsum(track_counts, out=self.track_offsets[1:])
+        self.track_positions = {pose_track_label: track_position for track_position, pose_track_label in enumerate(self.track_labels.tolist())}
+        self.track_frame_indices = self.frame_indices[self.track_rows]
+        self.build_grid()
+
+    def __len__(self):
+        return len(self.poses_2d)
+
+    def build_grid(self):
+        # Each box is registered in every grid cell it touches. Entries are
+        # sorted by (frame, cell) key so a cell's rows are a contiguous block
+        cells = self.generate_cell_bounds(self.bounding_box_corners)
+        max_cells = cells[:, 1].max(axis=0) + 1 if len(cells) > 0 else np.ones(2, dtype='int64')
+        self.num_cells_x = int(max_cells[0])
+        self.num_cells_y = int(max_cells[1])
+        cell_widths = cells[:, 1, 0] - cells[:, 0, 0] + 1
+        cell_heights = cells[:, 1, 1] - cells[:, 0, 1] + 1
+        cell_counts = cell_widths*cell_heights
+        rows = np.repeat(np.arange(len(cells)), cell_counts)
+        within_box = np.arange(cell_counts.sum()) - np.repeat(np.cumsum(cell_counts) - cell_counts, cell_counts)
+        cells_x = cells[rows, 0, 0] + within_box % cell_widths[rows]
+        cells_y = cells[rows, 0, 1] + within_box // cell_widths[rows]
+        cell_keys = self.generate_cell_keys(self.frame_indices[rows], cells_x, cells_y)
+        key_order = np.argsort(cell_keys, kind='stable')
+        self.grid_keys = cell_keys[key_order]
+        self.grid_rows = rows[key_order]
+
+    def generate_cell_bounds(self, bounding_box_corners):
+        cells = np.floor(np.asarray(bounding_box_corners, dtype=float)/self.grid_cell_size)
+        cells = np.nan_to_num(cells, nan=0.0, posinf=0.0, neginf=0.0)
+        cells = np.maximum(cells, 0).astype('int64')
+        cells[..., 1, :] = np.maximum(cells[..., 1, :], cells[..., 0, :])
+        return cells
+
+    def generate_cell_keys(self, frame_indices, cells_x, cells_y):
+        return (frame_indices*self.num_cells_y + cells_y)*self.num_cells_x + cells_x
+
+    def frame_index(self, timestamp):
+        return int(round((convert_timestamp_to_seconds(timestamp) - self.origin_seconds)/self.frame_period_seconds))
+
+    def frame_rows(self, frame_index):
+        if frame_index < 0 or frame_index >= self.num_frames:
+            return np.zeros(0, dtype='int64')
+        return np.arange(self.frame_offsets[frame_index], self.frame_offsets[frame_index + 1])
+
+    def frame_range_rows(self, start_frame_index, end_frame_index):
+        # Rows for frames start_frame_index <= f < end_frame_index
+        start_frame_index = min(max(start_frame_index, 0), self.num_frames)
+        end_frame_index = min(max(end_frame_index, start_frame_index), self.num_frames)
+        return np.arange(self.frame_offsets[start_frame_index], self.frame_offsets[end_frame_index])
+
+    def timestamp_rows(self, timestamp):
+        return self.frame_rows(self.frame_index(timestamp))
+
+    def time_range_rows(self, start, end):
+        # Rows with start <= timestamp < end
+        start_frame_index = math.ceil((convert_timestamp_to_seconds(start) - self.origin_seconds)/self.frame_period_seconds - 1e-6)
+        end_frame_index = math.ceil((convert_timestamp_to_seconds(end) - self.origin_seconds)/self.frame_period_seconds - 1e-6)
+        return self.frame_range_rows(start_frame_index, end_frame_index)
+
+    def track_position(self, pose_track_label):
+        return self.track_positions.get(pose_track_label)
+
+    def track_rows_for_label(self, pose_track_label):
+        track_position = self.track_position(pose_track_label)
+        if track_position is None:
+            return np.zeros(0, dtype='int64')
+        return self.track_rows[self.track_offsets[track_position]:self.track_offsets[track_position + 1]]
+
+    def track_frame_rows(self, pose_track_label, frame_index):
+        # Rows of a single track at a single frame; more than one row means
+        # the track contains duplicate timestamps
+        track_position = self.track_position(pose_track_label)
+        if track_position is None:
+            return np.zeros(0, dtype='int64')
+        track_start = self.track_offsets[track_position]
+        track_end = self.track_offsets[track_position + 1]
+        track_frame_indices = self.track_frame_indices[track_start:track_end]
+        first = np.searchsorted(track_frame_indices, frame_index, side='left')
+        last = np.searchsorted(track_frame_indices, frame_index, side='right')
+        return self.track_rows[(track_start + first):(track_start + last)]
+
+    def box_rows(self, frame_index, bounding_box_corners, min_iou=None):
+        # Rows at frame_index whose boxes overlap the query box (or whose IoU
+        # with it is at least min_iou). Only the grid cells the query box
+        # touches are searched. Sparse frames are simply scanned
+        if frame_index < 0 or frame_index >= self.num_frames:
+            return np.zeros(0, dtype='int64')
+        bounding_box_corners = np.asarray(bounding_box_corners, dtype=float)
+        if self.frame_offsets[frame_index + 1] - self.frame_offsets[frame_index] < self.min_grid_rows:
+            return self.filter_box_rows(
+                rows=self.frame_rows(frame_index),
+                bounding_box_corners=bounding_box_corners,
+                min_iou=min_iou,
+            )
+        # The query box's cell range is computed with scalar arithmetic since
+        # it usually spans only a handful of cells
+        (x_min, y_min), (x_max, y_max) = bounding_box_corners.tolist()
+        cell_x_min = max(math.floor(x_min/self.grid_cell_size), 0)
+        cell_y_min = max(math.floor(y_min/self.grid_cell_size), 0)
+        cell_x_max = min(math.floor(x_max/self.grid_cell_size), self.num_cells_x - 1)
+        cell_y_max = min(math.floor(y_max/self.grid_cell_size), self.num_cells_y - 1)
+        cell_keys = [
+            self.generate_cell_keys(frame_index, cell_x, cell_y)
+            for cell_y in range(cell_y_min, cell_y_max + 1)
+            for cell_x in range(cell_x_min, cell_x_max + 1)
+        ]
+        if len(cell_keys) == 0:
+            return np.zeros(0, dtype='int64')
+        firsts = self.grid_keys.searchsorted(cell_keys, side='left').tolist()
+        lasts = self.grid_keys.searchsorted(cell_keys, side='right').tolist()
+        candidate_rows = np.unique(np.concatenate([
+            self.grid_rows[first:last] for first, last in zip(firsts, lasts)
+        ]))
+        return self.filter_box_rows(
+            rows=candidate_rows,
+            bounding_box_corners=bounding_box_corners,
+            min_iou=min_iou,
+        )
+
+    def filter_box_rows(self, rows, bounding_box_corners, min_iou=None):
+        if len(rows) == 0:
+            return rows
+        boxes = self.bounding_box_corners[rows]
+        overlapping = (
+            (boxes[:, 0] <= bounding_box_corners[1]) &
+            (boxes[:, 1] >= bounding_box_corners[0])
+        ).all(axis=-1)
+        if min_iou is not None:
+            ious = pose_labelbox.tracks.compute_box_ious(
+                boxes,
+                np.broadcast_to(bounding_box_corners, boxes.shape),
+            )
+            overlapping &= ious >= min_iou
+        return rows[overlapping]
+
+    def poses_at(self, timestamp):
+        return self.poses_2d.iloc[self.timestamp_rows(timestamp)]
+
+    def poses_between(self, start, end):
+        return self.poses_2d.iloc[self.time_range_rows(start, end)]
+
+    def poses_for_track(self, pose_track_label):
+        return self.poses_2d.iloc[self.track_rows_for_label(pose_track_label)]
+
+    def poses_overlapping(self, timestamp, bounding_box_corners, min_iou=None):
+        return self.poses_2d.iloc[self.box_rows(
+            frame_index=self.frame_index(timestamp),
+            bounding_box_corners=bounding_box_corners,
+            min_iou=min_iou,
+        )]
+
+def load_pose_index(
+    inference_id,
+    camera_id,
+    start,
+    end,
+    video_duration=datetime.timedelta(seconds=10),
+    frame_period=datetime.timedelta(milliseconds=100),
+    alphapose_output_parent_directory='/data/alphapose_output',
+    parsed_alphapose_output_suffix=None,
+    grid_cell_size=128,
+):
+    alphapose_output_directory_path = pose_labelbox.alphapose.generate_alphapose_output_directory_path(
+        inference_id=inference_id,
+        camera_id=camera_id,
+        start=start,
+        end=end,
+        video_duration=video_duration,
+        alphapose_output_parent_directory=alphapose_output_parent_directory,
+    )
+    parsed_alphapose_output_filename = pose_labelbox.alphapose.generate_parsed_alphapose_output_filename(
+        camera_id=camera_id,
+        start=start,
+        end=end,
+        video_duration=video_duration,
+        suffix=parsed_alphapose_output_suffix,
+    )
+    poses_2d = pd.read_pickle(alphapose_output_directory_path / parsed_alphapose_output_filename)
+    pose_index = PoseIndex(
+        poses_2d=poses_2d,
+        frame_period=frame_period,
+        grid_cell_size=grid_cell_size,
+    )
+    logger.info(f'Indexed {len(pose_index)} poses in {len(pose_index.track_labels)} pose tracks over {pose_index.num_frames} frames for camera {camera_id}')
+    return pose_index
+
+def convert_timestamp_to_seconds(timestamp):
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize('UTC')
+    return timestamp.timestamp()
@@ -1,30 +1,146 @@
-import ffmpeg
-import subprocess
+import pose_labelbox.metrics
+import pose_labelbox.profiling
+import pose_labelbox.utils
+import pose_labelbox.tracks
+import pose_labelbox.overlay
 import datetime
+import bisect
+import concurrent.futures
+import json
+import tempfile
+import shutil
+import time
 import re
 import pathlib
 import logging
 
 logger = logging.getLogger(__name__)
 
+ffmpeg = pose_labelbox.utils.lazy_import('ffmpeg')
+
 
 def extract_video_frames(
     video_path,
     frame_directory_path,
     ffmpeg_frame_identifier,
     frames_per_second=10,
+    camera_id=None,
 ):
     if not pathlib.Path(video_path).is_file():
         raise ValueError(f'Video file {video_path} does not exist')
     pathlib.Path(frame_directory_path).mkdir(parents=True, exist_ok=True)
     frames_input_argument = str(video_path)
     frames_output_argument = str(frame_directory_path / ffmpeg_frame_identifier)
-    stdout, stderr = (
+    start_time = time.perf_counter()
+    process = (
         ffmpeg
         .input(frames_input_argument)
         .output(frames_output_argument, r=frames_per_second)
-        .run(quiet=True)
+        .run_async(pipe_stdout=True, pipe_stderr=True)
+    )
+    stdout, stderr = process.communicate()
+    pose_labelbox.metrics.record_subprocess(
+        name='extract_video_frames',
+        duration=time.perf_counter() - start_time,
+        returncode=process.returncode,
+        camera_id=camera_id,
     )
+    if process.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', stdout, stderr)
+
+def extract_video_frames_batch(
+    video_paths,
+    frame_directory_paths,
+    ffmpeg_frame_identifiers,
+    frames_per_video=100,
+    frames_per_second=10,
+    video_duration=datetime.timedelta(seconds=10),
+    frame_filename_extension='png',
+    camera_id=None,
+):
+    # Extracts frames from a sequence of consecutive videos with a single
+    # ffmpeg process (via the concat demuxer). Output frames are numbered by
+    # presentation timestamp, so frame k of the concatenated stream belongs to
+    # video k // frames_per_video. Any video whose frames don't come out as
+    # exactly frames_per_video contiguous frames is re-extracted on its own.
+    if not (len(video_paths) == len(frame_directory_paths) == len(ffmpeg_frame_identifiers)):
+        raise ValueError('Video paths, frame directory paths, and ffmpeg frame identifiers must have the same length')
+    for video_path in video_paths:
+        if not pathlib.Path(video_path).is_file():
+            raise ValueError(f'Video file {video_path} does not exist')
+    staging_parent_directory_path = pathlib.Path(frame_directory_paths[0]).parent
+    staging_parent_directory_path.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=staging_parent_directory_path, prefix='.batch_') as staging_directory:
+        staging_directory_path = pathlib.Path(staging_directory)
+        concat_list_path = staging_directory_path / 'concat_list.txt'
+        with open(concat_list_path, 'w') as fp:
+            for video_path in video_paths:
+                fp.write(f'file \'{pathlib.Path(video_path).resolve()}\'\n')
+                fp.write(f'duration {video_duration.total_seconds()}\n')
+        start_time = time.perf_counter()
+        process = (
+            ffmpeg
+            .input(str(concat_list_path), format='concat', safe=0)
+            .output(
+                str(staging_directory_path / f'%08d.{frame_filename_extension}'),
+                r=frames_per_second,
+                frame_pts=1,
+            )
+            .run_async(pipe_stdout=True, pipe_stderr=True)
+        )
+        stdout, stderr = process.communicate()
+        pose_labelbox.metrics.record_subprocess(
+            name='extract_video_frames_batch',
+            duration=time.perf_counter() - start_time,
+            returncode=process.returncode,
+            camera_id=camera_id,
+        )
+        if process.returncode != 0:
+            logger.warning(f'Batched extraction of {len(video_paths)} videos failed. Extracting individually.')
+            pose_labelbox.metrics.increment_counter('batched_extraction_fallbacks', len(video_paths), camera_id=camera_id)
+            for video_path, frame_directory_path, ffmpeg_frame_identifier in zip(
+                video_paths,
+                frame_directory_paths,
+                ffmpeg_frame_identifiers,
+            ):
+                extract_video_frames(
+                    video_path=video_path,
+                    frame_directory_path=frame_directory_path,
+                    ffmpeg_frame_identifier=ffmpeg_frame_identifier,
+                    frames_per_second=frames_per_second,
+                    camera_id=camera_id,
+                )
+            return
+        staged_frame_paths = dict()
+        for staged_frame_path in staging_directory_path.glob(f'*.{frame_filename_extension}'):
+            staged_frame_paths[int(staged_frame_path.stem)] = staged_frame_path
+        for video_index, (video_path, frame_directory_path, ffmpeg_frame_identifier) in enumerate(zip(
+            video_paths,
+            frame_directory_paths,
+            ffmpeg_frame_identifiers,
+        )):
+            frame_numbers = range(video_index*frames_per_video, (video_index + 1)*frames_per_video)
+            if not all(frame_number in staged_frame_paths for frame_number in frame_numbers):
+                logger.warning(f'Batched extraction produced incomplete frames for {video_path}. Extracting individually.')
+                pose_labelbox.metrics.increment_counter('batched_extraction_fallbacks', camera_id=camera_id)
+                extract_video_frames(
+                    video_path=video_path,
+                    frame_directory_path=frame_directory_path,
+                    ffmpeg_frame_identifier=ffmpeg_frame_identifier,
+                    frames_per_second=frames_per_second,
+                    camera_id=camera_id,
+                )
+                continue
+            frame_directory_path = pathlib.Path(frame_directory_path)
+            frame_directory_path.mkdir(parents=True, exist_ok=True)
+            for frame_index, frame_number in enumerate(frame_numbers):
+                shutil.move(
+                    str(staged_frame_paths[frame_number]),
+                    str(frame_directory_path / (ffmpeg_frame_identifier % (frame_index + 1)))
+                )
+        num_extra_frames = len(set(staged_frame_paths.keys()) - set(range(len(video_paths)*frames_per_video)))
+        if num_extra_frames > 0:
+            logger.warning(f'Batched extraction produced {num_extra_frames} frames beyond the expected range. Discarding.')
 
 def generate_bounding_box_overlay_videos(
     inference_id,
@@ -36,60 +152,221 @@ def generate_bounding_box_overlay_videos(
     overlay_video_pixel_format='yuv420p',
     frames_per_second=10,
     frame_period=datetime.timedelta(milliseconds=100),
+    max_gap=None,
+    max_video_duration=None,
+    num_encoder_workers=1,
+    cache_manager=None,
 ):
+    if num_encoder_workers < 1:
+        raise ValueError('Number of encoder workers must be at least 1')
+    if max_video_duration is not None and max_video_duration < frame_period:
+        raise ValueError('Maximum video duration must be at least one frame period')
     inference_directory_path = (
         pathlib.Path(bounding_box_overlay_parent_directory) /
         inference_id
     )
     for camera_directory_path in inference_directory_path.iterdir():
-        camera_id = camera_directory_path.name
-        logger.info(f'Generating bounding box overlay videos for camera {camera_id}')
-        for pose_track_directory_path in camera_directory_path.iterdir():
-            pose_track_label = pose_track_directory_path.name
-            image_paths = sorted(pose_track_directory_path.glob(f'*.{overlay_image_extension}'))
-            pose_track_start = extract_bounding_box_overlay_timestamp(image_paths[0].stem)
-            pose_track_end = extract_bounding_box_overlay_timestamp(image_paths[-1].stem) + frame_period
-            image_list_path = pose_track_directory_path / 'image_list.txt'
-            with open(image_list_path, 'w') as fp:
-                for image_path in image_paths:
-                    fp.write(f'file \'{str(image_path)}\'\n')
-                    fp.write(f'duration {frame_period.total_seconds()}\n')
-            output_path = generate_bounding_box_overlay_video_path(
-                inference_id=inference_id,
-                camera_id=camera_id,
-                pose_track_label=pose_track_label,
-                pose_track_start=pose_track_start,
-                pose_track_end=pose_track_end,
-                bounding_box_overlay_video_parent_directory=bounding_box_overlay_video_parent_directory,
-                overlay_video_extension=overlay_video_extension,
-            )
-            if output_path.is_file():
-                logger.info(f'Bounding box overlay video {output_path} already exists. Skipping')
-                continue
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            image_list_path = pose_track_directory_path / 'image_list.txt'
-            logger.info(f'Generating bounding box overlay video for camera {camera_id} for pose track {pose_track_label}')
-            # TODO: Use the python-ffmpeg API instead of subprocess
-            arguments = [
-                'ffmpeg',
-                '-safe',
-                '0',
-                '-f',
-                'concat',
-                '-i',
-                str(image_list_path),
-                '-c:v',
-                overlay_video_codec,
-                '-r',
-                str(frames_per_second),
-                '-pix_fmt',
-                overlay_video_pixel_format,
-                '-y',
-                str(output_path),
-            ]
-            logger.info(f"Executing: {' '.join(arguments)}")
-            subprocess.run(arguments)
+        with pose_labelbox.metrics.time_stage('generate_bounding_box_overlay_videos', camera_id=camera_directory_path.name), pose_labelbox.profiling.profile_stage('generate_bounding_box_overlay_videos', camera_id=camera_directory_path.name):
+            camera_id = camera_directory_path.name
+            logger.info(f'Generating bounding box overlay videos for camera {camera_id}')
+            encode_jobs = list()
+            for pose_track_directory_path in camera_directory_path.iterdir():
+                pose_track_label = pose_track_directory_path.name
+                image_paths = sorted(pose_track_directory_path.glob(f'*.{overlay_image_extension}'))
+                if len(image_paths) == 0:
+                    logger.warning(f'No bounding box overlay images found in {pose_track_directory_path}. Skipping')
+                    continue
+                image_timestamps = [extract_bounding_box_overlay_timestamp(image_path.stem) for image_path in image_paths]
+                overlay_metadata = pose_labelbox.overlay.read_bounding_box_overlay_metadata(
+                    inference_id=inference_id,
+                    camera_id=camera_id,
+                    pose_track_label=pose_track_label,
+                    bounding_box_overlay_parent_directory=bounding_box_overlay_parent_directory,
+                )
+                overlay_scale = overlay_metadata.get('output_scale', 1.0)
+                segments = None
+                if 'segments' in overlay_metadata:
+                    # Sparse overlays skip frames within segments, so segments
+                    # come from the overlay stage rather than from image gaps
+                    segments = [
+                        (datetime.datetime.fromisoformat(segment_start), datetime.datetime.fromisoformat(segment_end))
+                        for segment_start, segment_end in overlay_metadata['segments']
+                    ]
+                    segment_starts = [segment_start for segment_start, _ in segments]
+                    segment_indices = [
+                        max(bisect.bisect_right(segment_starts, image_timestamp) - 1, 0)
+                        for image_timestamp in image_timestamps
+                    ]
+                elif max_gap is None:
+                    segment_indices = [0]*len(image_paths)
+                else:
+                    # The overlay stage skips gaps longer than max_gap, so each
+                    # contiguous run of images becomes its own video
+                    segment_indices = pose_labelbox.tracks.generate_segment_indices(
+                        timestamps=image_timestamps,
+                        max_gap=max_gap,
+                    )
+                for segment_index in sorted(set(segment_indices)):
+                    segment_image_paths = [
+                        image_path for image_path, image_segment_index in zip(image_paths, segment_indices)
+                        if image_segment_index == segment_index
+                    ]
+                    segment_image_timestamps = [
+                        extract_bounding_box_overlay_timestamp(image_path.stem)
+                        for image_path in segment_image_paths
+                    ]
+                    if segments is not None:
+                        segment_start, segment_end = segments[segment_index]
+                    else:
+                        segment_start = segment_image_timestamps[0]
+                        segment_end = segment_image_timestamps[-1] + frame_period
+                    # With max_video_duration set, long segments are cut into
+                    # fixed-length videos (aligned to the segment start) that
+                    # can be encoded and labeled independently
+                    if max_video_duration is None:
+                        video_segment_indices = [0]*len(segment_image_paths)
+                    else:
+                        video_segment_indices = [
+                            (image_timestamp - segment_start)//max_video_duration
+                            for image_timestamp in segment_image_timestamps
+                        ]
+                    for video_segment_index in sorted(set(video_segment_indices)):
+                        video_image_paths = [
+                            image_path for image_path, image_video_segment_index in zip(segment_image_paths, video_segment_indices)
+                            if image_video_segment_index == video_segment_index
+                        ]
+                        video_image_timestamps = [
+                            image_timestamp for image_timestamp, image_video_segment_index in zip(segment_image_timestamps, video_segment_indices)
+                            if image_video_segment_index == video_segment_index
+                        ]
+                        pose_track_start = video_image_timestamps[0]
+                        pose_track_end = video_image_timestamps[-1] + frame_period
+                        frame_offsets = None
+                        if segments is not None:
+                            # Each sparse image becomes one video frame; the
+                            # offsets map video frames back onto the full
+                            # timeline
+                            pose_track_start = segment_start
+                            pose_track_end = segment_end
+                            if max_video_duration is not None:
+                                pose_track_start = segment_start + video_segment_index*max_video_duration
+                                pose_track_end = min(pose_track_start + max_video_duration, segment_end)
+                            frame_offsets = [
+                                round((image_timestamp - pose_track_start)/frame_period)
+                                for image_timestamp in video_image_timestamps
+                            ]
+                        output_path = generate_bounding_box_overlay_video_path(
+                            inference_id=inference_id,
+                            camera_id=camera_id,
+                            pose_track_label=pose_track_label,
+                            pose_track_start=pose_track_start,
+                            pose_track_end=pose_track_end,
+                            bounding_box_overlay_video_parent_directory=bounding_box_overlay_video_parent_directory,
+                            overlay_video_extension=overlay_video_extension,
+                        )
+                        if output_path.is_file():
+                            logger.info(f'Bounding box overlay video {output_path} already exists. Skipping')
+                            continue
+                        encode_jobs.append({
+                            'image_paths': video_image_paths,
+                            'output_path': output_path,
+                            'pose_track_label': pose_track_label,
+                            'pose_track_segment_index': segment_index,
+                            'video_segment_index': video_segment_index,
+                            'video_segment_offset': round((pose_track_start - segment_start)/frame_period),
+                            'pose_track_start': pose_track_start,
+                            'pose_track_end': pose_track_end,
+                            'overlay_scale': overlay_scale,
+                            'frame_offsets': frame_offsets,
+                        })
+
+            def encode_video(encode_job):
+                logger.info(f"Generating bounding box overlay video for camera {camera_id} for pose track {encode_job['pose_track_label']} (segment {encode_job['pose_track_segment_index']}, video segment {encode_job['video_segment_index']})")
+                encode_bounding_box_overlay_video(
+                    image_paths=encode_job['image_paths'],
+                    output_path=encode_job['output_path'],
+                    overlay_video_codec=overlay_video_codec,
+                    overlay_video_pixel_format=overlay_video_pixel_format,
+                    frames_per_second=frames_per_second,
+                    frame_period=frame_period,
+                    camera_id=camera_id,
+                )
+                write_bounding_box_overlay_video_metadata(
+                    video_path=encode_job['output_path'],
+                    pose_track_label=encode_job['pose_track_label'],
+                    pose_track_segment_index=encode_job['pose_track_segment_index'],
+                    pose_track_start=encode_job['pose_track_start'],
+                    pose_track_end=encode_job['pose_track_end'],
+                    num_frames=len(encode_job['image_paths']),
+                    overlay_scale=encode_job['overlay_scale'],
+                    frame_offsets=encode_job['frame_offsets'],
+                    video_segment_index=encode_job['video_segment_index'],
+                    video_segment_offset=encode_job['video_segment_offset'],
+                )
+
+            if num_encoder_workers > 1 and len(encode_jobs) > 1:
+                # Each job runs its own ffmpeg process, so threads are enough
+                with concurrent.futures.ThreadPoolExecutor(max_workers=num_encoder_workers) as executor:
+                    for future in [executor.submit(encode_video, encode_job) for encode_job in encode_jobs]:
+                        future.result()
+            else:
+                for encode_job in encode_jobs:
+                    encode_video(encode_job)
+            if cache_manager is not None:
+                camera_video_directory_path = pathlib.Path(bounding_box_overlay_video_parent_directory) / inference_id / camera_id
+                cache_manager.touch([camera_video_directory_path])
+                with cache_manager.protect([camera_video_directory_path]):
+                    cache_manager.enforce_budget()
             
+def encode_bounding_box_overlay_video(
+    image_paths,
+    output_path,
+    overlay_video_codec='libx264',
+    overlay_video_pixel_format='yuv420p',
+    frames_per_second=10,
+    frame_period=datetime.timedelta(milliseconds=100),
+    camera_id=None,
+):
+    # The image list sits next to the video so concurrent encodes of one
+    # track don't collide
+    output_path = pathlib.Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    image_list_path = output_path.with_suffix('.txt')
+    with open(image_list_path, 'w') as fp:
+        for image_path in image_paths:
+            fp.write(f'file \'{str(image_path)}\'\n')
+            fp.write(f'duration {frame_period.total_seconds()}\n')
+    # TODO: Use the python-ffmpeg API instead of subprocess
+    arguments = [
+        'ffmpeg',
+        '-safe',
+        '0',
+        '-f',
+        'concat',
+        '-i',
+        str(image_list_path),
+        '-c:v',
+        overlay_video_codec,
+        '-r',
+        str(frames_per_second),
+        '-pix_fmt',
+        overlay_video_pixel_format,
+        '-y',
+        str(output_path),
+    ]
+    logger.info(f"Executing: {' '.join(arguments)}")
+    try:
+        pose_labelbox.metrics.run_subprocess(
+            arguments,
+            name='encode_bounding_box_overlay_video',
+            camera_id=camera_id,
+        )
+    finally:
+        image_list_path.unlink(missing_ok=True)
+    pose_labelbox.metrics.increment_counter('overlay_videos_encoded', camera_id=camera_id)
+    pose_labelbox.metrics.increment_counter('overlay_video_frames_encoded', len(image_paths), camera_id=camera_id)
+    pose_labelbox.metrics.record_file_bytes('overlay_video_bytes', output_path, camera_id=camera_id)
+
 def generate_bounding_box_overlay_video_path(
     inference_id,
     camera_id,
@@ -109,6 +386,44 @@ def generate_bounding_box_overlay_video_path(
     )
     return generate_bounding_box_overlay_video_path
 
+def write_bounding_box_overlay_video_metadata(
+    video_path,
+    pose_track_label,
+    pose_track_segment_index,
+    pose_track_start,
+    pose_track_end,
+    num_frames,
+    overlay_scale=1.0,
+    frame_offsets=None,
+    video_segment_index=0,
+    video_segment_offset=0,
+):
+    metadata = {
+        'pose_track_label': str(pose_track_label),
+        'pose_track_segment_index': int(pose_track_segment_index),
+        'pose_track_start': pose_track_start.isoformat(),
+        'pose_track_end': pose_track_end.isoformat(),
+        'num_frames': int(num_frames),
+        'overlay_scale': float(overlay_scale),
+        'video_segment_index': int(video_segment_index),
+        'video_segment_offset': int(video_segment_offset),
+    }
+    if frame_offsets is not None:
+        metadata['frame_offsets'] = [int(frame_offset) for frame_offset in frame_offsets]
+    with open(generate_bounding_box_overlay_video_metadata_path(video_path), 'w') as fp:
+        json.dump(metadata, fp)
+
+def read_bounding_box_overlay_video_metadata(video_path):
+    metadata_path = generate_bounding_box_overlay_video_metadata_path(video_path)
+    if not metadata_path.is_file():
+        return dict()
+    with open(metadata_path, 'r') as fp:
+        metadata = json.load(fp)
+    return metadata
+
+def generate_bounding_box_overlay_video_metadata_path(video_path):
+    return pathlib.Path(video_path).with_suffix('.json')
+
 bounding_box_overlay_filename_re = re.compile(r'pose_track_overlay_(?P<year_string>[0-9]{4})(?P<month_string>[0-9]{2})(?P<day_string>[0-9]{2})_(?P<hour_string>[0-9]{2})(?P<minute_string>[0-9]{2})(?P<second_string>[0-9]{2})_(?P<microsecond_string>[0-9]{6})')
 def extract_bounding_box_overlay_timestamp(filename_stem):
     m = bounding_box_overlay_filename_re.match(filename_stem)
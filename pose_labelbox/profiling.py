@@ -0,0 +1,279 @@
+import contextlib
+import functools
+import threading
+import tracemalloc
+import cProfile
+import pstats
+import datetime
+import pathlib
+import time
+import sys
+import io
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROFILING_MODES = ['deterministic', 'sampling']
+
+_profiling_config = None
+_profiling_lock = threading.Lock()
+_profile_state = threading.local()
+_num_memory_tracing_stages = 0
+_started_memory_tracing = False
+_NULL_CONTEXT = contextlib.nullcontext()
+
+def enable_profiling(
+    run_directory='/data/profiles',
+    run_id=None,
+    mode='deterministic',
+    sampling_interval=0.005,
+    trace_memory=True,
+    num_hot_functions=25,
+):
+    global _profiling_config
+    if mode not in PROFILING_MODES:
+        raise ValueError(f'Profiling mode \'{mode}\' not recognized. Must be one of {PROFILING_MODES}')
+    if run_id is None:
+        run_id = datetime.datetime.now(tz=datetime.timezone.utc).strftime('%Y%m%d_%H%M%S')
+    run_directory_path = pathlib.Path(run_directory) / run_id
+    run_directory_path.mkdir(parents=True, exist_ok=True)
+    _profiling_config = {
+        'run_directory_path': run_directory_path,
+        'mode': mode,
+        'sampling_interval': sampling_interval,
+        'trace_memory': trace_memory,
+        'num_hot_functions': num_hot_functions,
+    }
+    logger.info(f'Profiling enabled. Writing profiles to {run_directory_path}')
+    return run_directory_path
+
+def disable_profiling():
+    global _profiling_config
+    _profiling_config = None
+
+@contextlib.contextmanager
+def profile_run(
+    run_directory='/data/profiles',
+    run_id=None,
+    mode='deterministic',
+    sampling_interval=0.005,
+    trace_memory=True,
+    num_hot_functions=25,
+):
+    run_directory_path = enable_profiling(
+        run_directory=run_directory,
+        run_id=run_id,
+        mode=mode,
+        sampling_interval=sampling_interval,
+        trace_memory=trace_memory,
+        num_hot_functions=num_hot_functions,
+    )
+    try:
+        yield run_directory_path
+    finally:
+        disable_profiling()
+
+def profile_stage(stage_name, camera_id=None):
+    # Only the outermost stage on each thread is profiled; nested stages
+    # (e.g., create_dataset called from create_project) are folded into the
+    # enclosing profile. Stages that profile each camera are therefore not
+    # wrapped in a whole-stage profile
+    if _profiling_config is None or _is_profile_active():
+        return _NULL_CONTEXT
+    return _profile_stage(
+        stage_name=stage_name,
+        camera_id=camera_id,
+        config=_profiling_config,
+    )
+
+def profiled(stage_name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiling_config is None or _is_profile_active():
+                return function(*args, **kwargs)
+            with profile_stage(stage_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _is_profile_active():
+    return getattr(_profile_state, 'active', False)
+
+@contextlib.contextmanager
+def _profile_stage(
+    stage_name,
+    camera_id,
+    config,
+):
+    if _is_profile_active():
+        yield
+        return
+    _profile_state.active = True
+    try:
+        output_path_stem = generate_profile_path_stem(
+            run_directory_path=config['run_directory_path'],
+            stage_name=stage_name,
+            camera_id=camera_id,
+        )
+        output_path_stem.parent.mkdir(parents=True, exist_ok=True)
+        if config['trace_memory']:
+            _start_tracing_memory()
+        if config['mode'] == 'deterministic':
+            profiler = cProfile.Profile()
+        else:
+            profiler = SamplingProfiler(interval=config['sampling_interval'])
+        start_time = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            wall_time = time.perf_counter() - start_time
+            peak_memory_bytes = None
+            if config['trace_memory']:
+                peak_memory_bytes = _stop_tracing_memory()
+            write_profile(
+                profiler=profiler,
+                output_path_stem=output_path_stem,
+                stage_name=stage_name,
+                camera_id=camera_id,
+                wall_time=wall_time,
+                peak_memory_bytes=peak_memory_bytes,
+                num_hot_functions=config['num_hot_functions'],
+            )
+    finally:
+        _profile_state.active = False
+
+def _start_tracing_memory():
+    # Memory tracing is process-wide, so stages profiled concurrently on
+    # other threads share it: it is started with the first such stage and
+    # stopped with the last, and the peak is only reset when no other stage
+    # is being traced (so a concurrent stage's peak is an upper bound)
+    global _num_memory_tracing_stages, _started_memory_tracing
+    with _profiling_lock:
+        if _num_memory_tracing_stages == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _started_memory_tracing = True
+            tracemalloc.reset_peak()
+        _num_memory_tracing_stages += 1
+
+def _stop_tracing_memory():
+    global _num_memory_tracing_stages, _started_memory_tracing
+    with _profiling_lock:
+        _, peak_memory_bytes = tracemalloc.get_traced_memory()
+        _num_memory_tracing_stages -= 1
+        if _num_memory_tracing_stages == 0 and _started_memory_tracing:
+            tracemalloc.stop()
+            _started_memory_tracing = False
+    return peak_memory_bytes
+
+def write_profile(
+    profiler,
+    output_path_stem,
+    stage_name,
+    camera_id,
+    wall_time,
+    peak_memory_bytes,
+    num_hot_functions=25,
+):
+    header_lines = [
+        f'Stage: {stage_name}',
+        f'Camera ID: {camera_id}',
+        f'Wall time: {wall_time:.3f} s',
+    ]
+    if peak_memory_bytes is not None:
+        header_lines.append(f'Peak traced memory: {peak_memory_bytes/2**20:.1f} MiB')
+    if isinstance(profiler, cProfile.Profile):
+        profile_path = output_path_stem.with_suffix('.prof')
+        profiler.dump_stats(str(profile_path))
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(num_hot_functions)
+        hot_function_summary = stream.getvalue()
+    else:
+        profile_path = output_path_stem.with_suffix('.folded')
+        profiler.write_folded_stacks(profile_path)
+        hot_function_summary = profiler.format_hot_functions(num_hot_functions)
+    summary_path = output_path_stem.with_suffix('.txt')
+    with open(summary_path, 'w') as fp:
+        fp.write('\n'.join(header_lines) + '\n\n')
+        fp.write(hot_function_summary)
+    logger.info(f'Wrote profile for stage {stage_name} (camera {camera_id}) to {profile_path}')
+
+def generate_profile_path_stem(
+    run_directory_path,
+    stage_name,
+    camera_id=None,
+):
+    if camera_id is None:
+        camera_string = 'all_cameras'
+    else:
+        camera_string = re.sub(r'[^A-Za-z0-9_.-]', '_', str(camera_id))
+    profile_path_stem = (
+        pathlib.Path(run_directory_path) /
+        stage_name /
+        f"{camera_string}_{datetime.datetime.now(tz=datetime.timezone.utc).strftime('%Y%m%d_%H%M%S_%f')}"
+    )
+    return profile_path_stem
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stack_counts = dict()
+        self.num_samples = 0
+        self._thread_id = None
+        self._stop_event = threading.Event()
+        self._sampler_thread = None
+
+    def enable(self):
+        self._thread_id = threading.get_ident()
+        self._stop_event.clear()
+        self._sampler_thread = threading.Thread(target=self._sample, daemon=True)
+        self._sampler_thread.start()
+
+    def disable(self):
+        self._stop_event.set()
+        if self._sampler_thread is not None:
+            self._sampler_thread.join()
+            self._sampler_thread = None
+
+    def _sample(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = list()
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            stack = tuple(reversed(stack))
+            self.stack_counts[stack] = self.stack_counts.get(stack, 0) + 1
+            self.num_samples += 1
+
+    def write_folded_stacks(self, path):
+        with open(path, 'w') as fp:
+            for stack, count in sorted(self.stack_counts.items(), key=lambda item: -item[1]):
+                fp.write(';'.join(stack) + f' {count}\n')
+
+    def format_hot_functions(self, num_hot_functions=25):
+        self_counts = dict()
+        total_counts = dict()
+        for stack, count in self.stack_counts.items():
+            if len(stack) == 0:
+                continue
+            self_counts[stack[-1]] = self_counts.get(stack[-1], 0) + count
+            for function_name in set(stack):
+                total_counts[function_name] = total_counts.get(function_name, 0) + count
+        lines = [f'{self.num_samples} samples at {self.interval*1000:.1f} ms intervals', '']
+        lines.append(f"{'self %':>8} {'total %':>8}  function")
+        num_samples = max(self.num_samples, 1)
+        hot_functions = sorted(total_counts.keys(), key=lambda function_name: -self_counts.get(function_name, 0))
+        for function_name in hot_functions[:num_hot_functions]:
+            lines.append('{:>8.1f} {:>8.1f}  {}'.format(
+                100*self_counts.get(function_name, 0)/num_samples,
+                100*total_counts[function_name]/num_samples,
+                function_name,
+            ))
+        return '\n'.join(lines) + '\n'
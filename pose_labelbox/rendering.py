@@ -0,0 +1,375 @@
+import pose_labelbox.utils
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+cv = pose_labelbox.utils.lazy_import('cv2')
+cv_utils = pose_labelbox.utils.lazy_import('cv_utils')
+np = pose_labelbox.utils.lazy_import('numpy')
+pd = pose_labelbox.utils.lazy_import('pandas')
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fUTC'
+
+class OverlayRenderer:
+    # Draws the same overlay as overlay.overlay_bounding_box, but in place.
+    # Elements that are identical from frame to frame (pose track label
+    # badge, no detection banner, timestamp background) are rasterized once
+    # into per-pixel alpha masks and blended into the image with NumPy slice
+    # operations; the per-frame bounding box and timestamp text are drawn
+    # into small patches. A small fraction of pixels on antialiased edges
+    # differ from the cv_utils output, by one (rarely two) intensity levels.
+    # With output_scale, images are expected to have been resized already
+    # (see resize_image) and bounding boxes, fonts, line widths and padding
+    # are scaled to match
+    def __init__(
+        self,
+        pose_track_label=None,
+        output_scale=1.0,
+        show_timestamp=True,
+        show_pose_track_label=True,
+        show_no_detection_warning=True,
+        bounding_box_line_width=1.5,
+        bounding_box_color='#00ff00',
+        bounding_box_fill=False,
+        bounding_box_alpha=1.0,
+        timestamp_padding=5,
+        timestamp_font_scale=1.5,
+        timestamp_text_line_width=1,
+        timestamp_text_color='#ffffff',
+        timestamp_box_color='#000000',
+        timestamp_box_fill=True,
+        timestamp_box_alpha=0.3,
+        pose_track_label_font_scale=2.0,
+        pose_track_label_text_line_width=1.5,
+        pose_track_label_text_color='#ffffff',
+        pose_track_label_text_alpha=1.0,
+        pose_track_label_box_line_width=1.5,
+        pose_track_label_box_color='#00ff00',
+        pose_track_label_box_fill=True,
+        pose_track_label_box_alpha=0.5,
+        no_detection_warning_font_scale=2.0,
+        no_detection_warning_text_line_width=1.5,
+        no_detection_warning_text_color='#ffffff',
+        no_detection_warning_text_alpha=1.0,
+        no_detection_warning_box_line_width=1.5,
+        no_detection_warning_box_color='#ff0000',
+        no_detection_warning_box_fill=True,
+        no_detection_warning_box_alpha=0.5,
+    ):
+        if show_pose_track_label and pose_track_label is None:
+            raise ValueError('Pose track label not specified')
+        if output_scale <= 0:
+            raise ValueError('Output scale must be positive')
+        self.pose_track_label = pose_track_label
+        self.output_scale = output_scale
+        self.anchor_padding = 5*output_scale
+        self.show_timestamp = show_timestamp
+        self.show_pose_track_label = show_pose_track_label
+        self.show_no_detection_warning = show_no_detection_warning
+        self.bounding_box_line_width = bounding_box_line_width*output_scale
+        self.bounding_box_color = bounding_box_color
+        self.bounding_box_fill = bounding_box_fill
+        self.bounding_box_alpha = bounding_box_alpha
+        self.timestamp_padding = timestamp_padding*output_scale
+        self.timestamp_font_scale = timestamp_font_scale*output_scale
+        self.timestamp_text_line_width = timestamp_text_line_width*output_scale
+        self.timestamp_text_color = timestamp_text_color
+        self.timestamp_box_color = timestamp_box_color
+        self.timestamp_box_fill = timestamp_box_fill
+        self.timestamp_box_alpha = timestamp_box_alpha
+        self.pose_track_label_style = dict(
+            font_scale=pose_track_label_font_scale*output_scale,
+            text_line_width=pose_track_label_text_line_width*output_scale,
+            text_color=pose_track_label_text_color,
+            text_alpha=pose_track_label_text_alpha,
+            box_line_width=pose_track_label_box_line_width*output_scale,
+            box_color=pose_track_label_box_color,
+            box_fill=pose_track_label_box_fill,
+            box_alpha=pose_track_label_box_alpha,
+        )
+        self.no_detection_warning_style = dict(
+            font_scale=no_detection_warning_font_scale*output_scale,
+            text_line_width=no_detection_warning_text_line_width*output_scale,
+            text_color=no_detection_warning_text_color,
+            text_alpha=no_detection_warning_text_alpha,
+            box_line_width=no_detection_warning_box_line_width*output_scale,
+            box_color=no_detection_warning_box_color,
+            box_fill=no_detection_warning_box_fill,
+            box_alpha=no_detection_warning_box_alpha,
+        )
+        self.patch_cache = dict()
+        self.buffer = None
+
+    def render(
+        self,
+        image,
+        show_bounding_box=True,
+        bounding_box_corners=None,
+        timestamp=None,
+        copy=False,
+    ):
+        # With copy=True the source image is left untouched (e.g., when it is
+        # held in a frame cache) and drawing happens in a reused buffer
+        if copy:
+            if self.buffer is None or self.buffer.shape != image.shape or self.buffer.dtype != image.dtype:
+                self.buffer = np.empty_like(image)
+            np.copyto(self.buffer, image)
+            image = self.buffer
+        image_height, image_width = image.shape[:2]
+        if show_bounding_box:
+            if bounding_box_corners is None:
+                raise ValueError('Bounding box not specified')
+            if self.output_scale != 1.0:
+                bounding_box_corners = np.asarray(bounding_box_corners, dtype=float)*self.output_scale
+            draw_rectangle_in_place(
+                image=image,
+                coordinates=bounding_box_corners,
+                line_width=self.bounding_box_line_width,
+                color=self.bounding_box_color,
+                fill=self.bounding_box_fill,
+                alpha=self.bounding_box_alpha,
+            )
+        if not show_bounding_box and self.show_no_detection_warning:
+            self.blend_patch(image, self.fetch_text_box_patch(
+                key=('no_detection_warning', image_width, image_height),
+                image_shape=image.shape,
+                anchor_coordinates=[round(image_width/2), self.anchor_padding],
+                text='No detection',
+                horizontal_alignment='center',
+                vertical_alignment='top',
+                **self.no_detection_warning_style,
+            ))
+        if self.show_timestamp:
+            if timestamp is None:
+                raise ValueError('Timestamp not specified')
+            self.draw_timestamp(image, timestamp)
+        if self.show_pose_track_label:
+            self.blend_patch(image, self.fetch_text_box_patch(
+                key=('pose_track_label', image_width, image_height),
+                image_shape=image.shape,
+                anchor_coordinates=[self.anchor_padding, self.anchor_padding],
+                text=str(self.pose_track_label),
+                horizontal_alignment='left',
+                vertical_alignment='top',
+                **self.pose_track_label_style,
+            ))
+        return image
+
+    def draw_timestamp(self, image, timestamp):
+        image_height, image_width = image.shape[:2]
+        timestamp_text = pd.to_datetime(timestamp, utc=True).strftime(TIMESTAMP_FORMAT)
+        anchor_coordinates = [image_width - self.timestamp_padding, self.timestamp_padding]
+        text_size, _ = cv.getTextSize(
+            text=timestamp_text,
+            fontFace=cv.FONT_HERSHEY_PLAIN,
+            fontScale=self.timestamp_font_scale,
+            thickness=math.ceil(self.timestamp_text_line_width),
+        )
+        # The background box only depends on the size of the text, which is
+        # almost always the same for every timestamp
+        self.blend_patch(image, self.fetch_text_box_patch(
+            key=('timestamp', image_width, image_height, tuple(text_size)),
+            image_shape=image.shape,
+            anchor_coordinates=anchor_coordinates,
+            text=timestamp_text,
+            horizontal_alignment='right',
+            vertical_alignment='top',
+            font_scale=self.timestamp_font_scale,
+            text_line_width=self.timestamp_text_line_width,
+            text_color=self.timestamp_text_color,
+            text_alpha=1.0,
+            box_line_width=0,
+            box_color=self.timestamp_box_color,
+            box_fill=self.timestamp_box_fill,
+            box_alpha=self.timestamp_box_alpha,
+            include_text=False,
+        ))
+        text_org_u, text_org_v = cv_utils.get_text_org(
+            anchor_coordinates=anchor_coordinates,
+            text=timestamp_text,
+            horizontal_alignment='right',
+            vertical_alignment='top',
+            font_face=cv.FONT_HERSHEY_PLAIN,
+            font_scale=self.timestamp_font_scale,
+            line_width=self.timestamp_text_line_width,
+        )
+        cv.putText(
+            img=image,
+            text=timestamp_text,
+            org=(int(round(text_org_u)), int(round(text_org_v))),
+            fontFace=cv.FONT_HERSHEY_PLAIN,
+            fontScale=self.timestamp_font_scale,
+            color=cv_utils.hex_to_bgr(self.timestamp_text_color),
+            thickness=math.ceil(self.timestamp_text_line_width),
+            lineType=cv.LINE_AA,
+        )
+
+    def fetch_text_box_patch(self, key, **kwargs):
+        if key not in self.patch_cache:
+            self.patch_cache[key] = rasterize_text_box(**kwargs)
+        return self.patch_cache[key]
+
+    def blend_patch(self, image, patch):
+        if patch is None:
+            return
+        (row_start, row_end, column_start, column_end), layers = patch
+        region = image[row_start:row_end, column_start:column_end]
+        blended_region = region.astype('float32')
+        # Each layer is antialiased onto the region and then alpha blended,
+        # rounding after both steps as cv_utils does
+        for color_bgr, coverage_mask, alpha in layers:
+            overlay_region = np.rint(blended_region + coverage_mask*(color_bgr - blended_region))
+            blended_region *= 1 - alpha
+            blended_region += alpha*overlay_region
+            np.rint(blended_region, out=blended_region)
+        np.clip(blended_region, 0, 255, out=blended_region)
+        region[...] = blended_region
+
+def rasterize_text_box(
+    image_shape,
+    anchor_coordinates,
+    text,
+    horizontal_alignment,
+    vertical_alignment,
+    font_scale=1.0,
+    text_line_width=1,
+    text_color='#00ff00',
+    text_alpha=1.0,
+    box_line_width=1.5,
+    box_color='#00ff00',
+    box_fill=True,
+    box_alpha=1.0,
+    include_text=True,
+):
+    # Returns the image region covered by a text box and the (color, coverage
+    # mask, alpha) layers to blend into it, mirroring the geometry of
+    # cv_utils.draw_text_box
+    image_height, image_width = image_shape[:2]
+    text_thickness = math.ceil(text_line_width)
+    box_thickness = cv.FILLED if box_fill else math.ceil(box_line_width)
+    box_coordinates = cv_utils.get_text_box_coordinates(
+        anchor_coordinates=anchor_coordinates,
+        text=text,
+        horizontal_alignment=horizontal_alignment,
+        vertical_alignment=vertical_alignment,
+        font_face=cv.FONT_HERSHEY_PLAIN,
+        font_scale=font_scale,
+        line_width=text_line_width,
+    )
+    box_corners = [tuple(int(round(coordinate)) for coordinate in corner) for corner in box_coordinates]
+    text_org_u, text_org_v = cv_utils.get_text_org(
+        anchor_coordinates=anchor_coordinates,
+        text=text,
+        horizontal_alignment=horizontal_alignment,
+        vertical_alignment=vertical_alignment,
+        font_face=cv.FONT_HERSHEY_PLAIN,
+        font_scale=font_scale,
+        line_width=text_line_width,
+    )
+    text_org = (int(round(text_org_u)), int(round(text_org_v)))
+    margin = 2*max(text_thickness, 0 if box_fill else box_thickness) + 4
+    column_start = max(min(corner[0] for corner in box_corners) - margin, 0)
+    column_end = min(max(corner[0] for corner in box_corners) + margin + 1, image_width)
+    row_start = max(min(corner[1] for corner in box_corners) - margin, 0)
+    row_end = min(max(corner[1] for corner in box_corners) + margin + 1, image_height)
+    if column_start >= column_end or row_start >= row_end:
+        return None
+    offset = (column_start, row_start)
+    layers = list()
+    box_coverage = np.zeros((row_end - row_start, column_end - column_start), dtype='uint8')
+    cv.rectangle(
+        img=box_coverage,
+        pt1=shift_point(box_corners[0], offset),
+        pt2=shift_point(box_corners[1], offset),
+        color=255,
+        thickness=box_thickness,
+        lineType=cv.LINE_AA,
+    )
+    layers.append(generate_layer(box_color, box_coverage, box_alpha))
+    if include_text:
+        text_coverage = np.zeros_like(box_coverage)
+        cv.putText(
+            img=text_coverage,
+            text=text,
+            org=shift_point(text_org, offset),
+            fontFace=cv.FONT_HERSHEY_PLAIN,
+            fontScale=font_scale,
+            color=255,
+            thickness=text_thickness,
+            lineType=cv.LINE_AA,
+        )
+        layers.append(generate_layer(text_color, text_coverage, text_alpha))
+    return (row_start, row_end, column_start, column_end), layers
+
+def resize_image(image, output_scale=1.0):
+    # Output dimensions are rounded to even numbers since yuv420p video
+    # requires them
+    if output_scale == 1.0:
+        return image
+    if output_scale <= 0:
+        raise ValueError('Output scale must be positive')
+    image_height, image_width = image.shape[:2]
+    output_width = max(2*round(image_width*output_scale/2), 2)
+    output_height = max(2*round(image_height*output_scale/2), 2)
+    return cv.resize(
+        image,
+        (output_width, output_height),
+        interpolation=cv.INTER_AREA if output_scale < 1.0 else cv.INTER_LINEAR,
+    )
+
+def generate_layer(color, coverage, alpha):
+    color_bgr = np.asarray(cv_utils.hex_to_bgr(color), dtype='float32')
+    coverage_mask = (coverage.astype('float32')/255.0)[..., np.newaxis]
+    return color_bgr, coverage_mask, alpha
+
+def shift_point(point, offset):
+    return (point[0] - offset[0], point[1] - offset[1])
+
+def draw_rectangle_in_place(
+    image,
+    coordinates,
+    line_width=1.5,
+    color='#00ff00',
+    fill=True,
+    alpha=1.0,
+):
+    # Same result as cv_utils.draw_rectangle, but only the region around the
+    # rectangle is copied and blended
+    pt1 = tuple(map(lambda x: int(round(x)), coordinates[0]))
+    pt2 = tuple(map(lambda x: int(round(x)), coordinates[1]))
+    for coordinate in pt1 + pt2:
+        if abs(coordinate) > 2**30:
+            return image
+    color_bgr = cv_utils.hex_to_bgr(color)
+    thickness = cv.FILLED if fill else math.ceil(line_width)
+    if alpha == 1.0:
+        cv.rectangle(
+            img=image,
+            pt1=pt1,
+            pt2=pt2,
+            color=color_bgr,
+            thickness=thickness,
+            lineType=cv.LINE_AA,
+        )
+        return image
+    image_height, image_width = image.shape[:2]
+    margin = (0 if fill else thickness) + 2
+    column_start = max(min(pt1[0], pt2[0]) - margin, 0)
+    column_end = min(max(pt1[0], pt2[0]) + margin + 1, image_width)
+    row_start = max(min(pt1[1], pt2[1]) - margin, 0)
+    row_end = min(max(pt1[1], pt2[1]) + margin + 1, image_height)
+    if column_start >= column_end or row_start >= row_end:
+        return image
+    region = image[row_start:row_end, column_start:column_end]
+    overlay_region = region.copy()
+    cv.rectangle(
+        img=overlay_region,
+        pt1=shift_point(pt1, (column_start, row_start)),
+        pt2=shift_point(pt2, (column_start, row_start)),
+        color=color_bgr,
+        thickness=thickness,
+        lineType=cv.LINE_AA,
+    )
+    region[...] = cv.addWeighted(overlay_region, alpha, region, 1 - alpha, 0)
+    return image
@@ -0,0 +1,152 @@
+import pose_labelbox.metrics
+import pose_labelbox.utils
+import datetime
+import threading
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+honeycomb_io = pose_labelbox.utils.lazy_import('honeycomb_io')
+video_io = pose_labelbox.utils.lazy_import('video_io')
+lb = pose_labelbox.utils.lazy_import('labelbox')
+
+class Session:
+    # Holds one authenticated Honeycomb, video service and Labelbox client for
+    # a whole run, so stages (and the functions they call) reuse the same
+    # tokens and HTTP connection pools instead of creating a client per call.
+    # Clients are created on first use and recreated (fetching new tokens)
+    # once they are older than token_refresh_interval or after refresh()
+    def __init__(
+        self,
+        uri=None,
+        token_uri=None,
+        audience=None,
+        client_id=None,
+        client_secret=None,
+        video_storage_url=None,
+        video_storage_auth_domain=None,
+        video_storage_audience=None,
+        video_storage_client_id=None,
+        video_storage_client_secret=None,
+        labelbox_api_key=None,
+        honeycomb_client=None,
+        video_client=None,
+        labelbox_client=None,
+        token_refresh_interval=datetime.timedelta(hours=12),
+    ):
+        self.uri = uri
+        self.token_uri = token_uri
+        self.audience = audience
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.video_storage_url = video_storage_url
+        self.video_storage_auth_domain = video_storage_auth_domain
+        self.video_storage_audience = video_storage_audience
+        self.video_storage_client_id = video_storage_client_id
+        self.video_storage_client_secret = video_storage_client_secret
+        self.labelbox_api_key = labelbox_api_key
+        self.token_refresh_interval = token_refresh_interval
+        self.lock = threading.Lock()
+        # Clients passed in are used as is and never recreated
+        self.clients = dict()
+        self.client_creation_times = dict()
+        self.fixed_client_names = set()
+        for name, client in [
+            ('honeycomb', honeycomb_client),
+            ('video', video_client),
+            ('labelbox', labelbox_client),
+        ]:
+            if client is not None:
+                self.clients[name] = client
+                self.fixed_client_names.add(name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @property
+    def honeycomb_client(self):
+        return self.fetch_client('honeycomb', self.create_honeycomb_client)
+
+    @property
+    def video_client(self):
+        return self.fetch_client('video', self.create_video_client)
+
+    @property
+    def labelbox_client(self):
+        return self.fetch_client('labelbox', self.create_labelbox_client)
+
+    def fetch_client(self, name, create_function):
+        with self.lock:
+            client = self.clients.get(name)
+            if client is not None and name not in self.fixed_client_names and self.is_expired(name):
+                logger.info(f'Refreshing {name} client')
+                pose_labelbox.metrics.increment_counter('session_client_refreshes', client=name)
+                client = None
+            if client is None:
+                start_time = time.perf_counter()
+                client = create_function()
+                pose_labelbox.metrics.record_timing('session_client_creation', time.perf_counter() - start_time, client=name)
+                self.clients[name] = client
+                self.client_creation_times[name] = time.monotonic()
+            else:
+                pose_labelbox.metrics.increment_counter('session_client_reuses', client=name)
+            return client
+
+    def is_expired(self, name):
+        if self.token_refresh_interval is None or name not in self.client_creation_times:
+            return False
+        return time.monotonic() - self.client_creation_times[name] >= self.token_refresh_interval.total_seconds()
+
+    def refresh(self, name=None):
+        # Drops cached clients (all of them if name is None) so the next use
+        # authenticates again, e.g., after a request fails with an expired
+        # token
+        with self.lock:
+            for client_name in list(self.clients.keys()):
+                if client_name in self.fixed_client_names:
+                    continue
+                if name is None or client_name == name:
+                    del self.clients[client_name]
+                    self.client_creation_times.pop(client_name, None)
+
+    def close(self):
+        self.refresh()
+
+    def create_honeycomb_client(self):
+        return honeycomb_io.generate_client(
+            uri=self.uri,
+            token_uri=self.token_uri,
+            audience=self.audience,
+            client_id=self.client_id,
+            client_secret=self.client_secret,
+        )
+
+    def create_video_client(self):
+        return video_io.client.VideoStorageClient(
+            url=self.video_storage_url if self.video_storage_url is not None else video_io.config.VIDEO_STORAGE_URL,
+            auth_domain=self.video_storage_auth_domain if self.video_storage_auth_domain is not None else video_io.config.VIDEO_STORAGE_AUTH_DOMAIN,
+            audience=self.video_storage_audience if self.video_storage_audience is not None else video_io.config.VIDEO_STORAGE_AUDIENCE,
+            client_id=self.video_storage_client_id if self.video_storage_client_id is not None else video_io.config.VIDEO_STORAGE_CLIENT_ID,
+            client_secret=self.video_storage_client_secret if self.video_storage_client_secret is not None else video_io.config.VIDEO_STORAGE_CLIENT_SECRET,
+        )
+
+    def create_labelbox_client(self):
+        api_key = self.labelbox_api_key if self.labelbox_api_key is not None else os.getenv('LABELBOX_API_KEY')
+        return lb.Client(api_key=api_key)
+
+def resolve_honeycomb_client(client=None, session=None):
+    # An explicitly passed client takes precedence over the session's
+    if client is None and session is not None:
+        return session.honeycomb_client
+    return client
+
+def resolve_video_client(video_client=None, session=None):
+    if video_client is None and session is not None:
+        return session.video_client
+    return video_client
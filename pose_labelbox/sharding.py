@@ -0,0 +1,610 @@
+import pose_labelbox.core
+import pose_labelbox.utils
+import pose_labelbox.session
+import pose_labelbox.metrics
+import threading
+import inspect
+import datetime
+import pathlib
+import socket
+import random
+import json
+import time
+import uuid
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+honeycomb_io = pose_labelbox.utils.lazy_import('honeycomb_io')
+
+# Work units are (camera, window) pairs. A unit is claimed by atomically
+# creating (O_EXCL) a lease file with a generation number. An expired lease of
+# generation g is reclaimed by creating generation g + 1, so exactly one
+# worker wins each reclaim. A worker only marks its unit done while its lease
+# is still the latest generation, and a worker that acquires a lease always
+# checks for a done marker before processing.
+
+LEASE_FILENAME_RE = re.compile(r'(?P<unit_id>.+)\.lease\.(?P<generation>[0-9]+)$')
+UNREADABLE_LEASE_GRACE_PERIOD = datetime.timedelta(minutes=1)
+
+# Arguments that run_sharded fills in for each work unit. Stages only receive
+# the ones their signature accepts
+WORK_UNIT_ARGUMENTS = ['start', 'end', 'environment_id', 'camera_ids', 'video_duration', 'session']
+# Stages that must be able to restrict themselves to one work unit
+REQUIRED_WORK_UNIT_ARGUMENTS = ['start', 'end', 'camera_ids']
+# Overlay stages render whole pose tracks, so a window's overlays would
+# collide with those of its neighbors unless tracks were first linked across
+# windows (tracks.link_pose_track_windows). They are only sharded by camera,
+# over the linked output for the whole period
+OVERLAY_STAGES = ['generate_bounding_box_overlays', 'generate_bounding_box_overlay_videos']
+
+def run_sharded(
+    stage_function,
+    run_id,
+    start,
+    end,
+    environment_id=None,
+    environment_name=None,
+    camera_ids=None,
+    camera_part_numbers=None,
+    camera_serial_numbers=None,
+    camera_names=None,
+    window_duration=datetime.timedelta(minutes=10),
+    window_overlap=datetime.timedelta(0),
+    video_duration=datetime.timedelta(seconds=10),
+    stage_kwargs=None,
+    lease_parent_directory='/data/leases',
+    lease_duration=datetime.timedelta(minutes=10),
+    worker_id=None,
+    max_attempts=3,
+    wait_for_completion=True,
+    poll_interval=datetime.timedelta(seconds=30),
+    client=None,
+    uri=None,
+    token_uri=None,
+    audience=None,
+    client_id=None,
+    client_secret=None,
+    session=None,
+):
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
+    if stage_kwargs is None:
+        stage_kwargs = dict()
+    validate_sharded_stage(
+        stage_function=stage_function,
+        stage_kwargs=stage_kwargs,
+        start=start,
+        end=end,
+        window_duration=window_duration,
+        window_overlap=window_overlap,
+        video_duration=video_duration,
+    )
+    if session is not None and 'session' not in stage_kwargs:
+        # Work units processed by this worker share its clients
+        stage_kwargs = {**stage_kwargs, 'session': session}
+    if worker_id is None:
+        worker_id = generate_worker_id()
+    environment_id = honeycomb_io.fetch_environment_id(
+        environment_id=environment_id,
+        environment_name=environment_name,
+        client=client,
+    )
+    lease_directory_path = generate_lease_directory_path(
+        run_id=run_id,
+        stage_name=stage_function.__name__,
+        lease_parent_directory=lease_parent_directory,
+    )
+    work_units = load_or_create_work_units(
+        lease_directory_path=lease_directory_path,
+        start=start,
+        end=end,
+        environment_id=environment_id,
+        camera_ids=camera_ids,
+        camera_part_numbers=camera_part_numbers,
+        camera_serial_numbers=camera_serial_numbers,
+        camera_names=camera_names,
+        window_duration=window_duration,
+        window_overlap=window_overlap,
+        video_duration=video_duration,
+        client=client,
+        uri=uri,
+        token_uri=token_uri,
+        audience=audience,
+        client_id=client_id,
+        client_secret=client_secret,
+    )
+    logger.info(f'Worker {worker_id} joining run {run_id} ({stage_function.__name__}) with {len(work_units)} work units')
+    num_processed = 0
+    while True:
+        pending_work_units = [
+            work_unit for work_unit in work_units
+            if not is_work_unit_done(lease_directory_path, work_unit['unit_id'])
+            and count_work_unit_failures(lease_directory_path, work_unit['unit_id']) < max_attempts
+        ]
+        if len(pending_work_units) == 0:
+            break
+        # Shuffle so that workers starting together don't contend for the same units
+        random.shuffle(pending_work_units)
+        claimed_any = False
+        for work_unit in pending_work_units:
+            lease = claim_work_unit(
+                lease_directory_path=lease_directory_path,
+                unit_id=work_unit['unit_id'],
+                worker_id=worker_id,
+                lease_duration=lease_duration,
+            )
+            if lease is None:
+                continue
+            if count_work_unit_failures(lease_directory_path, work_unit['unit_id']) >= max_attempts:
+                release_lease(lease)
+                continue
+            claimed_any = True
+            processed = process_work_unit(
+                stage_function=stage_function,
+                work_unit=work_unit,
+                lease=lease,
+                environment_id=environment_id,
+                video_duration=video_duration,
+                stage_kwargs=stage_kwargs,
+                lease_duration=lease_duration,
+            )
+            if processed:
+                num_processed += 1
+        if not claimed_any:
+            if not wait_for_completion:
+                break
+            # Remaining units are leased by other workers; wait for them to
+            # finish or for their leases to expire
+            time.sleep(poll_interval.total_seconds())
+    failed_unit_ids = [
+        work_unit['unit_id'] for work_unit in work_units
+        if not is_work_unit_done(lease_directory_path, work_unit['unit_id'])
+        and count_work_unit_failures(lease_directory_path, work_unit['unit_id']) >= max_attempts
+    ]
+    if len(failed_unit_ids) > 0:
+        logger.warning(f'{len(failed_unit_ids)} work units failed {max_attempts} times and were abandoned: {failed_unit_ids}')
+    logger.info(f'Worker {worker_id} processed {num_processed} work units for run {run_id}')
+    return num_processed
+
+def process_work_unit(
+    stage_function,
+    work_unit,
+    lease,
+    environment_id,
+    video_duration=datetime.timedelta(seconds=10),
+    stage_kwargs=None,
+    lease_duration=datetime.timedelta(minutes=10),
+):
+    if stage_kwargs is None:
+        stage_kwargs = dict()
+    unit_id = work_unit['unit_id']
+    camera_id = work_unit['camera_id']
+    heartbeat = LeaseHeartbeat(
+        lease=lease,
+        lease_duration=lease_duration,
+    )
+    heartbeat.start()
+    try:
+        logger.info(f"Processing work unit {unit_id} with {lease['worker_id']}")
+        with pose_labelbox.metrics.time_stage('sharded_work_unit', stage=stage_function.__name__, camera_id=camera_id):
+            stage_function(**generate_stage_arguments(
+                stage_function=stage_function,
+                work_unit=work_unit,
+                environment_id=environment_id,
+                video_duration=video_duration,
+                stage_kwargs=stage_kwargs,
+            ))
+    except Exception as e:
+        logger.exception(f'Work unit {unit_id} failed')
+        record_work_unit_failure(lease=lease, error=e)
+        pose_labelbox.metrics.increment_counter('sharded_work_units_failed', stage=stage_function.__name__, camera_id=camera_id)
+        release_lease(lease)
+        return False
+    finally:
+        heartbeat.stop()
+    if not complete_work_unit(lease):
+        logger.warning(f'Lease on work unit {unit_id} was superseded before completion')
+        return False
+    pose_labelbox.metrics.increment_counter('sharded_work_units_completed', stage=stage_function.__name__, camera_id=camera_id)
+    return True
+
+def validate_sharded_stage(
+    stage_function,
+    stage_kwargs,
+    start,
+    end,
+    window_duration=datetime.timedelta(minutes=10),
+    window_overlap=datetime.timedelta(0),
+    video_duration=datetime.timedelta(seconds=10),
+):
+    stage_name = stage_function.__name__
+    parameters = inspect.signature(stage_function).parameters
+    missing_arguments = [argument for argument in REQUIRED_WORK_UNIT_ARGUMENTS if argument not in parameters]
+    if len(missing_arguments) > 0:
+        raise ValueError(f'Stage {stage_name} does not accept {missing_arguments} and cannot be sharded')
+    # Work units that generate their own inference IDs would write their
+    # outputs to different directories
+    if 'inference_id' in parameters and stage_kwargs.get('inference_id') is None:
+        raise ValueError(f'Sharding stage {stage_name} requires an inference ID')
+    if stage_name in OVERLAY_STAGES:
+        windows = generate_windows(
+            start=start,
+            end=end,
+            window_duration=window_duration,
+            window_overlap=window_overlap,
+            video_duration=video_duration,
+        )
+        if len(windows) > 1:
+            raise ValueError(f'Stage {stage_name} cannot be sharded into windows. Link pose tracks across windows first and shard it by camera only')
+
+def generate_stage_arguments(
+    stage_function,
+    work_unit,
+    environment_id,
+    video_duration=datetime.timedelta(seconds=10),
+    stage_kwargs=None,
+):
+    if stage_kwargs is None:
+        stage_kwargs = dict()
+    work_unit_arguments = {
+        'start': work_unit['window_start'],
+        'end': work_unit['window_end'],
+        'environment_id': environment_id,
+        'camera_ids': [work_unit['camera_id']],
+        'video_duration': video_duration,
+    }
+    if 'session' in stage_kwargs:
+        work_unit_arguments['session'] = stage_kwargs['session']
+    parameters = inspect.signature(stage_function).parameters
+    accepts_all = any(parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters.values())
+    stage_arguments = {
+        name: value for name, value in work_unit_arguments.items()
+        if accepts_all or name in parameters
+    }
+    # Explicit stage arguments are passed through as given so that typos
+    # still fail loudly
+    stage_arguments.update({
+        name: value for name, value in stage_kwargs.items()
+        if name not in WORK_UNIT_ARGUMENTS
+    })
+    return stage_arguments
+
+def generate_work_units(
+    start,
+    end,
+    environment_id=None,
+    environment_name=None,
+    camera_ids=None,
+    camera_part_numbers=None,
+    camera_serial_numbers=None,
+    camera_names=None,
+    window_duration=datetime.timedelta(minutes=10),
+    window_overlap=datetime.timedelta(0),
+    video_duration=datetime.timedelta(seconds=10),
+    client=None,
+    uri=None,
+    token_uri=None,
+    audience=None,
+    client_id=None,
+    client_secret=None,
+    session=None,
+):
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
+    if window_duration % video_duration != datetime.timedelta(0):
+        raise ValueError('Window duration must be a multiple of the video duration')
+    if window_overlap % video_duration != datetime.timedelta(0):
+        raise ValueError('Window overlap must be a multiple of the video duration')
+    target_camera_ids = pose_labelbox.core.generate_target_camera_ids(
+        start=start,
+        end=end,
+        environment_id=environment_id,
+        environment_name=environment_name,
+        camera_ids=camera_ids,
+        camera_part_numbers=camera_part_numbers,
+        camera_serial_numbers=camera_serial_numbers,
+        camera_names=camera_names,
+        client=client,
+        uri=uri,
+        token_uri=token_uri,
+        audience=audience,
+        client_id=client_id,
+        client_secret=client_secret,
+    )
+    windows = generate_windows(
+        start=start,
+        end=end,
+        window_duration=window_duration,
+        window_overlap=window_overlap,
+        video_duration=video_duration,
+    )
+    work_units = list()
+    for camera_id in sorted(target_camera_ids):
+        for window_start, window_end in windows:
+            work_units.append({
+                'unit_id': generate_work_unit_id(
+                    camera_id=camera_id,
+                    window_start=window_start,
+                    window_end=window_end,
+                ),
+                'camera_id': camera_id,
+                'window_start': window_start,
+                'window_end': window_end,
+            })
+    return work_units
+
+def generate_windows(
+    start,
+    end,
+    window_duration=datetime.timedelta(minutes=10),
+    window_overlap=datetime.timedelta(0),
+    video_duration=datetime.timedelta(seconds=10),
+):
+    # Each window but the last extends window_overlap past the start of the
+    # next, so pose tracks can be linked across windows that were processed
+    # independently (see tracks.link_pose_track_windows)
+    output_start, output_end = pose_labelbox.utils.generate_output_period(
+        start=start,
+        end=end,
+        video_duration=video_duration,
+    )
+    windows = list()
+    window_start = output_start
+    while window_start < output_end:
+        window_end = min(window_start + window_duration, output_end)
+        windows.append((window_start, min(window_end + window_overlap, output_end)))
+        window_start = window_end
+    return windows
+
+def generate_work_unit_id(
+    camera_id,
+    window_start,
+    window_end,
+):
+    window_start_string = window_start.strftime('%Y%m%d_%H%M%S')
+    window_end_string = window_end.strftime('%Y%m%d_%H%M%S')
+    work_unit_id = f'{camera_id}_{window_start_string}_{window_end_string}'
+    return work_unit_id
+
+def generate_lease_directory_path(
+    run_id,
+    stage_name,
+    lease_parent_directory='/data/leases',
+):
+    lease_directory_path = (
+        pathlib.Path(lease_parent_directory) /
+        run_id /
+        stage_name
+    )
+    return lease_directory_path
+
+def generate_worker_id():
+    return f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+def load_or_create_work_units(
+    lease_directory_path,
+    start,
+    end,
+    environment_id=None,
+    camera_ids=None,
+    camera_part_numbers=None,
+    camera_serial_numbers=None,
+    camera_names=None,
+    window_duration=datetime.timedelta(minutes=10),
+    window_overlap=datetime.timedelta(0),
+    video_duration=datetime.timedelta(seconds=10),
+    client=None,
+    uri=None,
+    token_uri=None,
+    audience=None,
+    client_id=None,
+    client_secret=None,
+    session=None,
+):
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
+    # The first worker writes the unit manifest so that every worker agrees on
+    # the unit set even if the camera search results change mid-run
+    lease_directory_path = pathlib.Path(lease_directory_path)
+    lease_directory_path.mkdir(parents=True, exist_ok=True)
+    manifest_path = lease_directory_path / 'work_units.json'
+    if not manifest_path.is_file():
+        work_units = generate_work_units(
+            start=start,
+            end=end,
+            environment_id=environment_id,
+            camera_ids=camera_ids,
+            camera_part_numbers=camera_part_numbers,
+            camera_serial_numbers=camera_serial_numbers,
+            camera_names=camera_names,
+            window_duration=window_duration,
+            window_overlap=window_overlap,
+            video_duration=video_duration,
+            client=client,
+            uri=uri,
+            token_uri=token_uri,
+            audience=audience,
+            client_id=client_id,
+            client_secret=client_secret,
+        )
+        manifest = [
+            {
+                'unit_id': work_unit['unit_id'],
+                'camera_id': work_unit['camera_id'],
+                'window_start': work_unit['window_start'].isoformat(),
+                'window_end': work_unit['window_end'].isoformat(),
+            }
+            for work_unit in work_units
+        ]
+        try:
+            write_json_exclusive(manifest_path, manifest)
+        except FileExistsError:
+            pass
+    with open(manifest_path, 'r') as fp:
+        manifest = json.load(fp)
+    work_units = [
+        {
+            'unit_id': work_unit['unit_id'],
+            'camera_id': work_unit['camera_id'],
+            'window_start': datetime.datetime.fromisoformat(work_unit['window_start']),
+            'window_end': datetime.datetime.fromisoformat(work_unit['window_end']),
+        }
+        for work_unit in manifest
+    ]
+    return work_units
+
+def claim_work_unit(
+    lease_directory_path,
+    unit_id,
+    worker_id,
+    lease_duration=datetime.timedelta(minutes=10),
+):
+    lease_directory_path = pathlib.Path(lease_directory_path)
+    latest_generation, latest_lease = fetch_latest_lease(lease_directory_path, unit_id)
+    if latest_lease is not None and latest_lease['expires'] > time.time():
+        return None
+    if latest_lease is not None:
+        logger.info(f"Reclaiming expired lease on work unit {unit_id} from worker {latest_lease['worker_id']}")
+    generation = 0 if latest_generation is None else latest_generation + 1
+    lease = {
+        'unit_id': unit_id,
+        'generation': generation,
+        'worker_id': worker_id,
+        'claimed': time.time(),
+        'expires': time.time() + lease_duration.total_seconds(),
+        'lease_directory': str(lease_directory_path),
+    }
+    try:
+        write_json_exclusive(generate_lease_path(lease_directory_path, unit_id, generation), lease)
+    except FileExistsError:
+        return None
+    if is_work_unit_done(lease_directory_path, unit_id):
+        release_lease(lease)
+        return None
+    return lease
+
+def renew_lease(
+    lease,
+    lease_duration=datetime.timedelta(minutes=10),
+):
+    if is_lease_superseded(lease):
+        return False
+    lease['expires'] = time.time() + lease_duration.total_seconds()
+    lease_path = generate_lease_path(lease['lease_directory'], lease['unit_id'], lease['generation'])
+    temporary_path = lease_path.with_name(f'.{lease_path.name}.{uuid.uuid4().hex}.tmp')
+    with open(temporary_path, 'w') as fp:
+        json.dump(lease, fp)
+    os.replace(temporary_path, lease_path)
+    return True
+
+def release_lease(lease):
+    # Expire the lease rather than deleting it so that generation numbers
+    # keep increasing
+    lease['expires'] = 0.0
+    lease_path = generate_lease_path(lease['lease_directory'], lease['unit_id'], lease['generation'])
+    temporary_path = lease_path.with_name(f'.{lease_path.name}.{uuid.uuid4().hex}.tmp')
+    with open(temporary_path, 'w') as fp:
+        json.dump(lease, fp)
+    os.replace(temporary_path, lease_path)
+
+def complete_work_unit(lease):
+    if is_lease_superseded(lease):
+        return False
+    done_path = generate_done_path(lease['lease_directory'], lease['unit_id'])
+    try:
+        write_json_exclusive(done_path, {
+            'unit_id': lease['unit_id'],
+            'generation': lease['generation'],
+            'worker_id': lease['worker_id'],
+            'completed': time.time(),
+        })
+    except FileExistsError:
+        return False
+    return True
+
+def record_work_unit_failure(lease, error):
+    failure_path = (
+        pathlib.Path(lease['lease_directory']) /
+        f"{lease['unit_id']}.failed.{lease['generation']}"
+    )
+    with open(failure_path, 'w') as fp:
+        json.dump({
+            'unit_id': lease['unit_id'],
+            'generation': lease['generation'],
+            'worker_id': lease['worker_id'],
+            'failed': time.time(),
+            'error': repr(error),
+        }, fp)
+
+def count_work_unit_failures(lease_directory_path, unit_id):
+    return len(list(pathlib.Path(lease_directory_path).glob(f'{unit_id}.failed.*')))
+
+def is_work_unit_done(lease_directory_path, unit_id):
+    return generate_done_path(lease_directory_path, unit_id).is_file()
+
+def is_lease_superseded(lease):
+    return generate_lease_path(lease['lease_directory'], lease['unit_id'], lease['generation'] + 1).exists()
+
+def fetch_latest_lease(lease_directory_path, unit_id):
+    latest_generation = None
+    for lease_path in pathlib.Path(lease_directory_path).glob(f'{unit_id}.lease.*'):
+        m = LEASE_FILENAME_RE.match(lease_path.name)
+        if not m or m.group('unit_id') != unit_id:
+            continue
+        generation = int(m.group('generation'))
+        if latest_generation is None or generation > latest_generation:
+            latest_generation = generation
+    if latest_generation is None:
+        return None, None
+    lease_path = generate_lease_path(lease_directory_path, unit_id, latest_generation)
+    try:
+        with open(lease_path, 'r') as fp:
+            lease = json.load(fp)
+    except (json.JSONDecodeError, FileNotFoundError):
+        # Lease is still being written by its creator. Treat it as live unless
+        # its creator appears to have died mid-write
+        try:
+            expires = lease_path.stat().st_mtime + UNREADABLE_LEASE_GRACE_PERIOD.total_seconds()
+        except FileNotFoundError:
+            expires = time.time() + UNREADABLE_LEASE_GRACE_PERIOD.total_seconds()
+        lease = {
+            'worker_id': None,
+            'expires': expires,
+        }
+    return latest_generation, lease
+
+def generate_lease_path(lease_directory_path, unit_id, generation):
+    return pathlib.Path(lease_directory_path) / f'{unit_id}.lease.{generation}'
+
+def generate_done_path(lease_directory_path, unit_id):
+    return pathlib.Path(lease_directory_path) / f'{unit_id}.done'
+
+def write_json_exclusive(path, data):
+    file_descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    with os.fdopen(file_descriptor, 'w') as fp:
+        json.dump(data, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+class LeaseHeartbeat:
+    def __init__(self, lease, lease_duration=datetime.timedelta(minutes=10)):
+        self.lease = lease
+        self.lease_duration = lease_duration
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.lease_duration.total_seconds()/3):
+            if not renew_lease(self.lease, self.lease_duration):
+                logger.warning(f"Lease on work unit {self.lease['unit_id']} was superseded")
+                return
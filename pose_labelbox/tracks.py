@@ -0,0 +1,873 @@
+import pose_labelbox.core
+import pose_labelbox.alphapose
+import pose_labelbox.metrics
+import pose_labelbox.profiling
+import pose_labelbox.utils
+import pose_labelbox.session
+import pose_labelbox.sharding
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+np = pose_labelbox.utils.lazy_import('numpy')
+pd = pose_labelbox.utils.lazy_import('pandas')
+
+def prune_pose_tracks(
+    inference_id,
+    start,
+    end,
+    environment_id=None,
+    environment_name=None,
+    camera_ids=None,
+    camera_part_numbers=None,
+    camera_serial_numbers=None,
+    camera_names=None,
+    video_duration=datetime.timedelta(seconds=10),
+    frame_period=datetime.timedelta(milliseconds=100),
+    client=None,
+    uri=None,
+    token_uri=None,
+    audience=None,
+    client_id=None,
+    client_secret=None,
+    session=None,
+    alphapose_output_parent_directory='/data/alphapose_output',
+    input_parsed_alphapose_output_suffix=None,
+    output_parsed_alphapose_output_suffix='pruned',
+    image_width=None,
+    image_height=None,
+    edge_margin=5,
+    min_num_poses=5,
+    min_coverage=None,
+    min_mean_pose_quality=None,
+    min_median_box_area=None,
+    min_total_motion=None,
+    max_fraction_at_edge=None,
+    overwrite=False,
+):
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
+    # Writes a per-track statistics table and a copy of the parsed poses
+    # containing only the tracks that survive the pruning rules. Downstream
+    # stages pick up the pruned poses via parsed_alphapose_output_suffix.
+    target_camera_ids = pose_labelbox.core.generate_target_camera_ids(
+        start=start,
+        end=end,
+        environment_id=environment_id,
+        environment_name=environment_name,
+        camera_ids=camera_ids,
+        camera_part_numbers=camera_part_numbers,
+        camera_serial_numbers=camera_serial_numbers,
+        camera_names=camera_names,
+        client=client,
+        uri=uri,
+        token_uri=token_uri,
+        audience=audience,
+        client_id=client_id,
+        client_secret=client_secret,
+    )
+    for camera_id in target_camera_ids:
+        alphapose_output_directory_path = pose_labelbox.alphapose.generate_alphapose_output_directory_path(
+            inference_id=inference_id,
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+            alphapose_output_parent_directory=alphapose_output_parent_directory,
+        )
+        input_path = alphapose_output_directory_path / pose_labelbox.alphapose.generate_parsed_alphapose_output_filename(
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+            suffix=input_parsed_alphapose_output_suffix,
+        )
+        output_path = alphapose_output_directory_path / pose_labelbox.alphapose.generate_parsed_alphapose_output_filename(
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+            suffix=output_parsed_alphapose_output_suffix,
+        )
+        statistics_path = alphapose_output_directory_path / generate_pose_track_statistics_filename(
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+        )
+        if output_path.is_file() and not overwrite:
+            logger.info(f'Pruned pose track file {output_path} already exists. Skipping.')
+            continue
+        with pose_labelbox.metrics.time_stage('prune_pose_tracks', camera_id=camera_id), pose_labelbox.profiling.profile_stage('prune_pose_tracks', camera_id=camera_id):
+            poses_2d = pd.read_pickle(input_path)
+            pose_track_statistics = compute_pose_track_statistics(
+                poses_2d=poses_2d,
+                frame_period=frame_period,
+                image_width=image_width,
+                image_height=image_height,
+                edge_margin=edge_margin,
+            )
+            pose_track_statistics = apply_pose_track_pruning_rules(
+                pose_track_statistics=pose_track_statistics,
+                min_num_poses=min_num_poses,
+                min_coverage=min_coverage,
+                min_mean_pose_quality=min_mean_pose_quality,
+                min_median_box_area=min_median_box_area,
+                min_total_motion=min_total_motion,
+                max_fraction_at_edge=max_fraction_at_edge,
+            )
+            pose_track_statistics.to_pickle(statistics_path)
+            kept_pose_track_labels = pose_track_statistics.index[~pose_track_statistics['pruned']]
+            pruned_poses_2d = poses_2d.loc[poses_2d['pose_track_label'].isin(kept_pose_track_labels)]
+            pruned_poses_2d.to_pickle(output_path)
+        num_pruned_pose_tracks = int(pose_track_statistics['pruned'].sum())
+        logger.info(f'Pruned {num_pruned_pose_tracks} of {len(pose_track_statistics)} pose tracks for camera {camera_id}')
+        pose_labelbox.metrics.increment_counter('pose_tracks_pruned', num_pruned_pose_tracks, camera_id=camera_id)
+        pose_labelbox.metrics.increment_counter('pose_tracks_kept', len(kept_pose_track_labels), camera_id=camera_id)
+
+def compute_pose_track_statistics(
+    poses_2d,
+    frame_period=datetime.timedelta(milliseconds=100),
+    image_width=None,
+    image_height=None,
+    edge_margin=5,
+):
+    # One pass over the poses (sorted by track and time) to build per-pose
+    # columns, followed by a single groupby aggregation
+    poses_2d = poses_2d.sort_values(['pose_track_label', 'timestamp'])
+    pose_track_labels = poses_2d['pose_track_label'].to_numpy()
+    bounding_boxes = np.stack(poses_2d['bounding_box_xywh'].to_numpy()).astype(float)
+    centers = bounding_boxes[:, :2] + bounding_boxes[:, 2:]/2
+    same_track = np.concatenate(([False], pose_track_labels[1:] == pose_track_labels[:-1]))
+    center_steps = np.concatenate(([np.nan], np.linalg.norm(np.diff(centers, axis=0), axis=1)))
+    center_steps[~same_track] = np.nan
+    per_pose = pd.DataFrame({
+        'pose_track_label': pose_track_labels,
+        'timestamp': poses_2d['timestamp'].to_numpy(),
+        'pose_quality_2d': poses_2d['pose_quality_2d'].to_numpy(dtype=float),
+        'box_area': bounding_boxes[:, 2]*bounding_boxes[:, 3],
+        'center_x': centers[:, 0],
+        'center_y': centers[:, 1],
+        'center_step': center_steps,
+    })
+    aggregations = {
+        'num_poses': ('timestamp', 'size'),
+        'start': ('timestamp', 'min'),
+        'end': ('timestamp', 'max'),
+        'mean_pose_quality': ('pose_quality_2d', 'mean'),
+        'min_pose_quality': ('pose_quality_2d', 'min'),
+        'median_box_area': ('box_area', 'median'),
+        'total_motion': ('center_step', 'sum'),
+        'first_center_x': ('center_x', 'first'),
+        'first_center_y': ('center_y', 'first'),
+        'last_center_x': ('center_x', 'last'),
+        'last_center_y': ('center_y', 'last'),
+    }
+    if image_width is not None and image_height is not None:
+        per_pose['at_edge'] = (
+            (bounding_boxes[:, 0] <= edge_margin) |
+            (bounding_boxes[:, 1] <= edge_margin) |
+            (bounding_boxes[:, 0] + bounding_boxes[:, 2] >= image_width - edge_margin) |
+            (bounding_boxes[:, 1] + bounding_boxes[:, 3] >= image_height - edge_margin)
+        )
+        aggregations['fraction_at_edge'] = ('at_edge', 'mean')
+    pose_track_statistics = per_pose.groupby('pose_track_label').agg(**aggregations)
+    pose_track_statistics['duration'] = pose_track_statistics['end'] - pose_track_statistics['start'] + pd.Timedelta(frame_period)
+    pose_track_statistics['coverage'] = (
+        pose_track_statistics['num_poses'] /
+        (pose_track_statistics['duration']/pd.Timedelta(frame_period))
+    )
+    pose_track_statistics['net_motion'] = np.hypot(
+        pose_track_statistics['last_center_x'] - pose_track_statistics['first_center_x'],
+        pose_track_statistics['last_center_y'] - pose_track_statistics['first_center_y'],
+    )
+    pose_track_statistics = pose_track_statistics.drop(columns=[
+        'first_center_x',
+        'first_center_y',
+        'last_center_x',
+        'last_center_y',
+    ])
+    return pose_track_statistics
+
+def apply_pose_track_pruning_rules(
+    pose_track_statistics,
+    min_num_poses=5,
+    min_coverage=None,
+    min_mean_pose_quality=None,
+    min_median_box_area=None,
+    min_total_motion=None,
+    max_fraction_at_edge=None,
+):
+    # Rules set to None are not applied. A track is pruned if it fails any
+    # rule; the failed rules are listed in pruning_reasons.
+    pose_track_statistics = pose_track_statistics.copy()
+    rule_failures = dict()
+    if min_num_poses is not None:
+        rule_failures['num_poses'] = pose_track_statistics['num_poses'] < min_num_poses
+    if min_coverage is not None:
+        rule_failures['coverage'] = pose_track_statistics['coverage'] < min_coverage
+    if min_mean_pose_quality is not None:
+        rule_failures['mean_pose_quality'] = pose_track_statistics['mean_pose_quality'] < min_mean_pose_quality
+    if min_median_box_area is not None:
+        rule_failures['median_box_area'] = pose_track_statistics['median_box_area'] < min_median_box_area
+    if min_total_motion is not None:
+        rule_failures['total_motion'] = pose_track_statistics['total_motion'] < min_total_motion
+    if max_fraction_at_edge is not None:
+        if 'fraction_at_edge' not in pose_track_statistics.columns:
+            raise ValueError('Edge pruning requires statistics computed with image width and height')
+        rule_failures['fraction_at_edge'] = pose_track_statistics['fraction_at_edge'] > max_fraction_at_edge
+    pose_track_statistics['pruning_reasons'] = [list() for _ in range(len(pose_track_statistics))]
+    for rule_name, failures in rule_failures.items():
+        for pruning_reasons in pose_track_statistics.loc[failures, 'pruning_reasons']:
+            pruning_reasons.append(rule_name)
+    pose_track_statistics['pruned'] = pose_track_statistics['pruning_reasons'].apply(len) > 0
+    return pose_track_statistics
+
+def stitch_pose_tracks(
+    inference_id,
+    start,
+    end,
+    environment_id=None,
+    environment_name=None,
+    camera_ids=None,
+    camera_part_numbers=None,
+    camera_serial_numbers=None,
+    camera_names=None,
+    video_duration=datetime.timedelta(seconds=10),
+    client=None,
+    uri=None,
+    token_uri=None,
+    audience=None,
+    client_id=None,
+    client_secret=None,
+    session=None,
+    alphapose_output_parent_directory='/data/alphapose_output',
+    input_parsed_alphapose_output_suffix=None,
+    output_parsed_alphapose_output_suffix='stitched',
+    max_gap=datetime.timedelta(seconds=2),
+    max_cost=1.0,
+    iou_weight=1.0,
+    keypoint_weight=1.0,
+    gap_weight=0.5,
+    overwrite=False,
+):
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
+    # Writes a copy of the parsed poses in which fragments of the same person
+    # share one pose track label, plus a lineage table mapping each original
+    # label to its stitched label
+    target_camera_ids = pose_labelbox.core.generate_target_camera_ids(
+        start=start,
+        end=end,
+        environment_id=environment_id,
+        environment_name=environment_name,
+        camera_ids=camera_ids,
+        camera_part_numbers=camera_part_numbers,
+        camera_serial_numbers=camera_serial_numbers,
+        camera_names=camera_names,
+        client=client,
+        uri=uri,
+        token_uri=token_uri,
+        audience=audience,
+        client_id=client_id,
+        client_secret=client_secret,
+    )
+    for camera_id in target_camera_ids:
+        alphapose_output_directory_path = pose_labelbox.alphapose.generate_alphapose_output_directory_path(
+            inference_id=inference_id,
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+            alphapose_output_parent_directory=alphapose_output_parent_directory,
+        )
+        input_path = alphapose_output_directory_path / pose_labelbox.alphapose.generate_parsed_alphapose_output_filename(
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+            suffix=input_parsed_alphapose_output_suffix,
+        )
+        output_path = alphapose_output_directory_path / pose_labelbox.alphapose.generate_parsed_alphapose_output_filename(
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+            suffix=output_parsed_alphapose_output_suffix,
+        )
+        lineage_path = alphapose_output_directory_path / generate_pose_track_lineage_filename(
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+        )
+        if output_path.is_file() and not overwrite:
+            logger.info(f'Stitched pose track file {output_path} already exists. Skipping.')
+            continue
+        with pose_labelbox.metrics.time_stage('stitch_pose_tracks', camera_id=camera_id), pose_labelbox.profiling.profile_stage('stitch_pose_tracks', camera_id=camera_id):
+            poses_2d = pd.read_pickle(input_path)
+            stitched_poses_2d, pose_track_lineage = stitch_pose_track_fragments(
+                poses_2d=poses_2d,
+                max_gap=max_gap,
+                max_cost=max_cost,
+                iou_weight=iou_weight,
+                keypoint_weight=keypoint_weight,
+                gap_weight=gap_weight,
+            )
+            pose_track_lineage.to_pickle(lineage_path)
+            stitched_poses_2d.to_pickle(output_path)
+        num_pose_tracks = len(pose_track_lineage)
+        num_stitched_pose_tracks = pose_track_lineage['pose_track_label'].nunique()
+        logger.info(f'Stitched {num_pose_tracks} pose track fragments into {num_stitched_pose_tracks} pose tracks for camera {camera_id}')
+        pose_labelbox.metrics.increment_counter('pose_track_fragments_merged', num_pose_tracks - num_stitched_pose_tracks, camera_id=camera_id)
+
+def stitch_pose_track_fragments(
+    poses_2d,
+    max_gap=datetime.timedelta(seconds=2),
+    max_cost=1.0,
+    iou_weight=1.0,
+    keypoint_weight=1.0,
+    gap_weight=0.5,
+):
+    # Links the last pose of each track to the first pose of tracks that start
+    # within max_gap after it ends. Link cost combines box overlap, keypoint
+    # distance (relative to box size) and the length of the gap. Links are
+    # accepted in order of increasing cost, each track end and track start
+    # used at most once, so chains of fragments never overlap in time.
+    poses_2d = poses_2d.sort_values(['pose_track_label', 'timestamp'])
+    track_groups = poses_2d.groupby('pose_track_label', sort=True)
+    track_starts = track_groups.head(1)
+    track_ends = track_groups.tail(1)
+    pose_track_labels = track_starts['pose_track_label'].to_numpy()
+    start_times = convert_to_seconds(track_starts['timestamp'])
+    end_times = convert_to_seconds(track_ends['timestamp'])
+    end_indices, start_indices = generate_stitching_candidates(
+        start_times=start_times,
+        end_times=end_times,
+        max_gap=max_gap,
+    )
+    costs = compute_stitching_costs(
+        end_poses=track_ends.iloc[end_indices],
+        start_poses=track_starts.iloc[start_indices],
+        max_gap=max_gap,
+        iou_weight=iou_weight,
+        keypoint_weight=keypoint_weight,
+        gap_weight=gap_weight,
+    )
+    successors = dict()
+    predecessors = dict()
+    order = np.argsort(costs, kind='stable')
+    num_accepted = np.searchsorted(costs[order], max_cost, side='right')
+    for candidate_index in order[:num_accepted]:
+        end_index = int(end_indices[candidate_index])
+        start_index = int(start_indices[candidate_index])
+        if end_index in successors or start_index in predecessors:
+            continue
+        successors[end_index] = start_index
+        predecessors[start_index] = end_index
+    # Each chain takes the label of its earliest fragment, so stitched labels
+    # are stable across reruns and never collide with other chains
+    lineage_list = list()
+    for head_index in range(len(pose_track_labels)):
+        if head_index in predecessors:
+            continue
+        track_index = head_index
+        fragment_index = 0
+        while True:
+            lineage_list.append({
+                'original_pose_track_label': pose_track_labels[track_index],
+                'pose_track_label': pose_track_labels[head_index],
+                'fragment_index': fragment_index,
+            })
+            if track_index not in successors:
+                break
+            track_index = successors[track_index]
+            fragment_index += 1
+    pose_track_lineage = (
+        pd.DataFrame(
+            lineage_list,
+            columns=['original_pose_track_label', 'pose_track_label', 'fragment_index'],
+        )
+        .set_index('original_pose_track_label')
+        .sort_index()
+    )
+    stitched_poses_2d = poses_2d.copy()
+    stitched_poses_2d['original_pose_track_label'] = stitched_poses_2d['pose_track_label']
+    stitched_poses_2d['pose_track_label'] = stitched_poses_2d['original_pose_track_label'].map(pose_track_lineage['pose_track_label'])
+    stitched_poses_2d = stitched_poses_2d.sort_values('timestamp')
+    return stitched_poses_2d, pose_track_lineage
+
+def generate_stitching_candidates(
+    start_times,
+    end_times,
+    max_gap=datetime.timedelta(seconds=2),
+):
+    # Times are in seconds (see convert_to_seconds). For each track end, all track starts strictly after it and no more than
+    # max_gap later, found with two binary searches over sorted start times
+    start_order = np.argsort(start_times, kind='stable')
+    sorted_start_times = start_times[start_order]
+    lower_bounds = np.searchsorted(sorted_start_times, end_times, side='right')
+    upper_bounds = np.searchsorted(sorted_start_times, end_times + pd.Timedelta(max_gap).total_seconds(), side='right')
+    counts = upper_bounds - lower_bounds
+    end_indices = np.repeat(np.arange(len(end_times)), counts)
+    positions = (
+        np.arange(counts.sum()) -
+        np.repeat(np.cumsum(counts) - counts, counts) +
+        np.repeat(lower_bounds, counts)
+    )
+    start_indices = start_order[positions]
+    return end_indices, start_indices
+
+def compute_stitching_costs(
+    end_poses,
+    start_poses,
+    max_gap=datetime.timedelta(seconds=2),
+    iou_weight=1.0,
+    keypoint_weight=1.0,
+    gap_weight=0.5,
+):
+    if len(end_poses) == 0:
+        return np.zeros(0)
+    end_boxes = np.stack(end_poses['bounding_box_corners'].to_numpy()).astype(float)
+    start_boxes = np.stack(start_poses['bounding_box_corners'].to_numpy()).astype(float)
+    ious = compute_box_ious(end_boxes, start_boxes)
+    end_keypoints = np.stack(end_poses['keypoint_coordinates_2d'].to_numpy()).astype(float)
+    start_keypoints = np.stack(start_poses['keypoint_coordinates_2d'].to_numpy()).astype(float)
+    keypoints_valid = (
+        np.isfinite(np.stack(end_poses['keypoint_quality_2d'].to_numpy()).astype(float)) &
+        np.isfinite(np.stack(start_poses['keypoint_quality_2d'].to_numpy()).astype(float))
+    )
+    box_scales = np.maximum(
+        np.linalg.norm(end_boxes[:, 1] - end_boxes[:, 0], axis=-1),
+        np.linalg.norm(start_boxes[:, 1] - start_boxes[:, 0], axis=-1),
+    )
+    keypoint_distances = np.linalg.norm(end_keypoints - start_keypoints, axis=-1)
+    num_valid_keypoints = keypoints_valid.sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_keypoint_distances = np.where(
+            num_valid_keypoints > 0,
+            np.where(keypoints_valid, keypoint_distances, 0.0).sum(axis=-1)/np.maximum(num_valid_keypoints, 1)/box_scales,
+            1.0,
+        )
+    gaps = (
+        (convert_to_seconds(start_poses['timestamp']) - convert_to_seconds(end_poses['timestamp'])) /
+        pd.Timedelta(max_gap).total_seconds()
+    )
+    costs = (
+        iou_weight*(1.0 - ious) +
+        keypoint_weight*np.nan_to_num(mean_keypoint_distances, nan=1.0) +
+        gap_weight*gaps
+    )
+    return costs
+
+def link_pose_track_windows(
+    inference_id,
+    start,
+    end,
+    environment_id=None,
+    environment_name=None,
+    camera_ids=None,
+    camera_part_numbers=None,
+    camera_serial_numbers=None,
+    camera_names=None,
+    window_duration=datetime.timedelta(minutes=10),
+    window_overlap=datetime.timedelta(seconds=10),
+    video_duration=datetime.timedelta(seconds=10),
+    frame_period=datetime.timedelta(milliseconds=100),
+    client=None,
+    uri=None,
+    token_uri=None,
+    audience=None,
+    client_id=None,
+    client_secret=None,
+    session=None,
+    alphapose_output_parent_directory='/data/alphapose_output',
+    input_parsed_alphapose_output_suffix=None,
+    output_parsed_alphapose_output_suffix='linked',
+    max_cost=0.5,
+    min_overlap_frames=3,
+    iou_weight=1.0,
+    keypoint_weight=1.0,
+    overwrite=False,
+):
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
+    # Combines parsed poses from windows that were detected and parsed
+    # independently (the windows of sharding.generate_windows with the same
+    # window_overlap) into one parsed output for the whole period, in which
+    # each person keeps one pose track label across window boundaries
+    windows = pose_labelbox.sharding.generate_windows(
+        start=start,
+        end=end,
+        window_duration=window_duration,
+        window_overlap=window_overlap,
+        video_duration=video_duration,
+    )
+    if len(windows) > 1 and window_overlap < min_overlap_frames*frame_period:
+        raise ValueError('Window overlap must span at least min_overlap_frames frames')
+    target_camera_ids = pose_labelbox.core.generate_target_camera_ids(
+        start=start,
+        end=end,
+        environment_id=environment_id,
+        environment_name=environment_name,
+        camera_ids=camera_ids,
+        camera_part_numbers=camera_part_numbers,
+        camera_serial_numbers=camera_serial_numbers,
+        camera_names=camera_names,
+        client=client,
+        uri=uri,
+        token_uri=token_uri,
+        audience=audience,
+        client_id=client_id,
+        client_secret=client_secret,
+    )
+    for camera_id in target_camera_ids:
+        output_directory_path = pose_labelbox.alphapose.generate_alphapose_output_directory_path(
+            inference_id=inference_id,
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+            alphapose_output_parent_directory=alphapose_output_parent_directory,
+        )
+        output_path = output_directory_path / pose_labelbox.alphapose.generate_parsed_alphapose_output_filename(
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+            suffix=output_parsed_alphapose_output_suffix,
+        )
+        if output_path.is_file() and not overwrite:
+            logger.info(f'Linked pose track file {output_path} already exists. Skipping.')
+            continue
+        with pose_labelbox.metrics.time_stage('link_pose_track_windows', camera_id=camera_id), pose_labelbox.profiling.profile_stage('link_pose_track_windows', camera_id=camera_id):
+            window_poses_2d = list()
+            for window_start, window_end in windows:
+                input_path = pose_labelbox.alphapose.generate_alphapose_output_directory_path(
+                    inference_id=inference_id,
+                    camera_id=camera_id,
+                    start=window_start,
+                    end=window_end,
+                    video_duration=video_duration,
+                    alphapose_output_parent_directory=alphapose_output_parent_directory,
+                ) / pose_labelbox.alphapose.generate_parsed_alphapose_output_filename(
+                    camera_id=camera_id,
+                    start=window_start,
+                    end=window_end,
+                    video_duration=video_duration,
+                    suffix=input_parsed_alphapose_output_suffix,
+                )
+                window_poses_2d.append(pd.read_pickle(input_path))
+            linked_poses_2d = link_window_pose_tracks(
+                window_poses_2d=window_poses_2d,
+                windows=windows,
+                frame_period=frame_period,
+                max_cost=max_cost,
+                min_overlap_frames=min_overlap_frames,
+                iou_weight=iou_weight,
+                keypoint_weight=keypoint_weight,
+            )
+            output_directory_path.mkdir(parents=True, exist_ok=True)
+            linked_poses_2d.to_pickle(output_path)
+        num_window_pose_tracks = len(linked_poses_2d[['window_index', 'window_pose_track_label']].drop_duplicates())
+        num_pose_tracks = linked_poses_2d['pose_track_label'].nunique()
+        logger.info(f'Linked {num_window_pose_tracks} pose tracks from {len(windows)} windows into {num_pose_tracks} pose tracks for camera {camera_id}')
+        pose_labelbox.metrics.increment_counter('pose_tracks_linked_across_windows', num_window_pose_tracks - num_pose_tracks, camera_id=camera_id)
+
+def link_window_pose_tracks(
+    window_poses_2d,
+    windows,
+    frame_period=datetime.timedelta(milliseconds=100),
+    max_cost=0.5,
+    min_overlap_frames=3,
+    iou_weight=1.0,
+    keypoint_weight=1.0,
+):
+    # Windows are (start, end) pairs in time order, each overlapping the next.
+    # Tracks in each window inherit the label of the track they match in the
+    # previous window's overlap frames; unmatched tracks get new labels. Each
+    # window contributes only its poses before the start of the next window,
+    # so overlap frames are not duplicated
+    if len(window_poses_2d) != len(windows):
+        raise ValueError('Expected one set of poses per window')
+    next_pose_track_label = 0
+    previous_poses_2d = None
+    previous_pose_track_label_map = dict()
+    linked_poses_2d_list = list()
+    for window_index, poses_2d in enumerate(window_poses_2d):
+        poses_2d = poses_2d.assign(frame_timestamp=pd.to_datetime(poses_2d['timestamp'], utc=True).dt.round(pd.Timedelta(frame_period)))
+        pose_track_label_map = dict()
+        if previous_poses_2d is not None:
+            matches = match_overlap_pose_tracks(
+                previous_poses_2d=previous_poses_2d.loc[previous_poses_2d['frame_timestamp'] >= pd.Timestamp(windows[window_index][0])],
+                next_poses_2d=poses_2d.loc[poses_2d['frame_timestamp'] < pd.Timestamp(windows[window_index - 1][1])],
+                max_cost=max_cost,
+                min_overlap_frames=min_overlap_frames,
+                iou_weight=iou_weight,
+                keypoint_weight=keypoint_weight,
+            )
+            for pose_track_label, previous_pose_track_label in matches.items():
+                pose_track_label_map[pose_track_label] = previous_pose_track_label_map[previous_pose_track_label]
+        for pose_track_label in sorted(poses_2d['pose_track_label'].unique()):
+            if pose_track_label not in pose_track_label_map:
+                pose_track_label_map[pose_track_label] = next_pose_track_label
+                next_pose_track_label += 1
+        if window_index + 1 < len(windows):
+            window_poses_2d_core = poses_2d.loc[poses_2d['frame_timestamp'] < pd.Timestamp(windows[window_index + 1][0])]
+        else:
+            window_poses_2d_core = poses_2d
+        linked_poses_2d = window_poses_2d_core.drop(columns='frame_timestamp').assign(
+            window_index=window_index,
+            window_pose_track_label=window_poses_2d_core['pose_track_label'],
+        )
+        linked_poses_2d['pose_track_label'] = linked_poses_2d['window_pose_track_label'].map(pose_track_label_map)
+        linked_poses_2d_list.append(linked_poses_2d)
+        previous_poses_2d = poses_2d
+        previous_pose_track_label_map = pose_track_label_map
+    linked_poses_2d = pd.concat(linked_poses_2d_list).sort_values('timestamp', kind='stable')
+    return linked_poses_2d
+
+def match_overlap_pose_tracks(
+    previous_poses_2d,
+    next_poses_2d,
+    max_cost=0.5,
+    min_overlap_frames=3,
+    iou_weight=1.0,
+    keypoint_weight=1.0,
+):
+    # Both windows detected the same overlap frames, so every pair of poses in
+    # the same frame is a candidate. Pair costs (box overlap and keypoint
+    # distance, as for stitching) are averaged per pair of tracks, and track
+    # pairs are matched one-to-one in order of increasing mean cost. Returns a
+    # map from next window track labels to previous window track labels
+    if len(previous_poses_2d) == 0 or len(next_poses_2d) == 0:
+        return dict()
+    pose_columns = [
+        'timestamp',
+        'pose_track_label',
+        'bounding_box_corners',
+        'keypoint_coordinates_2d',
+        'keypoint_quality_2d',
+    ]
+    pairs = previous_poses_2d[['frame_timestamp'] + pose_columns].merge(
+        next_poses_2d[['frame_timestamp'] + pose_columns],
+        on='frame_timestamp',
+        suffixes=('_previous', '_next'),
+    )
+    if len(pairs) == 0:
+        return dict()
+    costs = compute_stitching_costs(
+        end_poses=pairs[[f'{column}_previous' for column in pose_columns]].set_axis(pose_columns, axis=1),
+        start_poses=pairs[[f'{column}_next' for column in pose_columns]].set_axis(pose_columns, axis=1),
+        iou_weight=iou_weight,
+        keypoint_weight=keypoint_weight,
+        gap_weight=0.0,
+    )
+    track_pair_costs = (
+        pd.DataFrame({
+            'previous_pose_track_label': pairs['pose_track_label_previous'].to_numpy(),
+            'next_pose_track_label': pairs['pose_track_label_next'].to_numpy(),
+            'cost': costs,
+        })
+        .groupby(['previous_pose_track_label', 'next_pose_track_label'])
+        .agg(mean_cost=('cost', 'mean'), num_frames=('cost', 'size'))
+        .reset_index()
+    )
+    track_pair_costs = (
+        track_pair_costs
+        .loc[(track_pair_costs['num_frames'] >= min_overlap_frames) & (track_pair_costs['mean_cost'] <= max_cost)]
+        .sort_values(['mean_cost', 'num_frames'], ascending=[True, False])
+    )
+    pose_track_label_map = dict()
+    matched_previous_pose_track_labels = set()
+    for previous_pose_track_label, next_pose_track_label in zip(
+        track_pair_costs['previous_pose_track_label'],
+        track_pair_costs['next_pose_track_label'],
+    ):
+        if previous_pose_track_label in matched_previous_pose_track_labels or next_pose_track_label in pose_track_label_map:
+            continue
+        matched_previous_pose_track_labels.add(previous_pose_track_label)
+        pose_track_label_map[next_pose_track_label] = previous_pose_track_label
+    return pose_track_label_map
+
+def convert_to_seconds(timestamps):
+    # Seconds since the epoch as floats, for vectorized time arithmetic
+    timestamps = pd.Series(pd.to_datetime(timestamps, utc=True))
+    return (timestamps - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy()
+
+def compute_box_ious(boxes_a, boxes_b):
+    # Boxes are given as corners: [[x_min, y_min], [x_max, y_max]]
+    intersection_mins = np.maximum(boxes_a[:, 0], boxes_b[:, 0])
+    intersection_maxes = np.minimum(boxes_a[:, 1], boxes_b[:, 1])
+    intersection_areas = np.prod(np.clip(intersection_maxes - intersection_mins, 0.0, None), axis=-1)
+    areas_a = np.prod(boxes_a[:, 1] - boxes_a[:, 0], axis=-1)
+    areas_b = np.prod(boxes_b[:, 1] - boxes_b[:, 0], axis=-1)
+    union_areas = areas_a + areas_b - intersection_areas
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ious = np.where(union_areas > 0, intersection_areas/union_areas, 0.0)
+    return ious
+
+def segment_pose_tracks(
+    poses_2d,
+    max_gap=datetime.timedelta(seconds=10),
+):
+    # Splits each pose track wherever consecutive detections are more than
+    # max_gap apart. Segments are numbered from zero within each track.
+    poses_2d = poses_2d.sort_values(['pose_track_label', 'timestamp']).copy()
+    new_segment = poses_2d.groupby('pose_track_label')['timestamp'].diff() > pd.Timedelta(max_gap)
+    poses_2d['pose_track_segment_index'] = (
+        new_segment
+        .groupby(poses_2d['pose_track_label'])
+        .cumsum()
+        .astype('int64')
+    )
+    return poses_2d
+
+def generate_segment_indices(
+    timestamps,
+    max_gap=datetime.timedelta(seconds=10),
+):
+    # Indices are returned in the order of the input timestamps
+    timestamps = pd.Series(pd.to_datetime(timestamps, utc=True)).reset_index(drop=True).sort_values()
+    segment_indices = (
+        (timestamps.diff() > pd.Timedelta(max_gap))
+        .cumsum()
+        .sort_index()
+        .to_numpy()
+    )
+    return segment_indices
+
+def generate_pose_track_timestamps(
+    timestamps,
+    frame_period=datetime.timedelta(milliseconds=100),
+    max_gap=None,
+):
+    # Every frame period from the first to the last detection of each segment
+    # (or of the whole track if max_gap is None)
+    timestamps = pd.Series(pd.to_datetime(timestamps, utc=True)).sort_values().reset_index(drop=True)
+    if max_gap is None:
+        segment_indices = np.zeros(len(timestamps), dtype='int64')
+    else:
+        segment_indices = generate_segment_indices(
+            timestamps=timestamps,
+            max_gap=max_gap,
+        )
+    segment_bounds = timestamps.groupby(segment_indices).agg(['min', 'max'])
+    pose_track_timestamps = pd.DatetimeIndex([], tz='UTC')
+    for segment_start, segment_end in segment_bounds.itertuples(index=False):
+        pose_track_timestamps = pose_track_timestamps.append(pd.date_range(
+            start=segment_start,
+            end=segment_end,
+            freq=frame_period,
+        ))
+    return pose_track_timestamps
+
+SPARSE_MODES = ('frame_rate', 'keyframes')
+
+def select_sparse_frames(
+    bounding_box_corners,
+    segment_indices=None,
+    sparse_mode='frame_rate',
+    sparse_frame_interval=10,
+    keyframe_motion_threshold=0.5,
+    keyframe_min_iou=0.3,
+    max_keyframe_interval=None,
+):
+    # Chooses which frames of a pose track timeline to show to labelers.
+    # Bounding box corners are given per frame (NaN where the track has no
+    # detection). The first and last frame of each segment are always kept.
+    # In 'frame_rate' mode every sparse_frame_interval-th frame is kept as
+    # well. In 'keyframes' mode, detections are kept where the box jumps (IoU
+    # with the previous detection below keyframe_min_iou) or where the box
+    # center has moved more than keyframe_motion_threshold box heights since
+    # the last kept detection; these are the frames where identity swaps are
+    # likely. Missed detections alone don't make keyframes
+    if sparse_mode not in SPARSE_MODES:
+        raise ValueError(f'Sparse mode must be one of {SPARSE_MODES}')
+    if sparse_frame_interval < 1:
+        raise ValueError('Sparse frame interval must be at least 1')
+    bounding_box_corners = np.asarray(bounding_box_corners, dtype=float).reshape(-1, 2, 2)
+    num_frames = len(bounding_box_corners)
+    if segment_indices is None:
+        segment_indices = np.zeros(num_frames, dtype='int64')
+    segment_indices = np.asarray(segment_indices)
+    keep = np.zeros(num_frames, dtype='bool')
+    if num_frames == 0:
+        return keep
+    frame_indices = np.arange(num_frames)
+    segment_starts = np.ones(num_frames, dtype='bool')
+    segment_starts[1:] = segment_indices[1:] != segment_indices[:-1]
+    segment_ends = np.ones(num_frames, dtype='bool')
+    segment_ends[:-1] = segment_starts[1:]
+    keep |= segment_starts | segment_ends
+    if sparse_mode == 'frame_rate':
+        frame_positions = frame_indices - np.maximum.accumulate(np.where(segment_starts, frame_indices, 0))
+        keep |= frame_positions % sparse_frame_interval == 0
+        return keep
+    detected = ~np.isnan(bounding_box_corners).any(axis=(1, 2))
+    # Each detection is compared with the previous detection in its segment
+    detected_indices = np.flatnonzero(detected)
+    previous_indices = detected_indices[:-1][segment_indices[detected_indices[1:]] == segment_indices[detected_indices[:-1]]]
+    next_indices = detected_indices[1:][segment_indices[detected_indices[1:]] == segment_indices[detected_indices[:-1]]]
+    keep[next_indices[compute_box_ious(
+        bounding_box_corners[next_indices],
+        bounding_box_corners[previous_indices],
+    ) < keyframe_min_iou]] = True
+    # Motion is measured against the last kept detection, so it is
+    # accumulated sequentially
+    box_centers = bounding_box_corners.mean(axis=1)
+    box_heights = bounding_box_corners[:, 1, 1] - bounding_box_corners[:, 0, 1]
+    kept_index = None
+    reference_index = None
+    for frame_index in range(num_frames):
+        if segment_starts[frame_index]:
+            kept_index = None
+            reference_index = None
+        if (
+            not keep[frame_index] and
+            max_keyframe_interval is not None and
+            kept_index is not None and
+            frame_index - kept_index >= max_keyframe_interval
+        ):
+            keep[frame_index] = True
+        if not keep[frame_index] and detected[frame_index] and reference_index is not None:
+            displacement = np.linalg.norm(box_centers[frame_index] - box_centers[reference_index])
+            if box_heights[reference_index] > 0 and displacement > keyframe_motion_threshold*box_heights[reference_index]:
+                keep[frame_index] = True
+        if keep[frame_index]:
+            kept_index = frame_index
+        if keep[frame_index] and detected[frame_index]:
+            reference_index = frame_index
+        elif reference_index is None and detected[frame_index]:
+            reference_index = frame_index
+    return keep
+
+def generate_pose_track_statistics_filename(
+    camera_id,
+    start,
+    end,
+    video_duration=datetime.timedelta(seconds=10),
+):
+    output_start, output_end = pose_labelbox.utils.generate_output_period(
+        start=start,
+        end=end,
+        video_duration=video_duration,
+    )
+    output_start_string = output_start.strftime('%Y%m%d_%H%M%S')
+    output_end_string = output_end.strftime('%Y%m%d_%H%M%S')
+    pose_track_statistics_filename = f'pose_track_statistics_{camera_id}_{output_start_string}_{output_end_string}.pkl'
+    return pose_track_statistics_filename
+
+def generate_pose_track_lineage_filename(
+    camera_id,
+    start,
+    end,
+    video_duration=datetime.timedelta(seconds=10),
+):
+    output_start, output_end = pose_labelbox.utils.generate_output_period(
+        start=start,
+        end=end,
+        video_duration=video_duration,
+    )
+    output_start_string = output_start.strftime('%Y%m%d_%H%M%S')
+    output_end_string = output_end.strftime('%Y%m%d_%H%M%S')
+    pose_track_lineage_filename = f'pose_track_lineage_{camera_id}_{output_start_string}_{output_end_string}.pkl'
+    return pose_track_lineage_filename
@@ -0,0 +1,591 @@
+import pose_labelbox.core
+import pose_labelbox.alphapose
+import pose_labelbox.metrics
+import pose_labelbox.profiling
+import pose_labelbox.utils
+import pose_labelbox.session
+import datetime
+import pathlib
+import json
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+honeycomb_io = pose_labelbox.utils.lazy_import('honeycomb_io')
+np = pose_labelbox.utils.lazy_import('numpy')
+pd = pose_labelbox.utils.lazy_import('pandas')
+
+@pose_labelbox.profiling.profiled('generate_poses_3d')
+def generate_poses_3d(
+    inference_id,
+    start,
+    end,
+    environment_id=None,
+    environment_name=None,
+    camera_ids=None,
+    camera_part_numbers=None,
+    camera_serial_numbers=None,
+    camera_names=None,
+    video_duration=datetime.timedelta(seconds=10),
+    client=None,
+    uri=None,
+    token_uri=None,
+    audience=None,
+    client_id=None,
+    client_secret=None,
+    session=None,
+    calibration_path=None,
+    alphapose_output_parent_directory='/data/alphapose_output',
+    parsed_alphapose_output_suffix=None,
+    min_keypoint_quality=0.3,
+    min_matched_keypoints=5,
+    max_epipolar_distance=20.0,
+    timestamps_per_chunk=1000,
+    overwrite=False,
+):
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
+    stage_start_time = time.perf_counter()
+    poses_3d_output_path = generate_poses_3d_output_path(
+        inference_id=inference_id,
+        start=start,
+        end=end,
+        video_duration=video_duration,
+        alphapose_output_parent_directory=alphapose_output_parent_directory,
+    )
+    if poses_3d_output_path.is_file() and not overwrite:
+        logger.info(f'3D pose output file {poses_3d_output_path} already exists. Skipping.')
+        return pd.read_pickle(poses_3d_output_path)
+    target_camera_ids = pose_labelbox.core.generate_target_camera_ids(
+        start=start,
+        end=end,
+        environment_id=environment_id,
+        environment_name=environment_name,
+        camera_ids=camera_ids,
+        camera_part_numbers=camera_part_numbers,
+        camera_serial_numbers=camera_serial_numbers,
+        camera_names=camera_names,
+        client=client,
+        uri=uri,
+        token_uri=token_uri,
+        audience=audience,
+        client_id=client_id,
+        client_secret=client_secret,
+    )
+    poses_2d_list = list()
+    for camera_id in target_camera_ids:
+        alphapose_output_directory_path = pose_labelbox.alphapose.generate_alphapose_output_directory_path(
+            inference_id=inference_id,
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+            alphapose_output_parent_directory=alphapose_output_parent_directory,
+        )
+        parsed_alphapose_output_filename = pose_labelbox.alphapose.generate_parsed_alphapose_output_filename(
+            camera_id=camera_id,
+            start=start,
+            end=end,
+            video_duration=video_duration,
+            suffix=parsed_alphapose_output_suffix,
+        )
+        parsed_alphapose_output_file_path = alphapose_output_directory_path / parsed_alphapose_output_filename
+        if not parsed_alphapose_output_file_path.is_file():
+            logger.warning(f'Parsed AlphaPose output file {parsed_alphapose_output_file_path} does not exist. Omitting camera {camera_id}')
+            continue
+        poses_2d_list.append(pd.read_pickle(parsed_alphapose_output_file_path))
+    if len(poses_2d_list) < 2:
+        raise ValueError(f'Parsed 2D poses found for {len(poses_2d_list)} cameras. At least two are needed for triangulation')
+    poses_2d = pd.concat(poses_2d_list)
+    camera_calibrations = fetch_camera_calibrations(
+        camera_ids=poses_2d['camera_id'].unique().tolist(),
+        start=start,
+        end=end,
+        calibration_path=calibration_path,
+        client=client,
+        uri=uri,
+        token_uri=token_uri,
+        audience=audience,
+        client_id=client_id,
+        client_secret=client_secret,
+    )
+    logger.info(f'Triangulating {len(poses_2d)} 2D poses from {poses_2d["camera_id"].nunique()} cameras')
+    poses_3d = triangulate_poses(
+        poses_2d=poses_2d,
+        camera_calibrations=camera_calibrations,
+        min_keypoint_quality=min_keypoint_quality,
+        min_matched_keypoints=min_matched_keypoints,
+        max_epipolar_distance=max_epipolar_distance,
+        timestamps_per_chunk=timestamps_per_chunk,
+    )
+    poses_3d_output_path.parent.mkdir(parents=True, exist_ok=True)
+    poses_3d.to_pickle(poses_3d_output_path)
+    logger.info(f'Wrote {len(poses_3d)} 3D poses to {poses_3d_output_path}')
+    pose_labelbox.metrics.increment_counter('poses_3d_triangulated', len(poses_3d))
+    pose_labelbox.metrics.record_timing('generate_poses_3d', time.perf_counter() - stage_start_time)
+    return poses_3d
+
+def fetch_camera_calibrations(
+    camera_ids,
+    start=None,
+    end=None,
+    calibration_path=None,
+    client=None,
+    uri=None,
+    token_uri=None,
+    audience=None,
+    client_id=None,
+    client_secret=None,
+    session=None,
+):
+    client = pose_labelbox.session.resolve_honeycomb_client(client=client, session=session)
+    if calibration_path is not None:
+        camera_calibrations = load_camera_calibrations(calibration_path)
+    else:
+        camera_calibrations = honeycomb_io.fetch_camera_calibrations(
+            camera_ids=camera_ids,
+            start=start,
+            end=end,
+            client=client,
+            uri=uri,
+            token_uri=token_uri,
+            audience=audience,
+            client_id=client_id,
+            client_secret=client_secret,
+        )
+    missing_camera_ids = set(camera_ids).difference(camera_calibrations.keys())
+    if len(missing_camera_ids) > 0:
+        raise ValueError(f'Calibrations not found for cameras {missing_camera_ids}')
+    return {camera_id: camera_calibrations[camera_id] for camera_id in camera_ids}
+
+def load_camera_calibrations(path):
+    # Local calibration files map camera IDs to dictionaries with the same
+    # fields that Honeycomb returns (camera_matrix, distortion_coefficients,
+    # rotation_vector, translation_vector, image_width, image_height)
+    path = pathlib.Path(path)
+    if path.suffix == '.json':
+        with open(path, 'r') as fp:
+            camera_calibrations = json.load(fp)
+    elif path.suffix == '.pkl':
+        camera_calibrations = pd.read_pickle(path)
+    else:
+        raise ValueError(f'Calibration file type \'{path.suffix}\' not recognized. Must be .json or .pkl')
+    return camera_calibrations
+
+def triangulate_poses(
+    poses_2d,
+    camera_calibrations,
+    min_keypoint_quality=0.3,
+    min_matched_keypoints=5,
+    max_epipolar_distance=20.0,
+    timestamps_per_chunk=1000,
+):
+    # All 2D poses are packed into dense arrays (pose x keypoint) up front so
+    # that matching and triangulation run as batched array operations rather
+    # than per-pose Python loops
+    camera_ids = sorted(poses_2d['camera_id'].unique())
+    camera_indices = {camera_id: camera_index for camera_index, camera_id in enumerate(camera_ids)}
+    camera_parameters = generate_camera_parameters(
+        camera_ids=camera_ids,
+        camera_calibrations=camera_calibrations,
+    )
+    poses_2d = poses_2d.sort_values('timestamp')
+    pose_2d_ids = poses_2d.index.to_numpy()
+    pose_camera_indices = poses_2d['camera_id'].map(camera_indices).to_numpy()
+    timestamps, pose_timestamp_indices = np.unique(poses_2d['timestamp'].to_numpy(), return_inverse=True)
+    keypoint_coordinates = np.stack(poses_2d['keypoint_coordinates_2d'].to_numpy()).astype(float)
+    keypoint_quality = np.stack(poses_2d['keypoint_quality_2d'].to_numpy()).astype(float)
+    keypoint_valid = np.nan_to_num(keypoint_quality, nan=0.0) >= min_keypoint_quality
+    keypoint_valid &= np.all(np.isfinite(keypoint_coordinates), axis=-1)
+    normalized_coordinates = np.full_like(keypoint_coordinates, np.nan)
+    for camera_index in range(len(camera_ids)):
+        camera_mask = pose_camera_indices == camera_index
+        normalized_coordinates[camera_mask] = undistort_points(
+            points=keypoint_coordinates[camera_mask],
+            camera_matrix=camera_parameters['camera_matrices'][camera_index],
+            distortion_coefficients=camera_parameters['distortion_coefficients'][camera_index],
+        )
+    # Undistorted pixel coordinates (homogeneous) for epipolar distances
+    pixel_coordinates = np.concatenate(
+        (normalized_coordinates, np.ones(normalized_coordinates.shape[:-1] + (1,))),
+        axis=-1
+    )
+    for camera_index in range(len(camera_ids)):
+        camera_mask = pose_camera_indices == camera_index
+        pixel_coordinates[camera_mask] = pixel_coordinates[camera_mask] @ camera_parameters['camera_matrices'][camera_index].T
+    pose_groups = list()
+    for chunk_start in range(0, len(timestamps), timestamps_per_chunk):
+        chunk_pose_indices = np.nonzero(
+            (pose_timestamp_indices >= chunk_start) &
+            (pose_timestamp_indices < chunk_start + timestamps_per_chunk)
+        )[0]
+        pose_indices_a, pose_indices_b = generate_candidate_pairs(
+            pose_indices=chunk_pose_indices,
+            pose_timestamp_indices=pose_timestamp_indices,
+            pose_camera_indices=pose_camera_indices,
+        )
+        costs = compute_epipolar_costs(
+            pose_indices_a=pose_indices_a,
+            pose_indices_b=pose_indices_b,
+            pose_camera_indices=pose_camera_indices,
+            pixel_coordinates=pixel_coordinates,
+            keypoint_valid=keypoint_valid,
+            camera_parameters=camera_parameters,
+            min_matched_keypoints=min_matched_keypoints,
+        )
+        pose_groups.extend(match_poses(
+            pose_indices_a=pose_indices_a,
+            pose_indices_b=pose_indices_b,
+            costs=costs,
+            pose_camera_indices=pose_camera_indices,
+            max_cost=max_epipolar_distance,
+        ))
+    logger.info(f'Matched {len(pose_groups)} multi-view pose groups across {len(timestamps)} timestamps')
+    if len(pose_groups) == 0:
+        return generate_empty_poses_3d()
+    group_pose_indices = np.full((len(pose_groups), len(camera_ids)), -1)
+    for group_index, pose_group in enumerate(pose_groups):
+        group_pose_indices[group_index, pose_camera_indices[pose_group]] = pose_group
+    keypoint_coordinates_3d, reprojection_errors = triangulate_pose_groups(
+        group_pose_indices=group_pose_indices,
+        normalized_coordinates=normalized_coordinates,
+        keypoint_quality=np.where(keypoint_valid, keypoint_quality, 0.0),
+        camera_parameters=camera_parameters,
+    )
+    first_pose_indices = np.array([pose_group[0] for pose_group in pose_groups])
+    poses_3d = pd.DataFrame({
+        'pose_3d_id': [str(uuid.uuid4()) for _ in range(len(pose_groups))],
+        'timestamp': timestamps[pose_timestamp_indices[first_pose_indices]],
+        'keypoint_coordinates_3d': list(keypoint_coordinates_3d),
+        'pose_2d_ids': [pose_2d_ids[pose_group].tolist() for pose_group in pose_groups],
+        'camera_ids': [[camera_ids[camera_index] for camera_index in pose_camera_indices[pose_group]] for pose_group in pose_groups],
+        'num_views': [len(pose_group) for pose_group in pose_groups],
+        'reprojection_error': reprojection_errors,
+    })
+    poses_3d = (
+        poses_3d
+        .sort_values('timestamp')
+        .set_index('pose_3d_id')
+    )
+    return poses_3d
+
+def generate_empty_poses_3d():
+    poses_3d = (
+        pd.DataFrame(columns=[
+            'pose_3d_id',
+            'timestamp',
+            'keypoint_coordinates_3d',
+            'pose_2d_ids',
+            'camera_ids',
+            'num_views',
+            'reprojection_error',
+        ])
+        .set_index('pose_3d_id')
+    )
+    return poses_3d
+
+def generate_camera_parameters(
+    camera_ids,
+    camera_calibrations,
+):
+    camera_matrices = list()
+    distortion_coefficients = list()
+    rotation_matrices = list()
+    translation_vectors = list()
+    for camera_id in camera_ids:
+        camera_calibration = camera_calibrations[camera_id]
+        camera_matrices.append(np.asarray(camera_calibration['camera_matrix'], dtype=float).reshape((3, 3)))
+        distortion_coefficients.append(np.asarray(camera_calibration['distortion_coefficients'], dtype=float).flatten())
+        rotation_matrices.append(generate_rotation_matrix(camera_calibration['rotation_vector']))
+        translation_vectors.append(np.asarray(camera_calibration['translation_vector'], dtype=float).reshape(3))
+    rotation_matrices = np.stack(rotation_matrices)
+    translation_vectors = np.stack(translation_vectors)
+    # Projection matrices map world coordinates to normalized (undistorted)
+    # image coordinates
+    projection_matrices = np.concatenate((rotation_matrices, translation_vectors[:, :, np.newaxis]), axis=2)
+    camera_parameters = {
+        'camera_matrices': np.stack(camera_matrices),
+        'distortion_coefficients': distortion_coefficients,
+        'rotation_matrices': rotation_matrices,
+        'translation_vectors': translation_vectors,
+        'projection_matrices': projection_matrices,
+        'fundamental_matrices': generate_fundamental_matrices(
+            camera_matrices=np.stack(camera_matrices),
+            rotation_matrices=rotation_matrices,
+            translation_vectors=translation_vectors,
+        ),
+    }
+    return camera_parameters
+
+def generate_rotation_matrix(rotation_vector):
+    # Rodrigues' formula
+    rotation_vector = np.asarray(rotation_vector, dtype=float).reshape(3)
+    angle = np.linalg.norm(rotation_vector)
+    if angle < 1e-12:
+        return np.identity(3)
+    axis = rotation_vector/angle
+    cross_product_matrix = generate_cross_product_matrix(axis)
+    rotation_matrix = (
+        np.identity(3) +
+        np.sin(angle)*cross_product_matrix +
+        (1 - np.cos(angle))*(cross_product_matrix @ cross_product_matrix)
+    )
+    return rotation_matrix
+
+def generate_cross_product_matrix(vector):
+    return np.array([
+        [0.0, -vector[2], vector[1]],
+        [vector[2], 0.0, -vector[0]],
+        [-vector[1], vector[0], 0.0],
+    ])
+
+def generate_fundamental_matrices(
+    camera_matrices,
+    rotation_matrices,
+    translation_vectors,
+):
+    # Entry [a, b] maps undistorted pixel coordinates in camera a to epipolar
+    # lines in camera b
+    num_cameras = camera_matrices.shape[0]
+    inverse_camera_matrices = np.linalg.inv(camera_matrices)
+    fundamental_matrices = np.zeros((num_cameras, num_cameras, 3, 3))
+    for camera_index_a in range(num_cameras):
+        for camera_index_b in range(num_cameras):
+            if camera_index_a == camera_index_b:
+                continue
+            relative_rotation = rotation_matrices[camera_index_b] @ rotation_matrices[camera_index_a].T
+            relative_translation = translation_vectors[camera_index_b] - relative_rotation @ translation_vectors[camera_index_a]
+            essential_matrix = generate_cross_product_matrix(relative_translation) @ relative_rotation
+            fundamental_matrices[camera_index_a, camera_index_b] = (
+                inverse_camera_matrices[camera_index_b].T @
+                essential_matrix @
+                inverse_camera_matrices[camera_index_a]
+            )
+    return fundamental_matrices
+
+def undistort_points(
+    points,
+    camera_matrix,
+    distortion_coefficients,
+    num_iterations=5,
+):
+    # Iterative inversion of the OpenCV distortion model (k1, k2, p1, p2, k3),
+    # matching cv2.undistortPoints. Returns normalized image coordinates.
+    distortion_coefficients = np.asarray(distortion_coefficients, dtype=float).flatten()
+    if np.any(distortion_coefficients[5:] != 0.0):
+        raise ValueError('Only the k1, k2, p1, p2, k3 distortion model is supported')
+    k1, k2, p1, p2, k3 = np.pad(distortion_coefficients[:5], (0, max(5 - len(distortion_coefficients), 0)))
+    points = np.asarray(points, dtype=float)
+    x_distorted = (points[..., 0] - camera_matrix[0, 2])/camera_matrix[0, 0]
+    y_distorted = (points[..., 1] - camera_matrix[1, 2])/camera_matrix[1, 1]
+    x = x_distorted
+    y = y_distorted
+    for _ in range(num_iterations):
+        r_squared = x*x + y*y
+        radial_factor = 1 + k1*r_squared + k2*r_squared**2 + k3*r_squared**3
+        delta_x = 2*p1*x*y + p2*(r_squared + 2*x*x)
+        delta_y = p1*(r_squared + 2*y*y) + 2*p2*x*y
+        x = (x_distorted - delta_x)/radial_factor
+        y = (y_distorted - delta_y)/radial_factor
+    return np.stack((x, y), axis=-1)
+
+def generate_candidate_pairs(
+    pose_indices,
+    pose_timestamp_indices,
+    pose_camera_indices,
+):
+    # All pairs of poses that share a timestamp and come from different
+    # cameras (each unordered pair once)
+    poses = pd.DataFrame({
+        'pose_index': pose_indices,
+        'timestamp_index': pose_timestamp_indices[pose_indices],
+        'camera_index': pose_camera_indices[pose_indices],
+    })
+    pairs = poses.merge(
+        poses,
+        on='timestamp_index',
+        suffixes=('_a', '_b'),
+    )
+    pairs = pairs.loc[pairs['camera_index_a'] < pairs['camera_index_b']]
+    return pairs['pose_index_a'].to_numpy(), pairs['pose_index_b'].to_numpy()
+
+def compute_epipolar_costs(
+    pose_indices_a,
+    pose_indices_b,
+    pose_camera_indices,
+    pixel_coordinates,
+    keypoint_valid,
+    camera_parameters,
+    min_matched_keypoints=5,
+):
+    # Mean symmetric distance (in undistorted pixels) between each keypoint
+    # and the epipolar line of its counterpart in the other view. Pairs are
+    # processed one camera pair at a time so that each batch shares a single
+    # fundamental matrix.
+    costs = np.full(len(pose_indices_a), np.inf)
+    if len(pose_indices_a) == 0:
+        return costs
+    camera_indices_a = pose_camera_indices[pose_indices_a]
+    camera_indices_b = pose_camera_indices[pose_indices_b]
+    num_cameras = camera_parameters['fundamental_matrices'].shape[0]
+    camera_pair_indices = camera_indices_a*num_cameras + camera_indices_b
+    for camera_pair_index in np.unique(camera_pair_indices):
+        pair_mask = camera_pair_indices == camera_pair_index
+        camera_index_a, camera_index_b = divmod(int(camera_pair_index), num_cameras)
+        fundamental_matrix = camera_parameters['fundamental_matrices'][camera_index_a, camera_index_b]
+        points_a = pixel_coordinates[pose_indices_a[pair_mask]]
+        points_b = pixel_coordinates[pose_indices_b[pair_mask]]
+        lines_b = points_a @ fundamental_matrix.T
+        lines_a = points_b @ fundamental_matrix
+        algebraic_errors = np.abs(np.sum(points_b*lines_b, axis=-1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            distances = 0.5*algebraic_errors*(
+                1/np.sqrt(lines_b[..., 0]**2 + lines_b[..., 1]**2) +
+                1/np.sqrt(lines_a[..., 0]**2 + lines_a[..., 1]**2)
+            )
+        matched_keypoints = keypoint_valid[pose_indices_a[pair_mask]] & keypoint_valid[pose_indices_b[pair_mask]]
+        num_matched_keypoints = matched_keypoints.sum(axis=-1)
+        pair_costs = np.where(matched_keypoints, distances, 0.0).sum(axis=-1)/np.maximum(num_matched_keypoints, 1)
+        costs[pair_mask] = np.where(num_matched_keypoints >= min_matched_keypoints, pair_costs, np.inf)
+    return costs
+
+def match_poses(
+    pose_indices_a,
+    pose_indices_b,
+    costs,
+    pose_camera_indices,
+    max_cost=20.0,
+):
+    # Greedy clustering: pairs are accepted in order of increasing cost as long
+    # as each group still contains at most one pose per camera. Pairs never
+    # span timestamps, so groups never do either.
+    pose_group_ids = dict()
+    groups = dict()
+    order = np.argsort(costs, kind='stable')
+    num_accepted = np.searchsorted(costs[order], max_cost, side='right')
+    for pair_index in order[:num_accepted]:
+        pose_index_a = int(pose_indices_a[pair_index])
+        pose_index_b = int(pose_indices_b[pair_index])
+        group_id_a = pose_group_ids.get(pose_index_a)
+        group_id_b = pose_group_ids.get(pose_index_b)
+        if group_id_a is None and group_id_b is None:
+            groups[pose_index_a] = [pose_index_a, pose_index_b]
+            pose_group_ids[pose_index_a] = pose_index_a
+            pose_group_ids[pose_index_b] = pose_index_a
+            continue
+        if group_id_a == group_id_b:
+            continue
+        if group_id_a is None:
+            group_id_a, group_id_b = group_id_b, group_id_a
+            pose_index_a, pose_index_b = pose_index_b, pose_index_a
+        if group_id_b is None:
+            incoming_pose_indices = [pose_index_b]
+        else:
+            incoming_pose_indices = groups[group_id_b]
+        group_camera_indices = set(pose_camera_indices[groups[group_id_a]])
+        if group_camera_indices.intersection(pose_camera_indices[incoming_pose_indices]):
+            continue
+        groups[group_id_a].extend(incoming_pose_indices)
+        for pose_index in incoming_pose_indices:
+            pose_group_ids[pose_index] = group_id_a
+        if group_id_b is not None:
+            del groups[group_id_b]
+    return list(groups.values())
+
+def triangulate_pose_groups(
+    group_pose_indices,
+    normalized_coordinates,
+    keypoint_quality,
+    camera_parameters,
+):
+    # Weighted linear (DLT) triangulation of every keypoint of every group at
+    # once. The normal matrices A^T A (group x keypoint x 4 x 4) are
+    # accumulated view by view and solved with a single batched eigh.
+    num_groups, num_cameras = group_pose_indices.shape
+    num_keypoints = normalized_coordinates.shape[1]
+    projection_matrices = camera_parameters['projection_matrices']
+    normal_matrices = np.zeros((num_groups, num_keypoints, 4, 4))
+    num_views = np.zeros((num_groups, num_keypoints), dtype=int)
+    for camera_index in range(num_cameras):
+        pose_indices = group_pose_indices[:, camera_index]
+        present = pose_indices >= 0
+        if not np.any(present):
+            continue
+        weights = np.where(present[:, np.newaxis], keypoint_quality[pose_indices], 0.0)
+        points = np.nan_to_num(normalized_coordinates[pose_indices])
+        projection_matrix = projection_matrices[camera_index]
+        rows_x = points[..., 0, np.newaxis]*projection_matrix[2] - projection_matrix[0]
+        rows_y = points[..., 1, np.newaxis]*projection_matrix[2] - projection_matrix[1]
+        weights_squared = (weights**2)[..., np.newaxis, np.newaxis]
+        normal_matrices += weights_squared*(
+            rows_x[..., :, np.newaxis]*rows_x[..., np.newaxis, :] +
+            rows_y[..., :, np.newaxis]*rows_y[..., np.newaxis, :]
+        )
+        num_views += weights > 0
+    _, eigenvectors = np.linalg.eigh(normal_matrices)
+    homogeneous_points = eigenvectors[..., :, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        keypoint_coordinates_3d = homogeneous_points[..., :3]/homogeneous_points[..., 3:]
+    keypoint_coordinates_3d[num_views < 2] = np.nan
+    reprojection_errors = compute_reprojection_errors(
+        keypoint_coordinates_3d=keypoint_coordinates_3d,
+        group_pose_indices=group_pose_indices,
+        normalized_coordinates=normalized_coordinates,
+        keypoint_quality=keypoint_quality,
+        camera_parameters=camera_parameters,
+    )
+    return keypoint_coordinates_3d, reprojection_errors
+
+def compute_reprojection_errors(
+    keypoint_coordinates_3d,
+    group_pose_indices,
+    normalized_coordinates,
+    keypoint_quality,
+    camera_parameters,
+):
+    # Mean distance (in undistorted pixels) between observed keypoints and the
+    # projections of their triangulated positions
+    num_groups, num_cameras = group_pose_indices.shape
+    error_sums = np.zeros(num_groups)
+    error_counts = np.zeros(num_groups)
+    for camera_index in range(num_cameras):
+        pose_indices = group_pose_indices[:, camera_index]
+        present = pose_indices >= 0
+        if not np.any(present):
+            continue
+        camera_points = (
+            keypoint_coordinates_3d @ camera_parameters['rotation_matrices'][camera_index].T +
+            camera_parameters['translation_vectors'][camera_index]
+        )
+        with np.errstate(divide='ignore', invalid='ignore'):
+            projected_points = camera_points[..., :2]/camera_points[..., 2:]
+        focal_lengths = np.diag(camera_parameters['camera_matrices'][camera_index])[:2]
+        errors = np.linalg.norm((projected_points - normalized_coordinates[pose_indices])*focal_lengths, axis=-1)
+        valid = present[:, np.newaxis] & (keypoint_quality[pose_indices] > 0) & np.isfinite(errors)
+        error_sums += np.where(valid, errors, 0.0).sum(axis=-1)
+        error_counts += valid.sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reprojection_errors = np.where(error_counts > 0, error_sums/error_counts, np.nan)
+    return reprojection_errors
+
+def generate_poses_3d_output_path(
+    inference_id,
+    start,
+    end,
+    video_duration=datetime.timedelta(seconds=10),
+    alphapose_output_parent_directory='/data/alphapose_output',
+):
+    output_start, output_end = pose_labelbox.utils.generate_output_period(
+        start=start,
+        end=end,
+        video_duration=video_duration,
+    )
+    output_start_string = output_start.strftime('%Y%m%d_%H%M%S')
+    output_end_string = output_end.strftime('%Y%m%d_%H%M%S')
+    poses_3d_output_path = (
+        pathlib.Path(alphapose_output_parent_directory) /
+        inference_id /
+        f'poses_3d_{output_start_string}_{output_end_string}.pkl'
+    )
+    return poses_3d_output_path
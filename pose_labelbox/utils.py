@@ -1,9 +1,51 @@
-import pandas as pd
+import importlib
 import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+class LazyModule:
+    def __init__(self, module_name):
+        self.__dict__['_module_name'] = module_name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_module_name'])
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, name):
+        module = self._load()
+        try:
+            return getattr(module, name)
+        except AttributeError:
+            # Submodules such as tqdm.notebook are only attributes once imported
+            module_name = self.__dict__['_module_name']
+            try:
+                return importlib.import_module(f'{module_name}.{name}')
+            except ModuleNotFoundError as error:
+                # Only a missing submodule means a missing attribute; a
+                # submodule that fails on its own imports should still say so
+                if error.name != f'{module_name}.{name}':
+                    raise
+                raise AttributeError(f"module '{module_name}' has no attribute '{name}'") from error
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        return f"<lazy module '{self.__dict__['_module_name']}'>"
+
+def lazy_import(module_name):
+    return LazyModule(module_name)
+
+pd = lazy_import('pandas')
+
 def generate_output_period(
     start,
     end,
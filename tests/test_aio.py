@@ -0,0 +1,204 @@
+import asyncio
+import datetime
+import threading
+import time
+import types
+import pytest
+import pose_labelbox.aio
+import pose_labelbox.core
+import pose_labelbox.labelbox
+
+pd = pytest.importorskip('pandas')
+
+class FakeEndpoint:
+    # Stands in for a remote service: each call takes a while and the peak
+    # number of calls in flight at once is recorded
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.num_in_flight = 0
+        self.max_num_in_flight = 0
+        self.num_calls = 0
+
+    def call(self, result=None):
+        with self.lock:
+            self.num_calls += 1
+            self.num_in_flight += 1
+            self.max_num_in_flight = max(self.max_num_in_flight, self.num_in_flight)
+        time.sleep(self.latency)
+        with self.lock:
+            self.num_in_flight -= 1
+        return result
+
+def generate_fake_labelbox_module():
+    return types.SimpleNamespace(
+        Dataset=types.SimpleNamespace(name='dataset_name'),
+        DataRow=types.SimpleNamespace(
+            row_data='row_data',
+            external_id='external_id',
+            global_key='global_key',
+            metadata_fields='metadata_fields',
+        ),
+        DataRowMetadataField=lambda name, value: (name, value),
+    )
+
+def test_dataset_uploads_and_data_row_tasks_run_concurrently(tmp_path, monkeypatch):
+    monkeypatch.setattr(pose_labelbox.labelbox, 'lb', generate_fake_labelbox_module())
+    monkeypatch.setattr(pose_labelbox.labelbox, 'honeycomb_io', types.SimpleNamespace(
+        fetch_environment_id=lambda environment_id, environment_name, client: environment_id,
+    ))
+    camera_directory_path = tmp_path / 'inference' / 'camera'
+    camera_directory_path.mkdir(parents=True)
+    for pose_track_label in range(8):
+        (camera_directory_path / f'{pose_track_label}_20230101_080000_000000_20230101_080010_000000.mp4').write_bytes(b'video')
+    endpoint = FakeEndpoint()
+    created_batches = list()
+
+    def create_data_rows(datarows):
+        created_batches.append(datarows)
+        return types.SimpleNamespace(
+            wait_till_done=lambda: endpoint.call(),
+            errors=None,
+            status='COMPLETE',
+        )
+
+    dataset = types.SimpleNamespace(uid='dataset', create_data_rows=create_data_rows)
+    client = types.SimpleNamespace(
+        get_datasets=lambda where: types.SimpleNamespace(get_one=lambda: None),
+        create_dataset=lambda iam_integration, name, description: dataset,
+        upload_file=lambda path: endpoint.call(f'https://example.com/{path.name}'),
+    )
+
+    async def create_dataset():
+        async with pose_labelbox.aio.RequestPool(max_concurrent_requests=4) as request_pool:
+            dataset_id = await pose_labelbox.labelbox.create_dataset_async(
+                start=datetime.datetime(2023, 1, 1, 8, 0, 0, tzinfo=datetime.timezone.utc),
+                end=datetime.datetime(2023, 1, 1, 8, 0, 10, tzinfo=datetime.timezone.utc),
+                inference_id='inference',
+                environment_id='environment',
+                bounding_box_overlay_video_parent_directory=tmp_path,
+                client=client,
+                data_row_batch_size=3,
+                request_pool=request_pool,
+            )
+        return dataset_id, request_pool
+
+    dataset_id, request_pool = asyncio.run(create_dataset())
+    assert dataset_id == 'dataset'
+    assert endpoint.num_calls == 8 + 3
+    assert endpoint.max_num_in_flight == 4
+    assert request_pool.max_num_in_flight == 4
+    assert [len(batch) for batch in created_batches] == [3, 3, 2]
+    datarows = [datarow for batch in created_batches for datarow in batch]
+    # Data rows keep the order of the videos regardless of upload order
+    assert [datarow['row_data'] for datarow in datarows] == [
+        f'https://example.com/{pose_track_label}_20230101_080000_000000_20230101_080010_000000.mp4'
+        for pose_track_label in range(8)
+    ]
+    assert ('pose_track_2d_label', '5') in datarows[5]['metadata_fields']
+
+@pytest.mark.parametrize('max_download_workers, expected_max_downloads_in_flight', [
+    (2, 2),
+    ('2', 2),
+    # A single-CPU machine configures zero download workers
+    (0, 1),
+])
+def test_video_metadata_and_downloads_run_concurrently(tmp_path, monkeypatch, max_download_workers, expected_max_downloads_in_flight):
+    start = datetime.datetime(2023, 1, 1, 8, 0, 0, tzinfo=datetime.timezone.utc)
+    camera_ids = [f'camera_{camera_index}' for camera_index in range(6)]
+    endpoint = FakeEndpoint()
+    download_endpoint = FakeEndpoint()
+
+    def fetch_video_metadata(camera_device_ids, **kwargs):
+        return endpoint.call([
+            {
+                'data_id': f'{camera_id}_{video_index}',
+                'environment_id': 'environment',
+                'device_id': camera_id,
+                'video_timestamp': start + video_index*datetime.timedelta(seconds=10),
+            }
+            for camera_id in camera_device_ids
+            for video_index in range(2)
+        ])
+
+    def download_video_files(video_metadata, local_video_directory, **kwargs):
+        video_metadata_with_local_paths = list()
+        for video_metadatum in video_metadata:
+            video_local_path = tmp_path / f"{video_metadatum['data_id']}.mp4"
+            video_local_path.write_bytes(b'video')
+            video_metadata_with_local_paths.append({**video_metadatum, 'video_local_path': str(video_local_path)})
+        return download_endpoint.call(video_metadata_with_local_paths)
+
+    monkeypatch.setattr(pose_labelbox.core, 'video_io', types.SimpleNamespace(
+        config=types.SimpleNamespace(
+            HONEYCOMB_URI=None,
+            HONEYCOMB_TOKEN_URI=None,
+            HONEYCOMB_AUDIENCE=None,
+            HONEYCOMB_CLIENT_ID=None,
+            HONEYCOMB_CLIENT_SECRET=None,
+            VIDEO_STORAGE_URL=None,
+            VIDEO_STORAGE_AUTH_DOMAIN=None,
+            VIDEO_STORAGE_AUDIENCE=None,
+            VIDEO_STORAGE_CLIENT_ID=None,
+            VIDEO_STORAGE_CLIENT_SECRET=None,
+            MAX_DOWNLOAD_WORKERS=max_download_workers,
+        ),
+        fetch_video_metadata=fetch_video_metadata,
+        download_video_files=download_video_files,
+    ))
+    monkeypatch.setattr(pose_labelbox.core, 'generate_target_camera_ids', lambda **kwargs: endpoint.call(camera_ids))
+    video_metadata_df = pose_labelbox.core.download_videos(
+        start=start,
+        end=start + datetime.timedelta(seconds=20),
+        environment_id='environment',
+        local_video_directory=tmp_path,
+        max_concurrent_requests=3,
+    )
+    # One camera lookup and a metadata request per camera, then a download
+    # per video, with no more downloads in flight than download workers
+    assert endpoint.num_calls == 1 + 6
+    assert endpoint.max_num_in_flight == 3
+    assert download_endpoint.num_calls == 12
+    assert download_endpoint.max_num_in_flight == expected_max_downloads_in_flight
+    assert len(video_metadata_df) == 12
+    assert video_metadata_df['camera_id'].tolist() == sorted(camera_ids*2)
+
+def test_sync_wrappers_work_inside_a_running_event_loop():
+    video_start = datetime.datetime(2023, 1, 1, 8, 0, 0, tzinfo=datetime.timezone.utc)
+    video_end = video_start + datetime.timedelta(seconds=1)
+    metadata = {
+        'inference_id': 'inference',
+        'environment_id': 'environment',
+        'labeling_period_start_isoformat': video_start.strftime(pose_labelbox.labelbox.LABELBOX_DATETIME_FORMAT),
+        'labeling_period_end_isoformat': video_end.strftime(pose_labelbox.labelbox.LABELBOX_DATETIME_FORMAT),
+        'camera_id': 'camera',
+        'pose_track_2d_label': '7',
+        'video_start_isoformat': video_start.strftime(pose_labelbox.labelbox.LABELBOX_DATETIME_FORMAT),
+        'video_end_isoformat': video_end.strftime(pose_labelbox.labelbox.LABELBOX_DATETIME_FORMAT),
+        'num_frames': '10',
+    }
+    data_row = {
+        'metadata_fields': [{'schema_name': name, 'value': value} for name, value in metadata.items()],
+        'projects': {'project': {'labels': [{'annotations': {'frames': {'1': {'classifications': [{'radio_answer': {'name': 'alice'}}]}}}}]}},
+    }
+    export_task = types.SimpleNamespace(wait_till_done=lambda: None, errors=None, result=[data_row])
+    client = types.SimpleNamespace(get_project=lambda project_id: types.SimpleNamespace(export_v2=lambda params, filters: export_task))
+
+    async def fetch_labels_from_coroutine():
+        return pose_labelbox.labelbox.fetch_labels(project_id='project', client=client)
+
+    label_data = asyncio.run(fetch_labels_from_coroutine())
+    assert label_data['person_name'].tolist() == ['alice']
+
+def test_request_pool_can_be_created_outside_the_event_loop():
+    request_pool = pose_labelbox.aio.RequestPool(max_concurrent_requests=2)
+    endpoint = FakeEndpoint()
+
+    async def run_requests():
+        return await asyncio.gather(*[request_pool.run(endpoint.call, result=index) for index in range(4)])
+
+    try:
+        assert asyncio.run(run_requests()) == [0, 1, 2, 3]
+    finally:
+        request_pool.close()
+    assert endpoint.max_num_in_flight == 2
@@ -0,0 +1,71 @@
+import datetime
+import json
+import pytest
+import pose_labelbox.alphapose
+import pose_labelbox.core
+
+pytest.importorskip('pandas')
+
+def generate_pose_2d_raw(image_id, box, idx):
+    return {'image_id': image_id, 'box': box, 'idx': idx, 'keypoints': [0.0]*78, 'score': 1.0}
+
+def test_detection_chunks_are_aligned_to_videos():
+    detection_chunks = pose_labelbox.core.generate_detection_chunks(
+        start=datetime.datetime(2023, 1, 1, 8, 0, 5, tzinfo=datetime.timezone.utc),
+        end=datetime.datetime(2023, 1, 1, 8, 2, 25, tzinfo=datetime.timezone.utc),
+        video_duration=datetime.timedelta(seconds=10),
+        chunk_duration=datetime.timedelta(minutes=1),
+    )
+    assert [(chunk_end - chunk_start).total_seconds() for chunk_start, chunk_end in detection_chunks] == [60.0, 60.0, 30.0]
+    assert detection_chunks[0][0] == datetime.datetime(2023, 1, 1, 8, 0, 0, tzinfo=datetime.timezone.utc)
+
+def test_chunk_outputs_are_merged_with_continuous_pose_tracks(tmp_path):
+    chunk_outputs = [
+        [
+            generate_pose_2d_raw('a_001', [0, 0, 100, 200], 1),
+            generate_pose_2d_raw('a_002', [2, 0, 100, 200], 1),
+            generate_pose_2d_raw('a_002', [500, 0, 100, 200], 2),
+        ],
+        [
+            generate_pose_2d_raw('a_003', [504, 0, 100, 200], 1),
+            generate_pose_2d_raw('a_003', [4, 0, 100, 200], 2),
+            generate_pose_2d_raw('a_003', [900, 0, 100, 200], 3),
+        ],
+    ]
+    chunk_output_paths = list()
+    for chunk_index, chunk_output in enumerate(chunk_outputs):
+        chunk_output_path = tmp_path / f'{chunk_index}.json'
+        chunk_output_path.write_text(json.dumps(chunk_output))
+        chunk_output_paths.append(chunk_output_path)
+    merged_poses_2d_raw = pose_labelbox.alphapose.merge_detection_chunk_outputs(
+        chunk_output_paths=chunk_output_paths,
+        output_path=tmp_path / 'alphapose-results.json',
+    )
+    assert [pose_2d_raw['idx'] for pose_2d_raw in merged_poses_2d_raw] == [0, 0, 1, 1, 0, 2]
+    assert json.loads((tmp_path / 'alphapose-results.json').read_text()) == merged_poses_2d_raw
+    # Without linking, labels are still unique across chunks
+    merged_poses_2d_raw = pose_labelbox.alphapose.merge_detection_chunk_outputs(
+        chunk_output_paths=chunk_output_paths,
+        output_path=tmp_path / 'alphapose-results.json',
+        link_pose_tracks=False,
+    )
+    assert [pose_2d_raw['idx'] for pose_2d_raw in merged_poses_2d_raw] == [0, 0, 1, 2, 3, 4]
+    # Tracks are not linked across a chunk without detections
+    empty_chunk_output_path = tmp_path / 'empty.json'
+    empty_chunk_output_path.write_text('[]')
+    merged_poses_2d_raw = pose_labelbox.alphapose.merge_detection_chunk_outputs(
+        chunk_output_paths=[chunk_output_paths[0], empty_chunk_output_path, chunk_output_paths[1]],
+        output_path=tmp_path / 'alphapose-results.json',
+    )
+    assert [pose_2d_raw['idx'] for pose_2d_raw in merged_poses_2d_raw] == [0, 0, 1, 2, 3, 4]
+
+def test_failed_detection_chunks_are_recorded_until_they_succeed(tmp_path):
+    chunk_start = datetime.datetime(2023, 1, 1, 8, 0, 0, tzinfo=datetime.timezone.utc)
+    chunk_end = chunk_start + datetime.timedelta(minutes=1)
+    for returncode in [1, 137]:
+        pose_labelbox.alphapose.update_failed_detection_chunks(tmp_path, chunk_start, chunk_end, returncode)
+    failed_detection_chunks = pose_labelbox.alphapose.read_failed_detection_chunks(tmp_path)
+    assert failed_detection_chunks['20230101_080000_20230101_080100']['num_failures'] == 2
+    assert failed_detection_chunks['20230101_080000_20230101_080100']['returncode'] == 137
+    pose_labelbox.alphapose.update_failed_detection_chunks(tmp_path, chunk_start, chunk_end, 0)
+    assert pose_labelbox.alphapose.read_failed_detection_chunks(tmp_path) == dict()
@@ -0,0 +1,69 @@
+import datetime
+import os
+import pose_labelbox.cache
+
+def write_file(path, num_bytes, last_used):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'\0'*num_bytes)
+    os.utime(path, (last_used, last_used))
+
+def test_least_recently_used_files_are_evicted_first(tmp_path):
+    frames_path = tmp_path / 'frames'
+    write_file(frames_path / 'a' / 'old.png', 100, 1000)
+    write_file(frames_path / 'b' / 'middle.png', 100, 2000)
+    write_file(frames_path / 'b' / 'new.png', 100, 3000)
+    cache_manager = pose_labelbox.cache.CacheManager(
+        cache_directories=[frames_path],
+        max_bytes=250,
+        target_fraction=0.5,
+        min_idle_time=datetime.timedelta(0),
+    )
+    assert cache_manager.enforce_budget() == 200
+    assert not (frames_path / 'a').exists()
+    assert not (frames_path / 'b' / 'middle.png').exists()
+    assert (frames_path / 'b' / 'new.png').is_file()
+    assert frames_path.is_dir()
+
+def test_protected_and_recently_used_files_are_kept(tmp_path):
+    frames_path = tmp_path / 'frames'
+    write_file(frames_path / 'a' / 'old.png', 100, 1000)
+    write_file(frames_path / 'b' / 'older.png', 100, 500)
+    write_file(frames_path / 'c' / 'recent.png', 100, 1000)
+    cache_manager = pose_labelbox.cache.CacheManager(
+        cache_directories=[frames_path],
+        max_bytes=150,
+        min_idle_time=datetime.timedelta(minutes=5),
+    )
+    cache_manager.touch([frames_path / 'c'])
+    with cache_manager.protect([frames_path / 'b']):
+        cache_manager.enforce_budget()
+    assert not (frames_path / 'a' / 'old.png').exists()
+    assert (frames_path / 'b' / 'older.png').is_file()
+    assert (frames_path / 'c' / 'recent.png').is_file()
+    assert not cache_manager.is_protected(frames_path / 'b' / 'older.png')
+
+def test_retained_files_count_toward_budget_but_are_never_evicted(tmp_path, monkeypatch):
+    frames_path = tmp_path / 'frames'
+    overlays_path = tmp_path / 'overlays'
+    write_file(overlays_path / 'a' / 'overlay.png', 200, 500)
+    write_file(frames_path / 'a' / 'old.png', 100, 1000)
+    cache_manager = pose_labelbox.cache.CacheManager(
+        cache_directories=[frames_path],
+        retained_directories=[overlays_path],
+        max_bytes=250,
+        min_idle_time=datetime.timedelta(0),
+    )
+    assert cache_manager.enforce_budget() == 100
+    assert (overlays_path / 'a' / 'overlay.png').is_file()
+    assert cache_manager.usage_bytes() == 200
+    # New files are added to the size index as stages touch them, without
+    # rescanning the cache directories
+    def scan():
+        raise AssertionError('Cache directories rescanned')
+    monkeypatch.setattr(cache_manager, 'scan', scan)
+    write_file(frames_path / 'b' / 'new.png', 100, 2000)
+    cache_manager.touch([frames_path / 'b'])
+    assert cache_manager.usage_bytes() == 300
+    assert cache_manager.enforce_budget() == 100
+    assert not (frames_path / 'b').exists()
+    assert cache_manager.usage_bytes() == 200
@@ -1,2 +1,202 @@
+import datetime
+import pathlib
+import types
+import pytest
+import pose_labelbox.alphapose
+import pose_labelbox.cache
+import pose_labelbox.core
+import pose_labelbox.overlay
+import pose_labelbox.process_video
+import pose_labelbox.loadtest
+import pose_labelbox.metrics
+import pose_labelbox.profiling
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
 def test_example():
-    assert True
\ No newline at end of file
+    assert True
+
+def test_bulk_frame_paths_match_scalar_frame_paths():
+    timestamps = pd.date_range('2023-01-01T08:00:09.8Z', periods=25, freq='100ms')
+    camera_ids = np.array(['camera_a', 'camera_b'] * 12 + ['camera_a'], dtype=object)
+    frame_paths = pose_labelbox.core.generate_frame_paths(
+        environment_id='environment',
+        camera_ids=camera_ids,
+        timestamps=timestamps,
+        frame_filename_extension='jpg',
+    )
+    assert list(frame_paths) == [
+        str(pose_labelbox.core.generate_frame_path(
+            environment_id='environment',
+            camera_id=camera_id,
+            timestamp=timestamp,
+            frame_filename_extension='jpg',
+        ))
+        for camera_id, timestamp in zip(camera_ids, timestamps)
+    ]
+    assert frame_paths[2].endswith('_2023-01-01_08-00-10_001.jpg')
+    frame_filenames = pose_labelbox.core.generate_frame_filenames(
+        environment_id='environment',
+        camera_id='camera_a',
+        video_start=pd.Timestamp('2023-01-01T08:00:10Z'),
+        frames_per_video=3,
+        frame_filename_extension='jpg',
+    )
+    assert frame_filenames == ['environment_camera_a_2023-01-01_08-00-10_00{}.jpg'.format(frame_index) for frame_index in range(1, 4)]
+
+def test_bulk_overlay_paths_match_scalar_overlay_paths():
+    timestamps = pd.date_range('2023-01-01T08:00:09.8Z', periods=25, freq='100ms')
+    camera_ids = np.array(['camera_a', 'camera_b'] * 12 + ['camera_a'], dtype=object)
+    pose_track_labels = np.array([1, 1, 2, 2, 3] * 5, dtype=object)
+    overlay_paths = pose_labelbox.overlay.generate_bounding_box_overlay_paths(
+        inference_id='inference',
+        camera_ids=camera_ids,
+        timestamps=timestamps,
+        pose_track_labels=pose_track_labels,
+        bounding_box_overlay_parent_directory='/overlays',
+    )
+    assert list(overlay_paths) == [
+        str(pose_labelbox.overlay.generate_bounding_box_overlay_path(
+            inference_id='inference',
+            camera_id=camera_id,
+            timestamp=timestamp,
+            pose_track_label=pose_track_label,
+            bounding_box_overlay_parent_directory='/overlays',
+        ))
+        for camera_id, timestamp, pose_track_label in zip(camera_ids, timestamps, pose_track_labels)
+    ]
+    # Single camera and pose track label broadcast to every timestamp
+    overlay_paths = pose_labelbox.overlay.generate_bounding_box_overlay_paths(
+        inference_id='inference',
+        camera_ids='camera_a',
+        timestamps=timestamps[:3],
+        pose_track_labels=7,
+    )
+    assert list(overlay_paths) == [
+        str(pose_labelbox.overlay.generate_bounding_box_overlay_path(
+            inference_id='inference',
+            camera_id='camera_a',
+            timestamp=timestamp,
+            pose_track_label=7,
+        ))
+        for timestamp in timestamps[:3]
+    ]
+
+def extract_synthetic_frames(
+    tmp_path,
+    local_frames_directory,
+    extraction_batch_size=None,
+):
+    start = datetime.datetime(2023, 1, 1, 8, 0, 0, tzinfo=datetime.timezone.utc)
+    video_duration = datetime.timedelta(seconds=2)
+    for video_start in [start, start + video_duration]:
+        video_path = pose_labelbox.core.generate_video_path(
+            environment_id='environment',
+            camera_id='camera_a',
+            video_start=video_start,
+            local_video_directory=tmp_path / 'videos',
+        )
+        if not video_path.is_file():
+            pose_labelbox.loadtest.generate_synthetic_video(
+                video_path,
+                video_duration=video_duration,
+                frame_width=64,
+                frame_height=48,
+            )
+    honeycomb = pose_labelbox.loadtest.FakeHoneycomb(environment_id='environment', camera_ids=['camera_a'])
+    with pose_labelbox.loadtest.install_fake_services(honeycomb=honeycomb):
+        pose_labelbox.core.extract_frames(
+            start=start,
+            end=start + 2*video_duration,
+            environment_id='environment',
+            video_duration=video_duration,
+            frames_per_video=20,
+            local_video_directory=tmp_path / 'videos',
+            local_frames_directory=local_frames_directory,
+            extraction_batch_size=extraction_batch_size,
+        )
+    cv2 = pytest.importorskip('cv2')
+    return {
+        path.relative_to(local_frames_directory): cv2.imread(str(path))
+        for path in sorted(local_frames_directory.rglob('*.png'))
+    }
+
+def test_batched_frame_extraction_matches_per_video_extraction(tmp_path, monkeypatch):
+    pytest.importorskip('ffmpeg')
+    pytest.importorskip('cv_utils')
+    frames = extract_synthetic_frames(tmp_path, tmp_path / 'frames')
+    batched_frames = extract_synthetic_frames(tmp_path, tmp_path / 'batched_frames', extraction_batch_size=2)
+    assert len(frames) == 40
+    assert list(batched_frames.keys()) == list(frames.keys())
+    # The test source draws a running timer, so matching pixels means each
+    # filename carries the timestamp of the frame it holds
+    for frame_path, frame in frames.items():
+        assert np.array_equal(batched_frames[frame_path], frame)
+    # A failed batch falls back to extracting each video on its own
+    ffmpeg = pose_labelbox.process_video.ffmpeg
+    def input(filename, **kwargs):
+        if kwargs.get('format') == 'concat':
+            filename = str(tmp_path / 'missing.txt')
+        return ffmpeg.input(filename, **kwargs)
+    monkeypatch.setattr(pose_labelbox.process_video, 'ffmpeg', types.SimpleNamespace(input=input, Error=ffmpeg.Error))
+    metrics_sink = pose_labelbox.metrics.InMemoryMetricsSink()
+    with pose_labelbox.metrics.metrics_sink(metrics_sink):
+        fallback_frames = extract_synthetic_frames(tmp_path, tmp_path / 'fallback_frames', extraction_batch_size=2)
+    assert pose_labelbox.loadtest.sum_counter(metrics_sink, 'batched_extraction_fallbacks') == 2
+    assert list(fallback_frames.keys()) == list(frames.keys())
+
+def test_detection_chunk_extracts_missing_frames(tmp_path, monkeypatch):
+    pytest.importorskip('ffmpeg')
+    pytest.importorskip('cv_utils')
+    start = datetime.datetime(2023, 1, 1, 8, 0, 0, tzinfo=datetime.timezone.utc)
+    video_duration = datetime.timedelta(seconds=2)
+    pose_labelbox.loadtest.generate_synthetic_video(
+        pose_labelbox.core.generate_video_path(
+            environment_id='environment',
+            camera_id='camera_a',
+            video_start=start,
+            local_video_directory=tmp_path / 'videos',
+        ),
+        video_duration=video_duration,
+        frame_width=64,
+        frame_height=48,
+    )
+    image_lists = list()
+    def detect_poses_2d(image_list_path, output_directory_path, **kwargs):
+        with open(image_list_path, 'r') as fp:
+            image_lists.append(fp.read().splitlines())
+        return 0
+    monkeypatch.setattr(pose_labelbox.alphapose, 'detect_poses_2d', detect_poses_2d)
+    cache_manager = pose_labelbox.cache.CacheManager(cache_directories=[tmp_path / 'frames'])
+    honeycomb = pose_labelbox.loadtest.FakeHoneycomb(environment_id='environment', camera_ids=['camera_a'])
+    with pose_labelbox.loadtest.install_fake_services(honeycomb=honeycomb):
+        returncode = pose_labelbox.core.run_pose_detection_2d_chunk(
+            inference_id='inference',
+            environment_id='environment',
+            camera_id='camera_a',
+            chunk_start=start,
+            chunk_end=start + video_duration,
+            chunk_output_directory_path=tmp_path / 'alphapose_output',
+            video_duration=video_duration,
+            frames_per_video=20,
+            local_frames_directory=tmp_path / 'frames',
+            image_list_parent_directory=tmp_path / 'image_lists',
+            local_video_directory=tmp_path / 'videos',
+            cache_manager=cache_manager,
+        )
+    assert returncode == 0
+    # No frames were on disk, so the chunk extracted them before listing
+    assert len(image_lists) == 1
+    assert len(image_lists[0]) == 20
+    assert all(pathlib.Path(path).is_file() for path in image_lists[0])
+
+def test_frame_extraction_is_profiled_per_camera(tmp_path):
+    pytest.importorskip('ffmpeg')
+    pytest.importorskip('cv_utils')
+    with pose_labelbox.profiling.profile_run(run_directory=tmp_path / 'profiles', run_id='test', trace_memory=False) as run_directory_path:
+        extract_synthetic_frames(tmp_path, tmp_path / 'frames')
+    # One profile for the camera rather than one for the whole stage
+    stage_directory_path = run_directory_path / 'extract_frames'
+    assert len(list(stage_directory_path.glob('*.prof'))) == 1
+    assert len(list(stage_directory_path.glob('camera_a_*.prof'))) == 1
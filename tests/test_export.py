@@ -0,0 +1,117 @@
+import pytest
+import pose_labelbox.alphapose
+import pose_labelbox.core
+import pose_labelbox.export
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+cv = pytest.importorskip('cv2')
+
+def test_generate_shard_indices_closes_shards_on_frame_boundaries():
+    frame_keys = [('a', 0), ('a', 0), ('a', 1), ('a', 1), ('a', 1), ('b', 0)]
+    assert pose_labelbox.export.generate_shard_indices(frame_keys, shard_size=1) == [0, 0, 1, 1, 1, 2]
+    assert pose_labelbox.export.generate_shard_indices(frame_keys, shard_size=3) == [0, 0, 0, 0, 0, 1]
+    with pytest.raises(ValueError):
+        pose_labelbox.export.generate_shard_indices(frame_keys, shard_size=0)
+
+def test_generate_crop_corners():
+    assert pose_labelbox.export.generate_crop_corners([[10.0, 20.0], [30.0, 60.0]], (100, 100, 3), crop_padding=0.1) == [[8, 16], [32, 64]]
+    assert pose_labelbox.export.generate_crop_corners([[-10.0, 90.0], [10.0, 120.0]], (100, 100, 3), crop_padding=0.0) == [[0, 90], [10, 100]]
+    assert pose_labelbox.export.generate_crop_corners([[np.nan, 0.0], [10.0, 10.0]], (100, 100, 3)) is None
+    assert pose_labelbox.export.generate_crop_corners([[200.0, 0.0], [210.0, 10.0]], (100, 100, 3)) is None
+
+def test_export_person_crops_is_resumable(tmp_path):
+    start = pd.Timestamp('2023-01-01T08:00:00Z')
+    end = start + pd.Timedelta(seconds=1)
+    camera_id = 'camera'
+    poses_2d_list = list()
+    label_data_list = list()
+    for frame_index in range(5):
+        timestamp = start + frame_index*pd.Timedelta(milliseconds=100)
+        frame_path = pose_labelbox.core.generate_frame_path(
+            environment_id='environment',
+            camera_id=camera_id,
+            timestamp=timestamp,
+            local_frames_directory=tmp_path / 'frames',
+        )
+        frame_path.parent.mkdir(parents=True, exist_ok=True)
+        image = np.zeros((100, 200, 3), dtype='uint8')
+        image[:, :, 1] = 10*frame_index
+        cv.imwrite(str(frame_path), image)
+        for pose_track_label, x_min in [(1, 10.0), (2, 100.0)]:
+            poses_2d_list.append({
+                'pose_2d_id': f'{pose_track_label}-{frame_index}',
+                'timestamp': timestamp,
+                'pose_track_label': pose_track_label,
+                'bounding_box_corners': np.array([[x_min, 10.0], [x_min + 40.0, 90.0]]),
+                'keypoint_coordinates_2d': np.full((17, 2), x_min),
+                'keypoint_quality_2d': np.ones(17),
+            })
+            label_data_list.append({
+                'camera_id': camera_id,
+                'pose_track_2d_label': pose_track_label,
+                # Label timestamps need not match detection timestamps exactly
+                'timestamp': timestamp + pd.Timedelta(milliseconds=1),
+                'person_name': 'Unusable bounding box' if pose_track_label == 2 and frame_index == 4 else f'person {pose_track_label}',
+            })
+    alphapose_output_directory_path = pose_labelbox.alphapose.generate_alphapose_output_directory_path(
+        inference_id='inference',
+        camera_id=camera_id,
+        start=start,
+        end=end,
+        alphapose_output_parent_directory=tmp_path / 'alphapose_output',
+    )
+    alphapose_output_directory_path.mkdir(parents=True)
+    pd.DataFrame(poses_2d_list).set_index('pose_2d_id').to_pickle(
+        alphapose_output_directory_path / pose_labelbox.alphapose.generate_parsed_alphapose_output_filename(
+            camera_id=camera_id,
+            start=start,
+            end=end,
+        )
+    )
+    label_data = pd.DataFrame(label_data_list).set_index(['camera_id', 'pose_track_2d_label', 'timestamp'])
+    export_arguments = dict(
+        label_data=label_data,
+        inference_id='inference',
+        environment_id='environment',
+        start=start,
+        end=end,
+        export_parent_directory=tmp_path / 'person_crops',
+        shard_size=3,
+        crop_padding=0.0,
+        crop_image_extension='png',
+        num_workers=1,
+        alphapose_output_parent_directory=tmp_path / 'alphapose_output',
+        local_frames_directory=tmp_path / 'frames',
+    )
+    export_directory_path = pose_labelbox.export.export_person_crops(**export_arguments)
+    assert export_directory_path == tmp_path / 'person_crops' / 'inference'
+    shard_indexes = list(pose_labelbox.export.load_person_crop_index(export_directory_path))
+    assert [len(shard_index) for shard_index in shard_indexes] == [4, 4, 1]
+    index = pd.concat(shard_indexes, ignore_index=True)
+    assert sorted(index['shard_index'].unique().tolist()) == [0, 1, 2]
+    assert 'Unusable bounding box' not in index['person_name'].tolist()
+    crop = index.loc[index['member_name'] == '2-3.png'].iloc[0]
+    assert crop['person_name'] == 'person 2'
+    assert crop['timestamp'] == start + pd.Timedelta(milliseconds=300)
+    assert crop['crop_corners'].tolist() == [[100, 10], [140, 90]]
+    image = pose_labelbox.export.read_person_crop(export_directory_path, crop['shard_index'], crop['member_name'])
+    assert image.shape == (80, 40, 3)
+    assert np.all(image[:, :, 1] == 30)
+    # Rerunning after losing a shard only rewrites that shard
+    shard_path = pose_labelbox.export.generate_shard_path(export_directory_path, 1)
+    pose_labelbox.export.generate_shard_index_path(export_directory_path, 1).unlink()
+    shard_path.unlink()
+    untouched_mtime = pose_labelbox.export.generate_shard_path(export_directory_path, 0).stat().st_mtime_ns
+    pose_labelbox.export.export_person_crops(**export_arguments)
+    resumed_index = pd.concat(pose_labelbox.export.load_person_crop_index(export_directory_path), ignore_index=True)
+    assert shard_path.is_file()
+    assert pose_labelbox.export.generate_shard_path(export_directory_path, 0).stat().st_mtime_ns == untouched_mtime
+    assert resumed_index['member_name'].tolist() == index['member_name'].tolist()
+    # Crop records are planned per shard
+    shard_crop_records = pd.read_pickle(pose_labelbox.export.generate_shard_plan_path(export_directory_path, 2))
+    assert shard_crop_records['shard_index'].tolist() == [2]
+    # Shards written by a bounded worker pool match the sequential ones
+    pose_labelbox.export.export_person_crops(**{**export_arguments, 'export_id': 'parallel', 'num_workers': 2})
+    parallel_index = pd.concat(pose_labelbox.export.load_person_crop_index(tmp_path / 'person_crops' / 'parallel'), ignore_index=True)
+    assert parallel_index['member_name'].tolist() == index['member_name'].tolist()
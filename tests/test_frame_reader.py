@@ -0,0 +1,89 @@
+import shutil
+import pytest
+
+pd = pytest.importorskip('pandas')
+np = pytest.importorskip('numpy')
+
+import pose_labelbox.frame_reader
+import pose_labelbox.core
+import pose_labelbox.loadtest
+import pose_labelbox.process_video
+
+def test_nearby_frames_are_batched_into_one_decode():
+    video_start = pd.Timestamp('2023-01-01T00:00:00Z')
+    video_metadata = pd.DataFrame([{
+        'data_id': 'a',
+        'environment_id': 'environment',
+        'camera_id': 'camera',
+        'video_start': video_start,
+        'fps': 10,
+        'duration_seconds': 10.0,
+        'frame_offsets': None,
+    }]).set_index('data_id')
+    frame_reader = pose_labelbox.frame_reader.VideoFrameReader(
+        video_metadata=video_metadata,
+        max_batch_gap_frames=10,
+    )
+    frame_locations = [
+        frame_reader.locate_frame('camera', video_start + pd.Timedelta(milliseconds=100*frame_number))
+        for frame_number in [40, 0, 3, 5, 90]
+    ]
+    batches = frame_reader.generate_decode_batches(frame_locations)
+    assert [[frame_number for frame_number, _ in frame_batch] for _, frame_batch in batches] == [[0, 3, 5], [40], [90]]
+
+def test_frame_offsets_in_milliseconds_are_normalized():
+    frame_offsets = pose_labelbox.frame_reader.normalize_frame_offsets(
+        frame_offsets=[0, 100, 200],
+        fps=10,
+        duration_seconds=0.3,
+    )
+    assert np.allclose(frame_offsets, [0.0, 0.1, 0.2])
+
+def test_decoded_frames_match_extracted_frames(tmp_path):
+    pytest.importorskip('ffmpeg')
+    cv2 = pytest.importorskip('cv2')
+    if shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None:
+        pytest.skip('ffmpeg and ffprobe executables are required')
+    video_start = pd.Timestamp('2023-01-01T08:00:00Z')
+    video_duration = pd.Timedelta(seconds=2)
+    video_path = pose_labelbox.loadtest.generate_synthetic_video(
+        pose_labelbox.core.generate_video_path(
+            environment_id='environment',
+            camera_id='camera',
+            video_start=video_start,
+            local_video_directory=tmp_path / 'videos',
+        ),
+        video_duration=video_duration,
+        frame_width=64,
+        frame_height=48,
+    )
+    pose_labelbox.process_video.extract_video_frames(
+        video_path=video_path,
+        frame_directory_path=tmp_path / 'frames',
+        ffmpeg_frame_identifier='%03d.png',
+    )
+    extracted_frames = [cv2.imread(str(frame_path)) for frame_path in sorted((tmp_path / 'frames').glob('*.png'))]
+    assert len(extracted_frames) == 20
+    video_metadata = pd.DataFrame([{
+        'data_id': 'a',
+        'environment_id': 'environment',
+        'camera_id': 'camera',
+        'video_start': video_start,
+        'fps': 10,
+        'duration_seconds': 2.0,
+        'frame_offsets': None,
+    }]).set_index('data_id')
+    frame_reader = pose_labelbox.frame_reader.VideoFrameReader(
+        video_metadata=video_metadata,
+        local_video_directory=tmp_path / 'videos',
+        video_duration=video_duration,
+        max_batch_gap_frames=5,
+    )
+    # Out of order and with gaps, so the frames come from several decode passes
+    frame_numbers = [19, 0, 1, 2, 10, 7, 18]
+    frames = frame_reader.read_frames(
+        'camera',
+        [video_start + pd.Timedelta(milliseconds=100*frame_number) for frame_number in frame_numbers],
+    )
+    for frame_number, frame in zip(frame_numbers, frames):
+        assert np.array_equal(frame, extracted_frames[frame_number]), frame_number
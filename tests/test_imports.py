@@ -0,0 +1,64 @@
+import subprocess
+import importlib
+import inspect
+import json
+import sys
+import pose_labelbox
+
+HEAVY_MODULES = [
+    'pandas',
+    'numpy',
+    'labelbox',
+    'honeycomb_io',
+    'video_io',
+    'cv_utils',
+    'cv2',
+    'ffmpeg',
+    'tqdm',
+    'toml',
+    'slugify',
+]
+
+def run_in_fresh_interpreter(code):
+    completed_process = subprocess.run(
+        [sys.executable, '-c', code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed_process.stdout)
+
+def test_package_import_does_not_import_heavy_dependencies():
+    imported_modules = run_in_fresh_interpreter(
+        'import sys, json\n'
+        'import importlib\n'
+        'import pose_labelbox\n'
+        'for submodule_name in pose_labelbox._SUBMODULE_EXPORTS:\n'
+        '    importlib.import_module(f"pose_labelbox.{submodule_name}")\n'
+        f'print(json.dumps(sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules)))\n'
+    )
+    assert imported_modules == []
+
+def test_lazy_exports_match_submodule_definitions():
+    for submodule_name, attribute_names in pose_labelbox._SUBMODULE_EXPORTS.items():
+        submodule = importlib.import_module(f'pose_labelbox.{submodule_name}')
+        defined_names = {
+            name for name, value in vars(submodule).items()
+            if not name.startswith('_')
+            and name != 'logger'
+            and not inspect.ismodule(value)
+            and not isinstance(value, pose_labelbox.utils.LazyModule)
+            and (
+                not (inspect.isfunction(value) or inspect.isclass(value))
+                or value.__module__ == submodule.__name__
+            )
+        }
+        assert defined_names == set(attribute_names), submodule_name
+
+def test_lazy_module_missing_attribute_raises_attribute_error():
+    lazy_json = pose_labelbox.utils.lazy_import('json')
+    assert lazy_json.dumps is json.dumps
+    # Submodules are imported on first access
+    assert lazy_json.tool is importlib.import_module('json.tool')
+    assert not hasattr(lazy_json, 'missing_attribute')
+    assert getattr(lazy_json, 'missing_attribute', None) is None
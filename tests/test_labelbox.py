@@ -0,0 +1,86 @@
+import datetime
+import types
+import pytest
+import pose_labelbox.labelbox
+
+pd = pytest.importorskip('pandas')
+
+def test_frame_offsets_round_trip():
+    frame_offsets = [0, 10, 20, 30, 33, 34, 35, 50]
+    encoded_frame_offsets = pose_labelbox.labelbox.encode_frame_offsets(frame_offsets)
+    assert encoded_frame_offsets == '0,10x3,3,1x2,15'
+    assert pose_labelbox.labelbox.decode_frame_offsets(encoded_frame_offsets) == frame_offsets
+    assert pose_labelbox.labelbox.decode_frame_offsets(pose_labelbox.labelbox.encode_frame_offsets([])) == []
+
+def generate_data_row(video_start, video_end, frames, **metadata):
+    metadata = {
+        'inference_id': 'inference',
+        'environment_id': 'environment',
+        'labeling_period_start_isoformat': video_start.strftime(pose_labelbox.labelbox.LABELBOX_DATETIME_FORMAT),
+        'labeling_period_end_isoformat': video_end.strftime(pose_labelbox.labelbox.LABELBOX_DATETIME_FORMAT),
+        'camera_id': 'camera',
+        'pose_track_2d_label': '7',
+        'video_start_isoformat': video_start.strftime(pose_labelbox.labelbox.LABELBOX_DATETIME_FORMAT),
+        'video_end_isoformat': video_end.strftime(pose_labelbox.labelbox.LABELBOX_DATETIME_FORMAT),
+        'num_frames': str(round((video_end - video_start)/datetime.timedelta(milliseconds=100))),
+        **metadata,
+    }
+    frames = {
+        str(frame_number): {'classifications': [{'radio_answer': {'name': person_name}}]}
+        for frame_number, person_name in frames.items()
+    }
+    return {
+        'metadata_fields': [{'schema_name': name, 'value': value} for name, value in metadata.items()],
+        'projects': {'project': {'labels': [{'annotations': {'frames': frames}}]}},
+    }
+
+def generate_fake_client(data_rows):
+    export_task = types.SimpleNamespace(
+        wait_till_done=lambda: None,
+        errors=None,
+        result=data_rows,
+    )
+    project = types.SimpleNamespace(export_v2=lambda params, filters: export_task)
+    return types.SimpleNamespace(get_project=lambda project_id: project)
+
+def test_sparse_labels_are_mapped_onto_full_timeline():
+    video_start = datetime.datetime(2023, 1, 1, 8, 0, 0, tzinfo=datetime.timezone.utc)
+    data_row = generate_data_row(
+        video_start=video_start,
+        video_end=video_start + datetime.timedelta(seconds=2),
+        frames={1: 'alice', 2: 'bob'},
+        num_frames='3',
+        frame_offsets=pose_labelbox.labelbox.encode_frame_offsets([0, 5, 19]),
+    )
+    label_data = pose_labelbox.labelbox.fetch_labels(
+        project_id='project',
+        client=generate_fake_client([data_row]),
+    )
+    person_names = label_data['person_name'].tolist()
+    assert len(person_names) == 20
+    assert person_names[:5] == ['alice']*5
+    assert person_names[5:] == ['bob']*15
+
+def test_fixed_length_video_labels_are_reassembled():
+    video_start = datetime.datetime(2023, 1, 1, 8, 0, 0, tzinfo=datetime.timezone.utc)
+    video_duration = datetime.timedelta(seconds=1)
+    data_rows = [
+        generate_data_row(
+            video_start=video_start + video_segment_index*video_duration,
+            video_end=video_start + (video_segment_index + 1)*video_duration,
+            frames=frames,
+            video_segment_index=str(video_segment_index),
+            video_segment_offset=str(10*video_segment_index),
+        )
+        for video_segment_index, frames in [(1, {5: 'bob', 10: 'bob'}), (0, {1: 'alice'})]
+    ]
+    label_data = pose_labelbox.labelbox.fetch_labels(
+        project_id='project',
+        client=generate_fake_client(data_rows),
+    )
+    person_names = label_data['person_name'].tolist()
+    # Labels carry over the boundary between the two videos
+    assert len(person_names) == 20
+    assert person_names[:14] == ['alice']*14
+    assert person_names[14:] == ['bob']*6
+    assert (label_data['pose_track_segment_index'] == 0).all()
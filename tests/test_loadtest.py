@@ -0,0 +1,114 @@
+import shutil
+import datetime
+import pytest
+import pose_labelbox.core
+import pose_labelbox.labelbox
+import pose_labelbox.loadtest
+import pose_labelbox.metrics
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('cv_utils')
+pytest.importorskip('ffmpeg')
+
+def test_fake_service_injects_errors_and_counts_traffic():
+    service = pose_labelbox.loadtest.FakeService(name='service', error_rate=0.5, seed=1)
+    num_errors = 0
+    for _ in range(100):
+        try:
+            service.request('upload', num_bytes=10)
+        except pose_labelbox.loadtest.FakeServiceError:
+            num_errors += 1
+    assert 30 < num_errors < 70
+    assert service.summary() == {'num_requests': 100, 'num_errors': num_errors, 'num_bytes': 1000}
+    with pytest.raises(ValueError):
+        pose_labelbox.loadtest.FakeService(name='service', error_rate=1.5)
+
+def test_fake_services_are_installed_and_restored():
+    honeycomb = pose_labelbox.loadtest.FakeHoneycomb(environment_id='environment', camera_ids=['a', 'b'])
+    original_honeycomb_io = pose_labelbox.core.honeycomb_io
+    original_lb = pose_labelbox.labelbox.lb
+    with pose_labelbox.loadtest.install_fake_services(honeycomb=honeycomb):
+        assert pose_labelbox.core.honeycomb_io is honeycomb
+        assert pose_labelbox.labelbox.honeycomb_io is honeycomb
+        assert pose_labelbox.labelbox.lb is original_lb
+        assert pose_labelbox.core.generate_target_camera_ids(
+            start=datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc),
+            end=datetime.datetime(2023, 1, 2, tzinfo=datetime.timezone.utc),
+            environment_id='environment',
+            camera_ids=['b'],
+        ) == ['b']
+    assert pose_labelbox.core.honeycomb_io is original_honeycomb_io
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg not installed')
+def test_run_load_test_covers_every_stage(tmp_path):
+    report = pose_labelbox.loadtest.run_load_test(
+        working_directory=tmp_path,
+        num_cameras=1,
+        duration=datetime.timedelta(seconds=10),
+        frame_width=160,
+        frame_height=90,
+        num_people=1,
+        honeycomb_latency=0.0,
+        video_service_latency=0.0,
+        labelbox_latency=0.0,
+        report_path=tmp_path / 'report.json',
+    )
+    assert report.index.tolist() == list(pose_labelbox.loadtest.LOAD_TEST_STAGE_ITEM_COUNTERS.keys())
+    assert report['error'].isna().all()
+    assert report['num_attempts'].tolist() == [1]*8
+    assert report.loc['download_videos', 'num_items'] == 1
+    assert report.loc['extract_frames', 'num_items'] == 100
+    assert report.loc['run_pose_detection_2d', 'num_items'] == 100
+    assert report.loc['generate_bounding_box_overlays', 'num_items'] == 100
+    assert report.loc['create_project', 'num_items'] == 1
+    # Labels on the first and last frame of the video fill the whole track
+    assert report.loc['fetch_labels', 'num_items'] == 100
+    assert report.loc['download_videos', 'video_service_num_bytes'] > 0
+    assert report.loc['create_project', 'labelbox_num_bytes'] > 0
+    assert (report['peak_rss_bytes'] > 0).all()
+    assert (tmp_path / 'report.json').is_file()
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg not installed')
+def test_run_load_test_recovers_from_labelbox_errors(tmp_path, monkeypatch):
+    # The first upload always fails, after the dataset has been created
+    upload_file = pose_labelbox.loadtest.FakeLabelboxClient.upload_file
+    failed_uploads = list()
+    def fail_first_upload(self, path):
+        if len(failed_uploads) == 0:
+            failed_uploads.append(path)
+            raise pose_labelbox.loadtest.FakeServiceError('Injected labelbox error in upload_file')
+        return upload_file(self, path)
+    monkeypatch.setattr(pose_labelbox.loadtest.FakeLabelboxClient, 'upload_file', fail_first_upload)
+    report = pose_labelbox.loadtest.run_load_test(
+        working_directory=tmp_path,
+        num_cameras=1,
+        duration=datetime.timedelta(seconds=10),
+        frame_width=160,
+        frame_height=90,
+        num_people=1,
+        honeycomb_latency=0.0,
+        video_service_latency=0.0,
+        labelbox_latency=0.0,
+        labelbox_error_rate=0.05,
+        max_stage_attempts=20,
+    )
+    assert len(failed_uploads) == 1
+    assert report['error'].isna().all()
+    assert report.loc['create_project', 'num_attempts'] > 1
+    # The retry starts from a new dataset rather than the empty one
+    assert report.loc['create_project', 'num_items'] == 1
+    assert report.loc['fetch_labels', 'num_items'] == 100
+
+def test_load_test_stage_reports_unexpected_errors():
+    def stage_function():
+        raise ValueError('No objects to concatenate')
+    stage_report, result, error = pose_labelbox.loadtest.run_load_test_stage(
+        stage_name='fetch_labels',
+        stage_function=stage_function,
+        metrics_sink=pose_labelbox.metrics.InMemoryMetricsSink(),
+        services=[],
+    )
+    assert result is None
+    assert isinstance(error, ValueError)
+    assert stage_report['num_attempts'] == 1
+    assert 'No objects to concatenate' in stage_report['error']
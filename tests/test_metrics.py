@@ -0,0 +1,21 @@
+import pose_labelbox.metrics
+
+def test_in_memory_sink_aggregates_counters_and_timings():
+    sink = pose_labelbox.metrics.InMemoryMetricsSink()
+    with pose_labelbox.metrics.metrics_sink(sink):
+        pose_labelbox.metrics.increment_counter('frames_extracted', 100, camera_id='a')
+        pose_labelbox.metrics.increment_counter('frames_extracted', 100, camera_id='a')
+        pose_labelbox.metrics.record_timing('extract_frames', 2.0, camera_id='a')
+        pose_labelbox.metrics.record_timing('extract_frames', 4.0, camera_id='a')
+    assert pose_labelbox.metrics.get_metrics_sink() is None
+    summary = {(item['type'], item['name']): item for item in sink.summary()}
+    assert summary[('counter', 'frames_extracted')]['total'] == 200
+    assert summary[('timing', 'extract_frames')]['mean'] == 3.0
+    assert summary[('timing', 'extract_frames')]['max'] == 4.0
+
+def test_prometheus_textfile_sink(tmp_path):
+    path = tmp_path / 'pose_labelbox.prom'
+    sink = pose_labelbox.metrics.PrometheusTextfileMetricsSink(path)
+    with pose_labelbox.metrics.metrics_sink(sink):
+        pose_labelbox.metrics.increment_counter('videos_downloaded', 3, camera_id='a')
+    assert 'pose_labelbox_videos_downloaded_total{camera_id="a"} 3' in path.read_text()
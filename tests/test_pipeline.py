@@ -0,0 +1,38 @@
+import time
+import pytest
+import pose_labelbox.metrics
+import pose_labelbox.pipeline
+
+def test_pipeline_processes_every_task_and_reports_stalls():
+    stored = dict()
+    sink = pose_labelbox.metrics.InMemoryMetricsSink()
+    with pose_labelbox.metrics.metrics_sink(sink):
+        num_processed = pose_labelbox.pipeline.run_io_pipeline(
+            tasks=range(50),
+            load_function=lambda task: task*2,
+            process_function=lambda task, loaded: loaded + 1,
+            store_function=lambda task, processed: (time.sleep(0.002), stored.__setitem__(task, processed)),
+            num_loader_threads=3,
+            num_storer_threads=1,
+            queue_depth=2,
+            stage='test',
+            camera_id='a',
+        )
+    assert num_processed == 50
+    assert stored == {task: task*2 + 1 for task in range(50)}
+    summary = {(item['type'], item['name']): item for item in sink.summary()}
+    assert summary[('counter', 'test_write_queue_full_stalls')]['total'] > 0
+    assert summary[('timing', 'test_write_queue_full_wait')]['labels'] == {'camera_id': 'a'}
+
+def test_pipeline_errors_are_raised():
+    def store(task, processed):
+        if task == 7:
+            raise OSError('disk full')
+    with pytest.raises(OSError, match='disk full'):
+        pose_labelbox.pipeline.run_io_pipeline(
+            tasks=range(100),
+            load_function=lambda task: task,
+            process_function=lambda task, loaded: loaded,
+            store_function=store,
+            queue_depth=1,
+        )
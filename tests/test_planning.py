@@ -0,0 +1,144 @@
+import pytest
+import pose_labelbox.alphapose
+import pose_labelbox.core
+import pose_labelbox.overlay
+import pose_labelbox.planning
+import datetime
+import pathlib
+import json
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+def test_load_throughput_calibration(tmp_path):
+    events = [
+        ('counter', 'videos_downloaded', 4, {'camera_id': 'a'}),
+        ('counter', 'videos_downloaded', 6, {'camera_id': 'b'}),
+        ('counter', 'video_bytes_downloaded', 5000, {'camera_id': 'a'}),
+        ('timing', 'download_videos', 20.0, {}),
+        ('counter', 'images_detected', 1000, {'camera_id': 'a'}),
+        ('counter', 'overlay_images_generated', 250, {'camera_id': 'a'}),
+        ('timing', 'run_pose_detection_2d', 50.0, {}),
+    ]
+    with open(tmp_path / 'metrics.jsonl', 'w') as fp:
+        for event_type, name, value, labels in events:
+            fp.write(json.dumps({'type': event_type, 'name': name, 'value': value, 'labels': labels, 'time': 0.0}) + '\n')
+    calibration = pose_labelbox.planning.load_throughput_calibration(tmp_path / '*.jsonl')
+    assert calibration == {
+        'download_videos_seconds_per_item': 2.0,
+        'download_videos_bytes_per_item': 500.0,
+        'detect_poses_2d_seconds_per_item': 0.05,
+        'overlay_images_per_frame': 0.25,
+    }
+
+def test_plan_run_marks_existing_artifacts(tmp_path, monkeypatch):
+    start = datetime.datetime(2023, 1, 1, 8, 0, 0, tzinfo=datetime.timezone.utc)
+    end = start + datetime.timedelta(seconds=20)
+    video_starts = pose_labelbox.core.generate_target_video_starts(start=start, end=end)
+    monkeypatch.setattr(pose_labelbox.core, 'generate_target_camera_ids', lambda **kwargs: ['parsed', 'unparsed'])
+    directories = {
+        'local_video_directory': tmp_path / 'videos',
+        'local_frames_directory': tmp_path / 'frames',
+        'alphapose_output_parent_directory': tmp_path / 'alphapose_output',
+        'bounding_box_overlay_parent_directory': tmp_path / 'overlays',
+        'bounding_box_overlay_video_parent_directory': tmp_path / 'overlay_videos',
+    }
+    # First video of each camera downloaded, and its frames half extracted
+    for camera_id in ['parsed', 'unparsed']:
+        video_path = pose_labelbox.core.generate_video_path(
+            environment_id='environment',
+            camera_id=camera_id,
+            video_start=video_starts[0],
+            local_video_directory=directories['local_video_directory'],
+        )
+        video_path.parent.mkdir(parents=True)
+        video_path.write_bytes(b'x'*1000)
+        frame_directory_path = pose_labelbox.core.generate_frame_directory_path(
+            environment_id='environment',
+            camera_id=camera_id,
+            video_start=video_starts[0],
+            local_frames_directory=directories['local_frames_directory'],
+        )
+        frame_directory_path.mkdir(parents=True)
+        for frame_filename in pose_labelbox.core.generate_frame_filenames(
+            environment_id='environment',
+            camera_id=camera_id,
+            video_start=video_starts[0],
+        )[:50]:
+            (frame_directory_path / frame_filename).write_bytes(b'x'*10)
+    # Two tracks parsed for one camera, with overlays for the first track
+    alphapose_output_directory_path = pose_labelbox.alphapose.generate_alphapose_output_directory_path(
+        inference_id='inference',
+        camera_id='parsed',
+        start=start,
+        end=end,
+        alphapose_output_parent_directory=directories['alphapose_output_parent_directory'],
+    )
+    alphapose_output_directory_path.mkdir(parents=True)
+    (alphapose_output_directory_path / 'alphapose-results.json').write_text('[]')
+    poses_2d = pd.DataFrame({
+        'timestamp': [start, start + datetime.timedelta(seconds=1), start + datetime.timedelta(seconds=2)],
+        'pose_track_label': [1, 1, 2],
+    })
+    poses_2d.to_pickle(alphapose_output_directory_path / pose_labelbox.alphapose.generate_parsed_alphapose_output_filename(
+        camera_id='parsed',
+        start=start,
+        end=end,
+    ))
+    overlay_paths = pose_labelbox.overlay.generate_bounding_box_overlay_paths(
+        inference_id='inference',
+        camera_ids='parsed',
+        timestamps=pd.date_range(start, start + datetime.timedelta(seconds=1), freq='100ms'),
+        pose_track_labels=1,
+        bounding_box_overlay_parent_directory=directories['bounding_box_overlay_parent_directory'],
+    )
+    for overlay_path in overlay_paths:
+        overlay_path = pathlib.Path(overlay_path)
+        overlay_path.parent.mkdir(parents=True, exist_ok=True)
+        overlay_path.write_bytes(b'x'*100)
+    work_units = pose_labelbox.planning.plan_run(
+        inference_id='inference',
+        start=start,
+        end=end,
+        environment_id='environment',
+        **directories,
+    )
+    stage_counts = work_units.groupby('stage').agg(
+        num_units=('done', 'size'),
+        num_units_done=('done', 'sum'),
+        num_items_done=('num_items_done', 'sum'),
+    )
+    assert stage_counts.loc['download_videos'].tolist() == [4, 2, 2]
+    assert stage_counts.loc['extract_frames'].tolist() == [4, 0, 100]
+    assert stage_counts.loc['detect_poses_2d'].tolist() == [2, 1, 200]
+    assert stage_counts.loc['parse_alphapose_output'].tolist() == [2, 1, 200]
+    # One unit per parsed track plus one for the unparsed camera
+    overlay_units = work_units.loc[work_units['stage'] == 'generate_bounding_box_overlays']
+    assert overlay_units['num_items'].tolist()[:2] == [11, 1]
+    assert overlay_units['done'].tolist() == [True, False, False]
+    assert np.isnan(overlay_units['num_items'].iloc[2])
+    estimates = pose_labelbox.planning.estimate_run_costs(
+        work_units,
+        calibration={
+            'download_videos_seconds_per_item': 2.0,
+            'overlay_images_per_frame': 0.5,
+            'generate_bounding_box_overlays_seconds_per_item': 0.1,
+        },
+    )
+    assert estimates.loc['download_videos', 'estimated_seconds'] == 4.0
+    # Disk rates fall back to the sizes of existing artifacts
+    assert estimates.loc['download_videos', 'estimated_disk_bytes'] == 2000.0
+    assert estimates.loc['extract_frames', 'estimated_disk_bytes'] == 300*10.0
+    assert estimates.loc['generate_bounding_box_overlays', 'num_items_pending'] == 1 + 100
+    assert estimates.loc['generate_bounding_box_overlays', 'estimated_seconds'] == pytest.approx(10.1)
+    assert estimates.loc['generate_bounding_box_overlays', 'estimated_disk_bytes'] == 101*100.0
+    assert np.isnan(estimates.loc['create_dataset', 'estimated_upload_bytes'])
+    # Without an overlay ratio the unparsed camera's overlays are unknown, so
+    # the stage estimate is too
+    estimates = pose_labelbox.planning.estimate_run_costs(
+        work_units,
+        calibration={'generate_bounding_box_overlays_seconds_per_item': 0.1},
+    )
+    assert np.isnan(estimates.loc['generate_bounding_box_overlays', 'num_items_pending'])
+    assert np.isnan(estimates.loc['generate_bounding_box_overlays', 'estimated_seconds'])
+    assert estimates.loc['download_videos', 'num_items_pending'] == 2
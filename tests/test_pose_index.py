@@ -0,0 +1,45 @@
+import pytest
+import pose_labelbox.pose_index
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+def generate_poses_2d():
+    start = pd.Timestamp('2023-01-01T08:00:00Z')
+    poses_2d_list = list()
+    for pose_track_label, x_min in [(1, 0.0), (2, 500.0), (3, 1000.0)]:
+        for frame_index in range(10):
+            if pose_track_label == 3 and frame_index < 5:
+                continue
+            poses_2d_list.append({
+                'pose_track_label': pose_track_label,
+                'timestamp': start + frame_index*pd.Timedelta(milliseconds=100),
+                'bounding_box_corners': np.array([[x_min + frame_index, 100.0], [x_min + frame_index + 200.0, 500.0]]),
+            })
+    return start, pd.DataFrame(poses_2d_list).sample(frac=1.0, random_state=0)
+
+def test_pose_index_lookups():
+    start, poses_2d = generate_poses_2d()
+    pose_index = pose_labelbox.pose_index.PoseIndex(poses_2d, grid_cell_size=64, min_grid_rows=0)
+    assert pose_index.num_frames == 10
+    assert pose_index.poses_at(start + pd.Timedelta(milliseconds=200))['pose_track_label'].tolist() == [1, 2]
+    assert pose_index.poses_at(start + pd.Timedelta(milliseconds=700))['pose_track_label'].tolist() == [1, 2, 3]
+    assert len(pose_index.poses_at(start + pd.Timedelta(seconds=5))) == 0
+    assert len(pose_index.poses_between(start, start + pd.Timedelta(milliseconds=500))) == 10
+    track = pose_index.poses_for_track(3)
+    assert len(track) == 5
+    assert track['timestamp'].is_monotonic_increasing
+    assert len(pose_index.track_frame_rows(3, 2)) == 0
+    assert len(pose_index.track_frame_rows(3, 6)) == 1
+    assert len(pose_index.poses_for_track(4)) == 0
+    overlapping = pose_index.poses_overlapping(
+        start + pd.Timedelta(milliseconds=600),
+        [[650.0, 0.0], [1010.0, 150.0]],
+    )
+    assert overlapping['pose_track_label'].tolist() == [2, 3]
+    overlapping = pose_index.poses_overlapping(
+        start + pd.Timedelta(milliseconds=600),
+        [[506.0, 100.0], [706.0, 500.0]],
+        min_iou=0.5,
+    )
+    assert overlapping['pose_track_label'].tolist() == [2]
@@ -0,0 +1,33 @@
+import threading
+import pose_labelbox.profiling
+
+def test_profile_stage_is_noop_when_disabled():
+    assert pose_labelbox.profiling.profile_stage('parse_alphapose_output', camera_id='a') is pose_labelbox.profiling._NULL_CONTEXT
+
+def test_profile_stage_writes_profile_and_summary(tmp_path):
+    with pose_labelbox.profiling.profile_run(run_directory=tmp_path, run_id='test') as run_directory_path:
+        with pose_labelbox.profiling.profile_stage('parse_alphapose_output', camera_id='a'):
+            sum(range(1000))
+    stage_directory_path = run_directory_path / 'parse_alphapose_output'
+    assert len(list(stage_directory_path.glob('a_*.prof'))) == 1
+    summary_paths = list(stage_directory_path.glob('a_*.txt'))
+    assert len(summary_paths) == 1
+    assert 'Peak traced memory' in summary_paths[0].read_text()
+
+def test_stages_are_profiled_per_thread(tmp_path):
+    with pose_labelbox.profiling.profile_run(run_directory=tmp_path, run_id='test') as run_directory_path:
+        with pose_labelbox.profiling.profile_stage('create_project'):
+            # Nested on the same thread: folded into the enclosing profile
+            with pose_labelbox.profiling.profile_stage('create_dataset'):
+                sum(range(1000))
+            # On another thread: profiled on its own
+            thread = threading.Thread(target=profile_camera_stage)
+            thread.start()
+            thread.join()
+    assert len(list((run_directory_path / 'create_project').glob('all_cameras_*.prof'))) == 1
+    assert not (run_directory_path / 'create_dataset').exists()
+    assert len(list((run_directory_path / 'parse_alphapose_output').glob('a_*.prof'))) == 1
+
+def profile_camera_stage():
+    with pose_labelbox.profiling.profile_stage('parse_alphapose_output', camera_id='a'):
+        sum(range(1000))
@@ -0,0 +1,51 @@
+import pytest
+import pose_labelbox.overlay
+import pose_labelbox.rendering
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+pytest.importorskip('cv_utils')
+
+@pytest.mark.parametrize('output_scale', [1.0, 0.5])
+@pytest.mark.parametrize('show_bounding_box', [True, False])
+def test_in_place_renderer_matches_overlay(show_bounding_box, output_scale):
+    image = pose_labelbox.rendering.resize_image(
+        image=np.random.default_rng(0).integers(0, 256, size=(480, 640, 3), dtype='uint8'),
+        output_scale=output_scale,
+    )
+    original_image = image.copy()
+    timestamp = pd.Timestamp('2023-01-01T08:00:00.1Z')
+    bounding_box_corners = np.array([[100.4, 80.6], [220.5, 400.2]])
+    expected_image = pose_labelbox.overlay.overlay_bounding_box(
+        image=image,
+        show_bounding_box=show_bounding_box,
+        bounding_box_corners=bounding_box_corners,
+        timestamp=timestamp,
+        pose_track_label=17,
+        output_scale=output_scale,
+        bounding_box_alpha=0.6,
+    )
+    renderer = pose_labelbox.rendering.OverlayRenderer(
+        pose_track_label=17,
+        output_scale=output_scale,
+        bounding_box_alpha=0.6,
+    )
+    for _ in range(2):
+        rendered_image = renderer.render(
+            image=image,
+            show_bounding_box=show_bounding_box,
+            bounding_box_corners=bounding_box_corners,
+            timestamp=timestamp,
+            copy=True,
+        )
+        assert np.array_equal(image, original_image)
+        differences = np.abs(rendered_image.astype(int) - expected_image.astype(int))
+        assert differences.max() <= 2
+        assert (differences > 0).mean() < 0.001
+
+def test_resized_images_have_even_dimensions():
+    image = np.zeros((971, 1297, 3), dtype='uint8')
+    assert pose_labelbox.rendering.resize_image(image, output_scale=1.0) is image
+    assert pose_labelbox.rendering.resize_image(image, output_scale=0.5).shape == (486, 648, 3)
+    with pytest.raises(ValueError):
+        pose_labelbox.rendering.resize_image(image, output_scale=0.0)
@@ -0,0 +1,44 @@
+import datetime
+import threading
+import pose_labelbox.metrics
+import pose_labelbox.session
+
+class CountingSession(pose_labelbox.session.Session):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.num_created = 0
+
+    def create_honeycomb_client(self):
+        self.num_created += 1
+        return object()
+
+def test_session_clients_are_created_once_and_shared():
+    session = CountingSession()
+    with pose_labelbox.metrics.metrics_sink(pose_labelbox.metrics.InMemoryMetricsSink()):
+        clients = list()
+        threads = [threading.Thread(target=lambda: clients.append(session.honeycomb_client)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert session.num_created == 1
+    assert all(client is clients[0] for client in clients)
+    assert pose_labelbox.session.resolve_honeycomb_client(session=session) is clients[0]
+    explicit_client = object()
+    assert pose_labelbox.session.resolve_honeycomb_client(client=explicit_client, session=session) is explicit_client
+    assert pose_labelbox.session.resolve_honeycomb_client() is None
+    session.refresh()
+    assert session.honeycomb_client is not clients[0]
+    assert session.num_created == 2
+
+def test_expired_clients_are_recreated_but_passed_clients_are_kept():
+    labelbox_client = object()
+    session = CountingSession(
+        labelbox_client=labelbox_client,
+        token_refresh_interval=datetime.timedelta(0),
+    )
+    first_client = session.honeycomb_client
+    assert session.honeycomb_client is not first_client
+    assert session.num_created == 2
+    session.close()
+    assert session.labelbox_client is labelbox_client
@@ -0,0 +1,88 @@
+import pytest
+import datetime
+import pose_labelbox.sharding
+import pose_labelbox.overlay
+import pose_labelbox.process_video
+
+def test_windows_cover_output_period():
+    windows = pose_labelbox.sharding.generate_windows(
+        start=datetime.datetime(2023, 1, 1, 8, 0, 5, tzinfo=datetime.timezone.utc),
+        end=datetime.datetime(2023, 1, 1, 8, 25, 0, tzinfo=datetime.timezone.utc),
+        window_duration=datetime.timedelta(minutes=10),
+    )
+    assert [window_end - window_start for window_start, window_end in windows] == [
+        datetime.timedelta(minutes=10),
+        datetime.timedelta(minutes=10),
+        datetime.timedelta(minutes=5),
+    ]
+    assert windows[0][0] == datetime.datetime(2023, 1, 1, 8, 0, 0, tzinfo=datetime.timezone.utc)
+    overlapping_windows = pose_labelbox.sharding.generate_windows(
+        start=datetime.datetime(2023, 1, 1, 8, 0, 5, tzinfo=datetime.timezone.utc),
+        end=datetime.datetime(2023, 1, 1, 8, 25, 0, tzinfo=datetime.timezone.utc),
+        window_duration=datetime.timedelta(minutes=10),
+        window_overlap=datetime.timedelta(seconds=30),
+    )
+    assert [window_start for window_start, _ in overlapping_windows] == [window_start for window_start, _ in windows]
+    assert [window_end - window_start for window_start, window_end in overlapping_windows] == [
+        datetime.timedelta(minutes=10, seconds=30),
+        datetime.timedelta(minutes=10, seconds=30),
+        datetime.timedelta(minutes=5),
+    ]
+
+def test_leases_are_exclusive_and_expired_leases_are_reclaimed(tmp_path):
+    lease_a = pose_labelbox.sharding.claim_work_unit(tmp_path, 'unit', 'worker-a')
+    assert lease_a is not None
+    assert pose_labelbox.sharding.claim_work_unit(tmp_path, 'unit', 'worker-b') is None
+    # Simulate worker A crashing without renewing its lease
+    pose_labelbox.sharding.release_lease(lease_a)
+    lease_b = pose_labelbox.sharding.claim_work_unit(tmp_path, 'unit', 'worker-b')
+    assert lease_b['generation'] == 1
+    assert pose_labelbox.sharding.is_lease_superseded(lease_a)
+    assert not pose_labelbox.sharding.complete_work_unit(lease_a)
+    assert pose_labelbox.sharding.complete_work_unit(lease_b)
+    pose_labelbox.sharding.release_lease(lease_b)
+    assert pose_labelbox.sharding.claim_work_unit(tmp_path, 'unit', 'worker-c') is None
+
+def test_sharded_stages_receive_only_accepted_arguments():
+    start = datetime.datetime(2023, 1, 1, 8, 0, 0, tzinfo=datetime.timezone.utc)
+    end = start + datetime.timedelta(minutes=20)
+    def detect_stage(inference_id, start, end, camera_ids, session=None):
+        pass
+    with pytest.raises(ValueError):
+        pose_labelbox.sharding.validate_sharded_stage(detect_stage, dict(), start, end)
+    pose_labelbox.sharding.validate_sharded_stage(detect_stage, {'inference_id': 'inference'}, start, end)
+    stage_arguments = pose_labelbox.sharding.generate_stage_arguments(
+        stage_function=detect_stage,
+        work_unit={'camera_id': 'a', 'window_start': start, 'window_end': end},
+        environment_id='environment',
+        stage_kwargs={'inference_id': 'inference', 'session': 'session'},
+    )
+    assert stage_arguments == {
+        'start': start,
+        'end': end,
+        'camera_ids': ['a'],
+        'session': 'session',
+        'inference_id': 'inference',
+    }
+    with pytest.raises(ValueError):
+        pose_labelbox.sharding.validate_sharded_stage(
+            pose_labelbox.process_video.generate_bounding_box_overlay_videos,
+            {'inference_id': 'inference'},
+            start,
+            end,
+        )
+    # Overlays are only sharded by camera
+    with pytest.raises(ValueError):
+        pose_labelbox.sharding.validate_sharded_stage(
+            pose_labelbox.overlay.generate_bounding_box_overlays,
+            {'inference_id': 'inference'},
+            start,
+            end,
+        )
+    pose_labelbox.sharding.validate_sharded_stage(
+        pose_labelbox.overlay.generate_bounding_box_overlays,
+        {'inference_id': 'inference'},
+        start,
+        end,
+        window_duration=datetime.timedelta(minutes=20),
+    )
@@ -0,0 +1,162 @@
+import datetime
+import pytest
+import pose_labelbox.tracks
+
+pd = pytest.importorskip('pandas')
+
+def test_pose_tracks_are_split_at_long_gaps():
+    start = pd.Timestamp('2023-01-01T08:00:00Z')
+    poses_2d = pd.DataFrame({
+        'pose_track_label': [1, 1, 1, 1, 2],
+        'timestamp': [
+            start,
+            start + pd.Timedelta(milliseconds=300),
+            start + pd.Timedelta(minutes=2),
+            start + pd.Timedelta(minutes=2, milliseconds=100),
+            start + pd.Timedelta(minutes=1),
+        ],
+    })
+    segmented_poses_2d = pose_labelbox.tracks.segment_pose_tracks(
+        poses_2d=poses_2d,
+        max_gap=datetime.timedelta(seconds=10),
+    )
+    assert segmented_poses_2d['pose_track_segment_index'].tolist() == [0, 0, 1, 1, 0]
+    timestamps = pose_labelbox.tracks.generate_pose_track_timestamps(
+        timestamps=poses_2d.loc[poses_2d['pose_track_label'] == 1, 'timestamp'],
+        frame_period=datetime.timedelta(milliseconds=100),
+        max_gap=datetime.timedelta(seconds=10),
+    )
+    assert len(timestamps) == 6
+    unsegmented_timestamps = pose_labelbox.tracks.generate_pose_track_timestamps(
+        timestamps=poses_2d.loc[poses_2d['pose_track_label'] == 1, 'timestamp'],
+        frame_period=datetime.timedelta(milliseconds=100),
+    )
+    assert len(unsegmented_timestamps) == 1202
+    shuffled_timestamps = pose_labelbox.tracks.generate_pose_track_timestamps(
+        timestamps=poses_2d.loc[poses_2d['pose_track_label'] == 1, 'timestamp'].sample(frac=1.0, random_state=1),
+        frame_period=datetime.timedelta(milliseconds=100),
+        max_gap=datetime.timedelta(seconds=10),
+    )
+    assert shuffled_timestamps.equals(timestamps)
+
+def test_short_and_low_quality_pose_tracks_are_pruned():
+    np = pytest.importorskip('numpy')
+    start = pd.Timestamp('2023-01-01T08:00:00Z')
+    poses_2d_list = list()
+    for pose_track_label, num_poses, pose_quality in [(1, 20, 0.9), (2, 2, 0.9), (3, 20, 0.2)]:
+        for frame_index in range(num_poses):
+            poses_2d_list.append({
+                'pose_track_label': pose_track_label,
+                'timestamp': start + frame_index*pd.Timedelta(milliseconds=100),
+                'bounding_box_xywh': np.array([100.0 + frame_index, 100.0, 50.0, 100.0]),
+                'pose_quality_2d': pose_quality,
+            })
+    poses_2d = pd.DataFrame(poses_2d_list)
+    pose_track_statistics = pose_labelbox.tracks.compute_pose_track_statistics(poses_2d)
+    assert pose_track_statistics.loc[1, 'num_poses'] == 20
+    assert pose_track_statistics.loc[1, 'coverage'] == 1.0
+    assert pose_track_statistics.loc[1, 'median_box_area'] == 5000.0
+    assert pose_track_statistics.loc[1, 'total_motion'] == pytest.approx(19.0)
+    pose_track_statistics = pose_labelbox.tracks.apply_pose_track_pruning_rules(
+        pose_track_statistics=pose_track_statistics,
+        min_num_poses=5,
+        min_mean_pose_quality=0.5,
+    )
+    assert pose_track_statistics['pruned'].tolist() == [False, True, True]
+    assert pose_track_statistics.loc[2, 'pruning_reasons'] == ['num_poses']
+    assert pose_track_statistics.loc[3, 'pruning_reasons'] == ['mean_pose_quality']
+
+def test_fragments_of_one_person_are_stitched():
+    np = pytest.importorskip('numpy')
+    start = pd.Timestamp('2023-01-01T08:00:00Z')
+    poses_2d_list = list()
+    # Track 5 continues track 3 after a short occlusion; track 9 is someone
+    # else on the other side of the frame
+    for pose_track_label, first_frame, last_frame, x_offset in [(3, 0, 9, 100.0), (5, 15, 30, 100.0), (9, 12, 20, 900.0)]:
+        for frame_index in range(first_frame, last_frame + 1):
+            x = x_offset + frame_index
+            poses_2d_list.append({
+                'pose_track_label': pose_track_label,
+                'timestamp': start + frame_index*pd.Timedelta(milliseconds=100),
+                'bounding_box_corners': np.array([[x, 100.0], [x + 50.0, 200.0]]),
+                'keypoint_coordinates_2d': np.array([[x + 10.0, 120.0], [x + 40.0, 180.0]]),
+                'keypoint_quality_2d': np.array([0.9, 0.9]),
+            })
+    poses_2d = pd.DataFrame(poses_2d_list)
+    stitched_poses_2d, pose_track_lineage = pose_labelbox.tracks.stitch_pose_track_fragments(poses_2d)
+    assert pose_track_lineage['pose_track_label'].to_dict() == {3: 3, 5: 3, 9: 9}
+    assert pose_track_lineage.loc[5, 'fragment_index'] == 1
+    assert set(stitched_poses_2d['pose_track_label']) == {3, 9}
+    assert (stitched_poses_2d.loc[stitched_poses_2d['pose_track_label'] == 3, 'original_pose_track_label'].unique() == [3, 5]).all()
+
+def test_pose_tracks_are_linked_across_overlapping_windows():
+    np = pytest.importorskip('numpy')
+    start = pd.Timestamp('2023-01-01T08:00:00Z')
+    frame_period = pd.Timedelta(milliseconds=100)
+    windows = [
+        (start, start + 25*frame_period),
+        (start + 20*frame_period, start + 45*frame_period),
+        (start + 40*frame_period, start + 60*frame_period),
+    ]
+    # Each window labels its tracks from scratch. Person A is walking through
+    # all three windows, person B stands still in the first two and person C
+    # only appears after the second overlap
+    people = [('A', 0, 59, 100.0, 10.0), ('B', 0, 44, 900.0, 0.0), ('C', 50, 59, 500.0, 0.0)]
+    window_poses_2d = list()
+    for window_start, window_end in windows:
+        poses_2d_list = list()
+        window_people = [person for person in people if person[1] <= (window_end - start)/frame_period - 1 and person[2] >= (window_start - start)/frame_period]
+        for pose_track_label, (person_name, first_frame, last_frame, x_offset, speed) in enumerate(reversed(window_people)):
+            for frame_index in range(first_frame, last_frame + 1):
+                timestamp = start + frame_index*frame_period
+                if timestamp < window_start or timestamp >= window_end:
+                    continue
+                x = x_offset + speed*frame_index
+                poses_2d_list.append({
+                    'person_name': person_name,
+                    'pose_track_label': pose_track_label,
+                    # Detection timestamps jitter slightly between runs
+                    'timestamp': timestamp + pd.Timedelta(milliseconds=len(window_poses_2d)),
+                    'bounding_box_corners': np.array([[x, 100.0], [x + 50.0, 200.0]]),
+                    'keypoint_coordinates_2d': np.array([[x + 10.0, 120.0], [x + 40.0, 180.0]]),
+                    'keypoint_quality_2d': np.array([0.9, 0.9]),
+                })
+        window_poses_2d.append(pd.DataFrame(poses_2d_list))
+    linked_poses_2d = pose_labelbox.tracks.link_window_pose_tracks(
+        window_poses_2d=window_poses_2d,
+        windows=windows,
+        frame_period=frame_period,
+    )
+    assert len(linked_poses_2d) == 60 + 45 + 10
+    assert linked_poses_2d.groupby('person_name')['pose_track_label'].nunique().to_dict() == {'A': 1, 'B': 1, 'C': 1}
+    assert linked_poses_2d['pose_track_label'].nunique() == 3
+    assert linked_poses_2d['timestamp'].is_monotonic_increasing
+    assert linked_poses_2d.loc[linked_poses_2d['person_name'] == 'A', 'window_index'].value_counts().sort_index().tolist() == [20, 20, 20]
+
+def test_sparse_frames_keep_segment_bounds_and_change_candidates():
+    np = pytest.importorskip('numpy')
+    # A box drifting slowly, with one jump and one missed detection
+    bounding_box_corners = np.array([[[100.0 + frame, 100.0], [150.0 + frame, 300.0]] for frame in range(30)])
+    bounding_box_corners[12] += 200.0
+    bounding_box_corners[20] = np.nan
+    segment_indices = [0]*25 + [1]*5
+    keyframes = pose_labelbox.tracks.select_sparse_frames(
+        bounding_box_corners=bounding_box_corners,
+        segment_indices=segment_indices,
+        sparse_mode='keyframes',
+    )
+    assert np.flatnonzero(keyframes).tolist() == [0, 12, 13, 24, 25, 29]
+    frame_rate_frames = pose_labelbox.tracks.select_sparse_frames(
+        bounding_box_corners=bounding_box_corners,
+        segment_indices=segment_indices,
+        sparse_mode='frame_rate',
+        sparse_frame_interval=10,
+    )
+    assert np.flatnonzero(frame_rate_frames).tolist() == [0, 10, 20, 24, 25, 29]
+    # Slow drift adds a keyframe once the box has moved far enough
+    bounding_box_corners[:, :, 0] += np.arange(30)[:, np.newaxis]*20.0
+    drifting_keyframes = pose_labelbox.tracks.select_sparse_frames(
+        bounding_box_corners=bounding_box_corners,
+        sparse_mode='keyframes',
+    )
+    assert 0 < drifting_keyframes.sum() < 30
@@ -0,0 +1,81 @@
+import pytest
+import pose_labelbox.triangulation
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+def generate_camera_calibration(position, distortion_coefficients):
+    target = np.array([0.0, 0.0, 1.0])
+    z_axis = (target - position)/np.linalg.norm(target - position)
+    x_axis = np.cross(z_axis, [0.0, 0.0, 1.0])
+    x_axis /= np.linalg.norm(x_axis)
+    y_axis = np.cross(z_axis, x_axis)
+    rotation_matrix = np.stack((x_axis, y_axis, z_axis))
+    angle = np.arccos((np.trace(rotation_matrix) - 1)/2)
+    axis = np.array([
+        rotation_matrix[2, 1] - rotation_matrix[1, 2],
+        rotation_matrix[0, 2] - rotation_matrix[2, 0],
+        rotation_matrix[1, 0] - rotation_matrix[0, 1],
+    ])/(2*np.sin(angle))
+    return {
+        'camera_matrix': [[800.0, 0.0, 640.0], [0.0, 800.0, 360.0], [0.0, 0.0, 1.0]],
+        'distortion_coefficients': distortion_coefficients,
+        'rotation_vector': (axis*angle).tolist(),
+        'translation_vector': (-rotation_matrix @ position).tolist(),
+    }
+
+def project_points(points, camera_calibration):
+    rotation_matrix = pose_labelbox.triangulation.generate_rotation_matrix(camera_calibration['rotation_vector'])
+    camera_points = points @ rotation_matrix.T + np.asarray(camera_calibration['translation_vector'])
+    x = camera_points[:, 0]/camera_points[:, 2]
+    y = camera_points[:, 1]/camera_points[:, 2]
+    k1, k2, p1, p2, k3 = camera_calibration['distortion_coefficients']
+    r_squared = x*x + y*y
+    radial_factor = 1 + k1*r_squared + k2*r_squared**2 + k3*r_squared**3
+    x_distorted = x*radial_factor + 2*p1*x*y + p2*(r_squared + 2*x*x)
+    y_distorted = y*radial_factor + p1*(r_squared + 2*y*y) + 2*p2*x*y
+    return np.stack((800.0*x_distorted + 640.0, 800.0*y_distorted + 360.0), axis=-1)
+
+def test_triangulate_poses_recovers_people_across_cameras():
+    rng = np.random.default_rng(0)
+    distortion_coefficients = [0.05, -0.01, 0.001, 0.001, 0.0]
+    camera_calibrations = {
+        f'camera_{camera_index}': generate_camera_calibration(
+            position=np.array([5*np.cos(angle), 5*np.sin(angle), 2.5]),
+            distortion_coefficients=distortion_coefficients,
+        )
+        for camera_index, angle in enumerate(np.linspace(0, 2*np.pi, 4, endpoint=False))
+    }
+    timestamps = pd.date_range('2023-01-01T00:00:00Z', periods=3, freq='100ms')
+    people = {
+        (timestamp, person_index): np.array([person_index*1.5 - 1.5, 0.5, 1.0]) + rng.normal(0.0, 0.3, (17, 3))
+        for timestamp in timestamps
+        for person_index in range(3)
+    }
+    poses_2d_list = list()
+    for (timestamp, person_index), keypoints in people.items():
+        for camera_id, camera_calibration in camera_calibrations.items():
+            poses_2d_list.append({
+                'pose_2d_id': f'{camera_id}_{timestamp.isoformat()}_{person_index}',
+                'camera_id': camera_id,
+                'timestamp': timestamp,
+                'keypoint_coordinates_2d': project_points(keypoints, camera_calibration),
+                'keypoint_quality_2d': np.full(17, 0.9),
+                'person_index': person_index,
+            })
+    poses_2d = pd.DataFrame(poses_2d_list).set_index('pose_2d_id')
+    poses_3d = pose_labelbox.triangulation.triangulate_poses(
+        poses_2d=poses_2d,
+        camera_calibrations=camera_calibrations,
+    )
+    assert len(poses_3d) == 9
+    assert (poses_3d['num_views'] == 4).all()
+    for pose_3d in poses_3d.itertuples():
+        person_indices = poses_2d.loc[pose_3d.pose_2d_ids, 'person_index'].unique()
+        assert len(person_indices) == 1
+        np.testing.assert_allclose(
+            pose_3d.keypoint_coordinates_3d,
+            people[(pose_3d.timestamp, person_indices[0])],
+            atol=1e-6,
+        )
+    assert poses_3d['reprojection_error'].max() < 1e-3